@@ -0,0 +1,300 @@
+"""
+模擬交易機器人，用於產生接近真實的市場負載並找出系統的飽和點
+用法:
+    python agents.py --target engine --agents 2000 --rates 0.5,1,2,5 --duration 10
+    python agents.py --target api --base-url http://localhost:8000 --token-file tokens.txt --agents 200
+tokens.txt 每行一個用戶的 JWT，按順序分配給機器人 (少於機器人數時循環使用)
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from typing import Optional
+import httpx
+import numpy as np
+from engine import MatchingEngine, Order
+from fixedpoint import from_ticks, to_ticks
+from ledger import AccountLedger, RiskCheckError
+from prices import PriceFeed
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = []
+        # 被拒的委託與超時、連線失敗等傳輸錯誤分開統計，後者是飽和的訊號
+        self.errors = 0
+        self.transport_errors = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentiles(self) -> dict:
+        if not self.samples:
+            return {}
+        values = np.array(self.samples) * 1000.0
+        p50, p90, p99, p999 = np.percentile(values, [50, 90, 99, 99.9])
+        return {"p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "p999_ms": p999, "max_ms": values.max()}
+
+
+class EngineGateway:
+    """
+    直接呼叫同進程的撮合引擎，與 API 一樣以小數價格交互，在此換算 tick
+    """
+
+    def __init__(self, engine: MatchingEngine):
+        self.engine = engine
+        self.ids = itertools.count()
+
+    def last_price(self, symbol: str) -> Optional[float]:
+        return from_ticks(self.engine.price_feed.last_price(symbol)) if self.engine.price_feed else None
+
+    async def submit(self, user_id: str, symbol: str, side: str, quantity: int,
+                     price: float = None, order_type: str = 'limit') -> Optional[str]:
+        order_id = str(next(self.ids))
+        self.engine.submit(Order(order_id, user_id, symbol, side, quantity, to_ticks(price), order_type))
+        return order_id
+
+    async def cancel(self, user_id: str, order_id: str):
+        self.engine.cancel(order_id)
+
+    async def close(self):
+        pass
+
+
+class HttpGateway:
+    """
+    透過 /api/v1/orders 下單，測量包含網絡與序列化在內的端到端延遲
+    tokens 為 {user_id: JWT}，每個機器人以自己的用戶身份下單；連線數應不少於機器人數，否則測到的是連線池排隊
+    """
+
+    def __init__(self, base_url: str, tokens: dict, initial_prices: dict, connections: int = 100,
+                 timeout: float = 30.0, transport: httpx.AsyncBaseTransport = None):
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+            timeout=timeout,
+            transport=transport,
+        )
+        self.tokens = tokens
+        self.prices = dict(initial_prices)
+
+    def _headers(self, user_id: str) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+    def last_price(self, symbol: str) -> Optional[float]:
+        return self.prices.get(symbol)
+
+    async def submit(self, user_id: str, symbol: str, side: str, quantity: int,
+                     price: float = None, order_type: str = 'limit') -> Optional[str]:
+        response = await self.client.post("/api/v1/orders", headers=self._headers(user_id), json={
+            "symbol": symbol, "side": side, "quantity": quantity,
+            "price": price, "order_type": order_type,
+        })
+        if response.status_code != 200:
+            raise RiskCheckError(response.text)
+        data = response.json()
+        if data["fills"]:
+            self.prices[symbol] = data["fills"][-1]["price"]
+        return data["order_id"]
+
+    async def cancel(self, user_id: str, order_id: str):
+        await self.client.delete(f"/api/v1/orders/{order_id}", headers=self._headers(user_id))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class Agent:
+    """
+    以泊松過程到達的交易者，延遲從計劃送出時間算起，避免系統過載時低估延遲
+    """
+
+    def __init__(self, user_id: str, symbols: list, rate: float, rng: random.Random):
+        self.user_id = user_id
+        self.symbols = symbols
+        self.rate = rate
+        self.rng = rng
+
+    async def act(self, gateway):
+        raise NotImplementedError
+
+    async def run(self, gateway, deadline: float, recorder: LatencyRecorder):
+        next_time = time.perf_counter()
+        while True:
+            next_time += self.rng.expovariate(self.rate)
+            if next_time >= deadline:
+                return
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.act(gateway)
+                recorder.record(time.perf_counter() - next_time)
+            except RiskCheckError:
+                recorder.errors += 1
+            except httpx.HTTPError:
+                recorder.transport_errors += 1
+
+
+class MarketMaker(Agent):
+    def __init__(self, user_id: str, symbols: list, rate: float, rng: random.Random,
+                 spread: float = 0.002, size: int = 100):
+        super().__init__(user_id, symbols, rate, rng)
+        self.spread = spread
+        self.size = size
+        self.quotes = {}
+
+    async def act(self, gateway):
+        symbol = self.rng.choice(self.symbols)
+        for order_id in self.quotes.pop(symbol, ()):
+            await gateway.cancel(self.user_id, order_id)
+        mid = gateway.last_price(symbol) or 100.0
+        skew = self.rng.uniform(-self.spread, self.spread) * mid
+        half = self.spread * mid / 2
+        bid = round(mid + skew - half, 2)
+        ask = round(mid + skew + half, 2)
+        self.quotes[symbol] = [
+            await gateway.submit(self.user_id, symbol, 'buy', self.size, bid),
+            await gateway.submit(self.user_id, symbol, 'sell', self.size, ask),
+        ]
+
+
+class MomentumTrader(Agent):
+    def __init__(self, user_id: str, symbols: list, rate: float, rng: random.Random, size: int = 10):
+        super().__init__(user_id, symbols, rate, rng)
+        self.size = size
+        self.seen = {}
+
+    async def act(self, gateway):
+        symbol = self.rng.choice(self.symbols)
+        price = gateway.last_price(symbol)
+        previous = self.seen.get(symbol)
+        self.seen[symbol] = price
+        if price is None or previous is None or price == previous:
+            return
+        side = 'buy' if price > previous else 'sell'
+        await gateway.submit(self.user_id, symbol, side, self.size, None, 'market')
+
+
+class RandomTrader(Agent):
+    def __init__(self, user_id: str, symbols: list, rate: float, rng: random.Random, max_size: int = 20):
+        super().__init__(user_id, symbols, rate, rng)
+        self.max_size = max_size
+
+    async def act(self, gateway):
+        symbol = self.rng.choice(self.symbols)
+        side = self.rng.choice(('buy', 'sell'))
+        quantity = self.rng.randint(1, self.max_size)
+        if self.rng.random() < 0.5:
+            await gateway.submit(self.user_id, symbol, side, quantity, None, 'market')
+        else:
+            mid = gateway.last_price(symbol) or 100.0
+            price = round(mid * (1 + self.rng.uniform(-0.005, 0.005)), 2)
+            await gateway.submit(self.user_id, symbol, side, quantity, price)
+
+
+def build_agents(count: int, symbols: list, rate: float, seed: int = 0,
+                 mix: tuple = (0.2, 0.3, 0.5)) -> list:
+    """
+    按比例建立做市商、動量交易者與隨機交易者
+    """
+    rng = random.Random(seed)
+    makers = int(count * mix[0])
+    momentum = int(count * mix[1])
+    agents = []
+    for i in range(count):
+        agent_rng = random.Random(rng.random())
+        user_id = f"bot{i}"
+        if i < makers:
+            agents.append(MarketMaker(user_id, symbols, rate, agent_rng))
+        elif i < makers + momentum:
+            agents.append(MomentumTrader(user_id, symbols, rate, agent_rng))
+        else:
+            agents.append(RandomTrader(user_id, symbols, rate, agent_rng))
+    return agents
+
+
+def assign_tokens(agents: list, tokens: list) -> dict:
+    """
+    按順序為每個機器人分配 JWT，token 少於機器人數時循環使用
+    """
+    if not tokens:
+        raise ValueError("At least one token is required")
+    return {agent.user_id: tokens[i % len(tokens)] for i, agent in enumerate(agents)}
+
+
+def build_engine(agents: list, symbols: list, risk_checks: bool = True) -> MatchingEngine:
+    """
+    建立獨立的引擎，為每個機器人開立足夠的資金與持倉
+    """
+    price_feed = PriceFeed()
+    for symbol in symbols:
+        price_feed.prices[symbol] = to_ticks(100.0)
+    ledger = None
+    if risk_checks:
+        ledger = AccountLedger()
+        for agent in agents:
+            ledger.load_account(agent.user_id, to_ticks(1e12), {symbol: 10 ** 8 for symbol in symbols},
+                                max_position=10 ** 12)
+    return MatchingEngine(ledger, price_feed)
+
+
+async def run_load(gateway, agents: list, duration: float) -> dict:
+    recorder = LatencyRecorder()
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(agent.run(gateway, deadline, recorder) for agent in agents))
+    elapsed = time.perf_counter() - started
+    stats = {
+        "offered_per_second": sum(agent.rate for agent in agents),
+        "actions": len(recorder.samples),
+        "rejected": recorder.errors,
+        "transport_errors": recorder.transport_errors,
+        "actions_per_second": len(recorder.samples) / elapsed,
+    }
+    stats.update(recorder.percentiles())
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run simulated trader agents against the market")
+    parser.add_argument('--target', choices=('engine', 'api'), default='engine')
+    parser.add_argument('--agents', type=int, default=1000)
+    parser.add_argument('--symbols', type=int, default=10)
+    parser.add_argument('--rates', default='1,2,5,10', help="每個機器人每秒的動作數，逗號分隔逐步加壓")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--no-risk', action='store_true')
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--token', default='', help="所有機器人共用的 JWT，會與自己的掛單成交，只適合冒煙測試")
+    parser.add_argument('--token-file', help="每行一個 JWT，按順序分配給機器人")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    tokens = [args.token]
+    if args.token_file:
+        with open(args.token_file) as f:
+            tokens = [line.strip() for line in f if line.strip()]
+    for rate in (float(r) for r in args.rates.split(',')):
+        agents = build_agents(args.agents, symbols, rate, args.seed)
+        if args.target == 'engine':
+            gateway = EngineGateway(build_engine(agents, symbols, not args.no_risk))
+        else:
+            gateway = HttpGateway(args.base_url, assign_tokens(agents, tokens), {symbol: 100.0 for symbol in symbols},
+                                  connections=len(agents), timeout=args.timeout)
+        stats = await run_load(gateway, agents, args.duration)
+        await gateway.close()
+        saturated = stats["actions_per_second"] < 0.9 * stats["offered_per_second"]
+        print(
+            f"offered {stats['offered_per_second']:,.0f}/s achieved {stats['actions_per_second']:,.0f}/s "
+            f"p50 {stats.get('p50_ms', 0):.2f}ms p99 {stats.get('p99_ms', 0):.2f}ms "
+            f"p99.9 {stats.get('p999_ms', 0):.2f}ms rejected {stats['rejected']} "
+            f"transport errors {stats['transport_errors']}"
+            f"{'  <- saturated' if saturated else ''}"
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
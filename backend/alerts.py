@@ -0,0 +1,247 @@
+import asyncio
+from bisect import bisect_left, bisect_right
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from auth import get_current_user
+from clock import now_ns
+from database import Database
+from fixedpoint import from_ticks
+from models import User
+from streaming import broadcaster
+
+router = APIRouter()
+
+DIRECTIONS = ('above', 'below')
+
+
+class PriceAlert:
+    __slots__ = ('alert_id', 'user_id', 'symbol', 'level', 'direction')
+
+    def __init__(self, alert_id: str, user_id: str, symbol: str, level: float, direction: str):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction: {direction}")
+        self.alert_id = alert_id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.level = level
+        self.direction = direction
+
+
+class _SortedLevels:
+    """
+    以價格排序的平行陣列，支援區間查詢與整段刪除
+    """
+
+    def __init__(self):
+        self.levels = []
+        self.alerts = []
+
+    def add(self, alert: PriceAlert):
+        i = bisect_right(self.levels, alert.level)
+        self.levels.insert(i, alert.level)
+        self.alerts.insert(i, alert)
+
+    def load(self, alerts: list):
+        merged = sorted(list(zip(self.levels, self.alerts)) + [(a.level, a) for a in alerts],
+                        key=lambda item: item[0])
+        self.levels = [level for level, _ in merged]
+        self.alerts = [alert for _, alert in merged]
+
+    def remove(self, alert: PriceAlert) -> bool:
+        i = bisect_left(self.levels, alert.level)
+        while i < len(self.levels) and self.levels[i] == alert.level:
+            if self.alerts[i] is alert:
+                del self.levels[i]
+                del self.alerts[i]
+                return True
+            i += 1
+        return False
+
+    def pop_range(self, lo: int, hi: int) -> list:
+        if lo >= hi:
+            return []
+        fired = self.alerts[lo:hi]
+        del self.levels[lo:hi]
+        del self.alerts[lo:hi]
+        return fired
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class AlertIndex:
+    """
+    按股票分組的提醒索引，價格由 p0 變到 p1 時以二分查找取出所有被穿越的提醒
+    """
+
+    def __init__(self):
+        self.books = {}
+        self.alerts = {}
+        self.by_user = {}
+
+    def _book(self, symbol: str) -> dict:
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = {'above': _SortedLevels(), 'below': _SortedLevels()}
+        return book
+
+    def add(self, alert: PriceAlert):
+        if alert.alert_id in self.alerts:
+            raise ValueError("Duplicate alert id")
+        self.alerts[alert.alert_id] = alert
+        self.by_user.setdefault(alert.user_id, set()).add(alert.alert_id)
+        self._book(alert.symbol)[alert.direction].add(alert)
+
+    def load(self, alerts: list):
+        """
+        批量載入，每個股票只排序一次
+        """
+        grouped = {}
+        for alert in alerts:
+            self.alerts[alert.alert_id] = alert
+            self.by_user.setdefault(alert.user_id, set()).add(alert.alert_id)
+            grouped.setdefault((alert.symbol, alert.direction), []).append(alert)
+        for (symbol, direction), items in grouped.items():
+            self._book(symbol)[direction].load(items)
+
+    def remove(self, alert_id: str) -> bool:
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return False
+        self._forget(alert)
+        return self.books[alert.symbol][alert.direction].remove(alert)
+
+    def crossed(self, symbol: str, old_price: Optional[float], price: float) -> list:
+        """
+        取出並移除 old_price 到 price 之間被穿越的提醒
+        上漲觸發 old < level <= new 的 above 提醒，下跌觸發 new <= level < old 的 below 提醒
+        """
+        book = self.books.get(symbol)
+        if book is None or old_price is None or old_price == price:
+            return []
+        if price > old_price:
+            side = book['above']
+            fired = side.pop_range(bisect_right(side.levels, old_price), bisect_right(side.levels, price))
+        else:
+            side = book['below']
+            fired = side.pop_range(bisect_left(side.levels, price), bisect_left(side.levels, old_price))
+        for alert in fired:
+            del self.alerts[alert.alert_id]
+            self._forget(alert)
+        return fired
+
+    def _forget(self, alert: PriceAlert):
+        ids = self.by_user.get(alert.user_id)
+        if ids:
+            ids.discard(alert.alert_id)
+            if not ids:
+                del self.by_user[alert.user_id]
+
+    def for_user(self, user_id: str) -> list:
+        return [self.alerts[alert_id] for alert_id in self.by_user.get(user_id, ())]
+
+    def __len__(self):
+        return len(self.alerts)
+
+
+class AlertService:
+    """
+    作為 PriceFeed 的訂閱者觸發提醒，並在背景任務中推送通知與寫回數據庫
+    """
+
+    def __init__(self, channel=broadcaster, batch_size: int = 500):
+        self.index = AlertIndex()
+        self.channel = channel
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue()
+
+    def on_price(self, symbol: str, old_price: Optional[int], price: int):
+        # 提醒價位以小數保存，價格由 tick 換算後比較
+        price = from_ticks(price)
+        for alert in self.index.crossed(symbol, from_ticks(old_price), price):
+            self.queue.put_nowait((alert, price, now_ns()))
+
+    async def load(self, db):
+        alerts = [
+            PriceAlert(str(row.id), str(row.user.id), row.stock.symbol, row.level, row.direction)
+            for row in await db.get_active_alerts()
+        ]
+        self.index.load(alerts)
+
+    async def dispatch(self, db):
+        """
+        推送觸發的提醒，並批量標記為已觸發
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty() and len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+            for alert, price, triggered_at in batch:
+                self.channel.publish(f"user:{alert.user_id}", {
+                    "type": "price_alert",
+                    "alert_id": alert.alert_id,
+                    "symbol": alert.symbol,
+                    "level": alert.level,
+                    "direction": alert.direction,
+                    "price": price,
+                    "ts": triggered_at,
+                })
+            try:
+                await db.mark_alerts_triggered([alert.alert_id for alert, _, _ in batch])
+            except Exception as e:
+                print(f"Error marking alerts: {e}")
+
+
+alert_service = AlertService()
+
+
+class AlertCreate(BaseModel):
+    symbol: str
+    level: float
+    direction: str
+
+
+class AlertResponse(BaseModel):
+    id: str
+    symbol: str
+    level: float
+    direction: str
+
+
+@router.post("", response_model=AlertResponse)
+async def create_alert(data: AlertCreate, current_user: User = Depends(get_current_user)):
+    if data.direction not in DIRECTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Direction must be 'above' or 'below'"
+        )
+    row = await Database().create_price_alert(str(current_user.id), data.symbol, data.level, data.direction)
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Stock not found"
+        )
+    alert_service.index.add(PriceAlert(str(row.id), str(current_user.id), data.symbol, data.level, data.direction))
+    return AlertResponse(id=str(row.id), symbol=data.symbol, level=data.level, direction=data.direction)
+
+
+@router.get("")
+async def list_alerts(current_user: User = Depends(get_current_user)):
+    return [
+        AlertResponse(id=alert.alert_id, symbol=alert.symbol, level=alert.level, direction=alert.direction)
+        for alert in alert_service.index.for_user(str(current_user.id))
+    ]
+
+
+@router.delete("/{alert_id}")
+async def delete_alert(alert_id: str, current_user: User = Depends(get_current_user)):
+    alert = alert_service.index.alerts.get(alert_id)
+    if alert is None or alert.user_id != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Alert not found"
+        )
+    alert_service.index.remove(alert_id)
+    await Database().delete_price_alert(alert_id)
+    return {"message": "Alert deleted"}
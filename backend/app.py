@@ -1,8 +1,28 @@
+import asyncio
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from auth import router as auth_router
-from database import DatabaseConnection
+from alerts import router as alerts_router, alert_service
+from backtest import router as backtest_router
+from corporate_actions import router as corporate_actions_router
+from streaming import router as streaming_router
+from database import DatabaseConnection, Database
+from equity import router as equity_router, equity_service
+from idempotency import idempotency_store
+from ledger import run_reconciliation
+from indicators import indicator_engine
+from market import candles, correlations, depth, engine, ledger, price_feed, sessions, settlement, shard_pool
+from margin import router as margin_router, margin_engine
+from montecarlo import router as projections_router
+from options import router as options_router, options_service
+from orders import router as orders_router
+from replay import router as replay_router
+from risk import router as risk_router, risk_service
+from rooms import router as rooms_router, room_manager
+from search import search_service
+from stocks import router as stocks_router
+from trades import router as trades_router, trade_history
 from fastapi.responses import JSONResponse
 
 # 加載環境變量
@@ -25,6 +45,76 @@ app.include_router(
     prefix="/api/v1/auth",
     tags=["Authentication"]
 )
+app.include_router(
+    orders_router,
+    prefix="/api/v1/orders",
+    tags=["Orders"]
+)
+app.include_router(
+    margin_router,
+    prefix="/api/v1/margin",
+    tags=["Margin"]
+)
+app.include_router(
+    options_router,
+    prefix="/api/v1/options",
+    tags=["Options"]
+)
+app.include_router(
+    alerts_router,
+    prefix="/api/v1/alerts",
+    tags=["Alerts"]
+)
+app.include_router(
+    backtest_router,
+    prefix="/api/v1/backtests",
+    tags=["Backtesting"]
+)
+app.include_router(
+    streaming_router,
+    prefix="/api/v1/stream",
+    tags=["Streaming"]
+)
+app.include_router(
+    stocks_router,
+    prefix="/api/v1/stocks",
+    tags=["Stocks"]
+)
+app.include_router(
+    replay_router,
+    prefix="/api/v1/replay",
+    tags=["Replay"]
+)
+app.include_router(
+    equity_router,
+    prefix="/api/v1/equity",
+    tags=["Equity"]
+)
+app.include_router(
+    risk_router,
+    prefix="/api/v1/risk",
+    tags=["Risk"]
+)
+app.include_router(
+    projections_router,
+    prefix="/api/v1/projections",
+    tags=["Risk"]
+)
+app.include_router(
+    rooms_router,
+    prefix="/api/v1/rooms",
+    tags=["Rooms"]
+)
+app.include_router(
+    trades_router,
+    prefix="/api/v1/trades",
+    tags=["Trades"]
+)
+app.include_router(
+    corporate_actions_router,
+    prefix="/api/v1/corporate-actions",
+    tags=["Corporate Actions"]
+)
 
 # 全局错误处理
 @app.exception_handler(Exception)
@@ -43,15 +133,59 @@ async def global_exception_handler(request: Request, exc: Exception):
 # 数据库连接管理
 db = DatabaseConnection()
 
+background_tasks = []
+price_feed.add_listener(margin_engine.on_price)
+engine.add_fill_listener(margin_engine.on_fills)
+price_feed.add_listener(alert_service.on_price)
+price_feed.add_listener(options_service.on_price)
+candles.add_listener(indicator_engine.on_bar)
+engine.add_fill_listener(trade_history.cache.on_fills)
+candles.add_listener(risk_service.on_bar)
+
 @app.on_event("startup")
 async def startup():
     try:
         await db.connect()
     except Exception as e:
         print(f"数据库连接失败: {e}")
+        return
+    await price_feed.load(Database())
+    if shard_pool:
+        shard_pool.start()
+    await alert_service.load(Database())
+    await options_service.load(Database())
+    await search_service.refresh(Database())
+    await risk_service.load(Database())
+    await correlations.load(Database(), candles.interval)
+    margin_engine.load()
+    idempotency_store.load()
+    background_tasks.append(asyncio.create_task(run_reconciliation(ledger, Database(), pending=settlement.pending_users)))
+    background_tasks.append(asyncio.create_task(margin_engine.run()))
+    background_tasks.append(asyncio.create_task(alert_service.dispatch(Database())))
+    background_tasks.append(asyncio.create_task(settlement.run(Database())))
+    background_tasks.append(asyncio.create_task(price_feed.run(Database())))
+    background_tasks.append(asyncio.create_task(candles.run(Database())))
+    background_tasks.append(asyncio.create_task(depth.run()))
+    background_tasks.append(asyncio.create_task(sessions.run()))
+    background_tasks.append(asyncio.create_task(search_service.run(Database())))
+    background_tasks.append(asyncio.create_task(equity_service.run(Database())))
+    background_tasks.append(asyncio.create_task(risk_service.run()))
+    background_tasks.append(asyncio.create_task(options_service.run(Database())))
+    background_tasks.append(asyncio.create_task(room_manager.run(Database())))
+    background_tasks.append(asyncio.create_task(idempotency_store.run_journal()))
 
 @app.on_event("shutdown")
 async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    if shard_pool:
+        shard_pool.stop()
+    await idempotency_store.flush()
+    if db.get_client():
+        await settlement.flush(Database())
+        await price_feed.flush(Database())
+        await candles.flush(Database())
+        await room_manager.unload_all(Database())
     await db.close()
 
 @app.get("/")
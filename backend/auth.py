@@ -1,7 +1,7 @@
 import os
 import jwt
 import bcrypt
-from datetime import datetime, timedelta
+from clock import NANOS_PER_SECOND, system_clock
 from database import DatabaseConnection
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
@@ -13,6 +13,11 @@ from database import Database
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# JWT 有效期 (秒)
+TOKEN_LIFETIME = 3600
+# 可使用運維接口 (歷史回放等) 的用戶 ID 或郵箱，逗號分隔，留空則無人可用
+OPERATORS = {item.strip() for item in os.getenv('OPERATORS', '').split(',') if item.strip()}
+
 class UserCreate(BaseModel):
     name: str
     email: EmailStr
@@ -57,7 +62,8 @@ class Auth:
         """
         根據用戶 ID 生成 JWT
         """
-        expiration = datetime.utcnow() + timedelta(hours=1)  # 設定 1 小時過期
+        # 設定 1 小時過期，exp 為 epoch 整數秒
+        expiration = system_clock.now() // NANOS_PER_SECOND + TOKEN_LIFETIME
         payload = {
             'user_id': user_id,
             'exp': expiration
@@ -131,7 +137,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user = await DatabaseConnection().get_client().get_user_by_id(user_id)
     if user is None:
         raise credentials_exception
-    return user
+    return User.from_edgeql(user)
+
+
+def is_operator(user: User) -> bool:
+    return str(user.id) in OPERATORS or (user.email is not None and user.email in OPERATORS)
+
+
+async def get_operator_user(current_user: User = Depends(get_current_user)):
+    """
+    只允許 OPERATORS 中的用戶，其他已登入用戶返回 403
+    """
+    if not is_operator(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Operator access required"
+        )
+    return current_user
 
 @router.post("/register", response_model=UserResponse)
 async def register(user: UserCreate):
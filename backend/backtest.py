@@ -0,0 +1,339 @@
+import asyncio
+import inspect
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from auth import get_current_user
+from database import Database
+from models import User
+
+router = APIRouter()
+
+TRADING_DAYS = 252
+
+
+def moving_average(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    以累加和計算簡單移動平均，前 period - 1 個值為 NaN
+    """
+    result = np.full(len(values), np.nan)
+    if period <= 0 or len(values) < period:
+        return result
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    result[period - 1:] = (cumsum[period:] - cumsum[:-period]) / period
+    return result
+
+
+def moving_std(values: np.ndarray, period: int) -> np.ndarray:
+    mean = moving_average(values, period)
+    mean_sq = moving_average(values * values, period)
+    return np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+
+
+# 策略接收 OHLCV 陣列與參數，返回每根K線收盤後的目標倉位 (權益的比例，0 到 1，只做多)
+
+def sma_crossover(data: dict, fast: int = 10, slow: int = 50) -> np.ndarray:
+    close = data['close']
+    fast_ma = moving_average(close, fast)
+    slow_ma = moving_average(close, slow)
+    return np.where(fast_ma > slow_ma, 1.0, 0.0)
+
+
+def momentum(data: dict, lookback: int = 20, threshold: float = 0.0) -> np.ndarray:
+    close = data['close']
+    signal = np.zeros(len(close))
+    if len(close) > lookback:
+        change = close[lookback:] / close[:-lookback] - 1.0
+        signal[lookback:] = np.where(change > threshold, 1.0, 0.0)
+    return signal
+
+
+def mean_reversion(data: dict, period: int = 20, width: float = 2.0) -> np.ndarray:
+    """
+    收盤跌破布林下軌做多，回到中軌平倉
+    """
+    close = data['close']
+    mid = moving_average(close, period)
+    lower = mid - width * moving_std(close, period)
+    entries = close < lower
+    exits = close >= mid
+    # 以最近一次進出場訊號的位置決定當前倉位
+    last_entry = np.maximum.accumulate(np.where(entries, np.arange(len(close)), -1))
+    last_exit = np.maximum.accumulate(np.where(exits, np.arange(len(close)), -1))
+    return np.where(last_entry > last_exit, 1.0, 0.0)
+
+
+STRATEGIES = {
+    'sma_crossover': sma_crossover,
+    'momentum': momentum,
+    'mean_reversion': mean_reversion,
+}
+
+
+def validate_params(strategy: str, params: dict):
+    """
+    檢查策略參數：不能有未知參數，週期類 (預設為整數) 必須是正整數，其他必須是有限數值，
+    並檢查策略特有的約束，不通過時拋出 ValueError
+    """
+    func = STRATEGIES.get(strategy)
+    if func is None:
+        raise ValueError(f"Unknown strategy, choose one of: {', '.join(STRATEGIES)}")
+    defaults = {name: p.default for name, p in inspect.signature(func).parameters.items() if name != 'data'}
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {strategy}: {', '.join(sorted(unknown))}")
+    resolved = dict(defaults, **params)
+    for name, value in resolved.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{name} must be a number")
+        if isinstance(defaults[name], int) and (not isinstance(value, int) or value < 1):
+            raise ValueError(f"{name} must be a positive integer")
+        if not math.isfinite(value):
+            raise ValueError(f"{name} must be finite")
+    if strategy == 'sma_crossover' and resolved['fast'] >= resolved['slow']:
+        raise ValueError("fast must be smaller than slow")
+    if strategy == 'mean_reversion' and resolved['width'] <= 0:
+        raise ValueError("width must be positive")
+
+
+def validate_costs(initial_cash: float, commission: float = 0.0, slippage: float = 0.0):
+    """
+    初始資金必須為正的有限數值，手續費與滑價為 [0, 1) 的比例，不通過時拋出 ValueError
+    """
+    if not math.isfinite(initial_cash) or initial_cash <= 0:
+        raise ValueError("initial_cash must be a positive number")
+    for name, value in (('commission', commission), ('slippage', slippage)):
+        if not math.isfinite(value) or not 0 <= value < 1:
+            raise ValueError(f"{name} must be between 0 and 1")
+
+
+class SimulatedTransaction:
+    __slots__ = ('type', 'quantity', 'price', 'timestamp')
+
+    def __init__(self, type: str, quantity: int, price: float, timestamp):
+        self.type = type
+        self.quantity = quantity
+        self.price = price
+        self.timestamp = timestamp
+
+
+class SimulatedPortfolio:
+    """
+    與 Portfolio 相同的語義：買入時更新平均成本，賣出時平均成本不變
+    """
+
+    def __init__(self, cash: float):
+        self.cash = cash
+        self.quantity = 0
+        self.average_price = 0.0
+        self.realized_pnl = 0.0
+        self.transactions = []
+
+    def apply(self, type: str, quantity: int, price: float, commission: float, timestamp=None):
+        if quantity <= 0:
+            return
+        if type == 'buy':
+            total = self.quantity * self.average_price + quantity * price
+            self.quantity += quantity
+            self.average_price = total / self.quantity
+            self.cash -= quantity * price
+        else:
+            quantity = min(quantity, self.quantity)
+            self.realized_pnl += quantity * (price - self.average_price)
+            self.quantity -= quantity
+            self.cash += quantity * price
+            if self.quantity == 0:
+                self.average_price = 0.0
+        self.cash -= quantity * price * commission
+        self.transactions.append(SimulatedTransaction(type, quantity, price, timestamp))
+
+
+class BacktestResult:
+    def __init__(self, symbol: str, strategy: str, params: dict, equity: Optional[np.ndarray],
+                 total_return: float, sharpe: float, max_drawdown: float, trades: int,
+                 portfolio: Optional[SimulatedPortfolio] = None):
+        self.symbol = symbol
+        self.strategy = strategy
+        self.params = params
+        self.equity = equity
+        self.total_return = total_return
+        self.sharpe = sharpe
+        self.max_drawdown = max_drawdown
+        self.trades = trades
+        self.portfolio = portfolio
+
+    def to_dict(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "strategy": self.strategy,
+            "params": self.params,
+            "total_return": self.total_return,
+            "sharpe": self.sharpe,
+            "max_drawdown": self.max_drawdown,
+            "trades": self.trades,
+        }
+
+
+def run_backtest(data: dict, strategy: str, params: dict = None, symbol: str = '',
+                 initial_cash: float = 100000.0, commission: float = 0.001,
+                 slippage: float = 0.0005, keep_details: bool = True) -> BacktestResult:
+    """
+    向量化回測：第 t 根K線收盤產生的目標倉位在第 t+1 根開盤成交
+    權益曲線以開盤到開盤的報酬向量化計算，成交記錄只在倉位改變處逐筆模擬
+    """
+    params = params or {}
+    validate_params(strategy, params)
+    validate_costs(initial_cash, commission, slippage)
+    func: Callable = STRATEGIES[strategy]
+    opens = np.asarray(data['open'], dtype=np.float64)
+    closes = np.asarray(data['close'], dtype=np.float64)
+    n = len(closes)
+    if n < 2:
+        return BacktestResult(symbol, strategy, params, None, 0.0, 0.0, 0.0, 0)
+
+    target = np.clip(np.nan_to_num(func(data, **params)), 0.0, 1.0)
+    # 第 t 根持有的倉位為第 t-1 根收盤的訊號
+    held = np.empty(n)
+    held[0] = 0.0
+    held[1:] = target[:-1]
+    turnover = np.abs(np.diff(held, prepend=0.0))
+
+    # 持有區間為開盤到下一根開盤，最後一根以收盤價計價
+    next_price = np.empty(n)
+    next_price[:-1] = opens[1:]
+    next_price[-1] = closes[-1]
+    bar_returns = next_price / opens - 1.0
+    strategy_returns = held * bar_returns - turnover * (commission + slippage)
+    equity = initial_cash * np.cumprod(1.0 + strategy_returns)
+
+    peak = np.maximum.accumulate(equity)
+    max_drawdown = float(np.max(1.0 - equity / peak))
+    std = strategy_returns.std()
+    sharpe = float(strategy_returns.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else 0.0
+    total_return = float(equity[-1] / initial_cash - 1.0)
+
+    changes = np.flatnonzero(turnover)
+    portfolio = None
+    if keep_details:
+        portfolio = SimulatedPortfolio(initial_cash)
+        timestamps = data.get('timestamp')
+        prior_equity = np.concatenate(([initial_cash], equity[:-1]))
+        for t in changes:
+            price = opens[t]
+            target_quantity = int(held[t] * prior_equity[t] / price)
+            delta = target_quantity - portfolio.quantity
+            stamp = timestamps[t] if timestamps is not None else t
+            if delta > 0:
+                portfolio.apply('buy', delta, price * (1 + slippage), commission, stamp)
+            elif delta < 0:
+                portfolio.apply('sell', -delta, price * (1 - slippage), commission, stamp)
+
+    return BacktestResult(
+        symbol, strategy, params, equity if keep_details else None,
+        total_return, sharpe, max_drawdown, len(changes), portfolio
+    )
+
+
+def expand_grid(param_grid: dict) -> list:
+    """
+    {'fast': [5, 10], 'slow': [50]} -> [{'fast': 5, 'slow': 50}, {'fast': 10, 'slow': 50}]
+    """
+    keys = list(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(param_grid[k] for k in keys))]
+
+
+_worker_data = {}
+
+
+def _init_worker(data: dict):
+    global _worker_data
+    _worker_data = data
+
+
+def _run_job(job: tuple) -> dict:
+    symbol, strategy, params, options = job
+    result = run_backtest(_worker_data[symbol], strategy, params, symbol=symbol, keep_details=False, **options)
+    return result.to_dict()
+
+
+def sweep(data: dict, strategy: str, param_grid: dict, processes: int = None, **options) -> list:
+    """
+    在進程池中對所有股票與參數組合執行回測，歷史數據只在每個進程初始化時傳送一次
+    data 為 {symbol: {'open': ..., 'close': ...}}
+    """
+    jobs = [(symbol, strategy, params, options) for symbol in data for params in expand_grid(param_grid)]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        _init_worker(data)
+        return [_run_job(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(data,)) as pool:
+        return list(pool.map(_run_job, jobs, chunksize=chunksize))
+
+
+async def load_history(db, symbols: list, interval: str = '1d') -> dict:
+    """
+    從 Candle 載入歷史K線並轉為 NumPy 陣列
+    """
+    history = {}
+    for row in await db.get_candles(symbols, interval):
+        bars = history.setdefault(row.stock.symbol, {k: [] for k in ('timestamp', 'open', 'high', 'low', 'close', 'volume')})
+        bars['timestamp'].append(row.start_time)
+        bars['open'].append(row.open)
+        bars['high'].append(row.high)
+        bars['low'].append(row.low)
+        bars['close'].append(row.close)
+        bars['volume'].append(row.volume)
+    for bars in history.values():
+        for key in ('open', 'high', 'low', 'close'):
+            bars[key] = np.array(bars[key], dtype=np.float64)
+        bars['volume'] = np.array(bars['volume'], dtype=np.int64)
+    return history
+
+
+class BacktestRequest(BaseModel):
+    symbol: str
+    strategy: str
+    params: dict = {}
+    interval: str = '1d'
+    initial_cash: float = 100000.0
+
+
+@router.post("")
+async def create_backtest(data: BacktestRequest, current_user: User = Depends(get_current_user)):
+    if data.strategy not in STRATEGIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown strategy, choose one of: {', '.join(STRATEGIES)}"
+        )
+    try:
+        validate_params(data.strategy, data.params)
+        validate_costs(data.initial_cash)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    history = await load_history(Database(), [data.symbol], data.interval)
+    if data.symbol not in history:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No price history for symbol"
+        )
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            None,
+            lambda: run_backtest(history[data.symbol], data.strategy, data.params,
+                                 symbol=data.symbol, initial_cash=data.initial_cash)
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    response = result.to_dict()
+    response["transactions"] = [
+        {"type": t.type, "quantity": t.quantity, "price": t.price, "timestamp": t.timestamp}
+        for t in result.portfolio.transactions
+    ] if result.portfolio else []
+    return response
@@ -0,0 +1,53 @@
+"""
+價格提醒索引基準測試：預設 2M 筆提醒，量測每秒可處理的價格更新數
+用法: python benchmarks/bench_alerts.py --alerts 2000000 --ticks 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import AlertIndex, PriceAlert
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the price alert index")
+    parser.add_argument('--alerts', type=int, default=2_000_000)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--ticks', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    alerts = []
+    for i in range(args.alerts):
+        direction = 'above' if i & 1 else 'below'
+        offset = round(rng.uniform(0.5, 50), 2)
+        level = 100.0 + offset if direction == 'above' else 100.0 - offset
+        alerts.append(PriceAlert(str(i), f"user{i % 10000}", symbols[i % args.symbols], level, direction))
+
+    index = AlertIndex()
+    start = time.perf_counter()
+    index.load(alerts)
+    print(f"Loaded {args.alerts} alerts in {time.perf_counter() - start:.2f}s")
+
+    prices = {symbol: 100.0 for symbol in symbols}
+    moves = [round(rng.gauss(0, 0.05), 2) for _ in range(args.ticks)]
+    fired = 0
+    start = time.perf_counter()
+    for i, move in enumerate(moves):
+        symbol = symbols[i % args.symbols]
+        old = prices[symbol]
+        price = max(0.01, round(old + move, 2))
+        prices[symbol] = price
+        fired += len(index.crossed(symbol, old, price))
+    elapsed = time.perf_counter() - start
+    print(f"Processed {args.ticks} ticks in {elapsed:.2f}s ({args.ticks / elapsed:,.0f} ticks/s), fired {fired} alerts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+回測引擎基準測試：預設 500 支股票、10 年日線，量測每秒可完成的回測數
+用法: python benchmarks/bench_backtest.py --symbols 500 --years 10 --processes 4
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backtest import TRADING_DAYS, sweep
+
+
+def synthetic_history(symbols: int, bars: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(symbols):
+        returns = rng.normal(0.0003, 0.02, bars)
+        close = 100.0 * np.exp(np.cumsum(returns))
+        opens = close * (1 + rng.normal(0, 0.002, bars))
+        data[f"SYM{i}"] = {
+            "open": opens,
+            "high": np.maximum(opens, close) * 1.01,
+            "low": np.minimum(opens, close) * 0.99,
+            "close": close,
+            "volume": rng.integers(1000, 100000, bars),
+        }
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized backtesting engine")
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--strategy', default='sma_crossover')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    data = synthetic_history(args.symbols, args.years * TRADING_DAYS, args.seed)
+    grid = {'fast': [5, 10, 20], 'slow': [50, 100]}
+
+    for processes in sorted({1, args.processes}):
+        start = time.perf_counter()
+        results = sweep(data, args.strategy, grid, processes=processes)
+        elapsed = time.perf_counter() - start
+        print(f"{processes} process(es): {len(results)} backtests in {elapsed:.2f}s "
+              f"({len(results) / elapsed:,.0f} backtests/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+時間戳基準測試：比較 datetime 物件與整數納秒在建立、排序比較與 JSON 序列化上的成本
+用法: python benchmarks/bench_clock.py --count 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import now_ns, to_datetime
+
+
+def measure(create, encode, count: int) -> tuple:
+    start = time.perf_counter()
+    stamps = [create() for _ in range(count)]
+    created = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sorted(reversed(stamps))
+    compared = time.perf_counter() - start
+
+    start = time.perf_counter()
+    json.dumps([encode(stamp) for stamp in stamps])
+    encoded = time.perf_counter() - start
+    return created, compared, encoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark datetime vs integer nanosecond timestamps")
+    parser.add_argument('--count', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    utc = timezone.utc
+    results = {
+        'datetime': measure(lambda: datetime.now(utc), datetime.isoformat, args.count),
+        'int64 ns': measure(now_ns, int, args.count),
+    }
+    for name, (created, compared, encoded) in results.items():
+        print(f"{name:>8}: create {created / args.count * 1e9:.0f}ns, sort {compared * 1000:.1f}ms, "
+              f"JSON {encoded * 1000:.1f}ms")
+    # API 邊界轉換的成本只在輸出時付出
+    start = time.perf_counter()
+    for _ in range(args.count):
+        to_datetime(now_ns())
+    print(f"boundary conversion: {(time.perf_counter() - start) / args.count * 1e9:.0f}ns per timestamp")
+
+
+if __name__ == '__main__':
+    main()
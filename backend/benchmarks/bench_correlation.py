@@ -0,0 +1,48 @@
+"""
+線上協方差基準測試：量測數千支股票時每根K線一次秩一更新的耗時與矩陣佔用的記憶體
+用法: python benchmarks/bench_correlation.py --symbols 3000 --updates 50 --dtype float32
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from correlation import EWCovariance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the online EW covariance")
+    parser.add_argument('--symbols', type=int, default=3000)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--dtype', choices=('float32', 'float64'), default='float32')
+    parser.add_argument('--subset', type=int, default=50, help="快照的股票數")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    estimator = EWCovariance(dtype=args.dtype, capacity=args.symbols)
+    symbols = [f"S{i:05d}" for i in range(args.symbols)]
+    for symbol in symbols:
+        estimator.column(symbol)
+    returns = rng.normal(0, 0.01, (args.updates, args.symbols))
+
+    start = time.perf_counter()
+    for r in returns:
+        estimator.update(r)
+    elapsed = time.perf_counter() - start
+    print(f"{args.symbols:,} symbols ({args.dtype}): {elapsed / args.updates * 1000:.1f}ms per bar update, "
+          f"matrix {estimator.cov.nbytes / 2**20:,.0f} MiB")
+
+    subset = list(rng.choice(symbols, args.subset, replace=False))
+    start = time.perf_counter()
+    for _ in range(100):
+        estimator.correlation(subset)
+    print(f"{args.subset}-symbol correlation snapshot: {(time.perf_counter() - start) * 10:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
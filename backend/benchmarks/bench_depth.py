@@ -0,0 +1,66 @@
+"""
+委託簿深度推送基準測試：對單一股票持續下單與撤單，量測含增量推送在內每秒可處理的委託簿更新數
+用法: python benchmarks/bench_depth.py --updates 500000 --flush-every 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from depth import DepthFeed, depth_topic
+from engine import MatchingEngine, Order
+from fixedpoint import to_ticks
+from streaming import Broadcaster
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark L2 depth diffs")
+    parser.add_argument('--updates', type=int, default=500_000)
+    parser.add_argument('--flush-every', type=int, default=100, help="每多少筆委託簿更新推送一次增量")
+    parser.add_argument('--subscribers', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = MatchingEngine()
+    broadcaster = Broadcaster()
+    queues = [broadcaster.subscribe(depth_topic("SYM"), asyncio.Queue(maxsize=1000))
+              for _ in range(args.subscribers)]
+    feed = DepthFeed(engine, broadcaster.publish)
+
+    ops = []
+    for i in range(args.updates):
+        side = rng.choice(('buy', 'sell'))
+        # 大部分委託掛在中間價兩側，少數越過中間價造成成交
+        offset = abs(rng.gauss(0, 1)) * (1 if side == 'sell' else -1)
+        if rng.random() < 0.05:
+            offset = -offset
+        ops.append((str(i), side, rng.randint(1, 100), to_ticks(round(100 + offset, 2)), rng.random() < 0.3))
+
+    start = time.perf_counter()
+    for i, (order_id, side, quantity, price, cancel) in enumerate(ops):
+        if cancel and engine.orders:
+            engine.cancel(next(iter(engine.orders)))
+        else:
+            engine.submit(Order(order_id, "u", "SYM", side, quantity, price))
+        if i % args.flush_every == 0:
+            feed.flush()
+    feed.flush()
+    elapsed = time.perf_counter() - start
+    print(f"{args.updates / elapsed:,.0f} book updates/s, {feed.sequences['SYM']:,} diffs, "
+          f"{args.subscribers} subscribers, queue depth {queues[0].qsize()}")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        feed.snapshots.clear()
+        feed.snapshot("SYM")
+    print(f"Uncached snapshot of {len(engine.books['SYM'].prices['buy']) + len(engine.books['SYM'].prices['sell'])} "
+          f"levels: {(time.perf_counter() - start) * 1000:.1f}us")
+
+
+if __name__ == '__main__':
+    main()
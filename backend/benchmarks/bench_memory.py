@@ -0,0 +1,126 @@
+"""
+熱路徑物件記憶體基準測試：比較 __slots__ 記錄與普通物件 (__dict__) 的單個物件大小，
+並以同一批委託比較物件池與直接構造 Order 時每筆委託的記憶體分配
+用法: python benchmarks/bench_memory.py --orders 200000 --users 1000 --symbols 20
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Fill, MatchingEngine, Order
+from ledger import AccountLedger, CashAccount, Reservation
+from models import User
+from prices import PriceFeed
+from trades import TradeRecord
+
+INITIAL_CASH = 10 ** 13
+INITIAL_SHARES = 10 ** 7
+
+
+class _Plain:
+    """
+    沒有 __slots__ 的對照物件
+    """
+
+    def __init__(self, source, fields):
+        for field in fields:
+            setattr(self, field, getattr(source, field))
+
+
+def deep_size(obj) -> int:
+    """
+    物件本身加上屬性字典 (如有) 的大小，不含屬性值
+    """
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def object_sizes() -> list:
+    maker = Order("o1", "u1", "AAPL", "sell", 10, 1000000)
+    taker = Order("o2", "u2", "AAPL", "buy", 10, 1000000)
+    samples = [
+        maker,
+        Fill("AAPL", 1000000, 10, taker, maker),
+        Reservation("o1", "u1", "AAPL", "buy", 10, 1000000),
+        CashAccount("u1", INITIAL_CASH, {"AAPL": 10}),
+        User("id", "name", "user@example.com"),
+        TradeRecord("t1", "buy", "AAPL", 10, 1000000, time.time()),
+    ]
+    rows = []
+    for sample in samples:
+        fields = type(sample).__slots__
+        rows.append((type(sample).__name__, deep_size(sample), deep_size(_Plain(sample, fields))))
+    return rows
+
+
+def make_ops(count: int, users: int, symbols: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [(str(i), f"u{rng.randrange(users)}", f"SYM{rng.randrange(symbols)}", rng.choice(('buy', 'sell')),
+             rng.randint(1, 100), 1000000 + rng.randint(-50, 50) * 100)
+            for i in range(count)]
+
+
+def run(ops: list, users: int, symbols: int, pooled: bool) -> tuple:
+    feed = PriceFeed()
+    ledger = AccountLedger(feed)
+    engine = MatchingEngine(ledger, feed)
+    engine.add_fill_listener(lambda fills: None)
+    for i in range(users):
+        ledger.load_account(f"u{i}", INITIAL_CASH, {f"SYM{s}": INITIAL_SHARES for s in range(symbols)},
+                            max_position=10 ** 12)
+    # 先跑一半預熱委託簿與物件池，只統計後一半
+    half = len(ops) // 2
+    gc.collect()
+    tracemalloc.start()
+    start_blocks = start_created = start_reused = 0
+    start = 0.0
+    for i, op in enumerate(ops):
+        if i == half:
+            gc.collect()
+            tracemalloc.reset_peak()
+            start_blocks = sys.getallocatedblocks()
+            start_created, start_reused = engine.pool.created, engine.pool.reused
+            start = time.perf_counter()
+        order = engine.new_order(*op) if pooled else Order(*op)
+        engine.submit(order)
+        if pooled:
+            engine.release(order)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - start_blocks
+    created = engine.pool.created - start_created if pooled else len(ops) - half
+    return elapsed, peak, blocks, created, engine.pool.reused - start_reused
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-object memory and per-order allocations")
+    parser.add_argument('--orders', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'record':>12} {'slots':>7} {'dict':>7}")
+    for name, slotted, plain in object_sizes():
+        print(f"{name:>12} {slotted:>6}B {plain:>6}B")
+
+    ops = make_ops(args.orders, args.users, args.symbols, args.seed)
+    measured = args.orders - args.orders // 2
+    for name, pooled in (('new', False), ('pooled', True)):
+        elapsed, peak, blocks, created, reused = run(ops, args.users, args.symbols, pooled)
+        print(f"{name:>6}: {measured / elapsed:,.0f} orders/s, peak {peak / measured:.1f}B/order, "
+              f"live blocks {blocks / measured:+.2f}/order, "
+              f"Order allocations {created / measured:.2f}/order (reused {reused:,})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+期權重新定價基準測試：以隨機行權價與到期日建立期權鏈，報告每次標的跳價的重新定價耗時
+用法: python benchmarks/bench_options.py --contracts 100000 --chains 1 --american-puts 0
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from options import OptionChain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized option chain repricing")
+    parser.add_argument('--contracts', type=int, default=100_000)
+    parser.add_argument('--chains', type=int, default=1)
+    parser.add_argument('--american-puts', type=int, default=0,
+                        help="number of contracts per chain priced as American puts (binomial)")
+    parser.add_argument('--ticks', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    now = time.time()
+    per_chain = args.contracts // args.chains
+    chains = []
+    for c in range(args.chains):
+        chain = OptionChain(f"S{c}")
+        strikes = np.round(rng.uniform(50, 150, per_chain), 1)
+        expiries = now + rng.uniform(1, 365, per_chain) * 86400
+        is_call = rng.random(per_chain) < 0.5
+        chain.add([(f"S{c}-{i}", bool(is_call[i]), float(strikes[i]), float(expiries[i]))
+                   for i in range(per_chain)])
+        chains.append(chain)
+    american = None
+    if args.american_puts:
+        american = OptionChain("A", style='american')
+        expiries = now + rng.uniform(1, 365, args.american_puts) * 86400
+        american.add([(f"A-{i}", False, float(strike), float(expiry)) for i, (strike, expiry) in
+                      enumerate(zip(rng.uniform(50, 150, args.american_puts), expiries))])
+
+    spots = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.001, args.ticks)))
+    timings = []
+    for tick, spot in enumerate(spots):
+        start = time.perf_counter()
+        for chain in chains:
+            chain.reprice(float(spot), now + tick)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    print(f"{len(chains) * per_chain:,} contracts in {len(chains)} chains: "
+          f"median {np.median(timings):.2f} ms/tick, p99 {np.percentile(timings, 99):.2f} ms/tick "
+          f"({len(chains) * per_chain / np.median(timings) * 1000:,.0f} contracts/s)")
+
+    if american is not None:
+        start = time.perf_counter()
+        american.reprice(100.0, now)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{args.american_puts:,} American puts (binomial): {elapsed:.2f} ms/tick")
+
+
+if __name__ == '__main__':
+    main()
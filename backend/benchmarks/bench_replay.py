@@ -0,0 +1,52 @@
+"""
+歷史回放基準測試：以極高倍速回放合成 tick，量測經過 PriceFeed 與條件單索引的發布速度
+用法: python benchmarks/bench_replay.py --ticks 1000000 --symbols 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import NANOS_PER_SECOND
+from fixedpoint import PRICE_SCALE, to_ticks
+from prices import PriceFeed
+from replay import ReplayDriver, TickTape
+from triggers import ConditionalOrder, TriggerIndex
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark historical market replay")
+    parser.add_argument('--ticks', type=int, default=1_000_000)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--stops', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    times = np.arange(args.ticks, dtype=np.int64) * (NANOS_PER_SECOND // 100)
+    ids = rng.integers(0, args.symbols, args.ticks)
+    prices = np.round(100.0 + np.cumsum(rng.normal(0, 0.01, args.ticks)), 2)
+    prices = np.rint(prices * PRICE_SCALE).astype(np.int64)
+    tape = TickTape(times, ids, prices, [f"SYM{i}" for i in range(args.symbols)])
+
+    feed = PriceFeed()
+    index = TriggerIndex(on_trigger=lambda order: None)
+    for i in range(args.stops):
+        symbol = f"SYM{i % args.symbols}"
+        index.add(ConditionalOrder(str(i), 'u', symbol, 'sell', 1, 'stop', stop_price=to_ticks(50.0)), to_ticks(100.0))
+    feed.add_listener(index.on_price)
+
+    driver = ReplayDriver(tape, feed, speed=1e9)
+    start = time.perf_counter()
+    await driver.run()
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {driver.published} ticks in {elapsed:.2f}s ({driver.published / elapsed:,.0f} ticks/s)")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+股票搜索索引基準測試：建立合成股票清單，量測自動完成查詢的吞吐量與延遲
+用法: python benchmarks/bench_search.py --stocks 20000 --queries 100000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchIndex
+
+WORDS = ['global', 'bank', 'energy', 'tech', 'holdings', 'pharma', 'motors', 'capital',
+         'systems', 'foods', 'semiconductor', 'airlines', 'realty', 'networks', 'mining']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stock search index")
+    parser.add_argument('--stocks', type=int, default=20_000)
+    parser.add_argument('--queries', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = SearchIndex()
+    start = time.perf_counter()
+    stocks = []
+    for i in range(args.stocks):
+        symbol = ''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 5))) + str(i)
+        name = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + f" {symbol.lower()}"
+        stocks.append((symbol, name))
+        index.upsert(symbol, name, rng.randint(0, 10_000))
+    print(f"Indexed {args.stocks} stocks in {time.perf_counter() - start:.2f}s")
+
+    queries = []
+    for _ in range(args.queries):
+        symbol, name = rng.choice(stocks)
+        text = rng.choice((symbol, name))
+        query = text[:rng.randint(1, min(len(text), 8))]
+        if rng.random() < 0.1 and len(query) > 3:
+            query = query[:-2] + rng.choice(string.ascii_lowercase) + query[-1]
+        queries.append(query)
+
+    # 第一輪包含節點熱門結果的懶惰建立，第二輪為穩定狀態 (清空查詢緩存)
+    for label in ('cold', 'warm'):
+        index.cache.clear()
+        latencies = np.empty(len(queries))
+        start = time.perf_counter()
+        for i, query in enumerate(queries):
+            t = time.perf_counter()
+            index.search(query, 10)
+            latencies[i] = time.perf_counter() - t
+        elapsed = time.perf_counter() - start
+        p50, p99 = np.percentile(latencies * 1e6, [50, 99])
+        print(f"{label}: {len(queries) / elapsed:,.0f} queries/s, p50 {p50:.0f}us, p99 {p99:.0f}us")
+
+if __name__ == '__main__':
+    main()
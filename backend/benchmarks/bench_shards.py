@@ -0,0 +1,70 @@
+"""
+撮合分片擴展性基準測試：把同一批委託按股票分散到 1..N 個進程，量測每秒撮合的委託數
+用法: python benchmarks/bench_shards.py --orders 400000 --shards 1,2,4,8 --batch 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import MatchingEngine, Order
+from fixedpoint import to_ticks
+from shards import ShardPool, order_to_wire
+
+
+def make_orders(count: int, symbols: int, seed: int) -> list:
+    rng = random.Random(seed)
+    orders = []
+    for i in range(count):
+        side = rng.choice(('buy', 'sell'))
+        price = to_ticks(round(100 + rng.gauss(0, 0.5), 2))
+        orders.append(Order(str(i), "u", f"SYM{rng.randrange(symbols)}", side, rng.randint(1, 100), price))
+    return orders
+
+
+def run_pool(shards: int, orders: list, batch: int) -> float:
+    pool = ShardPool(shards)
+    pool.start()
+    try:
+        start = time.perf_counter()
+        for offset in range(0, len(orders), batch):
+            batches = {}
+            for order in orders[offset:offset + batch]:
+                batches.setdefault(pool.shard_for(order.symbol), []).append(('submit', order_to_wire(order)))
+            pool.call_many(batches)
+        return len(orders) / (time.perf_counter() - start)
+    finally:
+        pool.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded matching across processes")
+    parser.add_argument('--orders', type=int, default=400_000)
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--shards', default=None, help="逗號分隔的分片數，預設 1 到 CPU 核數")
+    parser.add_argument('--batch', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    counts = [int(c) for c in args.shards.split(',')] if args.shards else sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    orders = make_orders(args.orders, args.symbols, args.seed)
+
+    engine = MatchingEngine()
+    start = time.perf_counter()
+    for order in make_orders(args.orders, args.symbols, args.seed):
+        engine.submit(order)
+    baseline = args.orders / (time.perf_counter() - start)
+    print(f"{cores} CPU(s) available")
+    print(f"in-process: {baseline:,.0f} orders/s")
+
+    for count in counts:
+        rate = run_pool(count, orders, args.batch)
+        print(f"{count} shard(s): {rate:,.0f} orders/s ({rate / baseline:.2f}x in-process)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+條件單觸發索引基準測試：預設 1M 筆掛單，量測每秒可處理的價格更新數
+用法: python benchmarks/bench_triggers.py --orders 1000000 --ticks 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from triggers import ConditionalOrder, TriggerIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stop order trigger index")
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=100_000)
+    parser.add_argument('--target-rate', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    prices = {symbol: 100.0 for symbol in symbols}
+    index = TriggerIndex()
+    for symbol in symbols:
+        index.on_price(symbol, None, 100.0)
+
+    start = time.perf_counter()
+    for i in range(args.orders):
+        symbol = symbols[i % args.symbols]
+        side = 'buy' if i & 1 else 'sell'
+        if i % 4 == 0:
+            order = ConditionalOrder(str(i), "bench", symbol, side, 1, 'trailing_stop',
+                                     trail=round(rng.uniform(1, 30), 2))
+        else:
+            offset = round(rng.uniform(0.5, 50), 2)
+            stop = 100.0 + offset if side == 'buy' else 100.0 - offset
+            order = ConditionalOrder(str(i), "bench", symbol, side, 1, stop_price=stop)
+        index.add(order)
+    load_time = time.perf_counter() - start
+    print(f"Loaded {args.orders} resting stops in {load_time:.2f}s")
+
+    moves = [round(rng.gauss(0, 0.05), 2) for _ in range(args.ticks)]
+    fired = 0
+    start = time.perf_counter()
+    for i, move in enumerate(moves):
+        symbol = symbols[i % args.symbols]
+        old = prices[symbol]
+        price = max(0.01, round(old + move, 2))
+        prices[symbol] = price
+        fired += len(index.on_price(symbol, old, price))
+    elapsed = time.perf_counter() - start
+
+    rate = args.ticks / elapsed
+    print(f"Processed {args.ticks} ticks in {elapsed:.2f}s ({rate:,.0f} ticks/s), fired {fired} orders")
+    print(f"Target {args.target_rate:,} ticks/s: {'OK' if rate >= args.target_rate else 'BELOW TARGET'}")
+
+
+if __name__ == '__main__':
+    main()
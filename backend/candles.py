@@ -0,0 +1,125 @@
+import asyncio
+import os
+from typing import Callable
+from clock import NANOS_PER_SECOND, now_ns, to_datetime
+from fixedpoint import from_ticks
+
+CANDLE_INTERVAL = os.getenv('CANDLE_INTERVAL', '1m')
+CANDLE_FLUSH_INTERVAL = float(os.getenv('CANDLE_FLUSH_INTERVAL', '5'))
+
+INTERVAL_SECONDS = {
+    '1m': 60,
+    '5m': 300,
+    '15m': 900,
+    '1h': 3600,
+    '1d': 86400,
+}
+
+
+class Bar:
+    """
+    start 為K線起始時間 (整數納秒)，價格為小數
+    """
+    __slots__ = ('symbol', 'interval', 'start', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, symbol: str, interval: str, start: int, price: float, volume: int = 0):
+        self.symbol = symbol
+        self.interval = interval
+        self.start = start
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.volume = volume
+
+    def update(self, price: float, volume: int = 0):
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += volume
+
+    def to_row(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "interval": self.interval,
+            "start_time": to_datetime(self.start).isoformat(),
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume,
+        }
+
+
+class CandleAggregator:
+    """
+    由價格更新與成交即時聚合K線，K線收盤時通知訂閱者並緩存待寫入數據庫
+    K線供指標與風險分析使用，價格由 tick 換算為小數
+    訂閱者簽名為 listener(bar)，時間取自市場時鐘的整數納秒
+    """
+
+    def __init__(self, interval: str = CANDLE_INTERVAL, clock: Callable = now_ns):
+        if interval not in INTERVAL_SECONDS:
+            raise ValueError(f"Unknown interval: {interval}")
+        self.interval = interval
+        self.nanos = INTERVAL_SECONDS[interval] * NANOS_PER_SECOND
+        self.clock = clock
+        self.bars = {}
+        self.closed = []
+        self.listeners = []
+
+    def add_listener(self, listener: Callable):
+        self.listeners.append(listener)
+
+    def _close(self, bar: Bar):
+        self.closed.append(bar)
+        for listener in self.listeners:
+            try:
+                listener(bar)
+            except Exception as e:
+                print(f"Candle listener error: {e}")
+
+    def update(self, symbol: str, price: float, volume: int = 0):
+        now = self.clock()
+        start = now - now % self.nanos
+        bar = self.bars.get(symbol)
+        if bar is not None and bar.start == start:
+            bar.update(price, volume)
+            return
+        if bar is not None:
+            self._close(bar)
+        self.bars[symbol] = Bar(symbol, self.interval, start, price, volume)
+
+    def on_price(self, symbol: str, old_price, new_price: int):
+        self.update(symbol, from_ticks(new_price))
+
+    def on_fills(self, fills: list):
+        for fill in fills:
+            self.update(fill.symbol, from_ticks(fill.price), fill.quantity)
+
+    def close_due(self) -> int:
+        """
+        收盤所有已過期但尚未收到下一筆價格的K線
+        """
+        now = self.clock()
+        due = [symbol for symbol, bar in self.bars.items() if bar.start + self.nanos <= now]
+        for symbol in due:
+            self._close(self.bars.pop(symbol))
+        return len(due)
+
+    async def flush(self, db):
+        if not self.closed:
+            return
+        bars, self.closed = self.closed, []
+        await db.upsert_candles([bar.to_row() for bar in bars])
+
+    async def run(self, db, interval: float = CANDLE_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.close_due()
+                await self.flush(db)
+            except Exception as e:
+                print(f"Candle flush error: {e}")
@@ -0,0 +1,140 @@
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+# 熱路徑上的時間一律為 epoch 起算的整數納秒 (int64)，datetime 只在 API 與數據庫邊界轉換
+NANOS_PER_SECOND = 1_000_000_000
+NANOS_PER_MICRO = 1_000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class RealClock:
+    """
+    牆上時間只在建立時讀取一次，之後以 monotonic_ns 推進，系統校時不會讓時間倒退
+    """
+
+    def __init__(self):
+        self._anchor_epoch = time.time_ns()
+        self._anchor_mono = time.monotonic_ns()
+
+    def now(self) -> int:
+        return self._anchor_epoch + time.monotonic_ns() - self._anchor_mono
+
+
+class SimulatedClock:
+    """
+    可暫停、變速與跳轉的模擬時鐘：sim = anchor_sim + (wall - anchor_wall) * speed
+    """
+
+    def __init__(self, start: int, speed: float = 1.0):
+        if speed <= 0:
+            raise ValueError("Speed must be positive")
+        self.speed = speed
+        self.paused = True
+        self._anchor_sim = start
+        self._anchor_wall = time.monotonic_ns()
+
+    def now(self) -> int:
+        if self.paused:
+            return self._anchor_sim
+        return self._anchor_sim + int((time.monotonic_ns() - self._anchor_wall) * self.speed)
+
+    def _reanchor(self, sim: int):
+        self._anchor_sim = sim
+        self._anchor_wall = time.monotonic_ns()
+
+    def pause(self):
+        self._reanchor(self.now())
+        self.paused = True
+
+    def resume(self):
+        self._reanchor(self.now())
+        self.paused = False
+
+    def set_speed(self, speed: float):
+        if speed <= 0:
+            raise ValueError("Speed must be positive")
+        self._reanchor(self.now())
+        self.speed = speed
+
+    def seek(self, sim: int):
+        self._reanchor(sim)
+
+
+class ManualClock:
+    """
+    只在調用 advance/set 時前進的時鐘，供回測與測試逐步推進
+    """
+
+    def __init__(self, start: int = 0):
+        self.time = start
+
+    def now(self) -> int:
+        return self.time
+
+    def advance(self, nanos: int) -> int:
+        self.time += nanos
+        return self.time
+
+    def set(self, nanos: int):
+        self.time = nanos
+
+
+# 系統時鐘永遠是真實時間 (冪等窗口、令牌過期等)；市場時鐘可在獨立進程的回測或測試中換成模擬時鐘
+system_clock = RealClock()
+_market_clock = system_clock
+
+
+def now_ns() -> int:
+    """
+    市場時間：撮合、K線與推送消息的時間戳
+    """
+    return _market_clock.now()
+
+
+def get_clock():
+    return _market_clock
+
+
+def use_clock(clock=None):
+    """
+    切換市場時鐘並返回原來的時鐘，None 恢復為系統時鐘
+    """
+    global _market_clock
+    previous, _market_clock = _market_clock, clock or system_clock
+    return previous
+
+
+def to_nanos(seconds: Optional[float]) -> Optional[int]:
+    if seconds is None:
+        return None
+    return int(round(seconds * NANOS_PER_SECOND))
+
+
+def to_seconds(nanos: Optional[int]) -> Optional[float]:
+    if nanos is None:
+        return None
+    return nanos / NANOS_PER_SECOND
+
+
+def from_datetime(value: Optional[datetime]) -> Optional[int]:
+    """
+    datetime 精確轉為納秒 (不經過浮點秒)，沒有時區的視為 UTC
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * NANOS_PER_SECOND + delta.microseconds * NANOS_PER_MICRO
+
+
+def to_datetime(nanos: Optional[int]) -> Optional[datetime]:
+    """
+    納秒轉為 UTC datetime，截斷到微秒
+    """
+    if nanos is None:
+        return None
+    seconds, remainder = divmod(nanos, NANOS_PER_SECOND)
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=remainder // NANOS_PER_MICRO)
@@ -0,0 +1,229 @@
+import asyncio
+import math
+from datetime import date
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from auth import get_operator_user
+from database import Database
+from fixedpoint import to_ticks
+from market import engine, ledger, price_feed, settlement, shard_pool, trigger_index
+from models import User
+
+router = APIRouter()
+
+ACTION_TYPES = ('split', 'reverse_split', 'dividend')
+
+
+class CorporateAction:
+    """
+    拆股 new_shares:old_shares (例如 2:1)，合股例如 1:10，現金股利為每股 amount
+    """
+
+    def __init__(self, symbol: str, action_type: str, ex_date: date,
+                 new_shares: int = None, old_shares: int = None, amount: float = None):
+        if action_type not in ACTION_TYPES:
+            raise ValueError(f"Unknown action type: {action_type}")
+        if action_type == 'dividend':
+            if amount is None or not math.isfinite(amount) or amount <= 0:
+                raise ValueError("Dividend requires a positive amount")
+        else:
+            if not new_shares or not old_shares or new_shares <= 0 or old_shares <= 0:
+                raise ValueError("Split requires positive share ratio")
+            if (action_type == 'split') != (new_shares > old_shares):
+                raise ValueError("Share ratio does not match action type")
+        self.symbol = symbol
+        self.action_type = action_type
+        self.ex_date = ex_date
+        self.new_shares = new_shares
+        self.old_shares = old_shares
+        self.amount = amount
+
+    @property
+    def action_key(self) -> str:
+        return f"{self.symbol}:{self.action_type}:{self.ex_date.isoformat()}"
+
+    @property
+    def price_factor(self) -> Optional[float]:
+        if self.action_type == 'dividend':
+            return None
+        return self.old_shares / self.new_shares
+
+
+def split_positions(quantities, average_prices, new_shares: int, old_shares: int, price: int):
+    """
+    向量化計算拆股後的持倉：股數按比例取整，成本總額不變，
+    不足一股的部分以拆股後價格折算為現金；價格與現金為整數 tick，四捨五入
+    返回 (新股數, 新均價, 零股現金)
+    """
+    quantities = np.asarray(quantities, dtype=np.int64)
+    average_prices = np.asarray(average_prices, dtype=np.int64)
+    signs = np.sign(quantities)
+    scaled = np.abs(quantities) * new_shares
+    new_quantities = signs * (scaled // old_shares)
+    fractional = signs * (scaled % old_shares) / old_shares
+    new_prices = np.rint(average_prices * old_shares / new_shares).astype(np.int64)
+    cash_in_lieu = np.rint(fractional * price * old_shares / new_shares).astype(np.int64)
+    return new_quantities, new_prices, cash_in_lieu
+
+
+def dividend_payments(quantities, amount: int):
+    """
+    向量化計算每筆持倉應收 (空頭為應付) 的現金股利，amount 為每股 tick
+    """
+    return np.asarray(quantities, dtype=np.int64) * amount
+
+
+class CorporateActionProcessor:
+    """
+    批量處理拆股、合股與現金股利：持倉在記憶體中以 NumPy 一次計算，
+    數據庫寫入分批在單一事務中完成，並同步調整記憶體中的掛單與資金快取
+    處理期間暫停該股票的撮合，並先把已撮合的成交寫入數據庫，讀取的持倉不會漏掉或之後再被未調整的成交覆蓋
+    """
+
+    def __init__(self, db, ledger=None, trigger_index=None, price_feed=None, batch_size: int = 5000,
+                 engine=None, shard_pool=None, settlement=None):
+        self.db = db
+        self.ledger = ledger
+        self.trigger_index = trigger_index
+        self.price_feed = price_feed
+        self.batch_size = batch_size
+        self.engine = engine
+        self.shard_pool = shard_pool
+        self.settlement = settlement
+
+    async def apply(self, action: CorporateAction) -> Optional[dict]:
+        """
+        執行公司行動，已處理過的返回 None，該股票的成交無法寫入數據庫時拋出 RuntimeError
+        """
+        if await self.db.get_corporate_action(action.action_key):
+            return None
+        if self.engine:
+            self.engine.halted.add(action.symbol)
+        try:
+            if self.shard_pool:
+                await self.shard_pool.drain()
+            if self.settlement:
+                await self.settlement.flush(self.db)
+                if any(fill.symbol == action.symbol for fill in self.settlement.buffer):
+                    raise RuntimeError(f"Pending fills for {action.symbol} could not be settled")
+            return await self._apply(action)
+        finally:
+            if self.engine:
+                self.engine.halted.discard(action.symbol)
+
+    async def _apply(self, action: CorporateAction) -> dict:
+        rows = await self.db.get_symbol_positions(action.symbol)
+        ids = [str(row.id) for row in rows]
+        user_ids = [str(row.user.id) for row in rows]
+        quantities = np.array([row.quantity for row in rows], dtype=np.int64)
+        average_prices = np.array([row.average_price for row in rows], dtype=np.int64)
+
+        positions = []
+        removed = []
+        if action.action_type == 'dividend':
+            cash = dividend_payments(quantities, to_ticks(action.amount))
+        else:
+            price = self.price_feed.last_price(action.symbol) if self.price_feed else None
+            if price is None:
+                stocks = {stock.symbol: stock.current_price for stock in await self.db.get_stocks()}
+                price = stocks.get(action.symbol, 0)
+            new_quantities, new_prices, cash = split_positions(
+                quantities, average_prices, action.new_shares, action.old_shares, price
+            )
+            for i in range(len(ids)):
+                if new_quantities[i] == 0:
+                    removed.append(ids[i])
+                else:
+                    positions.append({
+                        "id": ids[i],
+                        "quantity": int(new_quantities[i]),
+                        "average_price": int(new_prices[i]),
+                    })
+
+        payments = [
+            {"user_id": user_ids[i], "amount": int(cash[i])}
+            for i in np.flatnonzero(cash)
+        ]
+
+        # 記憶體中的掛單只在寫入成功後調整，這裡先計算數量供審計使用
+        orders = 0
+        if action.action_type != 'dividend':
+            if self.trigger_index:
+                orders += sum(1 for o in self.trigger_index.orders.values() if o.symbol == action.symbol)
+            if self.ledger:
+                orders += sum(1 for r in self.ledger.reservations.values() if r.symbol == action.symbol)
+
+        record = {
+            "action_key": action.action_key,
+            "symbol": action.symbol,
+            "action_type": action.action_type,
+            "ex_date": action.ex_date,
+            "new_shares": action.new_shares,
+            "old_shares": action.old_shares,
+            "amount": action.amount,
+            "positions_adjusted": len(rows),
+            "orders_adjusted": orders,
+            "cash_paid": int(cash.sum()) if len(cash) else 0,
+        }
+        candles = await self.db.apply_corporate_action(
+            record, positions, removed, payments, action.price_factor, self.batch_size
+        )
+
+        if self.ledger:
+            for payment in payments:
+                account = self.ledger.get_account(payment["user_id"])
+                if account:
+                    account.cash += payment["amount"]
+        if action.action_type != 'dividend':
+            if self.trigger_index:
+                self.trigger_index.apply_split(action.symbol, action.new_shares, action.old_shares)
+            # 委託簿中的掛單先調整，數量變為 0 的撤銷並釋放凍結，其餘凍結再由 ledger 按同樣規則調整
+            if self.shard_pool:
+                await self.shard_pool.apply_split(action.symbol, action.new_shares, action.old_shares)
+            if self.engine:
+                self.engine.apply_split(action.symbol, action.new_shares, action.old_shares)
+            if self.ledger:
+                self.ledger.apply_split(action.symbol, action.new_shares, action.old_shares)
+            price = self.price_feed.last_price(action.symbol) if self.price_feed else None
+            if price is not None:
+                self.price_feed.prices[action.symbol] = round(price * action.price_factor)
+
+        record["candles_adjusted"] = candles
+        return record
+
+
+class CorporateActionCreate(BaseModel):
+    symbol: str
+    action_type: str
+    ex_date: date
+    new_shares: Optional[int] = None
+    old_shares: Optional[int] = None
+    amount: Optional[float] = None
+
+
+# 同一時間只處理一個公司行動，避免兩次調整交錯
+_apply_lock = asyncio.Lock()
+
+
+@router.post("")
+async def apply_corporate_action(data: CorporateActionCreate, current_user: User = Depends(get_operator_user)):
+    """
+    執行拆股、合股或現金股利，同步調整主市場的持倉、掛單、條件單與資金快取
+    """
+    try:
+        action = CorporateAction(data.symbol, data.action_type, data.ex_date,
+                                 data.new_shares, data.old_shares, data.amount)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    processor = CorporateActionProcessor(Database(), ledger, trigger_index, price_feed,
+                                         engine=engine, shard_pool=shard_pool, settlement=settlement)
+    async with _apply_lock:
+        try:
+            record = await processor.apply(action)
+        except RuntimeError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if record is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Corporate action already applied")
+    return record
@@ -0,0 +1,157 @@
+import os
+from typing import Optional
+import numpy as np
+from backtest import load_history
+
+# 指數加權的半衰期 (K線根數)、協方差矩陣的存儲精度，以及啟動時用於預熱的K線數
+CORRELATION_HALFLIFE = float(os.getenv('CORRELATION_HALFLIFE', '60'))
+CORRELATION_DTYPE = os.getenv('CORRELATION_DTYPE', 'float64')
+CORRELATION_PRIME_BARS = int(os.getenv('CORRELATION_PRIME_BARS', '500'))
+
+# 秩一更新按行分塊，臨時陣列最多 BLOCK_ROWS x N
+BLOCK_ROWS = 256
+
+
+class EWCovariance:
+    """
+    指數加權的線上均值與協方差：每期收益率向量 r 以一次秩一更新併入
+        d = r - mean;  mean += a * d;  cov = (1 - a) * (cov + a * d d^T)
+    成本 O(N^2)，與歷史長度無關；協方差可用 float32 存儲以支撐數千支股票
+    """
+
+    def __init__(self, halflife: float = CORRELATION_HALFLIFE, dtype: str = CORRELATION_DTYPE,
+                 capacity: int = 64):
+        self.alpha = 1.0 - 0.5 ** (1.0 / halflife)
+        self.dtype = np.dtype(dtype)
+        self.columns = {}
+        self.symbols = []
+        self.mean = np.zeros(capacity)
+        self.cov = np.zeros((capacity, capacity), dtype=self.dtype)
+        self.updates = 0
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def column(self, symbol: str) -> int:
+        index = self.columns.get(symbol)
+        if index is None:
+            index = len(self.symbols)
+            if index == len(self.mean):
+                self._grow(index * 2)
+            self.columns[symbol] = index
+            self.symbols.append(symbol)
+        return index
+
+    def _grow(self, capacity: int):
+        size = len(self.symbols)
+        mean = np.zeros(capacity)
+        mean[:size] = self.mean[:size]
+        cov = np.zeros((capacity, capacity), dtype=self.dtype)
+        cov[:size, :size] = self.cov[:size, :size]
+        self.mean, self.cov = mean, cov
+
+    def update(self, returns: np.ndarray):
+        """
+        併入一期收益率，returns 按 column 順序排列，長度不足的部分視為 0
+        """
+        size = len(self.symbols)
+        r = np.zeros(size)
+        r[:len(returns)] = returns
+        a = self.alpha
+        d = r - self.mean[:size]
+        self.mean[:size] += a * d
+        scaled = (a * d).astype(self.dtype)
+        d = d.astype(self.dtype)
+        keep = self.dtype.type(1.0 - a)
+        for start in range(0, size, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, size)
+            block = self.cov[start:stop, :size]
+            block += np.outer(scaled[start:stop], d)
+            block *= keep
+        self.updates += 1
+
+    def _indices(self, symbols: Optional[list]) -> tuple:
+        if symbols is None:
+            return list(self.symbols), np.arange(len(self.symbols))
+        known = [symbol for symbol in symbols if symbol in self.columns]
+        return known, np.array([self.columns[symbol] for symbol in known], dtype=np.int64)
+
+    def covariance(self, symbols: list = None) -> tuple:
+        """
+        返回 (股票列表, float64 協方差子矩陣)，未知的股票被略去
+        """
+        known, indices = self._indices(symbols)
+        return known, self.cov[np.ix_(indices, indices)].astype(np.float64)
+
+    def correlation(self, symbols: list = None) -> tuple:
+        known, cov = self.covariance(symbols)
+        std = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        corr = np.clip(np.nan_to_num(corr, nan=0.0, posinf=0.0, neginf=0.0), -1.0, 1.0)
+        np.fill_diagonal(corr, np.where(std > 0, 1.0, 0.0))
+        return known, corr
+
+
+class CorrelationTracker:
+    """
+    由K線收盤驅動 EWCovariance：同一期 (相同開始時間) 的K線收益率先暫存，
+    下一期的第一根K線到達時以一個向量整體更新，該期沒有K線的股票收益率為 0
+    """
+
+    def __init__(self, estimator: EWCovariance = None):
+        self.estimator = estimator or EWCovariance()
+        self.last_close = {}
+        self.period = None
+        self.pending = {}
+
+    def on_bar(self, bar):
+        if self.period is not None and bar.start > self.period:
+            self.commit()
+        self.period = bar.start if self.period is None else max(self.period, bar.start)
+        previous = self.last_close.get(bar.symbol)
+        self.last_close[bar.symbol] = bar.close
+        self.estimator.column(bar.symbol)
+        if previous:
+            self.pending[bar.symbol] = bar.close / previous - 1.0
+
+    def commit(self) -> bool:
+        if not self.pending:
+            return False
+        returns = np.zeros(len(self.estimator))
+        for symbol, value in self.pending.items():
+            returns[self.estimator.columns[symbol]] = value
+        self.pending = {}
+        self.estimator.update(returns)
+        return True
+
+    def prime(self, history: dict, bars: int = CORRELATION_PRIME_BARS) -> int:
+        """
+        以歷史K線 {symbol: {'timestamp': [...], 'close': array}} 按時間對齊後逐期更新，返回更新期數
+        """
+        periods = sorted({ts for data in history.values() for ts in data['timestamp']})[-(bars + 1):]
+        if len(periods) < 2:
+            return 0
+        position = {ts: i for i, ts in enumerate(periods)}
+        closes = np.full((len(periods), len(history)), np.nan)
+        columns = []
+        for j, (symbol, data) in enumerate(history.items()):
+            columns.append(self.estimator.column(symbol))
+            for ts, close in zip(data['timestamp'], data['close']):
+                row = position.get(ts)
+                if row is not None:
+                    closes[row, j] = close
+            self.last_close[symbol] = float(data['close'][-1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.nan_to_num(closes[1:] / closes[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+        vector = np.zeros(len(self.estimator))
+        for row in returns:
+            vector[columns] = row
+            self.estimator.update(vector)
+        return len(returns)
+
+    async def load(self, db, interval: str) -> int:
+        symbols = [row.symbol for row in await db.get_stocks()]
+        if not symbols:
+            return 0
+        return self.prime(await load_history(db, symbols, interval))
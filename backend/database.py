@@ -1,7 +1,9 @@
 # database.py
 import os
+import json
 import edgedb
 from dotenv import load_dotenv
+from datetime import datetime
 from typing import Optional
 from contextlib import asynccontextmanager
 import pathlib
@@ -17,6 +19,26 @@ load_dotenv()
 print(f"Instance: {os.getenv('EDGEDB_INSTANCE')}")
 print(f"Secret key exists: {bool(os.getenv('EDGEDB_SECRET_KEY'))}")
 
+# 批量記錄資金流水並更新餘額，每行為 {"user_id", "amount"}，金額為整數 tick
+CASH_PAYMENTS_QUERY = """
+    FOR row IN json_array_unpack(<json>$rows) UNION (
+        WITH
+            account := (SELECT CashAccount FILTER .user.id = <uuid>row['user_id']),
+            entry := (
+                INSERT CashLedgerEntry {
+                    account := account,
+                    amount := <int64>row['amount'],
+                    reason := <str>$reason
+                }
+            )
+        UPDATE account
+        SET {
+            balance := .balance + <int64>row['amount'],
+            updated_at := datetime_current()
+        }
+    )
+"""
+
 class DatabaseConnection:
     _instance = None
     _pool = None
@@ -190,6 +212,961 @@ class Database:
             print(f"Error deleting user: {e}")
             return None
 
+    async def create_cash_account(self, user_id: str, balance: int = 0):
+        """
+        為用戶開立資金帳戶
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            INSERT CashAccount {
+                user := (SELECT User FILTER .id = <uuid>$user_id),
+                balance := <int64>$balance
+            }
+        """
+        try:
+            return await self.db_connection.execute_single(query, user_id=user_id, balance=balance)
+        except Exception as e:
+            print(f"Error creating cash account: {e}")
+            return None
+
+    async def adjust_cash(self, user_id: str, amount: int, reason: str):
+        """
+        記錄一筆資金流水並更新餘額
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            WITH
+                account := (SELECT CashAccount FILTER .user.id = <uuid>$user_id),
+                entry := (
+                    INSERT CashLedgerEntry {
+                        account := account,
+                        amount := <int64>$amount,
+                        reason := <str>$reason
+                    }
+                )
+            UPDATE account
+            SET {
+                balance := .balance + <int64>$amount,
+                updated_at := datetime_current()
+            }
+        """
+        try:
+            return await self.db_connection.execute_single(query, user_id=user_id, amount=amount, reason=reason)
+        except Exception as e:
+            print(f"Error adjusting cash: {e}")
+            return None
+
+    async def get_cash_accounts(self):
+        """
+        獲取所有資金帳戶
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT CashAccount {
+                user: { id },
+                balance,
+                max_position,
+                allow_short,
+                margin_ratio,
+                maintenance_ratio
+            }
+        """
+        try:
+            return await self.db_connection.execute(query)
+        except Exception as e:
+            print(f"Error getting cash accounts: {e}")
+            return []
+
+    async def get_positions(self):
+        """
+        獲取所有持倉
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT Portfolio {
+                user: { id },
+                stock: { symbol },
+                quantity,
+                average_price
+            }
+            FILTER NOT EXISTS .room
+        """
+        try:
+            return await self.db_connection.execute(query)
+        except Exception as e:
+            print(f"Error getting positions: {e}")
+            return []
+
+    async def get_stocks(self):
+        """
+        獲取所有股票
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT Stock {
+                symbol,
+                name,
+                current_price
+            }
+        """
+        try:
+            return await self.db_connection.execute(query)
+        except Exception as e:
+            print(f"Error getting stocks: {e}")
+            return []
+
+    async def get_stock_search_entries(self):
+        """
+        獲取股票代碼、名稱與成交筆數，用於搜索索引
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT Stock {
+                symbol,
+                name,
+                trade_count := count(.<stock[is Transaction])
+            }
+        """
+        try:
+            return await self.db_connection.execute(query)
+        except Exception as e:
+            print(f"Error getting stock search entries: {e}")
+            return None
+
+    async def update_stock_prices(self, prices: dict):
+        """
+        批量更新股票當前價格
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                UPDATE Stock
+                FILTER .symbol = <str>row['symbol']
+                SET {
+                    current_price := <int64>row['price'],
+                    updated_at := datetime_current()
+                }
+            )
+        """
+        rows = [{"symbol": symbol, "price": price} for symbol, price in prices.items()]
+        try:
+            return await self.db_connection.execute(query, rows=json.dumps(rows))
+        except Exception as e:
+            print(f"Error updating stock prices: {e}")
+            return []
+
+    async def create_price_alert(self, user_id: str, symbol: str, level: float, direction: str):
+        """
+        創建價格提醒
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            WITH stock := (SELECT Stock FILTER .symbol = <str>$symbol)
+            SELECT (
+                INSERT PriceAlert {
+                    user := (SELECT User FILTER .id = <uuid>$user_id),
+                    stock := stock,
+                    level := <float64>$level,
+                    direction := <str>$direction
+                }
+            ) { id }
+            FILTER EXISTS stock
+        """
+        try:
+            return await self.db_connection.execute_single(
+                query, user_id=user_id, symbol=symbol, level=level, direction=direction
+            )
+        except Exception as e:
+            print(f"Error creating price alert: {e}")
+            return None
+
+    async def get_active_alerts(self):
+        """
+        獲取所有未觸發的價格提醒
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT PriceAlert {
+                id,
+                user: { id },
+                stock: { symbol },
+                level,
+                direction
+            }
+            FILTER .active
+        """
+        try:
+            return await self.db_connection.execute(query)
+        except Exception as e:
+            print(f"Error getting price alerts: {e}")
+            return []
+
+    async def mark_alerts_triggered(self, alert_ids: list):
+        """
+        批量標記提醒為已觸發
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            UPDATE PriceAlert
+            FILTER .id IN array_unpack(<array<uuid>>$ids)
+            SET {
+                active := false,
+                triggered_at := datetime_current()
+            }
+        """
+        try:
+            return await self.db_connection.execute(query, ids=alert_ids)
+        except Exception as e:
+            print(f"Error marking price alerts: {e}")
+            return []
+
+    async def delete_price_alert(self, alert_id: str):
+        """
+        刪除價格提醒
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            DELETE PriceAlert
+            FILTER .id = <uuid>$alert_id
+        """
+        try:
+            return await self.db_connection.execute(query, alert_id=alert_id)
+        except Exception as e:
+            print(f"Error deleting price alert: {e}")
+            return None
+
+    async def get_symbol_positions(self, symbol: str):
+        """
+        獲取某支股票的所有持倉
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT Portfolio {
+                id,
+                user: { id },
+                quantity,
+                average_price
+            }
+            FILTER .stock.symbol = <str>$symbol AND NOT EXISTS .room
+        """
+        try:
+            return await self.db_connection.execute(query, symbol=symbol)
+        except Exception as e:
+            print(f"Error getting positions: {e}")
+            return []
+
+    async def get_corporate_action(self, action_key: str):
+        """
+        查詢公司行動的處理記錄
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT CorporateAction {
+                action_key,
+                action_type,
+                positions_adjusted,
+                orders_adjusted,
+                candles_adjusted,
+                cash_paid,
+                applied_at
+            }
+            FILTER .action_key = <str>$action_key
+        """
+        try:
+            return await self.db_connection.execute_single(query, action_key=action_key)
+        except Exception as e:
+            print(f"Error getting corporate action: {e}")
+            return None
+
+    async def apply_corporate_action(self, record: dict, positions: list, removed: list,
+                                     payments: list, price_factor: float = None,
+                                     batch_size: int = 5000):
+        """
+        在同一個事務中批量寫入持倉、資金、股價與K線的調整，並記錄審計資料
+        審計記錄的 action_key 唯一，重複執行時整個事務失敗回滾
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        audit_query = """
+            INSERT CorporateAction {
+                action_key := <str>$action_key,
+                stock := (SELECT Stock FILTER .symbol = <str>$symbol),
+                action_type := <str>$action_type,
+                ex_date := <cal::local_date>$ex_date,
+                new_shares := <optional int64>$new_shares,
+                old_shares := <optional int64>$old_shares,
+                amount := <optional float64>$amount,
+                positions_adjusted := <int64>$positions_adjusted,
+                orders_adjusted := <int64>$orders_adjusted,
+                candles_adjusted := <int64>$candles_adjusted,
+                cash_paid := <int64>$cash_paid
+            }
+        """
+        positions_query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                UPDATE Portfolio
+                FILTER .id = <uuid>row['id']
+                SET {
+                    quantity := <int64>row['quantity'],
+                    average_price := <int64>row['average_price'],
+                    updated_at := datetime_current()
+                }
+            )
+        """
+        removed_query = """
+            DELETE Portfolio
+            FILTER .id IN array_unpack(<array<uuid>>$ids)
+        """
+        price_query = """
+            UPDATE Stock
+            FILTER .symbol = <str>$symbol
+            SET {
+                current_price := <int64>round(.current_price * <float64>$factor),
+                updated_at := datetime_current()
+            }
+        """
+        candles_query = """
+            SELECT count((
+                UPDATE Candle
+                FILTER .stock.symbol = <str>$symbol
+                    AND .start_time < to_datetime(<cal::local_date>$ex_date, 'UTC')
+                SET {
+                    open := .open * <float64>$factor,
+                    high := .high * <float64>$factor,
+                    low := .low * <float64>$factor,
+                    close := .close * <float64>$factor,
+                    volume := <int64>math::floor(.volume / <float64>$factor)
+                }
+            ))
+        """
+        symbol = record['symbol']
+        reason = f"corporate_action:{record['action_key']}"
+        async for tx in self.db_connection.get_client().transaction():
+            async with tx:
+                candles = 0
+                if price_factor is not None:
+                    await tx.query(price_query, symbol=symbol, factor=price_factor)
+                    candles = await tx.query_single(
+                        candles_query, symbol=symbol, ex_date=record['ex_date'], factor=price_factor
+                    )
+                for i in range(0, len(positions), batch_size):
+                    await tx.query(positions_query, rows=json.dumps(positions[i:i + batch_size]))
+                if removed:
+                    await tx.query(removed_query, ids=removed)
+                for i in range(0, len(payments), batch_size):
+                    await tx.query(CASH_PAYMENTS_QUERY, rows=json.dumps(payments[i:i + batch_size]), reason=reason)
+                await tx.query(audit_query, candles_adjusted=candles, **record)
+        return candles
+
+    async def insert_stocks(self, rows: list):
+        """
+        批量新增股票，已存在的股票保持不變
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                INSERT Stock {
+                    symbol := <str>row['symbol'],
+                    name := <str>row['name'],
+                    current_price := <int64>row['price']
+                }
+                UNLESS CONFLICT ON .symbol
+            )
+        """
+        try:
+            return await self.db_connection.execute(query, rows=json.dumps(rows))
+        except Exception as e:
+            print(f"Error inserting stocks: {e}")
+            return None
+
+    async def upsert_candles(self, rows: list):
+        """
+        批量寫入K線，相同股票、週期與開始時間的K線會被覆蓋
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                INSERT Candle {
+                    stock := (SELECT Stock FILTER .symbol = <str>row['symbol']),
+                    interval := <str>row['interval'],
+                    start_time := <datetime>row['start_time'],
+                    open := <float64>row['open'],
+                    high := <float64>row['high'],
+                    low := <float64>row['low'],
+                    close := <float64>row['close'],
+                    volume := <int64>row['volume']
+                }
+                UNLESS CONFLICT ON (.stock, .interval, .start_time)
+                ELSE (
+                    UPDATE Candle
+                    SET {
+                        open := <float64>row['open'],
+                        high := <float64>row['high'],
+                        low := <float64>row['low'],
+                        close := <float64>row['close'],
+                        volume := <int64>row['volume']
+                    }
+                )
+            )
+        """
+        try:
+            return await self.db_connection.execute(query, rows=json.dumps(rows))
+        except Exception as e:
+            print(f"Error writing candles: {e}")
+            return None
+
+    async def get_candles(self, symbols: list, interval: str = '1d'):
+        """
+        按股票與時間順序獲取K線
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT Candle {
+                stock: { symbol },
+                start_time,
+                open,
+                high,
+                low,
+                close,
+                volume
+            }
+            FILTER .stock.symbol IN array_unpack(<array<str>>$symbols)
+                AND .interval = <str>$interval
+            ORDER BY .stock.symbol THEN .start_time
+        """
+        try:
+            return await self.db_connection.execute(query, symbols=symbols, interval=interval)
+        except Exception as e:
+            print(f"Error getting candles: {e}")
+            return []
+
+    async def get_user_trades(self, user_id: str, before_timestamp: Optional[datetime] = None,
+                              before_id: str = None, limit: int = 50):
+        """
+        按 (timestamp, trade_id) 由新到舊分頁查詢用戶成交記錄，游標為上一頁最後一筆的鍵
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT Transaction {
+                trade_id,
+                type,
+                quantity,
+                price,
+                timestamp,
+                symbol := .stock.symbol
+            }
+            FILTER .user.id = <uuid>$user_id
+                AND NOT EXISTS .room
+                AND (
+                    .timestamp < <optional datetime>$before_timestamp
+                    OR (
+                        .timestamp = <optional datetime>$before_timestamp
+                        AND .trade_id < <optional str>$before_id
+                    )
+                ) ?? true
+            ORDER BY .timestamp DESC THEN .trade_id DESC
+            LIMIT <int64>$limit
+        """
+        try:
+            return await self.db_connection.execute(
+                query, user_id=user_id, before_timestamp=before_timestamp,
+                before_id=before_id, limit=limit
+            )
+        except Exception as e:
+            print(f"Error getting user trades: {e}")
+            return None
+
+    async def get_equity_inputs(self, since, user_id: str = None):
+        """
+        權益曲線的輸入：現有資金與持倉，以及 since 之後的成交與資金流水 (user_id 為空時取全部用戶)
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT {
+                accounts := (
+                    SELECT CashAccount { user_id := <str>.user.id, balance }
+                    FILTER (.user.id = <optional uuid>$user_id) ?? true
+                ),
+                positions := (
+                    SELECT Portfolio { user_id := <str>.user.id, symbol := .stock.symbol, quantity }
+                    FILTER NOT EXISTS .room AND ((.user.id = <optional uuid>$user_id) ?? true)
+                ),
+                transactions := (
+                    SELECT Transaction {
+                        user_id := <str>.user.id,
+                        symbol := .stock.symbol,
+                        type,
+                        quantity,
+                        timestamp
+                    }
+                    FILTER .timestamp >= <datetime>$since
+                        AND NOT EXISTS .room
+                        AND ((.user.id = <optional uuid>$user_id) ?? true)
+                ),
+                cash_entries := (
+                    SELECT CashLedgerEntry { user_id := <str>.account.user.id, amount, timestamp }
+                    FILTER .timestamp >= <datetime>$since
+                        AND ((.account.user.id = <optional uuid>$user_id) ?? true)
+                )
+            }
+        """
+        try:
+            return await self.db_connection.execute_single(query, since=since, user_id=user_id)
+        except Exception as e:
+            print(f"Error getting equity inputs: {e}")
+            return None
+
+    async def get_daily_closes(self, since):
+        """
+        since 之後的日K收盤價，以及作為缺失時後備的股票現價
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT {
+                candles := (
+                    SELECT Candle { symbol := .stock.symbol, start_time, close }
+                    FILTER .interval = '1d' AND .start_time >= <datetime>$since
+                    ORDER BY .start_time
+                ),
+                stocks := (SELECT Stock { symbol, current_price })
+            }
+        """
+        try:
+            return await self.db_connection.execute_single(query, since=since)
+        except Exception as e:
+            print(f"Error getting daily closes: {e}")
+            return None
+
+    async def get_equity_progress(self, user_id: str = None):
+        """
+        最早的成交時間與已物化的最後一段權益曲線
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT {
+                first_trade := min(
+                    (
+                        SELECT Transaction
+                        FILTER NOT EXISTS .room AND ((.user.id = <optional uuid>$user_id) ?? true)
+                    ).timestamp
+                ),
+                last := (
+                    SELECT EquityCurve { month, first_day, days := len(.equity) }
+                    FILTER (.user.id = <optional uuid>$user_id) ?? true
+                    ORDER BY .month DESC THEN .first_day + len(.equity) DESC
+                    LIMIT 1
+                )
+            }
+        """
+        try:
+            return await self.db_connection.execute_single(query, user_id=user_id)
+        except Exception as e:
+            print(f"Error getting equity progress: {e}")
+            return None
+
+    async def get_equity_curves(self, start_month, end_month, user_id: str = None):
+        """
+        獲取月份區間內的權益曲線分段
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT EquityCurve {
+                user_id := <str>.user.id,
+                month,
+                first_day,
+                equity,
+                cash,
+                positions_value
+            }
+            FILTER .month >= <cal::local_date>$start_month
+                AND .month <= <cal::local_date>$end_month
+                AND ((.user.id = <optional uuid>$user_id) ?? true)
+            ORDER BY .month
+        """
+        try:
+            return await self.db_connection.execute(
+                query, start_month=start_month, end_month=end_month, user_id=user_id
+            )
+        except Exception as e:
+            print(f"Error getting equity curves: {e}")
+            return None
+
+    async def upsert_equity_curves(self, rows: list):
+        """
+        批量寫入每個用戶每月一段的權益曲線，已存在的分段整段覆蓋
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                INSERT EquityCurve {
+                    user := (SELECT User FILTER .id = <uuid>row['user_id']),
+                    month := <cal::local_date>row['month'],
+                    first_day := <int16>row['first_day'],
+                    equity := <array<float64>>row['equity'],
+                    cash := <array<float64>>row['cash'],
+                    positions_value := <array<float64>>row['positions_value']
+                }
+                UNLESS CONFLICT ON (.user, .month)
+                ELSE (
+                    UPDATE EquityCurve
+                    SET {
+                        first_day := <int16>row['first_day'],
+                        equity := <array<float64>>row['equity'],
+                        cash := <array<float64>>row['cash'],
+                        positions_value := <array<float64>>row['positions_value'],
+                        updated_at := datetime_current()
+                    }
+                )
+            )
+        """
+        try:
+            return await self.db_connection.execute(query, rows=json.dumps(rows))
+        except Exception as e:
+            print(f"Error writing equity curves: {e}")
+            return None
+
+    async def get_option_positions(self):
+        """
+        獲取所有未平倉的期權持倉及其合約
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT OptionPosition {
+                user_id := <str>.user.id,
+                quantity,
+                average_price,
+                contract: {
+                    symbol,
+                    underlying_symbol := .underlying.symbol,
+                    option_type,
+                    strike,
+                    expiry,
+                    style
+                }
+            }
+            FILTER .quantity != 0
+        """
+        try:
+            return await self.db_connection.execute(query)
+        except Exception as e:
+            print(f"Error getting option positions: {e}")
+            return []
+
+    async def record_option_trade(self, user_id: str, contract: dict, quantity: int, price: float,
+                                  amount: int):
+        """
+        在同一個事務中寫入期權合約、持倉變動 (quantity 買入為正) 與權利金 amount (整數 tick)
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        contract_query = """
+            INSERT OptionContract {
+                symbol := <str>$symbol,
+                underlying := (SELECT Stock FILTER .symbol = <str>$underlying),
+                option_type := <str>$option_type,
+                strike := <float64>$strike,
+                expiry := <datetime>$expiry,
+                style := <str>$style
+            }
+            UNLESS CONFLICT ON .symbol
+        """
+        position_query = """
+            WITH contract := (SELECT OptionContract FILTER .symbol = <str>$symbol)
+            INSERT OptionPosition {
+                user := (SELECT User FILTER .id = <uuid>$user_id),
+                contract := contract,
+                quantity := <int64>$quantity,
+                average_price := <float64>$price
+            }
+            UNLESS CONFLICT ON (.user, .contract)
+            ELSE (
+                UPDATE OptionPosition
+                SET {
+                    quantity := .quantity + <int64>$quantity,
+                    average_price := (
+                        (.quantity * .average_price + <int64>$quantity * <float64>$price)
+                            / (.quantity + <int64>$quantity)
+                        IF <int64>$quantity > 0 AND .quantity >= 0
+                        ELSE .average_price
+                    ),
+                    updated_at := datetime_current()
+                }
+            )
+        """
+        try:
+            async for tx in self.db_connection.get_client().transaction():
+                async with tx:
+                    await tx.query(contract_query, **contract)
+                    await tx.query(position_query, symbol=contract['symbol'], user_id=user_id,
+                                   quantity=quantity, price=price)
+                    await tx.query(CASH_PAYMENTS_QUERY, rows=json.dumps([{"user_id": user_id, "amount": amount}]),
+                                   reason='option')
+            return True
+        except Exception as e:
+            print(f"Error recording option trade: {e}")
+            return False
+
+    async def create_room(self, name: str, symbols: list, starting_cash: int):
+        """
+        創建比賽房間
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT (
+                INSERT Room {
+                    name := <str>$name,
+                    symbols := <array<str>>$symbols,
+                    starting_cash := <int64>$starting_cash
+                }
+            ) { id, name, symbols, starting_cash }
+        """
+        try:
+            return await self.db_connection.execute_single(
+                query, name=name, symbols=symbols, starting_cash=starting_cash
+            )
+        except Exception as e:
+            print(f"Error creating room: {e}")
+            return None
+
+    async def get_room(self, room_id: str):
+        """
+        獲取房間設定、最近一次快照與成員資金
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT Room {
+                id,
+                name,
+                symbols,
+                starting_cash,
+                snapshot,
+                members := (
+                    SELECT .<room[is RoomMember] { user_id := <str>.user.id, balance }
+                ),
+                positions := (
+                    SELECT .<room[is Portfolio] { user_id := <str>.user.id, symbol := .stock.symbol, quantity }
+                    FILTER .quantity != 0
+                )
+            }
+            FILTER .id = <uuid>$room_id
+        """
+        try:
+            return await self.db_connection.execute_single(query, room_id=room_id)
+        except Exception as e:
+            print(f"Error getting room: {e}")
+            return None
+
+    async def add_room_member(self, room_id: str, user_id: str, balance: int):
+        """
+        加入房間，已是成員時返回原有記錄
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            SELECT (
+                INSERT RoomMember {
+                    room := (SELECT Room FILTER .id = <uuid>$room_id),
+                    user := (SELECT User FILTER .id = <uuid>$user_id),
+                    balance := <int64>$balance
+                }
+                UNLESS CONFLICT ON (.room, .user)
+                ELSE (SELECT RoomMember)
+            ) { balance, joined_at }
+        """
+        try:
+            return await self.db_connection.execute_single(
+                query, room_id=room_id, user_id=user_id, balance=balance
+            )
+        except Exception as e:
+            print(f"Error adding room member: {e}")
+            return None
+
+    async def save_room_snapshot(self, room_id: str, snapshot: dict):
+        """
+        保存房間的撮合狀態快照
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        query = """
+            UPDATE Room
+            FILTER .id = <uuid>$room_id
+            SET {
+                snapshot := <json>$snapshot,
+                snapshot_at := datetime_current()
+            }
+        """
+        try:
+            await self.db_connection.execute(query, room_id=room_id, snapshot=json.dumps(snapshot))
+            return True
+        except Exception as e:
+            print(f"Error saving room snapshot: {e}")
+            return False
+
+    async def record_room_fills(self, room_id: str, transactions: list, positions: list, payments: list,
+                                snapshot: dict = None):
+        """
+        與 record_fills 相同，但成交與持倉歸屬於房間，資金變動記入房間成員餘額
+        snapshot 為寫入這批成交後的房間快照，在同一事務中保存，快照與成員餘額始終一致
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        transactions_query = """
+            WITH room := (SELECT Room FILTER .id = <uuid>$room_id)
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                INSERT Transaction {
+                    trade_id := <str>row['trade_id'],
+                    timestamp := to_datetime(<decimal>row['timestamp'] / 1000000000n),
+                    type := <str>row['type'],
+                    quantity := <int64>row['quantity'],
+                    price := <int64>row['price'],
+                    user := (SELECT User FILTER .id = <uuid>row['user_id']),
+                    stock := (SELECT Stock FILTER .symbol = <str>row['symbol']),
+                    room := room
+                }
+            )
+        """
+        positions_query = """
+            WITH room := (SELECT Room FILTER .id = <uuid>$room_id)
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                INSERT Portfolio {
+                    user := (SELECT User FILTER .id = <uuid>row['user_id']),
+                    stock := (SELECT Stock FILTER .symbol = <str>row['symbol']),
+                    room := room,
+                    quantity := <int64>row['quantity'],
+                    average_price := <int64>row['average_price']
+                }
+                UNLESS CONFLICT ON (.user, .stock, .room)
+                ELSE (
+                    UPDATE Portfolio
+                    SET {
+                        quantity := .quantity + <int64>row['quantity'],
+                        average_price := (
+                            <int64>round((.quantity * .average_price + <int64>row['buy_value'])
+                                / (.quantity + <int64>row['buy_quantity']))
+                            IF <int64>row['buy_quantity'] > 0 AND .quantity >= 0
+                            ELSE .average_price
+                        ),
+                        updated_at := datetime_current()
+                    }
+                )
+            )
+        """
+        payments_query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                UPDATE RoomMember
+                FILTER .room.id = <uuid>$room_id AND .user.id = <uuid>row['user_id']
+                SET {
+                    balance := .balance + <int64>row['amount']
+                }
+            )
+        """
+        snapshot_query = """
+            UPDATE Room
+            FILTER .id = <uuid>$room_id
+            SET {
+                snapshot := <json>$snapshot,
+                snapshot_at := datetime_current()
+            }
+        """
+        try:
+            async for tx in self.db_connection.get_client().transaction():
+                async with tx:
+                    if transactions:
+                        await tx.query(transactions_query, room_id=room_id, rows=json.dumps(transactions))
+                    if positions:
+                        await tx.query(positions_query, room_id=room_id, rows=json.dumps(positions))
+                    if payments:
+                        await tx.query(payments_query, room_id=room_id, rows=json.dumps(payments))
+                    if snapshot is not None:
+                        await tx.query(snapshot_query, room_id=room_id, snapshot=json.dumps(snapshot))
+            return True
+        except Exception as e:
+            print(f"Error recording room fills: {e}")
+            return False
+
+    async def record_fills(self, transactions: list, positions: list, payments: list):
+        """
+        在同一個事務中批量寫入成交記錄、持倉與資金變動
+        positions 每行為同一用戶同一股票的淨變動 (已在記憶體中彙總)
+        """
+        if not self.db_connection.get_client():
+            await self.db_connection.connect()
+        transactions_query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                INSERT Transaction {
+                    trade_id := <str>row['trade_id'],
+                    timestamp := to_datetime(<decimal>row['timestamp'] / 1000000000n),
+                    type := <str>row['type'],
+                    quantity := <int64>row['quantity'],
+                    price := <int64>row['price'],
+                    user := (SELECT User FILTER .id = <uuid>row['user_id']),
+                    stock := (SELECT Stock FILTER .symbol = <str>row['symbol'])
+                }
+            )
+        """
+        positions_query = """
+            FOR row IN json_array_unpack(<json>$rows) UNION (
+                INSERT Portfolio {
+                    user := (SELECT User FILTER .id = <uuid>row['user_id']),
+                    stock := (SELECT Stock FILTER .symbol = <str>row['symbol']),
+                    quantity := <int64>row['quantity'],
+                    average_price := <int64>row['average_price']
+                }
+                UNLESS CONFLICT ON (.user, .stock)
+                ELSE (
+                    UPDATE Portfolio
+                    SET {
+                        quantity := .quantity + <int64>row['quantity'],
+                        average_price := (
+                            <int64>round((.quantity * .average_price + <int64>row['buy_value'])
+                                / (.quantity + <int64>row['buy_quantity']))
+                            IF <int64>row['buy_quantity'] > 0 AND .quantity >= 0
+                            ELSE .average_price
+                        ),
+                        updated_at := datetime_current()
+                    }
+                )
+            )
+        """
+        try:
+            async for tx in self.db_connection.get_client().transaction():
+                async with tx:
+                    if transactions:
+                        await tx.query(transactions_query, rows=json.dumps(transactions))
+                    if positions:
+                        await tx.query(positions_query, rows=json.dumps(positions))
+                    if payments:
+                        await tx.query(CASH_PAYMENTS_QUERY, rows=json.dumps(payments), reason='trade')
+            return True
+        except Exception as e:
+            print(f"Error recording fills: {e}")
+            return False
+
 # 使用示例
 """
 async def main():
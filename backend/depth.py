@@ -0,0 +1,92 @@
+import asyncio
+import os
+from typing import Callable
+from clock import now_ns
+from fixedpoint import from_ticks
+
+DEPTH_INTERVAL = float(os.getenv('DEPTH_INTERVAL', '0.05'))
+
+
+def depth_topic(symbol: str) -> str:
+    return f"depth:{symbol}"
+
+
+class DepthFeed:
+    """
+    按價位彙總的委託簿深度 (L2)
+    定期把各委託簿變動過的價位合併成一條帶序號的增量消息推送到 depth:<symbol>，
+    增量為價位的最新數量 (0 表示價位移除)，因此重複套用無副作用
+    客戶端發現序號不連續時取快照重新同步，快照按序號緩存
+    委託簿以整數 tick 為鍵，推送給客戶端的價格換算為小數，ts 為市場時間的整數納秒
+    engine 為 MatchingEngine 或 ShardPool，只使用其 books 與 touched_books
+    """
+
+    def __init__(self, engine, publish: Callable, interval: float = DEPTH_INTERVAL):
+        self.engine = engine
+        self.publish = publish
+        self.interval = interval
+        self.sequences = {}
+        self.snapshots = {}
+
+    def _diff(self, book) -> dict:
+        changes = {}
+        for side, key in (('buy', 'bids'), ('sell', 'asks')):
+            touched = book.touched[side]
+            volume = book.volume[side]
+            changes[key] = [[from_ticks(price), volume.get(price, 0)] for price in sorted(touched)]
+            touched.clear()
+        return changes
+
+    def flush_book(self, book) -> int:
+        if not book.touched['buy'] and not book.touched['sell']:
+            return self.sequences.get(book.symbol, 0)
+        sequence = self.sequences.get(book.symbol, 0) + 1
+        self.sequences[book.symbol] = sequence
+        message = {"type": "depth", "symbol": book.symbol, "seq": sequence, "ts": now_ns()}
+        message.update(self._diff(book))
+        self.publish(depth_topic(book.symbol), message)
+        return sequence
+
+    def flush(self) -> int:
+        """
+        推送所有有變動的委託簿，返回推送的消息數
+        """
+        books = self.engine.touched_books
+        if not books:
+            return 0
+        self.engine.touched_books = set()
+        for book in books:
+            self.flush_book(book)
+        return len(books)
+
+    def snapshot(self, symbol: str) -> dict:
+        """
+        返回與最新序號一致的完整深度，買盤由高到低、賣盤由低到高
+        """
+        book = self.engine.books.get(symbol)
+        if book is None:
+            return {"symbol": symbol, "seq": 0, "bids": [], "asks": []}
+        # 先推送未發出的變動，保證快照與序號對應
+        sequence = self.flush_book(book)
+        self.engine.touched_books.discard(book)
+        cached = self.snapshots.get(symbol)
+        if cached is not None and cached["seq"] == sequence:
+            return cached
+        bids = book.volume['buy']
+        asks = book.volume['sell']
+        cached = self.snapshots[symbol] = {
+            "symbol": symbol,
+            "seq": sequence,
+            "bids": [[from_ticks(price), bids[price]] for price in reversed(book.prices['buy'])],
+            "asks": [[from_ticks(price), asks[price]] for price in book.prices['sell']],
+        }
+        return cached
+
+    async def run(self, interval: float = None):
+        interval = interval or self.interval
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Depth flush error: {e}")
@@ -0,0 +1,450 @@
+import math
+import os
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Callable, Optional
+from clock import now_ns
+from ledger import RiskCheckError
+
+SIDES = ('buy', 'sell')
+ORDER_TYPES = ('market', 'limit')
+
+# 市價買單按參考價加上此比例 (向上取整到 tick) 凍結資金，撮合時也只成交到這個價格
+MARKET_COLLAR = 0.05
+# 委託物件池最多保留的空閒物件數
+ORDER_POOL_SIZE = int(os.getenv('ORDER_POOL_SIZE', '65536'))
+
+
+class Order:
+    """
+    價格為整數 tick (見 fixedpoint)，市價單為 None，時間戳為市場時鐘的整數納秒 (見 clock)
+    pooled 表示物件取自 OrderPool，離開委託簿後由引擎歸還
+    """
+    __slots__ = ('order_id', 'user_id', 'symbol', 'side', 'order_type', 'quantity',
+                 'price', 'remaining', 'status', 'timestamp', 'pooled')
+
+    def __init__(self, order_id: str, user_id: str, symbol: str, side: str, quantity: int,
+                 price: int = None, order_type: str = 'limit'):
+        if side not in SIDES:
+            raise ValueError(f"Unknown side: {side}")
+        if order_type not in ORDER_TYPES:
+            raise ValueError(f"Unknown order type: {order_type}")
+        if order_type == 'limit' and (price is None or price <= 0):
+            raise ValueError("Limit order requires a positive price")
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        self.order_id = order_id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.side = side
+        self.order_type = order_type
+        self.quantity = quantity
+        self.price = price
+        self.remaining = quantity
+        self.status = 'new'
+        self.timestamp = now_ns()
+        self.pooled = False
+
+
+class OrderPool:
+    """
+    Order 的空閒鏈表：引擎內部產生的委託 (觸發的條件單、分片進程反序列化的委託) 從池中取出，
+    成交完畢或撤單後從委託簿移出時歸還，重用物件以減少撮合熱路徑上的記憶體分配
+    只有 acquire 取出的物件會被歸還，外部直接構造的 Order 不受影響
+    """
+
+    def __init__(self, size: int = ORDER_POOL_SIZE):
+        self.size = size
+        self.free = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, order_id: str, user_id: str, symbol: str, side: str, quantity: int,
+                price: int = None, order_type: str = 'limit') -> Order:
+        if self.free:
+            order = self.free.pop()
+            self.reused += 1
+        else:
+            order = Order.__new__(Order)
+            self.created += 1
+        try:
+            order.__init__(order_id, user_id, symbol, side, quantity, price, order_type)
+        except ValueError:
+            self.free.append(order)
+            raise
+        order.pooled = True
+        return order
+
+    def release(self, order: Order):
+        """
+        歸還不再被引用的委託，非池中物件與重複歸還會被忽略
+        """
+        if not order.pooled:
+            return
+        order.pooled = False
+        if len(self.free) < self.size:
+            self.free.append(order)
+
+
+class Fill:
+    __slots__ = ('symbol', 'price', 'quantity', 'buy_order_id', 'sell_order_id',
+                 'buyer_id', 'seller_id', 'timestamp')
+
+    def __init__(self, symbol: str, price: int, quantity: int, buy_order: Order, sell_order: Order):
+        self.symbol = symbol
+        self.price = price
+        self.quantity = quantity
+        self.buy_order_id = buy_order.order_id
+        self.sell_order_id = sell_order.order_id
+        self.buyer_id = buy_order.user_id
+        self.seller_id = sell_order.user_id
+        self.timestamp = now_ns()
+
+
+class OrderBook:
+    """
+    價格優先、時間優先的限價委託簿
+    價格檔位以整數 tick 為鍵，以排序陣列保存，同價位委託以隊列保存，撤單為懶惰刪除
+    touched 記錄上次深度推送後數量有變動的價位
+    移出隊列的池中委託歸還 pool
+    """
+
+    def __init__(self, symbol: str, pool: Optional[OrderPool] = None):
+        self.symbol = symbol
+        self.pool = pool
+        self.levels = {'buy': {}, 'sell': {}}
+        self.prices = {'buy': [], 'sell': []}
+        self.volume = {'buy': {}, 'sell': {}}
+        self.touched = {'buy': set(), 'sell': set()}
+
+    def best(self, side: str) -> Optional[int]:
+        prices = self.prices[side]
+        if not prices:
+            return None
+        return prices[-1] if side == 'buy' else prices[0]
+
+    def _crosses(self, order: Order, price: int) -> bool:
+        # 市價單沒有價格時不限價，市價買單在風控後以凍結價為上限
+        if order.price is None:
+            return True
+        return price <= order.price if order.side == 'buy' else price >= order.price
+
+    def _remove_level(self, side: str, price: int):
+        prices = self.prices[side]
+        del prices[bisect_left(prices, price)]
+        del self.levels[side][price]
+        del self.volume[side][price]
+
+    def match(self, order: Order) -> list:
+        """
+        與對手方撮合，返回成交列表，剩餘數量留在 order.remaining
+        """
+        fills = []
+        opposite = 'sell' if order.side == 'buy' else 'buy'
+        levels = self.levels[opposite]
+        volume = self.volume[opposite]
+        touched = self.touched[opposite]
+        pool = self.pool
+        while order.remaining > 0:
+            price = self.best(opposite)
+            if price is None or not self._crosses(order, price):
+                break
+            touched.add(price)
+            queue = levels[price]
+            while queue and order.remaining > 0:
+                resting = queue[0]
+                if resting.status == 'cancelled':
+                    queue.popleft()
+                    if pool is not None:
+                        pool.release(resting)
+                    continue
+                quantity = min(order.remaining, resting.remaining)
+                order.remaining -= quantity
+                resting.remaining -= quantity
+                volume[price] -= quantity
+                if order.side == 'buy':
+                    fills.append(Fill(self.symbol, price, quantity, order, resting))
+                else:
+                    fills.append(Fill(self.symbol, price, quantity, resting, order))
+                if resting.remaining == 0:
+                    resting.status = 'filled'
+                    queue.popleft()
+                    if pool is not None:
+                        pool.release(resting)
+                else:
+                    resting.status = 'partial'
+            if not queue or volume[price] == 0:
+                self._remove_level(opposite, price)
+        return fills
+
+    def rest(self, order: Order):
+        side = order.side
+        queue = self.levels[side].get(order.price)
+        if queue is None:
+            queue = self.levels[side][order.price] = deque()
+            self.volume[side][order.price] = 0
+            insort(self.prices[side], order.price)
+        queue.append(order)
+        self.volume[side][order.price] += order.remaining
+        self.touched[side].add(order.price)
+
+    def cancel(self, order: Order):
+        side = order.side
+        order.status = 'cancelled'
+        volume = self.volume[side]
+        if order.price not in volume:
+            return
+        volume[order.price] -= order.remaining
+        self.touched[side].add(order.price)
+        if volume[order.price] == 0:
+            self._remove_level(side, order.price)
+
+
+def triggered_order(conditional, factory: Callable = Order) -> Order:
+    """
+    觸發的止損單轉為市價單，止損限價單轉為限價單
+    """
+    if conditional.order_type == 'stop_limit':
+        return factory(conditional.order_id, conditional.user_id, conditional.symbol,
+                       conditional.side, conditional.quantity, conditional.limit_price, 'limit')
+    return factory(conditional.order_id, conditional.user_id, conditional.symbol,
+                   conditional.side, conditional.quantity, None, 'market')
+
+
+class MatchingEngine:
+    """
+    各股票的委託簿與撮合入口，下單前經過資金帳戶風控，成交後更新最新價並通知訂閱者
+    """
+
+    def __init__(self, ledger=None, price_feed=None, pool: Optional[OrderPool] = None):
+        self.ledger = ledger
+        self.price_feed = price_feed
+        self.pool = pool if pool is not None else OrderPool()
+        self.books = {}
+        self.orders = {}
+        self.fill_listeners = []
+        self.touched_books = set()
+        # 暫停撮合的股票 (公司行動調整期間)，新委託在風控時被拒
+        self.halted = set()
+        self._pending = deque()
+        self._matching = False
+
+    def book(self, symbol: str) -> OrderBook:
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook(symbol, self.pool)
+        return book
+
+    def new_order(self, order_id: str, user_id: str, symbol: str, side: str, quantity: int,
+                  price: int = None, order_type: str = 'limit') -> Order:
+        """
+        從物件池取得委託，提交後調用方不應再持有，未掛單的由 release 歸還
+        """
+        return self.pool.acquire(order_id, user_id, symbol, side, quantity, price, order_type)
+
+    def release(self, order: Order):
+        """
+        提交完畢且沒有進入委託簿的池中委託歸還物件池
+        """
+        if order.status in ('filled', 'cancelled', 'new'):
+            self.pool.release(order)
+
+    def add_fill_listener(self, listener: Callable):
+        self.fill_listeners.append(listener)
+
+    def _reference_price(self, order: Order) -> Optional[int]:
+        if order.price is not None:
+            return order.price
+        opposite = 'sell' if order.side == 'buy' else 'buy'
+        price = self.book(order.symbol).best(opposite)
+        if price is None and self.price_feed:
+            price = self.price_feed.last_price(order.symbol)
+        if price is not None and order.side == 'buy':
+            price = math.ceil(price * (1 + MARKET_COLLAR))
+        return price
+
+    def check_risk(self, order: Order, forced: bool = False):
+        """
+        按委託價 (市價單按參考價) 凍結資金或持倉並返回凍結價，不通過時拋出 RiskCheckError
+        """
+        if order.symbol in self.halted:
+            raise RiskCheckError(f"Trading in {order.symbol} is halted")
+        if self.ledger:
+            price = self._reference_price(order)
+            if price is None:
+                raise RiskCheckError("No reference price for market order")
+            self.ledger.check_order(order.order_id, order.user_id, order.symbol,
+                                    order.side, order.quantity, price, forced)
+            return price
+        return None
+
+    def probe_risk(self, order: Order) -> Optional[int]:
+        """
+        只檢查不凍結：條件單下單時確認觸發後的委託能通過風控，不通過時拋出 RiskCheckError
+        """
+        price = self.check_risk(order)
+        if self.ledger:
+            self.ledger.release(order.order_id)
+        return price
+
+    def collar(self, order: Order, forced: bool = False) -> Optional[int]:
+        """
+        連續撮合前的風控：市價買單 (強制平倉除外) 只成交到凍結的參考價，超出部分取消並釋放，
+        現金帳戶不會因為吃掉多個價位而透支
+        """
+        price = self.check_risk(order, forced)
+        if price is not None and order.order_type == 'market' and order.side == 'buy' and not forced:
+            order.price = price
+        return price
+
+    def submit(self, order: Order, forced: bool = False) -> list:
+        """
+        提交委託並返回成交列表，風控不通過時拋出 RiskCheckError
+        forced 為強制平倉委託，略過購買力與持倉限制
+        """
+        self.collar(order, forced)
+        book = self.book(order.symbol)
+        self.touched_books.add(book)
+        outer = not self._matching
+        self._matching = True
+        try:
+            fills = book.match(order)
+            self._settle(fills)
+            if order.remaining == 0:
+                order.status = 'filled'
+            elif order.order_type == 'limit':
+                order.status = 'partial' if fills else 'open'
+                book.rest(order)
+                self.orders[order.order_id] = order
+            else:
+                # 市價單未成交部分直接取消
+                order.status = 'cancelled'
+                if self.ledger:
+                    self.ledger.release(order.order_id)
+            self._publish(fills)
+        finally:
+            if outer:
+                self._matching = False
+        if outer:
+            self._drain()
+        return fills
+
+    def submit_triggered(self, conditional):
+        """
+        觸發的條件單轉為市價單或限價單進入撮合，撮合過程中觸發的排隊到本輪結束後處理
+        """
+        self._pending.append(conditional)
+        if not self._matching:
+            self._drain()
+
+    def submit_forced(self, order: Order, on_done: Optional[Callable] = None):
+        """
+        強制平倉委託與觸發的條件單共用隊列，撮合過程中提交的在本輪結束後處理
+        on_done(order) 在委託處理完 (成交、取消或被拒) 後調用
+        """
+        self._pending.append((order, on_done))
+        if not self._matching:
+            self._drain()
+
+    def _drain(self):
+        """
+        排隊的委託逐筆處理，任何一筆失敗都只記錄錯誤，不會讓觸發它的 (其他用戶的) 委託失敗
+        """
+        while self._pending:
+            item = self._pending.popleft()
+            try:
+                if isinstance(item, tuple):
+                    self._submit_forced(*item)
+                else:
+                    self._submit_triggered(item)
+            except Exception as e:
+                print(f"Queued order error: {e}")
+
+    def _submit_forced(self, order: Order, on_done: Optional[Callable]):
+        try:
+            self.submit(order, forced=True)
+        except (RiskCheckError, ValueError) as e:
+            print(f"Forced order {order.order_id} rejected: {e}")
+        if on_done:
+            on_done(order)
+
+    def _submit_triggered(self, conditional):
+        order = triggered_order(conditional, self.new_order)
+        try:
+            self.submit(order)
+        except RiskCheckError as e:
+            print(f"Triggered order {conditional.order_id} rejected: {e}")
+        self.release(order)
+
+    def cancel(self, order_id: str) -> bool:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return False
+        book = self.books[order.symbol]
+        book.cancel(order)
+        self.touched_books.add(book)
+        if self.ledger:
+            self.ledger.release(order_id)
+        return True
+
+    def apply_split(self, symbol: str, new_shares: int, old_shares: int) -> list:
+        """
+        拆股/合股後按比例調整該股票的掛單：數量向下取整，價格四捨五入到 tick，按原時間順序重新掛單
+        數量變為 0 的掛單撤銷並釋放凍結，返回這些委託號
+        """
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+        for side in ('buy', 'sell'):
+            book.touched[side].update(book.prices[side])
+            for queue in book.levels[side].values():
+                for order in queue:
+                    if order.status == 'cancelled' and self.pool is not None:
+                        self.pool.release(order)
+            book.levels[side].clear()
+            book.prices[side].clear()
+            book.volume[side].clear()
+        self.touched_books.add(book)
+        removed = []
+        resting = sorted((o for o in self.orders.values() if o.symbol == symbol), key=lambda o: o.timestamp)
+        for order in resting:
+            order.quantity = order.quantity * new_shares // old_shares
+            order.remaining = order.remaining * new_shares // old_shares
+            order.price = max(1, round(order.price * old_shares / new_shares))
+            if order.remaining == 0:
+                del self.orders[order.order_id]
+                order.status = 'cancelled'
+                removed.append(order.order_id)
+                if self.ledger:
+                    self.ledger.release(order.order_id)
+                continue
+            book.rest(order)
+        return removed
+
+    def apply_fills(self, fills: list):
+        """
+        引擎外撮合 (集合競價) 產生的成交，走與連續撮合相同的結算與通知流程
+        """
+        self._settle(fills)
+        self._publish(fills)
+
+    def _settle(self, fills: list):
+        for fill in fills:
+            for order_id in (fill.buy_order_id, fill.sell_order_id):
+                resting = self.orders.get(order_id)
+                if resting is not None and resting.remaining == 0:
+                    del self.orders[order_id]
+            if self.ledger:
+                self.ledger.apply_fill(fill.buy_order_id, fill.quantity, fill.price)
+                self.ledger.apply_fill(fill.sell_order_id, fill.quantity, fill.price)
+
+    def _publish(self, fills: list):
+        if not fills:
+            return
+        for listener in self.fill_listeners:
+            try:
+                listener(fills)
+            except Exception as e:
+                print(f"Fill listener error: {e}")
+        if self.price_feed:
+            self.price_feed.publish(fills[-1].symbol, fills[-1].price)
@@ -0,0 +1,304 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, status
+from auth import get_current_user
+from database import Database
+from fixedpoint import PRICE_SCALE, from_ticks
+from models import User
+from sessions import SESSION_TIMEZONE
+
+router = APIRouter()
+
+# 每日收盤後物化權益曲線的時刻 (交易所時區)，以及估值進程數 (0 為 CPU 數)
+EQUITY_JOB_TIME = os.getenv('EQUITY_JOB_TIME', '14:00')
+EQUITY_PROCESSES = int(os.getenv('EQUITY_PROCESSES', '0'))
+# 區間起點前缺少日K時向前尋找收盤價的天數
+EQUITY_PRICE_LOOKBACK = int(os.getenv('EQUITY_PRICE_LOOKBACK', '14'))
+
+COLUMNS = ('equity', 'cash', 'positions_value')
+
+
+def day_ends(start: date, days: int, tz: ZoneInfo) -> np.ndarray:
+    """
+    每個交易日結束 (次日零時) 的 epoch 秒
+    """
+    return np.array([
+        datetime.combine(start + timedelta(days=i + 1), dtime(), tz).timestamp() for i in range(days)
+    ])
+
+
+def day_index(timestamps, ends: np.ndarray) -> np.ndarray:
+    return np.searchsorted(ends, np.asarray(timestamps, dtype=np.float64), side='right')
+
+
+def holdings(current: np.ndarray, owners: np.ndarray, days: np.ndarray, amounts: np.ndarray,
+             n_days: int) -> np.ndarray:
+    """
+    由現值倒推每日收盤後的數量：第 d 日收盤後 = 現值 - 第 d 日之後的全部變動
+    days 等於 n_days 的變動發生在區間結束之後，返回 (用戶數, n_days)
+    """
+    delta = np.zeros((len(current), n_days + 1))
+    np.add.at(delta, (owners, np.minimum(days, n_days)), amounts)
+    after = np.cumsum(delta[:, ::-1], axis=1)[:, ::-1]
+    return current[:, None] - after[:, 1:]
+
+
+def daily_closes(days: np.ndarray, closes: np.ndarray, n_days: int, fallback: float) -> np.ndarray:
+    """
+    按時間順序的日K落到日序號上，同日取最後一根，缺失日沿用前一日收盤
+    """
+    result = np.full(n_days, np.nan)
+    mask = days < n_days
+    result[days[mask]] = closes[mask]
+    valid = np.where(np.isnan(result), -1, np.arange(n_days))
+    last = np.maximum.accumulate(valid)
+    return np.where(last >= 0, result[np.maximum(last, 0)], fallback)
+
+
+def value_symbol(job: tuple) -> tuple:
+    """
+    單支股票所有持有人的每日持倉市值：(持有人全局序號, (持有人數, 日數) 市值矩陣)
+    """
+    users, current, owners, days, quantities, closes = job
+    return users, holdings(current, owners, days, quantities, len(closes)) * closes[None, :]
+
+
+def _value_all(jobs: list, processes: int) -> list:
+    if processes == 1 or len(jobs) < 2:
+        return [value_symbol(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(value_symbol, jobs, chunksize=chunksize))
+
+
+def compute_curves(inputs, prices, start: date, end: date, tz: ZoneInfo, processes: int = 1) -> tuple:
+    """
+    計算 [start, end] 每日收盤後的資金、持倉市值與權益
+    各股票的持倉倒推與估值為獨立的向量化任務，分散到進程池
+    資金與現價由 tick 換算為小數，與K線收盤價的單位一致
+    返回 (用戶編號列表, {列名: (用戶數, 日數) 陣列})
+    """
+    n_days = (end - start).days + 1
+    ends = day_ends(start, n_days, tz)
+
+    user_ids = sorted(
+        {row.user_id for row in inputs.accounts} | {row.user_id for row in inputs.positions}
+        | {row.user_id for row in inputs.transactions} | {row.user_id for row in inputs.cash_entries}
+    )
+    index = {user_id: i for i, user_id in enumerate(user_ids)}
+
+    balances = np.zeros(len(user_ids))
+    for row in inputs.accounts:
+        balances[index[row.user_id]] = from_ticks(row.balance)
+    entries = inputs.cash_entries
+    cash = holdings(
+        balances,
+        np.array([index[row.user_id] for row in entries], dtype=np.int64),
+        day_index([row.timestamp.timestamp() for row in entries], ends),
+        np.array([row.amount for row in entries], dtype=np.float64) / PRICE_SCALE,
+        n_days,
+    )
+
+    # 按股票分組：現持倉與區間內成交 (買入為正、賣出為負)
+    groups = {}
+    for row in inputs.positions:
+        groups.setdefault(row.symbol, ({}, []))[0][row.user_id] = row.quantity
+    for row in inputs.transactions:
+        quantity = row.quantity if row.type == 'buy' else -row.quantity
+        groups.setdefault(row.symbol, ({}, []))[1].append((row.user_id, row.timestamp.timestamp(), quantity))
+
+    bars = {}
+    for row in prices.candles:
+        bars.setdefault(row.symbol, ([], []))
+        bars[row.symbol][0].append(row.start_time.timestamp())
+        bars[row.symbol][1].append(row.close)
+    current_prices = {row.symbol: from_ticks(row.current_price) for row in prices.stocks}
+
+    jobs = []
+    for symbol, (current, trades) in groups.items():
+        holders = sorted(set(current) | {user_id for user_id, _, _ in trades})
+        local = {user_id: i for i, user_id in enumerate(holders)}
+        times, closes = bars.get(symbol, ([], []))
+        jobs.append((
+            np.array([index[user_id] for user_id in holders], dtype=np.int64),
+            np.array([current.get(user_id, 0) for user_id in holders], dtype=np.float64),
+            np.array([local[user_id] for user_id, _, _ in trades], dtype=np.int64),
+            day_index([timestamp for _, timestamp, _ in trades], ends),
+            np.array([quantity for _, _, quantity in trades], dtype=np.float64),
+            daily_closes(day_index(times, ends), np.array(closes, dtype=np.float64), n_days,
+                         current_prices.get(symbol) or 0.0),
+        ))
+
+    positions_value = np.zeros((len(user_ids), n_days))
+    for users, values in _value_all(jobs, processes):
+        positions_value[users] += values
+    return user_ids, {"equity": cash + positions_value, "cash": cash, "positions_value": positions_value}
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def merge_chunk(existing, month: date, first: date, values: dict) -> dict:
+    """
+    把一個月內從 first 開始的連續日值合併進已存在的分段，新值覆蓋舊值，中間缺口沿用前一日
+    """
+    length = (next_month(month) - month).days
+    dense = {column: np.full(length, np.nan) for column in COLUMNS}
+    if existing is not None:
+        for column in COLUMNS:
+            old = np.array(getattr(existing, column), dtype=np.float64)
+            dense[column][existing.first_day:existing.first_day + len(old)] = old
+    offset = (first - month).days
+    for column in COLUMNS:
+        dense[column][offset:offset + len(values[column])] = values[column]
+    filled = np.flatnonzero(~np.isnan(dense['equity']))
+    lo, hi = int(filled[0]), int(filled[-1]) + 1
+    row = {"month": month.isoformat(), "first_day": lo}
+    for column in COLUMNS:
+        segment = dense[column][lo:hi]
+        valid = np.where(np.isnan(segment), -1, np.arange(len(segment)))
+        row[column] = segment[np.maximum.accumulate(valid)].tolist()
+    return row
+
+
+class EquityService:
+    """
+    每日收盤後物化所有用戶的權益曲線：以現有資金與持倉減去之後的成交與資金流水倒推每日收盤狀態，
+    因此增量物化只需讀取區間起點之後的記錄；結果按用戶每月一段以陣列保存
+    """
+
+    def __init__(self, processes: int = EQUITY_PROCESSES, timezone: str = SESSION_TIMEZONE,
+                 job_time: str = EQUITY_JOB_TIME):
+        self.processes = processes or os.cpu_count() or 1
+        self.timezone = ZoneInfo(timezone)
+        self.job_time = dtime.fromisoformat(job_time)
+
+    def today(self) -> date:
+        return datetime.now(self.timezone).date()
+
+    async def materialize(self, db, start: date, end: date, user_id: str = None) -> int:
+        """
+        計算並寫入 [start, end] 的權益曲線，返回寫入的分段數
+        """
+        since = datetime.combine(start, dtime(), self.timezone)
+        inputs = await db.get_equity_inputs(since, user_id)
+        prices = await db.get_daily_closes(since - timedelta(days=EQUITY_PRICE_LOOKBACK))
+        if inputs is None or prices is None:
+            return 0
+        loop = asyncio.get_running_loop()
+        user_ids, curves = await loop.run_in_executor(
+            None, compute_curves, inputs, prices, start, end, self.timezone, self.processes
+        )
+        if not user_ids:
+            return 0
+
+        existing = {}
+        for row in await db.get_equity_curves(month_start(start), month_start(end), user_id) or []:
+            existing[(row.user_id, row.month)] = row
+        rows = []
+        month = month_start(start)
+        while month <= end:
+            first = max(month, start)
+            last = min(next_month(month) - timedelta(days=1), end)
+            lo, hi = (first - start).days, (last - start).days + 1
+            for i, uid in enumerate(user_ids):
+                values = {column: curves[column][i, lo:hi] for column in COLUMNS}
+                row = merge_chunk(existing.get((uid, month)), month, first, values)
+                row["user_id"] = uid
+                rows.append(row)
+            month = next_month(month)
+        if await db.upsert_equity_curves(rows) is None:
+            return 0
+        return len(rows)
+
+    async def start_date(self, db, user_id: str = None) -> Optional[date]:
+        """
+        增量起點：已物化的最後一日之後；尚未物化時從最早的成交日開始
+        """
+        progress = await db.get_equity_progress(user_id)
+        if progress is None:
+            return None
+        if progress.last:
+            last = progress.last
+            return last.month + timedelta(days=last.first_day + last.days)
+        if progress.first_trade:
+            return progress.first_trade.astimezone(self.timezone).date()
+        return None
+
+    async def run_once(self, db, user_id: str = None) -> int:
+        end = self.today()
+        start = await self.start_date(db, user_id)
+        if start is None:
+            return 0
+        # 當日重跑時覆蓋當日的值
+        return await self.materialize(db, min(start, end), end, user_id)
+
+    def seconds_until_next_run(self) -> float:
+        now = datetime.now(self.timezone)
+        target = datetime.combine(now.date(), self.job_time, self.timezone)
+        if target <= now:
+            target += timedelta(days=1)
+        return (target - now).total_seconds()
+
+    async def run(self, db):
+        while True:
+            await asyncio.sleep(self.seconds_until_next_run())
+            try:
+                await self.run_once(db)
+            except Exception as e:
+                print(f"Equity job error: {e}")
+
+    async def curve(self, db, user_id: str, start: date, end: date) -> Optional[dict]:
+        """
+        讀取 [start, end] 內已物化的日值，返回列式結果
+        """
+        rows = await db.get_equity_curves(month_start(start), month_start(end), user_id)
+        if rows is None:
+            return None
+        result = {"dates": [], **{column: [] for column in COLUMNS}}
+        for row in rows:
+            first = row.month + timedelta(days=row.first_day)
+            lo = max((start - first).days, 0)
+            hi = min((end - first).days + 1, len(row.equity))
+            for i in range(lo, hi):
+                result["dates"].append((first + timedelta(days=i)).isoformat())
+            for column in COLUMNS:
+                result[column].extend(getattr(row, column)[lo:hi])
+        return result
+
+
+equity_service = EquityService()
+
+
+@router.get("")
+async def get_equity_curve(start: date, end: Optional[date] = None,
+                           current_user: User = Depends(get_current_user)):
+    end = end or equity_service.today()
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    curve = await equity_service.curve(Database(), str(current_user.id), start, end)
+    if curve is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Equity curve unavailable"
+        )
+    return curve
+
+
+@router.post("/refresh")
+async def refresh_equity_curve(current_user: User = Depends(get_current_user)):
+    """
+    立即為當前用戶補算至今日的權益曲線
+    """
+    written = await equity_service.run_once(Database(), str(current_user.id))
+    return {"segments": written}
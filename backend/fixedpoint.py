@@ -0,0 +1,28 @@
+import math
+import os
+from typing import Optional
+
+# 價格與資金共用的定點精度：1 元 = PRICE_SCALE 個最小單位 (tick)
+# 股數 x 價格 tick 即為資金 tick，撮合、帳戶與結算全程為整數運算
+PRICE_SCALE = int(os.getenv('PRICE_SCALE', '10000'))
+
+
+def to_ticks(value: Optional[float]) -> Optional[int]:
+    """
+    API 輸入的小數價格或金額轉為整數 tick，四捨五入到最近的 tick
+    inf 與 nan 拋出 ValueError (路由轉為 422)，而不是 OverflowError
+    """
+    if value is None:
+        return None
+    if not math.isfinite(value):
+        raise ValueError("Price or amount must be a finite number")
+    return int(round(value * PRICE_SCALE))
+
+
+def from_ticks(ticks: Optional[int]) -> Optional[float]:
+    """
+    整數 tick 轉回小數，只在 API 輸出與分析模組 (K線、期權定價等) 使用
+    """
+    if ticks is None:
+        return None
+    return ticks / PRICE_SCALE
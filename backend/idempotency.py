@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+from fastapi import HTTPException, Response, status
+from clock import NANOS_PER_SECOND, system_clock
+from journal import Journal
+
+# 冪等鍵的有效時間窗口、最多保留的鍵數，以及日誌路徑 (空字串為不落盤) 與寫盤間隔
+IDEMPOTENCY_WINDOW = float(os.getenv('IDEMPOTENCY_WINDOW', '86400'))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', '1000000'))
+IDEMPOTENCY_JOURNAL = os.getenv('IDEMPOTENCY_JOURNAL', 'idempotency.journal')
+IDEMPOTENCY_FLUSH_INTERVAL = float(os.getenv('IDEMPOTENCY_FLUSH_INTERVAL', '0.05'))
+
+MAX_KEY_LENGTH = 255
+# 日誌行數超過存活鍵數的倍數 (且超過最小行數) 時壓縮
+COMPACT_RATIO = 2
+COMPACT_MIN_LINES = 10000
+
+
+class IdempotencyConflictError(Exception):
+    """
+    同一個冪等鍵對應了不同的請求內容
+    """
+    pass
+
+
+def fingerprint(payload: dict) -> str:
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+
+class _Entry:
+    __slots__ = ('expires', 'fingerprint', 'result', 'future')
+
+    def __init__(self, expires: int, fingerprint: str, result=None, future=None):
+        self.expires = expires
+        self.fingerprint = fingerprint
+        self.result = result
+        self.future = future
+
+
+class IdempotencyStore:
+    """
+    有時間窗口與容量上限的去重表：鍵按寫入時間排在 OrderedDict 中，
+    過期與超量都從最舊的一端淘汰，查詢、寫入與淘汰均為 O(1) (攤還)
+    處理中的鍵保存 Future，並發的重試等待同一個結果；失敗的請求不保存，可以重試
+    成功的結果寫入日誌，重啟後載入窗口內的記錄
+    窗口以秒設定，過期時間為系統時鐘的整數納秒 (回放時的市場時間不影響去重)
+    """
+
+    def __init__(self, window: float = IDEMPOTENCY_WINDOW, max_keys: int = IDEMPOTENCY_MAX_KEYS,
+                 journal: Optional[Journal] = None, clock: Callable = system_clock.now):
+        self.window = int(window * NANOS_PER_SECOND)
+        self.max_keys = max_keys
+        self.journal = journal
+        self.clock = clock
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _evict(self, now: int, room: int = 0):
+        entries = self.entries
+        while entries:
+            entry = next(iter(entries.values()))
+            if entry.expires > now and len(entries) + room <= self.max_keys:
+                break
+            entries.popitem(last=False)
+
+    async def run(self, key: str, payload_fingerprint: str, operation: Callable[[], Awaitable]) -> tuple:
+        """
+        同一個鍵只執行一次 operation，返回 (結果, 是否為重放)
+        """
+        now = self.clock()
+        self._evict(now, room=1)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != payload_fingerprint:
+                raise IdempotencyConflictError("Idempotency key was reused with a different request")
+            if entry.future is not None:
+                return await asyncio.shield(entry.future), True
+            return entry.result, True
+
+        entry = self.entries[key] = _Entry(now + self.window, payload_fingerprint,
+                                           future=asyncio.get_running_loop().create_future())
+        future = entry.future
+        try:
+            result = await operation()
+        except BaseException as e:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+            future.set_exception(e)
+            # 沒有並發重試時避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        entry.result = result
+        entry.future = None
+        future.set_result(result)
+        if self.journal is not None:
+            self.journal.append({"key": key, "expires": entry.expires,
+                                 "fingerprint": payload_fingerprint, "result": result})
+        return result, False
+
+    def load(self) -> int:
+        """
+        從日誌載入仍在窗口內的記錄並壓縮日誌，返回載入的鍵數
+        """
+        if self.journal is None:
+            return 0
+        now = self.clock()
+        for record in self.journal.read():
+            if record["expires"] > now:
+                self.entries[record["key"]] = _Entry(record["expires"], record["fingerprint"], record["result"])
+                self.entries.move_to_end(record["key"])
+        self._evict(now)
+        self.compact()
+        return len(self.entries)
+
+    def _records(self) -> list:
+        return [
+            {"key": key, "expires": entry.expires, "fingerprint": entry.fingerprint, "result": entry.result}
+            for key, entry in self.entries.items() if entry.future is None
+        ]
+
+    def compact(self) -> int:
+        self.journal.buffer = []
+        return self.journal.rewrite(self._records())
+
+    async def flush(self):
+        """
+        在執行緒中寫盤；日誌行數遠多於存活的鍵時，以當前存活記錄重寫日誌
+        """
+        if self.journal is None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.journal.flush)
+        if self.journal.lines > COMPACT_RATIO * len(self.entries) + COMPACT_MIN_LINES:
+            self._evict(self.clock())
+            # 記錄在事件循環中取出並清空緩存，緩存中的項都已包含在內
+            records = self._records()
+            self.journal.buffer = []
+            await loop.run_in_executor(None, self.journal.rewrite, records)
+
+    async def run_journal(self, interval: float = IDEMPOTENCY_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Idempotency journal error: {e}")
+
+
+idempotency_store = IdempotencyStore(journal=Journal(IDEMPOTENCY_JOURNAL) if IDEMPOTENCY_JOURNAL else None)
+
+
+async def idempotent(user_id: str, key: Optional[str], payload: dict, response: Response,
+                     operation: Callable[[], Awaitable], store: IdempotencyStore = None):
+    """
+    有 Idempotency-Key 時以 (用戶, 鍵) 去重，重試返回第一次的結果並加上 Idempotent-Replayed 標頭
+    operation 需返回可 JSON 序列化的結果
+    """
+    if key is None:
+        return await operation()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid idempotency key")
+    store = store or idempotency_store
+    try:
+        result, replayed = await store.run(f"{user_id}:{key}", fingerprint(payload), operation)
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
@@ -0,0 +1,265 @@
+"""
+歷史價格批量導入工具
+用法: python importer.py prices.csv [more.parquet ...] --interval 1d --batch-size 5000 --concurrency 4
+
+檔案需包含 symbol, timestamp, open, high, low, close 欄位，volume 與 name 可選
+"""
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from database import Database
+from fixedpoint import to_ticks
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+REQUIRED_COLUMNS = ('symbol', 'timestamp', 'open', 'high', 'low', 'close')
+
+
+def read_csv_chunks(path: str, chunk_size: int, skip_rows: int = 0) -> Iterator[list]:
+    """
+    以串流方式按塊讀取 CSV
+    """
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing columns in {path}: {', '.join(missing)}")
+        chunk = []
+        for i, row in enumerate(reader):
+            if i < skip_rows:
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def read_parquet_chunks(path: str, chunk_size: int, skip_rows: int = 0) -> Iterator[list]:
+    """
+    以串流方式按塊讀取 Parquet，需要安裝 pyarrow
+    """
+    if pq is None:
+        raise RuntimeError("pyarrow is required to import Parquet files")
+    parquet = pq.ParquetFile(path)
+    missing = [c for c in REQUIRED_COLUMNS if c not in parquet.schema_arrow.names]
+    if missing:
+        raise ValueError(f"Missing columns in {path}: {', '.join(missing)}")
+    chunk = []
+    seen = 0
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        rows = batch.to_pylist()
+        if seen + len(rows) <= skip_rows:
+            seen += len(rows)
+            continue
+        rows = rows[max(skip_rows - seen, 0):]
+        seen += len(rows)
+        chunk.extend(rows)
+        while len(chunk) >= chunk_size:
+            yield chunk[:chunk_size]
+            chunk = chunk[chunk_size:]
+    if chunk:
+        yield chunk
+
+
+def parse_timestamp(value) -> str:
+    if isinstance(value, datetime):
+        ts = value
+    else:
+        ts = datetime.fromisoformat(str(value).strip())
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.isoformat()
+
+
+def validate_row(row: dict, interval: str) -> Optional[dict]:
+    """
+    檢查並正規化一行價格數據，無效的返回 None
+    """
+    try:
+        symbol = str(row['symbol']).strip().upper()
+        open_, high, low, close = (float(row[c]) for c in ('open', 'high', 'low', 'close'))
+        volume = int(float(row.get('volume') or 0))
+        start_time = parse_timestamp(row['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(math.isfinite(v) for v in (open_, high, low, close)):
+        return None
+    if not symbol or min(open_, high, low, close) <= 0 or volume < 0:
+        return None
+    if high < max(open_, close, low) or low > min(open_, close):
+        return None
+    return {
+        "symbol": symbol,
+        "name": str(row.get('name') or symbol),
+        "interval": interval,
+        "start_time": start_time,
+        "open": open_,
+        "high": high,
+        "low": low,
+        "close": close,
+        "volume": volume,
+    }
+
+
+def clean_chunk(rows: list, interval: str) -> tuple:
+    """
+    驗證並去重 (同一股票同一時間只保留最後一行)，返回 (有效行, 無效行數)
+    """
+    unique = {}
+    invalid = 0
+    for row in rows:
+        clean = validate_row(row, interval)
+        if clean is None:
+            invalid += 1
+            continue
+        unique[(clean['symbol'], clean['start_time'])] = clean
+    return list(unique.values()), invalid
+
+
+class Checkpoint:
+    """
+    記錄每個檔案已連續完成的行數，中斷後可從該處繼續
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.files = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f).get('files', {})
+
+    def rows_done(self, file_path: str) -> int:
+        return self.files.get(os.path.abspath(file_path), 0)
+
+    def save(self, file_path: str, rows_done: int):
+        self.files[os.path.abspath(file_path)] = rows_done
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'files': self.files}, f)
+        os.replace(tmp, self.path)
+
+
+class PriceImporter:
+    def __init__(self, db: Database, interval: str = '1d', batch_size: int = 5000,
+                 concurrency: int = 4, checkpoint: Checkpoint = None):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.known_symbols = set()
+        self.latest = {}
+        self.rows_written = 0
+        self.rows_invalid = 0
+
+    def _chunks(self, path: str, skip_rows: int) -> Iterator[list]:
+        if path.endswith('.parquet') or path.endswith('.pq'):
+            return read_parquet_chunks(path, self.batch_size, skip_rows)
+        return read_csv_chunks(path, self.batch_size, skip_rows)
+
+    async def _write_chunk(self, rows: list):
+        new_symbols = {}
+        for row in rows:
+            if row['symbol'] not in self.known_symbols:
+                new_symbols[row['symbol']] = {"symbol": row['symbol'], "name": row['name'],
+                                              "price": to_ticks(row['close'])}
+            latest = self.latest.get(row['symbol'])
+            if latest is None or row['start_time'] >= latest[0]:
+                self.latest[row['symbol']] = (row['start_time'], row['close'])
+        if new_symbols:
+            if await self.db.insert_stocks(list(new_symbols.values())) is None:
+                raise RuntimeError("Failed to insert stocks")
+            self.known_symbols.update(new_symbols)
+        if await self.db.upsert_candles(rows) is None:
+            raise RuntimeError("Failed to write candles")
+
+    async def import_file(self, path: str):
+        start_row = self.checkpoint.rows_done(path)
+        if start_row:
+            print(f"Resuming {path} from row {start_row}")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        finished = {}
+        next_index = 0
+        committed = start_row
+        started = time.perf_counter()
+
+        async def run(index: int, raw: list):
+            nonlocal next_index, committed
+            try:
+                rows, invalid = clean_chunk(raw, self.interval)
+                if rows:
+                    await self._write_chunk(rows)
+                self.rows_written += len(rows)
+                self.rows_invalid += invalid
+                # 只有連續完成的塊才推進檢查點
+                finished[index] = len(raw)
+                while next_index in finished:
+                    committed += finished.pop(next_index)
+                    next_index += 1
+                self.checkpoint.save(path, committed)
+                elapsed = time.perf_counter() - started
+                print(f"{path}: {committed} rows committed, {self.rows_written / max(elapsed, 1e-9):,.0f} rows/s")
+            finally:
+                semaphore.release()
+
+        tasks = []
+        for index, raw in enumerate(self._chunks(path, start_row)):
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run(index, raw)))
+        await asyncio.gather(*tasks)
+
+    async def run(self, paths: list) -> dict:
+        started = time.perf_counter()
+        self.known_symbols = {stock.symbol for stock in await self.db.get_stocks()}
+        for path in paths:
+            await self.import_file(path)
+        if self.latest:
+            # K線保留小數，股票現價換算為整數 tick
+            await self.db.update_stock_prices({symbol: to_ticks(close) for symbol, (_, close) in self.latest.items()})
+        elapsed = time.perf_counter() - started
+        return {
+            "rows_written": self.rows_written,
+            "rows_invalid": self.rows_invalid,
+            "seconds": elapsed,
+            "rows_per_second": self.rows_written / elapsed if elapsed else 0.0,
+        }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bulk import historical prices into Stock and Candle")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--interval', default='1d')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--checkpoint', default='.import_checkpoint.json')
+    args = parser.parse_args()
+
+    importer = PriceImporter(
+        Database(),
+        interval=args.interval,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        checkpoint=Checkpoint(args.checkpoint),
+    )
+    stats = await importer.run(args.files)
+    print(
+        f"Imported {stats['rows_written']} rows ({stats['rows_invalid']} invalid) "
+        f"in {stats['seconds']:.1f}s, {stats['rows_per_second']:,.0f} rows/s"
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,488 @@
+import math
+import os
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+import numpy as np
+from backtest import load_history, moving_average, moving_std
+from candles import INTERVAL_SECONDS, Bar
+from clock import NANOS_PER_SECOND, to_datetime
+from database import Database
+
+INDICATOR_CACHE_SIZE = int(os.getenv('INDICATOR_CACHE_SIZE', '256'))
+# 每個緩存序列最多保留的點數 (接口一次最多返回 10000 點)，超過兩倍時裁剪
+INDICATOR_MAX_POINTS = int(os.getenv('INDICATOR_MAX_POINTS', '10000'))
+
+# 分塊計算指數加權時，塊內權重的最大放大倍數，控制浮點誤差
+_EWM_MAX_SCALE = math.log(1e8)
+
+
+def _ewm(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """
+    向量化計算 y[i] = (1 - alpha) * y[i - 1] + alpha * x[i]，y[-1] = initial
+    分塊以累加和求解遞推，避免逐筆 Python 循環
+    """
+    result = np.empty(len(values))
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        result[:] = values
+        return result
+    block = max(1, int(_EWM_MAX_SCALE / -math.log(decay)))
+    carry = initial
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(len(chunk))
+        y = decay * powers * carry + alpha * powers * np.cumsum(chunk / powers)
+        result[start:start + len(chunk)] = y
+        carry = y[-1]
+    return result
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    指數移動平均，以前 period 個值的簡單平均作為起點
+    """
+    result = np.full(len(values), np.nan)
+    if len(values) < period:
+        return result
+    seed = float(np.mean(values[:period]))
+    result[period - 1] = seed
+    result[period:] = _ewm(values[period:], 2.0 / (period + 1), seed)
+    return result
+
+
+def _wilder_averages(close: np.ndarray, period: int) -> tuple:
+    avg_gain = np.full(len(close), np.nan)
+    avg_loss = np.full(len(close), np.nan)
+    if len(close) <= period:
+        return avg_gain, avg_loss
+    diff = np.diff(close)
+    gains = np.maximum(diff, 0.0)
+    losses = np.maximum(-diff, 0.0)
+    avg_gain[period] = gains[:period].mean()
+    avg_loss[period] = losses[:period].mean()
+    avg_gain[period + 1:] = _ewm(gains[period:], 1.0 / period, avg_gain[period])
+    avg_loss[period + 1:] = _ewm(losses[period:], 1.0 / period, avg_loss[period])
+    return avg_gain, avg_loss
+
+
+def _rsi_value(avg_gain: float, avg_loss: float) -> float:
+    if avg_loss == 0:
+        return 100.0 if avg_gain > 0 else 50.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+class EMAState:
+    """
+    單一數列的指數移動平均狀態，供 EMA 與 MACD 共用
+    """
+    __slots__ = ('period', 'alpha', 'count', 'total', 'value')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = None
+
+    def push(self, x: float) -> Optional[float]:
+        self.count += 1
+        if self.value is None:
+            self.total += x
+            if self.count == self.period:
+                self.value = self.total / self.period
+            return self.value
+        self.value += self.alpha * (x - self.value)
+        return self.value
+
+    def prime(self, values: np.ndarray):
+        self.count = len(values)
+        if self.count < self.period:
+            self.total = float(np.sum(values))
+            self.value = None
+        else:
+            self.value = float(ema(values, self.period)[-1])
+
+
+# 串流指標：update(bar) 以 O(1) 更新並返回最新值，prime(data) 從批量計算的結果恢復狀態
+# batch(data, **params) 對整段歷史向量化計算，data 為 load_history 格式的 OHLCV 陣列
+
+class SMA:
+    outputs = ('value',)
+    params = {'period': 20}
+
+    def __init__(self, period: int = 20):
+        self.period = period
+        self.window = deque()
+        self.total = 0.0
+
+    def update(self, bar) -> Optional[float]:
+        self.window.append(bar.close)
+        self.total += bar.close
+        if len(self.window) > self.period:
+            self.total -= self.window.popleft()
+        if len(self.window) < self.period:
+            return None
+        return self.total / self.period
+
+    def prime(self, data: dict):
+        self.window = deque(data['close'][-self.period:].tolist())
+        self.total = sum(self.window)
+
+    @staticmethod
+    def batch(data: dict, period: int = 20) -> dict:
+        return {'value': moving_average(data['close'], period)}
+
+
+class EMA:
+    outputs = ('value',)
+    params = {'period': 20}
+
+    def __init__(self, period: int = 20):
+        self.state = EMAState(period)
+
+    def update(self, bar) -> Optional[float]:
+        return self.state.push(bar.close)
+
+    def prime(self, data: dict):
+        self.state.prime(data['close'])
+
+    @staticmethod
+    def batch(data: dict, period: int = 20) -> dict:
+        return {'value': ema(data['close'], period)}
+
+
+class RSI:
+    """
+    Wilder 平滑的相對強弱指標
+    """
+    outputs = ('value',)
+    params = {'period': 14}
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.previous = None
+        self.count = 0
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.avg_gain = None
+        self.avg_loss = None
+
+    def update(self, bar) -> Optional[float]:
+        close = bar.close
+        if self.previous is None:
+            self.previous = close
+            return None
+        change = close - self.previous
+        self.previous = close
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        if self.avg_gain is None:
+            self.count += 1
+            self.gain_sum += gain
+            self.loss_sum += loss
+            if self.count < self.period:
+                return None
+            self.avg_gain = self.gain_sum / self.period
+            self.avg_loss = self.loss_sum / self.period
+        else:
+            self.avg_gain += (gain - self.avg_gain) / self.period
+            self.avg_loss += (loss - self.avg_loss) / self.period
+        return _rsi_value(self.avg_gain, self.avg_loss)
+
+    def prime(self, data: dict):
+        close = data['close']
+        if not len(close):
+            return
+        self.previous = float(close[-1])
+        if len(close) <= self.period:
+            diff = np.diff(close)
+            self.count = len(diff)
+            self.gain_sum = float(np.maximum(diff, 0.0).sum())
+            self.loss_sum = float(np.maximum(-diff, 0.0).sum())
+            return
+        avg_gain, avg_loss = _wilder_averages(close, self.period)
+        self.avg_gain = float(avg_gain[-1])
+        self.avg_loss = float(avg_loss[-1])
+
+    @staticmethod
+    def batch(data: dict, period: int = 14) -> dict:
+        avg_gain, avg_loss = _wilder_averages(data['close'], period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+        value = np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, 50.0), value)
+        value[np.isnan(avg_gain)] = np.nan
+        return {'value': value}
+
+
+class MACD:
+    outputs = ('macd', 'signal', 'histogram')
+    params = {'fast': 12, 'slow': 26, 'signal': 9}
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        if fast >= slow:
+            raise ValueError("Fast period must be shorter than slow period")
+        self.fast = EMAState(fast)
+        self.slow = EMAState(slow)
+        self.signal = EMAState(signal)
+
+    def update(self, bar) -> Optional[tuple]:
+        fast = self.fast.push(bar.close)
+        slow = self.slow.push(bar.close)
+        if slow is None:
+            return None
+        macd = fast - slow
+        signal = self.signal.push(macd)
+        return macd, signal, None if signal is None else macd - signal
+
+    def prime(self, data: dict):
+        close = data['close']
+        self.fast.prime(close)
+        self.slow.prime(close)
+        if len(close) >= self.slow.period:
+            start = self.slow.period - 1
+            self.signal.prime(ema(close, self.fast.period)[start:] - ema(close, self.slow.period)[start:])
+
+    @staticmethod
+    def batch(data: dict, fast: int = 12, slow: int = 26, signal: int = 9) -> dict:
+        close = data['close']
+        macd = ema(close, fast) - ema(close, slow)
+        signal_line = np.full(len(close), np.nan)
+        if len(close) >= slow:
+            signal_line[slow - 1:] = ema(macd[slow - 1:], signal)
+        return {'macd': macd, 'signal': signal_line, 'histogram': macd - signal_line}
+
+
+class Bollinger:
+    outputs = ('middle', 'upper', 'lower')
+    params = {'period': 20, 'k': 2.0}
+
+    def __init__(self, period: int = 20, k: float = 2.0):
+        self.period = period
+        self.k = k
+        self.window = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, bar) -> Optional[tuple]:
+        close = bar.close
+        self.window.append(close)
+        self.total += close
+        self.total_sq += close * close
+        if len(self.window) > self.period:
+            old = self.window.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+        if len(self.window) < self.period:
+            return None
+        mean = self.total / self.period
+        std = math.sqrt(max(self.total_sq / self.period - mean * mean, 0.0))
+        return mean, mean + self.k * std, mean - self.k * std
+
+    def prime(self, data: dict):
+        self.window = deque(data['close'][-self.period:].tolist())
+        self.total = sum(self.window)
+        self.total_sq = sum(x * x for x in self.window)
+
+    @staticmethod
+    def batch(data: dict, period: int = 20, k: float = 2.0) -> dict:
+        middle = moving_average(data['close'], period)
+        std = moving_std(data['close'], period)
+        return {'middle': middle, 'upper': middle + k * std, 'lower': middle - k * std}
+
+
+class VWAP:
+    """
+    以典型價格 (高 + 低 + 收) / 3 計算的累計成交量加權均價
+    """
+    outputs = ('value',)
+    params = {}
+
+    def __init__(self):
+        self.price_volume = 0.0
+        self.volume = 0.0
+
+    def update(self, bar) -> Optional[float]:
+        typical = (bar.high + bar.low + bar.close) / 3.0
+        self.price_volume += typical * bar.volume
+        self.volume += bar.volume
+        return self.price_volume / self.volume if self.volume else None
+
+    def prime(self, data: dict):
+        typical = (data['high'] + data['low'] + data['close']) / 3.0
+        self.price_volume = float(np.sum(typical * data['volume']))
+        self.volume = float(np.sum(data['volume']))
+
+    @staticmethod
+    def batch(data: dict) -> dict:
+        typical = (data['high'] + data['low'] + data['close']) / 3.0
+        volume = np.cumsum(data['volume']).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = np.cumsum(typical * data['volume']) / volume
+        value[volume == 0] = np.nan
+        return {'value': value}
+
+
+INDICATORS = {
+    'sma': SMA,
+    'ema': EMA,
+    'rsi': RSI,
+    'macd': MACD,
+    'bollinger': Bollinger,
+    'vwap': VWAP,
+}
+
+
+def resolve_params(name: str, params: dict) -> dict:
+    """
+    合併預設參數，未知指標或參數時拋出 ValueError
+    """
+    indicator = INDICATORS.get(name)
+    if indicator is None:
+        raise ValueError(f"Unknown indicator, choose one of: {', '.join(INDICATORS)}")
+    unknown = set(params) - set(indicator.params)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+    resolved = dict(indicator.params)
+    resolved.update(params)
+    return resolved
+
+
+def _empty_history() -> dict:
+    history = {key: np.array([], dtype=np.float64) for key in ('open', 'high', 'low', 'close')}
+    history['volume'] = np.array([], dtype=np.int64)
+    history['timestamp'] = []
+    return history
+
+
+async def load_symbol_history(symbol: str, interval: str) -> dict:
+    history = await load_history(Database(), [symbol], interval)
+    return history.get(symbol) or _empty_history()
+
+
+class Series:
+    __slots__ = ('timestamps', 'columns', 'stream')
+
+    def __init__(self, timestamps: list, columns: dict, stream):
+        self.timestamps = timestamps
+        self.columns = columns
+        self.stream = stream
+
+    def tail(self, limit: int) -> dict:
+        """
+        最近 limit 個點，NaN 轉為 None 以便序列化
+        """
+        return {
+            "timestamps": self.timestamps[-limit:],
+            **{
+                name: [None if value is None or value != value else value for value in column[-limit:]]
+                for name, column in self.columns.items()
+            },
+        }
+
+    def trim(self, size: int):
+        """
+        只保留最近 size 個點，串流狀態不受影響
+        """
+        del self.timestamps[:-size]
+        for column in self.columns.values():
+            del column[:-size]
+
+
+class IndicatorEngine:
+    """
+    按 (股票, 週期, 指標, 參數) 緩存指標序列
+    首次請求時從歷史K線批量計算，之後每根K線收盤以 O(1) 串流更新，緩存按 LRU 淘汰
+    比收到的K線更長的週期由收盤K線合成，每個序列最多保留 max_points 個點
+    """
+
+    def __init__(self, loader: Callable = load_symbol_history, cache_size: int = INDICATOR_CACHE_SIZE,
+                 max_points: int = INDICATOR_MAX_POINTS):
+        self.loader = loader
+        self.cache_size = cache_size
+        self.max_points = max_points
+        self.cache = OrderedDict()
+        self.by_source = {}
+        # (股票, 週期) -> 正在合成的K線
+        self.rolling = {}
+
+    async def get(self, symbol: str, interval: str, name: str, params: dict = None) -> Series:
+        params = resolve_params(name, params or {})
+        key = (symbol, interval, name, tuple(sorted(params.items())))
+        series = self.cache.get(key)
+        if series is not None:
+            self.cache.move_to_end(key)
+            return series
+        history = await self.loader(symbol, interval)
+        indicator = INDICATORS[name]
+        columns = indicator.batch(history, **params)
+        stream = indicator(**params)
+        stream.prime(history)
+        series = Series(
+            list(history['timestamp']),
+            {column: columns[column].tolist() for column in indicator.outputs},
+            stream,
+        )
+        series.trim(self.max_points)
+        self.cache[key] = series
+        self.by_source.setdefault((symbol, interval), set()).add(key)
+        while len(self.cache) > self.cache_size:
+            evicted, _ = self.cache.popitem(last=False)
+            keys = self.by_source[evicted[:2]]
+            keys.discard(evicted)
+            if not keys:
+                del self.by_source[evicted[:2]]
+                self.rolling.pop(evicted[:2], None)
+        return series
+
+    def _evict(self, source: tuple):
+        for key in self.by_source.pop(source, ()):
+            del self.cache[key]
+        self.rolling.pop(source, None)
+
+    def _push(self, source: tuple, bar):
+        timestamp = to_datetime(bar.start)
+        for key in self.by_source.get(source, ()):
+            series = self.cache[key]
+            value = series.stream.update(bar)
+            if not isinstance(value, tuple):
+                value = (value,) * len(series.columns)
+            series.timestamps.append(timestamp)
+            for column, item in zip(series.columns.values(), value):
+                column.append(item)
+            if len(series.timestamps) > 2 * self.max_points:
+                series.trim(self.max_points)
+
+    def on_bar(self, bar):
+        """
+        K線收盤時更新所有已緩存的相關序列：同週期直接更新；更長且能整除的週期把收盤K線合成，
+        合成的K線在下一個週期的第一根K線到達時收盤；無法合成的週期從緩存移除，下次請求時重新載入
+        """
+        sources = [source for source in self.by_source if source[0] == bar.symbol]
+        if not sources:
+            return
+        nanos = INTERVAL_SECONDS[bar.interval] * NANOS_PER_SECOND
+        for source in sources:
+            interval = source[1]
+            if interval == bar.interval:
+                self._push(source, bar)
+                continue
+            target = INTERVAL_SECONDS.get(interval, 0) * NANOS_PER_SECOND
+            if target <= nanos or target % nanos:
+                self._evict(source)
+                continue
+            start = bar.start - bar.start % target
+            rolled = self.rolling.get(source)
+            if rolled is not None and rolled.start != start:
+                self._push(source, rolled)
+                rolled = None
+            if rolled is None:
+                rolled = self.rolling[source] = Bar(bar.symbol, interval, start, bar.open, bar.volume)
+                rolled.high, rolled.low, rolled.close = bar.high, bar.low, bar.close
+            else:
+                rolled.high = max(rolled.high, bar.high)
+                rolled.low = min(rolled.low, bar.low)
+                rolled.close = bar.close
+                rolled.volume += bar.volume
+
+
+indicator_engine = IndicatorEngine()
@@ -0,0 +1,62 @@
+import json
+import os
+from typing import Iterator
+
+
+class Journal:
+    """
+    追加寫入的 JSON 行日誌：記錄先緩存在記憶體，flush 時整批寫入並 fsync
+    flush 可在執行緒中調用，緩存以交換方式取出，不會丟失並發追加的記錄
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.buffer = []
+        # 文件中的行數，供調用方判斷何時壓縮
+        self.lines = 0
+
+    def append(self, record: dict):
+        self.buffer.append(json.dumps(record, separators=(',', ':')))
+
+    def flush(self) -> int:
+        lines, self.buffer = self.buffer, []
+        if not lines:
+            return 0
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.lines += len(lines)
+        return len(lines)
+
+    def read(self) -> Iterator[dict]:
+        """
+        依序讀出所有記錄，崩潰時寫了一半的末行被略過
+        """
+        if not os.path.exists(self.path):
+            return
+        count = 0
+        with open(self.path) as f:
+            for line in f:
+                count += 1
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+        self.lines = count
+
+    def rewrite(self, records) -> int:
+        """
+        以給定記錄原子地替換整個日誌 (壓縮)，未 flush 的緩存保留在之後追加
+        """
+        tmp = f"{self.path}.tmp"
+        count = 0
+        with open(tmp, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.lines = count
+        return count
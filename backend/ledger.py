@@ -0,0 +1,333 @@
+import asyncio
+import math
+import os
+from typing import Callable, Optional
+
+# 預設風控參數，可由環境變量覆蓋
+DEFAULT_MAX_POSITION = int(os.getenv('RISK_MAX_POSITION', '100000'))
+DEFAULT_ALLOW_SHORT = os.getenv('RISK_ALLOW_SHORT', 'false').lower() == 'true'
+# 保證金帳戶的預設初始與維持保證金比例 (佔持倉總市值)
+DEFAULT_MAINTENANCE_RATIO = float(os.getenv('MARGIN_MAINTENANCE_RATIO', '0.25'))
+RECONCILE_INTERVAL = float(os.getenv('RISK_RECONCILE_INTERVAL', '60'))
+
+
+class RiskCheckError(Exception):
+    """
+    下單前風控檢查未通過
+    """
+    pass
+
+
+class CashAccount:
+    """
+    資金、凍結額與價格同為整數 tick (見 fixedpoint)，股數乘以價格即為資金
+    """
+    __slots__ = ('user_id', 'cash', 'positions', 'max_position', 'allow_short', 'margin_ratio',
+                 'maintenance_ratio', 'reserved_cash', 'pending_buy', 'pending_sell')
+
+    def __init__(self, user_id: str, cash: int = 0, positions: dict = None,
+                 max_position: Optional[int] = None, allow_short: bool = DEFAULT_ALLOW_SHORT,
+                 margin_ratio: Optional[float] = None, maintenance_ratio: Optional[float] = None):
+        self.user_id = user_id
+        self.cash = cash
+        self.positions = dict(positions or {})
+        self.max_position = max_position if max_position is not None else DEFAULT_MAX_POSITION
+        self.allow_short = allow_short
+        # margin_ratio 為 None 時是現金帳戶；保證金帳戶可融資買入與放空，現金可為負
+        self.margin_ratio = margin_ratio
+        self.maintenance_ratio = maintenance_ratio if maintenance_ratio is not None else DEFAULT_MAINTENANCE_RATIO
+        # 未成交委託凍結的資金 (保證金帳戶為初始保證金) 與股數
+        self.reserved_cash = 0
+        self.pending_buy = {}
+        self.pending_sell = {}
+
+    @property
+    def is_margin(self) -> bool:
+        return self.margin_ratio is not None
+
+    @property
+    def buying_power(self) -> int:
+        return self.cash - self.reserved_cash
+
+    def available_quantity(self, symbol: str) -> int:
+        """
+        可賣出的股數 (持倉扣除已凍結的賣單)
+        """
+        return self.positions.get(symbol, 0) - self.pending_sell.get(symbol, 0)
+
+
+class Reservation:
+    """
+    每筆未成交委託一個，隨委託數量增長
+    """
+    __slots__ = ('order_id', 'user_id', 'symbol', 'side', 'quantity', 'price', 'margin')
+
+    def __init__(self, order_id: str, user_id: str, symbol: str, side: str, quantity: int, price: int,
+                 margin: Optional[int] = None):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        # 保證金帳戶每股凍結的初始保證金，None 表示按現金帳戶凍結買入金額
+        self.margin = margin
+
+    @property
+    def cash(self) -> int:
+        if self.margin is not None:
+            return self.quantity * self.margin
+        return self.quantity * self.price if self.side == 'buy' else 0
+
+
+class AccountLedger:
+    """
+    記憶體中的資金與持倉快取，每筆委託在進入撮合前以 O(1) 完成風控檢查
+    """
+
+    def __init__(self, price_feed=None):
+        self.accounts = {}
+        self.reservations = {}
+        # 保證金帳戶按最新價估值
+        self.price_feed = price_feed
+        # 上次對帳開始後資金或持倉有變動的帳戶
+        self.changed = set()
+
+    def load_account(self, user_id: str, cash: int, positions: dict = None,
+                     max_position: Optional[int] = None, allow_short: bool = DEFAULT_ALLOW_SHORT,
+                     margin_ratio: Optional[float] = None,
+                     maintenance_ratio: Optional[float] = None) -> CashAccount:
+        account = CashAccount(user_id, cash, positions, max_position, allow_short, margin_ratio, maintenance_ratio)
+        # 重新載入時保留尚未成交的凍結
+        old = self.accounts.get(user_id)
+        if old:
+            account.reserved_cash = old.reserved_cash
+            account.pending_buy = old.pending_buy
+            account.pending_sell = old.pending_sell
+        self.accounts[user_id] = account
+        return account
+
+    def get_account(self, user_id: str) -> Optional[CashAccount]:
+        return self.accounts.get(user_id)
+
+    def valuation(self, account: CashAccount, prices: dict = None) -> tuple:
+        """
+        返回 (權益, 持倉總市值)，空頭以絕對值計入總市值；沒有最新價的股票不計
+        """
+        equity = account.cash
+        gross = 0
+        for symbol, quantity in account.positions.items():
+            price = (prices or {}).get(symbol)
+            if price is None and self.price_feed:
+                price = self.price_feed.last_price(symbol)
+            if price:
+                equity += quantity * price
+                gross += abs(quantity) * price
+        return equity, gross
+
+    def _check_margin(self, account: CashAccount, symbol: str, side: str, quantity: int, price: int) -> int:
+        """
+        保證金帳戶的委託只檢查新增曝險所需的初始保證金，平倉部分不需保證金，
+        返回每股凍結額 (向上取整到 tick)
+        """
+        position = account.positions.get(symbol, 0)
+        if side == 'buy':
+            closing = max(-(position + account.pending_buy.get(symbol, 0)), 0)
+        else:
+            closing = max(position - account.pending_sell.get(symbol, 0), 0)
+        opening = max(quantity - closing, 0)
+        required = math.ceil(opening * price * account.margin_ratio)
+        equity, gross = self.valuation(account, {symbol: price})
+        if required and required > equity - gross * account.margin_ratio - account.reserved_cash:
+            raise RiskCheckError("Insufficient margin")
+        return -(-required // quantity)
+
+    def check_order(self, order_id: str, user_id: str, symbol: str, side: str,
+                    quantity: int, price: int, forced: bool = False) -> Reservation:
+        """
+        檢查購買力 (保證金帳戶為初始保證金)、持倉上限與放空限制，通過後凍結資金或股數
+        市價單需傳入參考價格；強制平倉 (forced) 略過上述檢查，只做凍結
+        """
+        if order_id in self.reservations:
+            raise RiskCheckError("Duplicate order id")
+        if side not in ('buy', 'sell'):
+            raise RiskCheckError(f"Unknown side: {side}")
+        if quantity <= 0 or price <= 0:
+            raise RiskCheckError("Quantity and price must be positive")
+
+        account = self.accounts.get(user_id)
+        if account is None:
+            raise RiskCheckError("Cash account not found")
+
+        position = account.positions.get(symbol, 0)
+        margin = None
+        if account.is_margin:
+            margin = 0 if forced else self._check_margin(account, symbol, side, quantity, price)
+        if side == 'buy':
+            cost = quantity * price
+            if margin is None and cost > account.buying_power and not forced:
+                raise RiskCheckError("Insufficient buying power")
+            if position + account.pending_buy.get(symbol, 0) + quantity > account.max_position and not forced:
+                raise RiskCheckError("Position limit exceeded")
+            account.pending_buy[symbol] = account.pending_buy.get(symbol, 0) + quantity
+        else:
+            if not (account.allow_short or account.is_margin or forced) \
+                    and quantity > account.available_quantity(symbol):
+                raise RiskCheckError("Short selling is not allowed")
+            if position - account.pending_sell.get(symbol, 0) - quantity < -account.max_position and not forced:
+                raise RiskCheckError("Position limit exceeded")
+            account.pending_sell[symbol] = account.pending_sell.get(symbol, 0) + quantity
+
+        reservation = Reservation(order_id, user_id, symbol, side, quantity, price, margin)
+        account.reserved_cash += reservation.cash
+        self.reservations[order_id] = reservation
+        return reservation
+
+    def _unreserve(self, account: CashAccount, reservation: Reservation, quantity: int):
+        pending = account.pending_buy if reservation.side == 'buy' else account.pending_sell
+        left = pending.get(reservation.symbol, 0) - quantity
+        if left > 0:
+            pending[reservation.symbol] = left
+        else:
+            pending.pop(reservation.symbol, None)
+        before = reservation.cash
+        reservation.quantity -= quantity
+        account.reserved_cash = max(account.reserved_cash - (before - reservation.cash), 0)
+
+    def release(self, order_id: str) -> bool:
+        """
+        撤單時釋放剩餘的凍結
+        """
+        reservation = self.reservations.pop(order_id, None)
+        if reservation is None:
+            return False
+        account = self.accounts.get(reservation.user_id)
+        if account:
+            self._unreserve(account, reservation, reservation.quantity)
+        return True
+
+    def apply_fill(self, order_id: str, quantity: int, price: int):
+        """
+        成交後扣減凍結並更新資金與持倉
+        """
+        reservation = self.reservations.get(order_id)
+        if reservation is None:
+            raise RiskCheckError("Reservation not found")
+        account = self.accounts[reservation.user_id]
+        quantity = min(quantity, reservation.quantity)
+        self._unreserve(account, reservation, quantity)
+        self.changed.add(account.user_id)
+
+        symbol = reservation.symbol
+        if reservation.side == 'buy':
+            account.cash -= quantity * price
+            account.positions[symbol] = account.positions.get(symbol, 0) + quantity
+        else:
+            account.cash += quantity * price
+            account.positions[symbol] = account.positions.get(symbol, 0) - quantity
+        if account.positions[symbol] == 0:
+            del account.positions[symbol]
+
+        if reservation.quantity == 0:
+            del self.reservations[order_id]
+
+    def adjust_cash(self, user_id: str, amount: int) -> int:
+        """
+        撮合以外的資金變動 (期權權利金等)，扣款超過購買力時拋出 RiskCheckError，返回變動後的資金
+        """
+        account = self.accounts.get(user_id)
+        if account is None:
+            raise RiskCheckError("Cash account not found")
+        if amount < 0 and account.buying_power + amount < 0:
+            raise RiskCheckError("Insufficient buying power")
+        account.cash += amount
+        self.changed.add(user_id)
+        return account.cash
+
+    def apply_split(self, symbol: str, new_shares: int, old_shares: int) -> int:
+        """
+        拆股或合股時調整快取中的持倉與未成交凍結，返回調整的委託數
+        """
+        for account in self.accounts.values():
+            quantity = account.positions.get(symbol)
+            if quantity:
+                scaled = (abs(quantity) * new_shares // old_shares) * (1 if quantity > 0 else -1)
+                if scaled:
+                    account.positions[symbol] = scaled
+                else:
+                    del account.positions[symbol]
+            account.pending_buy.pop(symbol, None)
+            account.pending_sell.pop(symbol, None)
+
+        # 凍結股數由調整後的委託重新累計，避免逐項取整的誤差
+        adjusted = 0
+        for reservation in self.reservations.values():
+            if reservation.symbol != symbol:
+                continue
+            account = self.accounts.get(reservation.user_id)
+            before = reservation.cash
+            reservation.quantity = reservation.quantity * new_shares // old_shares
+            reservation.price = max(1, round(reservation.price * old_shares / new_shares))
+            if reservation.margin is not None:
+                reservation.margin = math.ceil(reservation.margin * old_shares / new_shares)
+            if account:
+                account.reserved_cash += reservation.cash - before
+                pending = account.pending_buy if reservation.side == 'buy' else account.pending_sell
+                if reservation.quantity:
+                    pending[symbol] = pending.get(symbol, 0) + reservation.quantity
+            adjusted += 1
+        return adjusted
+
+    async def reconcile(self, db, pending: Optional[Callable] = None) -> int:
+        """
+        以數據庫的 CashAccount 與 Portfolio 校正快取，返回被修正或移除的帳戶數
+        pending() 返回仍有成交未寫入數據庫的用戶，這些用戶與讀取期間有成交的用戶數據庫值已過時，留到下一輪
+        數據庫中已不存在且沒有未成交凍結的帳戶從快取移除
+        """
+        self.changed.clear()
+        stale = set(pending()) if pending else set()
+        accounts = await db.get_cash_accounts()
+        positions = {}
+        for row in await db.get_positions():
+            if row.quantity:
+                positions.setdefault(str(row.user.id), {})[row.stock.symbol] = row.quantity
+        stale |= self.changed
+        if pending:
+            stale |= set(pending())
+
+        corrected = 0
+        seen = set()
+        for row in accounts:
+            user_id = str(row.user.id)
+            seen.add(user_id)
+            if user_id in stale:
+                continue
+            user_positions = positions.get(user_id, {})
+            cached = self.accounts.get(user_id)
+            if cached is None or cached.cash != row.balance or cached.positions != user_positions:
+                corrected += 1
+            self.load_account(user_id, row.balance, user_positions, row.max_position, row.allow_short,
+                              row.margin_ratio, row.maintenance_ratio)
+        for user_id, account in list(self.accounts.items()):
+            if user_id in seen or user_id in stale:
+                continue
+            if account.reserved_cash or any(account.pending_buy.values()) or any(account.pending_sell.values()):
+                continue
+            del self.accounts[user_id]
+            corrected += 1
+        return corrected
+
+
+async def run_reconciliation(ledger: AccountLedger, db, interval: float = RECONCILE_INTERVAL,
+                             pending: Optional[Callable] = None):
+    """
+    定期與數據庫對帳
+    """
+    while True:
+        try:
+            corrected = await ledger.reconcile(db, pending)
+            if corrected:
+                print(f"Ledger reconciliation corrected {corrected} accounts")
+        except Exception as e:
+            print(f"Ledger reconciliation error: {e}")
+        await asyncio.sleep(interval)
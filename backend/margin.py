@@ -0,0 +1,258 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import uuid
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from auth import get_current_user
+from engine import Order
+from fixedpoint import from_ticks
+from ledger import AccountLedger, CashAccount
+from market import engine, ledger, price_feed, shard_pool
+from models import User
+
+router = APIRouter()
+
+# 定期全量重新計算所有保證金帳戶的間隔，作為增量索引之外的保底
+MARGIN_REINDEX_INTERVAL = float(os.getenv('MARGIN_REINDEX_INTERVAL', '60'))
+
+
+def margin_status(ledger: AccountLedger, account: CashAccount) -> dict:
+    """
+    帳戶的保證金概況，金額由 tick 換算為小數
+    """
+    equity, gross = ledger.valuation(account)
+    requirement = gross * account.maintenance_ratio
+    return {
+        "equity": from_ticks(equity),
+        "gross_exposure": from_ticks(gross),
+        "initial_requirement": from_ticks(gross * account.margin_ratio),
+        "maintenance_requirement": from_ticks(requirement),
+        "excess": from_ticks(equity - requirement),
+    }
+
+
+def breach_prices(account: CashAccount, prices: dict, excess: float, gross: float) -> dict:
+    """
+    把超額保證金按市值比例分給各持倉，每個持倉在「其餘價格不變、只虧掉自己那份」時的價格即為觸發價
+    只要沒有任何持倉越過自己的觸發價，總虧損必小於超額保證金，帳戶一定未跌破維持保證金
+    返回 {symbol: (方向, 觸發價)}，long 為價格跌破、short 為價格漲破
+    """
+    m = account.maintenance_ratio
+    result = {}
+    for symbol, quantity in account.positions.items():
+        price = prices.get(symbol)
+        if not price or not quantity:
+            continue
+        budget = excess * abs(quantity) * price / gross
+        if quantity > 0:
+            # 每漲跌一元，超額保證金變動 q (1 - m)
+            if m < 1:
+                result[symbol] = ('long', price - budget / (quantity * (1 - m)))
+        else:
+            result[symbol] = ('short', price + budget / (-quantity * (1 + m)))
+    return result
+
+
+class _BreachBook:
+    """
+    單一股票的觸發價索引，與條件單相同以轉換後的價格 x 統一方向：
+    多頭 x = price，空頭 x = -price，x 跌到鍵值以下即越過；以鍵值為最大堆，帳戶版本不符的項懶惰丟棄
+    """
+
+    def __init__(self):
+        self.heaps = {'long': [], 'short': []}
+        self.counter = itertools.count()
+
+    def add(self, side: str, price: float, user_id: str, version: int):
+        key = price if side == 'long' else -price
+        heapq.heappush(self.heaps[side], (-key, next(self.counter), user_id, version))
+
+    def crossed(self, price: float, versions: dict) -> list:
+        users = []
+        for side, x in (('long', price), ('short', -price)):
+            heap = self.heaps[side]
+            while heap and -heap[0][0] >= x:
+                _, _, user_id, version = heapq.heappop(heap)
+                if versions.get(user_id) == version:
+                    users.append(user_id)
+        return users
+
+    def __len__(self):
+        return sum(len(heap) for heap in self.heaps.values())
+
+
+class MarginEngine:
+    """
+    保證金帳戶的維持保證金監控：每個帳戶按持倉在各股票的觸發價建索引，
+    價格更新時只重新計算觸發價被越過的帳戶 O(log n + k)，跌破維持保證金的帳戶經撮合引擎強制平倉
+    有撮合分片時平倉委託送往股票所屬的分片
+    帳戶的資金或持倉變動 (成交) 時遞增版本並重建其觸發價，舊索引項懶惰失效
+    """
+
+    def __init__(self, ledger: AccountLedger, engine, price_feed=None, shard_pool=None):
+        self.ledger = ledger
+        self.engine = engine
+        self.shard_pool = shard_pool
+        self.price_feed = price_feed or ledger.price_feed
+        self.books = {}
+        self.versions = {}
+        self.thresholds = {}
+        # 仍在撮合隊列中的強制平倉委託數，處理完之前不重複平倉
+        self.liquidating = {}
+
+    def _book(self, symbol: str) -> _BreachBook:
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = _BreachBook()
+        return book
+
+    def _prices(self, account: CashAccount) -> dict:
+        return {symbol: self.price_feed.last_price(symbol) for symbol in account.positions}
+
+    def index(self, user_id: str) -> bool:
+        """
+        重新計算帳戶的觸發價並加入索引，帳戶已跌破維持保證金時返回 True
+        """
+        version = self.versions.get(user_id, 0) + 1
+        self.versions[user_id] = version
+        self.thresholds.pop(user_id, None)
+        account = self.ledger.get_account(user_id)
+        if account is None or not account.is_margin or not account.positions:
+            return False
+        equity, gross = self.ledger.valuation(account)
+        if not gross:
+            return False
+        excess = equity - gross * account.maintenance_ratio
+        # 已跌破的帳戶觸發價即為現價，平倉後仍不足時下一次跳價會再次檢查
+        thresholds = breach_prices(account, self._prices(account), max(excess, 0.0), gross)
+        for symbol, (side, price) in thresholds.items():
+            self._book(symbol).add(side, price, user_id, version)
+        self.thresholds[user_id] = thresholds
+        return excess < 0
+
+    def check(self, user_ids) -> list:
+        """
+        對帳戶重新索引，跌破的強制平倉，返回被平倉的帳戶
+        """
+        breached = [user_id for user_id in dict.fromkeys(user_ids)
+                    if user_id not in self.liquidating and self.index(user_id)]
+        for user_id in breached:
+            self.liquidate(user_id)
+        return breached
+
+    def on_price(self, symbol: str, old_price: Optional[float], price: float) -> list:
+        """
+        可直接作為 PriceFeed 的訂閱者
+        """
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+        return self.check(book.crossed(price, self.versions))
+
+    def on_fills(self, fills: list):
+        """
+        成交改變了現金與持倉，重建雙方帳戶的觸發價
+        """
+        users = []
+        for fill in fills:
+            users.append(fill.buyer_id)
+            users.append(fill.seller_id)
+        accounts = self.ledger.accounts
+        self.check(user_id for user_id in users if user_id in accounts and accounts[user_id].is_margin)
+
+    def liquidation_orders(self, account: CashAccount) -> list:
+        """
+        以市價平倉，從市值最大的持倉開始，直到權益回到初始保證金要求；權益為負時全部平倉
+        返回 [(symbol, side, quantity)]
+        """
+        prices = self._prices(account)
+        equity, gross = self.ledger.valuation(account)
+        orders = []
+        for symbol, quantity in sorted(account.positions.items(),
+                                       key=lambda item: -abs(item[1]) * (prices.get(item[0]) or 0)):
+            price = prices.get(symbol)
+            if not price:
+                continue
+            shortfall = gross * account.margin_ratio - equity
+            if shortfall <= 0 and equity > 0:
+                break
+            size = abs(quantity)
+            if equity > 0:
+                # 每平一股，初始保證金要求減少 price * margin_ratio
+                size = min(size, math.ceil(shortfall / (price * account.margin_ratio)))
+            orders.append((symbol, 'sell' if quantity > 0 else 'buy', size))
+            gross -= size * price
+        return orders
+
+    def liquidate(self, user_id: str) -> int:
+        account = self.ledger.get_account(user_id)
+        orders = self.liquidation_orders(account)
+        if not orders:
+            return 0
+        self.liquidating[user_id] = len(orders)
+        print(f"Liquidating margin account {user_id}: {orders}")
+        matcher = self.shard_pool or self.engine
+        for symbol, side, quantity in orders:
+            order = Order(f"liq-{uuid.uuid4().hex}", user_id, symbol, side, quantity, None, 'market')
+            matcher.submit_forced(order, self._on_liquidated)
+        return len(orders)
+
+    def _on_liquidated(self, order: Order):
+        left = self.liquidating.get(order.user_id, 1) - 1
+        if left > 0:
+            self.liquidating[order.user_id] = left
+            return
+        self.liquidating.pop(order.user_id, None)
+        self.index(order.user_id)
+
+    def load(self) -> int:
+        """
+        為所有保證金帳戶重建索引，返回帳戶數
+        """
+        self.books = {}
+        margin_users = [user_id for user_id, account in self.ledger.accounts.items() if account.is_margin]
+        self.check(margin_users)
+        return len(margin_users)
+
+    def status(self, user_id: str) -> Optional[dict]:
+        account = self.ledger.get_account(user_id)
+        if account is None:
+            return None
+        if not account.is_margin:
+            return {"margin": False}
+        return {
+            "margin": True,
+            "margin_ratio": account.margin_ratio,
+            "maintenance_ratio": account.maintenance_ratio,
+            **margin_status(self.ledger, account),
+            "liquidation_prices": {
+                symbol: {"side": side, "price": from_ticks(price)}
+                for symbol, (side, price) in self.thresholds.get(user_id, {}).items()
+            },
+            "liquidating": user_id in self.liquidating,
+        }
+
+    async def run(self, interval: float = MARGIN_REINDEX_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Margin reindex error: {e}")
+
+
+margin_engine = MarginEngine(ledger, engine, price_feed, shard_pool)
+
+
+@router.get("")
+async def get_margin(current_user: User = Depends(get_current_user)):
+    """
+    保證金狀態與各持倉的強制平倉觸發價
+    """
+    result = margin_engine.status(str(current_user.id))
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Account not found")
+    return result
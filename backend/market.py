@@ -0,0 +1,49 @@
+from candles import CandleAggregator
+from correlation import CorrelationTracker
+from depth import DepthFeed
+from engine import MatchingEngine
+from journal import Journal
+from ledger import AccountLedger
+from prices import PriceFeed
+from sessions import SessionManager
+from shards import MATCHING_SHARDS, ShardPool
+from settlement import SETTLEMENT_DEAD_LETTER, FillSettlement
+from streaming import broadcaster
+from triggers import TriggerIndex
+
+# 市場的全局狀態，由 app 啟動時載入並在各個路由之間共用
+
+# 最新價格快取
+price_feed = PriceFeed()
+
+# 下單前風控使用的資金帳戶快取，保證金帳戶按最新價估值
+ledger = AccountLedger(price_feed)
+
+# 撮合引擎與條件單觸發索引
+engine = MatchingEngine(ledger, price_feed)
+
+# MATCHING_SHARDS > 0 時普通委託與觸發的條件單按股票分散到多個撮合進程，本進程只做風控與結算
+shard_pool = ShardPool(MATCHING_SHARDS, engine) if MATCHING_SHARDS else None
+
+# 交易時段與開收盤集合競價，分片中的掛單在收盤前取回參加競價
+sessions = SessionManager(engine, shard_pool=shard_pool)
+
+# 觸發的條件單按當前時段撮合、參加集合競價或在休市時拒絕
+trigger_index = TriggerIndex(on_trigger=sessions.submit_triggered)
+price_feed.add_listener(trigger_index.on_price)
+
+# 成交後批量結算寫回數據庫
+settlement = FillSettlement(dead_letter=Journal(SETTLEMENT_DEAD_LETTER) if SETTLEMENT_DEAD_LETTER else None)
+engine.add_fill_listener(settlement.on_fills)
+
+# 由價格與成交即時聚合K線
+candles = CandleAggregator()
+price_feed.add_listener(candles.on_price)
+engine.add_fill_listener(candles.on_fills)
+
+# K線收盤時增量更新跨股票的協方差與相關係數
+correlations = CorrelationTracker()
+candles.add_listener(correlations.on_bar)
+
+# 委託簿深度的增量推送與快照，有撮合分片時使用分片回報的深度鏡像
+depth = DepthFeed(shard_pool or engine, broadcaster.publish)
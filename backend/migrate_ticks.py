@@ -0,0 +1,79 @@
+"""
+把舊版數據庫的 float64 價格與資金欄位升級為整數 tick (乘以 PRICE_SCALE 後四捨五入)
+必須在套用新的 dbschema/default.esdl 之前執行，之後 edgedb migration create 不會再有類型差異
+已經是 int64 的欄位會跳過，可重複執行；房間快照在載入時由 rooms.upgrade_snapshot 轉換
+用法:
+    python migrate_ticks.py --dry-run
+    python migrate_ticks.py
+"""
+import argparse
+import asyncio
+from database import DatabaseConnection
+from fixedpoint import PRICE_SCALE
+
+# (類型, 欄位)：user-048 由 float64 改為 int64 的欄位
+TICK_PROPERTIES = (
+    ('Stock', 'current_price'),
+    ('Transaction', 'price'),
+    ('Portfolio', 'average_price'),
+    ('Room', 'starting_cash'),
+    ('RoomMember', 'balance'),
+    ('CorporateAction', 'cash_paid'),
+    ('CashAccount', 'balance'),
+    ('CashLedgerEntry', 'amount'),
+)
+
+PROPERTY_TYPE_QUERY = """
+    SELECT schema::Property { target_name := .target.name }
+    FILTER .source[IS schema::ObjectType].name = <str>$type_name AND .name = <str>$name
+    LIMIT 1
+"""
+
+
+def alter_statement(type_name: str, name: str, scale: int = PRICE_SCALE) -> str:
+    """
+    就地轉換類型的 DDL，舊值乘以精度後四捨五入為整數
+    """
+    return (f"ALTER TYPE default::{type_name} {{ ALTER PROPERTY {name} {{ "
+            f"SET TYPE std::int64 USING (<std::int64>round(.{name} * {int(scale)})); }}; }};")
+
+
+async def migrate(client, scale: int = PRICE_SCALE, dry_run: bool = False) -> list:
+    """
+    在同一個事務中轉換所有仍為 float64 的欄位，返回轉換的 (類型, 欄位)
+    """
+    converted = []
+    async for tx in client.transaction():
+        async with tx:
+            converted = []
+            for type_name, name in TICK_PROPERTIES:
+                prop = await tx.query_single(PROPERTY_TYPE_QUERY, type_name=f"default::{type_name}", name=name)
+                if prop is None or prop.target_name != 'std::float64':
+                    continue
+                converted.append((type_name, name))
+                if not dry_run:
+                    await tx.execute(alter_statement(type_name, name, scale))
+    return converted
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Convert float64 price and cash columns to int64 ticks")
+    parser.add_argument('--scale', type=int, default=PRICE_SCALE, help="1 元對應的 tick 數，須與服務的 PRICE_SCALE 一致")
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    db = DatabaseConnection()
+    await db.connect()
+    try:
+        converted = await migrate(db.get_client(), args.scale, args.dry_run)
+    finally:
+        await db.close()
+    action = "Would convert" if args.dry_run else "Converted"
+    for type_name, name in converted:
+        print(f"{action} {type_name}.{name} (x{args.scale})")
+    if not converted:
+        print("All price and cash columns are already int64")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
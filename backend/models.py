@@ -2,6 +2,8 @@ import edgedb
 
 # 假設有一個User模型
 class User:
+    __slots__ = ('id', 'name', 'email', 'password')
+
     def __init__(self, id: int, name: str, email: str, password: str = None):
         self.id = id
         self.name = name
@@ -9,16 +11,11 @@ class User:
         self.password = password
 
     @classmethod
-    def from_edgeql(cls, data: dict):
+    def from_edgeql(cls, row):
         """
-        從 EdgeDB 查詢結果創建 User 實例
+        從 EdgeDB 查詢結果創建 User 實例，直接讀取結果物件的屬性，不經過中間字典
         """
-        return cls(
-            id=data['id'],
-            name=data['name'],
-            email=data['email'],
-            password=data.get('password')  # 密碼可能是空的
-        )
+        return cls(row.id, row.name, row.email, getattr(row, 'password', None))  # 密碼可能未被查詢
 
 # 這個方法可以用來查詢 User 資料
 async def get_user_by_id(db, user_id: int) -> User:
@@ -0,0 +1,158 @@
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from auth import get_current_user
+from models import User
+from risk import RiskService, risk_service
+
+router = APIRouter()
+
+# 單個模擬塊的記憶體上限、每個進程任務的路徑數、進程數 (1 為不使用進程池) 與緩存的結果數
+MONTE_CARLO_CHUNK_BYTES = int(os.getenv('MONTE_CARLO_CHUNK_BYTES', str(64 * 2**20)))
+MONTE_CARLO_JOB_PATHS = int(os.getenv('MONTE_CARLO_JOB_PATHS', '2000'))
+MONTE_CARLO_PROCESSES = int(os.getenv('MONTE_CARLO_PROCESSES', '1'))
+MONTE_CARLO_CACHE_SIZE = int(os.getenv('MONTE_CARLO_CACHE_SIZE', '1000'))
+
+MAX_HORIZON = 252
+MAX_PATHS = 50_000
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def cholesky(covariance: np.ndarray) -> np.ndarray:
+    """
+    協方差可能只是半正定 (零波動或樣本數少於股票數)，逐步加大對角擾動，最後退回特徵分解
+    """
+    if not len(covariance):
+        return covariance
+    scale = max(float(np.abs(np.diag(covariance)).max()), 1e-12)
+    for jitter in (0.0, 1e-12, 1e-10, 1e-8):
+        try:
+            return np.linalg.cholesky(covariance + np.eye(len(covariance)) * jitter * scale)
+        except np.linalg.LinAlgError:
+            continue
+    values, vectors = np.linalg.eigh(covariance)
+    return vectors * np.sqrt(np.clip(values, 0.0, None))
+
+
+def simulate_paths(exposures: np.ndarray, drift: np.ndarray, factor: np.ndarray, horizon: int,
+                   paths: int, seed, chunk_bytes: int = MONTE_CARLO_CHUNK_BYTES) -> np.ndarray:
+    """
+    以相關的日對數收益率模擬組合市值，返回 (paths, horizon) 的 float32 陣列
+    每塊的路徑數按 chunk_bytes 限制，避免 (路徑, 天數, 股票) 的中間陣列過大
+    """
+    rng = np.random.default_rng(seed)
+    count = len(exposures)
+    values = np.empty((paths, horizon), dtype=np.float32)
+    chunk = max(1, chunk_bytes // (horizon * max(count, 1) * 8 * 2))
+    for start in range(0, paths, chunk):
+        size = min(chunk, paths - start)
+        shocks = rng.standard_normal((size, horizon, count))
+        log_returns = shocks @ factor.T
+        log_returns += drift
+        np.cumsum(log_returns, axis=1, out=log_returns)
+        np.exp(log_returns, out=log_returns)
+        values[start:start + size] = log_returns @ exposures
+    return values
+
+
+def _run_job(job: tuple) -> np.ndarray:
+    return simulate_paths(*job)
+
+
+def project(exposures: np.ndarray, mean: np.ndarray, covariance: np.ndarray, horizon: int, paths: int,
+            seed: int = None, processes: int = MONTE_CARLO_PROCESSES,
+            job_paths: int = MONTE_CARLO_JOB_PATHS) -> dict:
+    """
+    蒙地卡羅投影：日收益率的均值與協方差轉為對數收益率，Cholesky 分解後生成相關路徑
+    路徑按固定大小切成任務並各自派生隨機種子，是否使用進程池結果一致
+    返回每日市值的分位數與均值 (第 0 日為現值)
+    """
+    drift = np.log1p(mean) - 0.5 * np.diag(covariance)
+    factor = cholesky(covariance)
+    seeds = np.random.SeedSequence(seed).spawn((paths + job_paths - 1) // job_paths)
+    jobs = [
+        (exposures, drift, factor, horizon, min(job_paths, paths - i * job_paths), child)
+        for i, child in enumerate(seeds)
+    ]
+    if processes == 1 or len(jobs) < 2:
+        values = np.concatenate([_run_job(job) for job in jobs])
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            values = np.concatenate(list(pool.map(_run_job, jobs)))
+    current = float(exposures.sum())
+    percentiles = np.percentile(values, PERCENTILES, axis=0)
+    return {
+        "horizon": horizon,
+        "paths": paths,
+        "value": current,
+        "percentiles": {
+            str(p): [current] + row.astype(float).tolist() for p, row in zip(PERCENTILES, percentiles)
+        },
+        "mean": [current] + values.mean(axis=0, dtype=np.float64).tolist(),
+    }
+
+
+class _Projection:
+    __slots__ = ('positions', 'day', 'result')
+
+    def __init__(self, positions: dict, day: int, result: dict):
+        self.positions = positions
+        self.day = day
+        self.result = result
+
+
+class ProjectionService:
+    """
+    按 (用戶, 天數, 路徑數) 緩存投影結果，持倉變動或收益率窗口進入新交易日時重新模擬
+    """
+
+    def __init__(self, risk: RiskService, processes: int = MONTE_CARLO_PROCESSES,
+                 cache_size: int = MONTE_CARLO_CACHE_SIZE):
+        self.risk = risk
+        self.processes = processes
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    async def get(self, user_id: str, horizon: int, paths: int) -> Optional[dict]:
+        positions = self.risk.positions(user_id)
+        if positions is None:
+            return None
+        window = self.risk.window
+        day = int(window.days[-1])
+        key = (user_id, horizon, paths)
+        entry = self.cache.get(key)
+        if entry is not None and entry.positions == positions and entry.day == day:
+            self.cache.move_to_end(key)
+            return entry.result
+
+        exposures = self.risk.exposures([positions])[0]
+        returns, _, covariance = window.derived()
+        held = np.flatnonzero(exposures)
+        mean = returns[:, held].mean(axis=0) if len(returns) else np.zeros(len(held))
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: project(exposures[held], mean, covariance[np.ix_(held, held)], horizon, paths,
+                                  processes=self.processes)
+        )
+        self.cache[key] = _Projection(positions, day, result)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+
+projection_service = ProjectionService(risk_service)
+
+
+@router.get("")
+async def get_projection(
+    horizon: int = Query(20, gt=0, le=MAX_HORIZON),
+    paths: int = Query(5000, gt=0, le=MAX_PATHS),
+    current_user: User = Depends(get_current_user)
+):
+    result = await projection_service.get(str(current_user.id), horizon, paths)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Account not found")
+    return result
@@ -0,0 +1,459 @@
+import asyncio
+import math
+import os
+import time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Callable, Optional
+import numpy as np
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from pydantic import BaseModel
+from auth import get_current_user
+from database import Database
+from fixedpoint import from_ticks, to_ticks
+from idempotency import idempotent
+from ledger import RiskCheckError
+from market import ledger, price_feed
+from models import User
+
+router = APIRouter()
+
+OPTION_MULTIPLIER = int(os.getenv('OPTION_MULTIPLIER', '100'))
+# 每個標的生成的到期天數、價平上下各幾檔行權價與行權價間距 (現價比例)
+OPTION_EXPIRY_DAYS = [int(days) for days in os.getenv('OPTION_EXPIRY_DAYS', '7,30,60,90').split(',')]
+OPTION_STRIKES = int(os.getenv('OPTION_STRIKES', '5'))
+OPTION_STRIKE_STEP = float(os.getenv('OPTION_STRIKE_STEP', '0.05'))
+OPTION_VOLATILITY = float(os.getenv('OPTION_VOLATILITY', '0.3'))
+OPTION_RISK_FREE_RATE = float(os.getenv('OPTION_RISK_FREE_RATE', '0.02'))
+# european 或 american (美式賣權以二叉樹定價)
+OPTION_STYLE = os.getenv('OPTION_STYLE', 'european')
+OPTION_BINOMIAL_STEPS = int(os.getenv('OPTION_BINOMIAL_STEPS', '100'))
+OPTION_EXPIRY_CHECK_INTERVAL = float(os.getenv('OPTION_EXPIRY_CHECK_INTERVAL', '60'))
+
+SECONDS_PER_YEAR = 365 * 86400
+GREEKS = ('delta', 'gamma', 'vega', 'theta', 'rho')
+
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * x * x) / math.sqrt(2 * math.pi)
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    """
+    標準常態分佈函數，以 Abramowitz-Stegun 7.1.26 近似 erf (絕對誤差 < 1.5e-7)，避免依賴 scipy
+    """
+    z = np.abs(x) / math.sqrt(2)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def black_scholes(spot, strike: np.ndarray, years: np.ndarray, volatility, rate: float,
+                  is_call: np.ndarray) -> dict:
+    """
+    對整條期權鏈一次計算歐式價格與 Greeks
+    vega 與 rho 為每 1% 變動，theta 為每日；已到期的合約返回內在價值
+    """
+    spot = np.broadcast_to(np.asarray(spot, dtype=np.float64), strike.shape)
+    volatility = np.broadcast_to(np.asarray(volatility, dtype=np.float64), strike.shape)
+    live = (years > 0) & (volatility > 0)
+    t = np.where(live, years, 1.0)
+    sigma = np.where(live, volatility, 1.0)
+    root = np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * sigma * sigma) * t) / (sigma * root)
+    d2 = d1 - sigma * root
+    discount = np.exp(-rate * t)
+    sign = np.where(is_call, 1.0, -1.0)
+    nd1 = norm_cdf(sign * d1)
+    nd2 = norm_cdf(sign * d2)
+    pdf = norm_pdf(d1)
+    price = sign * (spot * nd1 - strike * discount * nd2)
+    delta = sign * nd1
+    gamma = pdf / (spot * sigma * root)
+    vega = spot * pdf * root / 100.0
+    theta = (-spot * pdf * sigma / (2 * root) - sign * rate * strike * discount * nd2) / 365.0
+    rho = sign * strike * t * discount * nd2 / 100.0
+
+    intrinsic = np.maximum(sign * (spot - strike), 0.0)
+    expired_delta = np.where(intrinsic > 0, sign, 0.0)
+    return {
+        "price": np.where(live, price, intrinsic),
+        "delta": np.where(live, delta, expired_delta),
+        "gamma": np.where(live, gamma, 0.0),
+        "vega": np.where(live, vega, 0.0),
+        "theta": np.where(live, theta, 0.0),
+        "rho": np.where(live, rho, 0.0),
+    }
+
+
+def binomial_american(spot, strike: np.ndarray, years: np.ndarray, volatility, rate: float,
+                      is_call: np.ndarray, steps: int = OPTION_BINOMIAL_STEPS) -> np.ndarray:
+    """
+    CRR 二叉樹的美式期權價格，對所有合約同時逆推 (每步一次 (合約數, 節點數) 的陣列運算)
+    """
+    spot = np.broadcast_to(np.asarray(spot, dtype=np.float64), strike.shape)
+    volatility = np.broadcast_to(np.asarray(volatility, dtype=np.float64), strike.shape)
+    sign = np.where(is_call, 1.0, -1.0)[:, None]
+    result = np.maximum(sign[:, 0] * (spot - strike), 0.0)
+    live = (years > 0) & (volatility > 0)
+    if not live.any():
+        return result
+    s, k, sign = spot[live][:, None], strike[live][:, None], sign[live]
+    dt = (years[live] / steps)[:, None]
+    up = np.exp(volatility[live][:, None] * np.sqrt(dt))
+    growth = np.exp(rate * dt)
+    p = (growth - 1.0 / up) / (up - 1.0 / up)
+    discount = 1.0 / growth
+    nodes = np.arange(steps + 1)
+    log_up = np.log(up)
+    values = np.maximum(sign * (s * np.exp(log_up * (steps - 2 * nodes)) - k), 0.0)
+    for i in range(steps - 1, -1, -1):
+        j = nodes[:i + 1]
+        values = discount * (p * values[:, :-1] + (1.0 - p) * values[:, 1:])
+        exercise = sign * (s * np.exp(log_up * (i - 2 * j)) - k)
+        np.maximum(values, exercise, out=values)
+    result[live] = values[:, 0]
+    return result
+
+
+def contract_symbol(underlying: str, expiry: date, is_call: bool, strike: float) -> str:
+    """
+    OCC 格式：標的 + YYMMDD + C/P + 行權價 x 1000 (8 位)
+    """
+    return f"{underlying}{expiry:%y%m%d}{'C' if is_call else 'P'}{int(round(strike * 1000)):08d}"
+
+
+def strike_increment(spot: float) -> float:
+    for limit, increment in ((5, 0.5), (25, 1.0), (100, 2.5), (250, 5.0), (1000, 10.0)):
+        if spot < limit:
+            return increment
+    return 50.0
+
+
+def strike_ladder(spot: float, count: int = OPTION_STRIKES, step: float = OPTION_STRIKE_STEP) -> list:
+    increment = strike_increment(spot)
+    strikes = {
+        round(round(spot * (1 + step * i) / increment) * increment, 4) for i in range(-count, count + 1)
+    }
+    return sorted(strike for strike in strikes if strike > 0)
+
+
+class OptionChain:
+    """
+    單一標的的全部合約，以平行陣列保存，標的價格變動時整條鏈一次向量化重新定價
+    """
+
+    def __init__(self, underlying: str, volatility: float = OPTION_VOLATILITY, style: str = OPTION_STYLE,
+                 rate: float = OPTION_RISK_FREE_RATE):
+        self.underlying = underlying
+        self.volatility = volatility
+        self.style = style
+        self.rate = rate
+        self.symbols = []
+        self.index = {}
+        self.strikes = np.zeros(0)
+        self.expiries = np.zeros(0)
+        self.is_call = np.zeros(0, dtype=bool)
+        self.spot = None
+        self.priced_at = None
+        self.marks = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, contracts: list):
+        """
+        contracts 為 (symbol, is_call, strike, expiry epoch 秒)，已存在的略過
+        """
+        new = [c for c in contracts if c[0] not in self.index]
+        if not new:
+            return
+        for symbol, *_ in new:
+            self.index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        self.is_call = np.concatenate([self.is_call, [c[1] for c in new]]).astype(bool)
+        self.strikes = np.concatenate([self.strikes, [c[2] for c in new]])
+        self.expiries = np.concatenate([self.expiries, [c[3] for c in new]])
+        if self.spot is not None:
+            self.reprice(self.spot, self.priced_at)
+
+    def remove(self, symbols: set):
+        keep = np.array([symbol not in symbols for symbol in self.symbols], dtype=bool)
+        self.symbols = [symbol for symbol, kept in zip(self.symbols, keep) if kept]
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.strikes, self.expiries, self.is_call = self.strikes[keep], self.expiries[keep], self.is_call[keep]
+        self.marks = {name: values[keep] for name, values in self.marks.items()}
+
+    def generate(self, spot: float, today: date, expiry_days: list = None, close: dtime = dtime(16)):
+        """
+        以當前價格生成各到期日的價平附近行權價，到期時刻為到期日收盤
+        """
+        contracts = []
+        for days in expiry_days or OPTION_EXPIRY_DAYS:
+            expiry = today + timedelta(days=days)
+            expires_at = datetime.combine(expiry, close, timezone.utc).timestamp()
+            for strike in strike_ladder(spot):
+                for is_call in (True, False):
+                    contracts.append((contract_symbol(self.underlying, expiry, is_call, strike),
+                                      is_call, strike, expires_at))
+        self.add(contracts)
+
+    def reprice(self, spot: float, now: float):
+        self.spot = spot
+        self.priced_at = now
+        if not self.symbols:
+            self.marks = {}
+            return
+        years = np.maximum(self.expiries - now, 0.0) / SECONDS_PER_YEAR
+        marks = black_scholes(spot, self.strikes, years, self.volatility, self.rate, self.is_call)
+        if self.style == 'american':
+            # 無股利時美式買權等於歐式，只有賣權需要二叉樹
+            puts = ~self.is_call
+            if puts.any():
+                marks["price"][puts] = binomial_american(
+                    spot, self.strikes[puts], years[puts], self.volatility, self.rate, self.is_call[puts]
+                )
+        self.marks = marks
+
+    def quote(self, symbol: str) -> Optional[dict]:
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        quote = {
+            "symbol": symbol,
+            "underlying": self.underlying,
+            "option_type": 'call' if self.is_call[i] else 'put',
+            "strike": float(self.strikes[i]),
+            "expiry": datetime.fromtimestamp(self.expiries[i], timezone.utc).isoformat(),
+            "style": self.style,
+        }
+        if self.marks:
+            quote["price"] = float(self.marks["price"][i])
+            quote.update({name: float(self.marks[name][i]) for name in GREEKS})
+        return quote
+
+    def contract_row(self, symbol: str) -> dict:
+        i = self.index[symbol]
+        return {
+            "symbol": symbol,
+            "underlying": self.underlying,
+            "option_type": 'call' if self.is_call[i] else 'put',
+            "strike": float(self.strikes[i]),
+            "expiry": datetime.fromtimestamp(self.expiries[i], timezone.utc),
+            "style": self.style,
+        }
+
+
+class OptionsService:
+    """
+    為每個標的維護期權鏈，訂閱價格更新只重新定價變動標的的那條鏈
+    期權以模型價格與系統成交 (每張 multiplier 股)，持倉與權利金寫入 OptionPosition 與資金帳戶
+    """
+
+    def __init__(self, ledger, feed=None, clock: Callable = time.time, multiplier: int = OPTION_MULTIPLIER):
+        self.ledger = ledger
+        self.feed = feed
+        self.clock = clock
+        self.multiplier = multiplier
+        self.chains = {}
+        self.contracts = {}
+        # user_id -> {contract: [數量, 均價]}
+        self.positions = {}
+
+    def chain(self, underlying: str) -> OptionChain:
+        chain = self.chains.get(underlying)
+        if chain is None:
+            chain = self.chains[underlying] = OptionChain(underlying)
+        return chain
+
+    def _register(self, chain: OptionChain):
+        for symbol in chain.symbols:
+            self.contracts[symbol] = chain
+
+    def ensure_chain(self, underlying: str, spot: float) -> OptionChain:
+        chain = self.chain(underlying)
+        today = datetime.fromtimestamp(self.clock(), timezone.utc).date()
+        chain.generate(spot, today)
+        self._register(chain)
+        chain.reprice(spot, self.clock())
+        return chain
+
+    def on_price(self, symbol: str, old_price, new_price: int):
+        chain = self.chains.get(symbol)
+        if chain is not None:
+            chain.reprice(from_ticks(new_price), self.clock())
+
+    def quote(self, symbol: str) -> Optional[dict]:
+        chain = self.contracts.get(symbol)
+        return chain.quote(symbol) if chain else None
+
+    def load_positions(self, rows: list):
+        for row in rows:
+            contract = row.contract
+            chain = self.chain(contract.underlying_symbol)
+            chain.add([(contract.symbol, contract.option_type == 'call', contract.strike,
+                        contract.expiry.timestamp())])
+            self.contracts[contract.symbol] = chain
+            self.positions.setdefault(row.user_id, {})[contract.symbol] = [row.quantity, row.average_price]
+
+    async def load(self, db) -> int:
+        self.load_positions(await db.get_option_positions())
+        for row in await db.get_stocks():
+            spot = (self.feed.last_price(row.symbol) if self.feed else None) or row.current_price
+            if spot:
+                self.ensure_chain(row.symbol, from_ticks(spot))
+        return len(self.contracts)
+
+    async def trade(self, db, user_id: str, symbol: str, side: str, quantity: int,
+                    price: float = None) -> dict:
+        """
+        以模型價格買入或賣出平倉，不允許裸賣 (保證金帳戶另行處理)
+        權利金以小數計價，入帳的資金變動換算為整數 tick
+        買入的權利金與賣出的持倉在寫入數據庫前先扣除，寫入失敗時恢復，並發的委託不會超額成交
+        買入價格必須為正數，賣出 (包括到期結算) 可以 0 價格平倉
+        """
+        chain = self.contracts.get(symbol)
+        if chain is None or not chain.marks:
+            raise ValueError(f"Unknown option contract: {symbol}")
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        if side not in ('buy', 'sell'):
+            raise ValueError(f"Unknown side: {side}")
+        price = float(chain.marks["price"][chain.index[symbol]] if price is None else price)
+        if not price >= 0 or (price == 0 and side == 'buy'):
+            raise ValueError("Option price must be positive")
+        amount = to_ticks(price * quantity * self.multiplier)
+        positions = self.positions.setdefault(user_id, {})
+        if side == 'buy':
+            if self.ledger is None:
+                raise RiskCheckError("Cash account not found")
+            self.ledger.adjust_cash(user_id, -amount)
+            delta, amount = quantity, -amount
+        else:
+            held = positions.get(symbol)
+            if held is None or held[0] < quantity:
+                raise RiskCheckError("Insufficient option position")
+            held[0] -= quantity
+            delta = -quantity
+        try:
+            recorded = await db.record_option_trade(user_id, chain.contract_row(symbol), delta, price, amount)
+        except Exception as e:
+            print(f"Error recording option trade: {e}")
+            recorded = False
+        if not recorded:
+            if delta > 0:
+                self.ledger.adjust_cash(user_id, -amount)
+            else:
+                held[0] += quantity
+                positions.setdefault(symbol, held)
+            raise RuntimeError("Failed to record option trade")
+        if delta > 0:
+            position = positions.setdefault(symbol, [0, 0.0])
+            position[1] = (position[0] * position[1] + delta * price) / (position[0] + delta)
+            position[0] += delta
+        else:
+            if held[0] == 0 and positions.get(symbol) is held:
+                del positions[symbol]
+            if self.ledger and self.ledger.get_account(user_id):
+                self.ledger.adjust_cash(user_id, amount)
+        return {"symbol": symbol, "side": side, "quantity": quantity, "price": price, "amount": from_ticks(amount)}
+
+    def portfolio(self, user_id: str) -> dict:
+        """
+        期權持倉的市值、未實現損益與按張數放大的 Greeks
+        """
+        rows = []
+        totals = {"market_value": 0.0, "unrealized_pnl": 0.0, **{name: 0.0 for name in GREEKS}}
+        for symbol, (quantity, average_price) in self.positions.get(user_id, {}).items():
+            quote = self.quote(symbol)
+            if quote is None or "price" not in quote:
+                continue
+            size = quantity * self.multiplier
+            row = dict(quote, quantity=quantity, average_price=average_price,
+                       market_value=quote["price"] * size,
+                       unrealized_pnl=(quote["price"] - average_price) * size)
+            for name in GREEKS:
+                row[name] = quote[name] * size
+                totals[name] += row[name]
+            totals["market_value"] += row["market_value"]
+            totals["unrealized_pnl"] += row["unrealized_pnl"]
+            rows.append(row)
+        return {"positions": rows, "totals": totals}
+
+    async def expire(self, db) -> int:
+        """
+        到期合約以內在價值現金結算持倉，並從期權鏈移除，返回結算的持倉數
+        """
+        now = self.clock()
+        settled = 0
+        for chain in self.chains.values():
+            if not len(chain):
+                continue
+            expired = {symbol for symbol, expiry in zip(chain.symbols, chain.expiries) if expiry <= now}
+            if not expired:
+                continue
+            if chain.spot is not None:
+                chain.reprice(chain.spot, now)
+            for user_id, positions in list(self.positions.items()):
+                for symbol in expired & set(positions):
+                    quantity = positions[symbol][0]
+                    intrinsic = float(chain.marks["price"][chain.index[symbol]]) if chain.marks else 0.0
+                    await self.trade(db, user_id, symbol, 'sell', quantity, price=intrinsic)
+                    settled += 1
+            chain.remove(expired)
+            for symbol in expired:
+                self.contracts.pop(symbol, None)
+            if chain.spot is not None:
+                self.ensure_chain(chain.underlying, chain.spot)
+        return settled
+
+    async def run(self, db, interval: float = OPTION_EXPIRY_CHECK_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.expire(db)
+            except Exception as e:
+                print(f"Option expiry error: {e}")
+
+
+options_service = OptionsService(ledger, price_feed)
+
+
+class OptionOrder(BaseModel):
+    symbol: str
+    side: str
+    quantity: int
+
+
+@router.get("/chains/{underlying}")
+async def get_chain(underlying: str, expiry: Optional[date] = None,
+                    current_user: User = Depends(get_current_user)):
+    chain = options_service.chains.get(underlying)
+    if chain is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No options for underlying")
+    quotes = [chain.quote(symbol) for symbol in chain.symbols]
+    if expiry is not None:
+        quotes = [quote for quote in quotes if quote["expiry"][:10] == expiry.isoformat()]
+    quotes.sort(key=lambda quote: (quote["expiry"], quote["strike"], quote["option_type"]))
+    return {"underlying": underlying, "spot": chain.spot, "contracts": quotes}
+
+
+@router.post("/orders")
+async def create_option_order(data: OptionOrder, response: Response, current_user: User = Depends(get_current_user),
+                              idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    user_id = str(current_user.id)
+
+    async def submit() -> dict:
+        try:
+            return await options_service.trade(Database(), user_id, data.symbol, data.side, data.quantity)
+        except RiskCheckError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+    return await idempotent(user_id, idempotency_key, data.model_dump(), response, submit)
+
+
+@router.get("/positions")
+async def get_option_positions(current_user: User = Depends(get_current_user)):
+    return options_service.portfolio(str(current_user.id))
@@ -0,0 +1,160 @@
+import uuid
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from pydantic import BaseModel
+from auth import get_current_user
+from engine import Order, triggered_order
+from fixedpoint import from_ticks, to_ticks
+from idempotency import idempotent
+from ledger import RiskCheckError
+from market import engine, sessions, shard_pool, trigger_index
+from models import User
+from sessions import COLLECTING, CONTINUOUS, MarketClosedError
+from shards import ShardUnavailableError
+from triggers import ConditionalOrder
+
+router = APIRouter()
+
+CONDITIONAL_TYPES = ('stop', 'stop_limit', 'trailing_stop')
+
+
+class OrderCreate(BaseModel):
+    symbol: str
+    side: str
+    quantity: int
+    order_type: str = 'limit'
+    price: Optional[float] = None
+    stop_price: Optional[float] = None
+    limit_price: Optional[float] = None
+    trail: Optional[float] = None
+
+
+class FillResponse(BaseModel):
+    price: float
+    quantity: int
+
+
+class OrderResponse(BaseModel):
+    order_id: str
+    status: str
+    remaining: int
+    fills: list[FillResponse] = []
+
+
+def to_order(order_id: str, user_id: str, data: OrderCreate) -> Order:
+    """
+    API 委託轉為撮合委託，價格在此換算為整數 tick
+    """
+    return Order(order_id, user_id, data.symbol, data.side, data.quantity, to_ticks(data.price), data.order_type)
+
+
+def fill_responses(fills: list) -> list:
+    return [FillResponse(price=from_ticks(fill.price), quantity=fill.quantity) for fill in fills]
+
+
+def place_order(user_id: str, data: OrderCreate) -> OrderResponse:
+    """
+    委託進入撮合引擎、集合競價或條件單索引
+    參數錯誤拋出 ValueError，風控不通過拋出 RiskCheckError，休市時拋出 MarketClosedError
+    """
+    order_id = uuid.uuid4().hex
+    if data.order_type in CONDITIONAL_TYPES:
+        conditional = ConditionalOrder(
+            order_id, user_id, data.symbol, data.side, data.quantity, data.order_type,
+            stop_price=to_ticks(data.stop_price), limit_price=to_ticks(data.limit_price), trail=to_ticks(data.trail)
+        )
+        # 掛單時不凍結，但觸發後的委託必須能通過風控，止損市價單按觸發價估算
+        probe = triggered_order(conditional)
+        if probe.price is None and conditional.stop_price is not None:
+            probe.price = conditional.stop_price
+        engine.probe_risk(probe)
+        reference = engine.price_feed.last_price(data.symbol) if engine.price_feed else None
+        triggered = trigger_index.add(conditional, reference)
+        return OrderResponse(order_id=order_id, status='triggered' if triggered else 'pending',
+                             remaining=data.quantity)
+
+    order = to_order(order_id, user_id, data)
+    if sessions.state in COLLECTING:
+        sessions.collect(order)
+        return OrderResponse(order_id=order_id, status=order.status, remaining=order.remaining)
+    sessions.check_open()
+    fills = engine.submit(order)
+    return OrderResponse(
+        order_id=order_id,
+        status=order.status,
+        remaining=order.remaining,
+        fills=fill_responses(fills),
+    )
+
+
+async def place_sharded_order(user_id: str, data: OrderCreate) -> OrderResponse:
+    """
+    連續交易時段的普通委託送往股票所屬的撮合分片
+    """
+    order = to_order(uuid.uuid4().hex, user_id, data)
+    status, remaining, fills = await shard_pool.submit(order)
+    return OrderResponse(
+        order_id=order.order_id,
+        status=status,
+        remaining=remaining,
+        fills=fill_responses(fills),
+    )
+
+
+@router.post("", response_model=OrderResponse)
+async def create_order(data: OrderCreate, response: Response, current_user: User = Depends(get_current_user),
+                       idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """
+    帶 Idempotency-Key 的重試返回第一次下單的結果，不會重複下單
+    """
+    user_id = str(current_user.id)
+
+    async def submit() -> dict:
+        try:
+            if shard_pool and data.order_type not in CONDITIONAL_TYPES and sessions.state == CONTINUOUS:
+                return (await place_sharded_order(user_id, data)).model_dump()
+            return place_order(user_id, data).model_dump()
+        except (RiskCheckError, MarketClosedError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except ShardUnavailableError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    return await idempotent(user_id, idempotency_key, data.model_dump(), response, submit)
+
+
+@router.delete("/{order_id}")
+async def cancel_order(order_id: str, current_user: User = Depends(get_current_user)):
+    user_id = str(current_user.id)
+    if shard_pool and order_id in shard_pool.resting:
+        if shard_pool.resting[order_id][0] != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Order not found"
+            )
+        try:
+            await shard_pool.cancel(order_id)
+        except ShardUnavailableError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        return {"message": "Order cancelled"}
+    order = engine.orders.get(order_id) or sessions.find(order_id) or trigger_index.orders.get(order_id)
+    if order is None or order.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    if not engine.cancel(order_id) and not sessions.cancel(order_id):
+        trigger_index.cancel(order_id)
+    return {"message": "Order cancelled"}
+
+
+@router.get("/session")
+async def get_session(current_user: User = Depends(get_current_user)):
+    """
+    當前交易時段與最近一次集合競價結果
+    """
+    auctions = {
+        symbol: dict(auction, price=from_ticks(auction["price"])) for symbol, auction in sessions.auctions.items()
+    }
+    return {"state": sessions.state, "auctions": auctions}
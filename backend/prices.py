@@ -0,0 +1,65 @@
+import asyncio
+import os
+from typing import Callable, Optional
+
+FLUSH_INTERVAL = float(os.getenv('PRICE_FLUSH_INTERVAL', '1'))
+
+
+class PriceFeed:
+    """
+    Stock.current_price 的記憶體快取 (整數 tick)，價格變動時通知各個訂閱者
+    訂閱者簽名為 listener(symbol, old_price, new_price)
+    """
+
+    def __init__(self):
+        self.prices = {}
+        self.listeners = []
+        self.dirty = set()
+
+    def add_listener(self, listener: Callable):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def last_price(self, symbol: str) -> Optional[int]:
+        return self.prices.get(symbol)
+
+    def publish(self, symbol: str, price: int):
+        """
+        更新最新價格並通知訂閱者
+        """
+        old_price = self.prices.get(symbol)
+        self.prices[symbol] = price
+        self.dirty.add(symbol)
+        for listener in self.listeners:
+            try:
+                listener(symbol, old_price, price)
+            except Exception as e:
+                print(f"Price listener error: {e}")
+
+    async def load(self, db):
+        """
+        從數據庫載入所有股票的當前價格
+        """
+        for stock in await db.get_stocks():
+            self.prices[stock.symbol] = stock.current_price
+
+    async def flush(self, db):
+        """
+        將變動過的價格批量寫回 Stock.current_price
+        """
+        if not self.dirty:
+            return
+        updates = {symbol: self.prices[symbol] for symbol in self.dirty}
+        self.dirty = set()
+        await db.update_stock_prices(updates)
+
+    async def run(self, db, interval: float = FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(db)
+            except Exception as e:
+                print(f"Price flush error: {e}")
@@ -0,0 +1,281 @@
+import asyncio
+import csv
+import os
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from auth import get_operator_user
+from clock import NANOS_PER_SECOND, SimulatedClock, from_datetime, to_datetime, to_seconds
+from fixedpoint import to_ticks
+from models import User
+from rooms import Room, get_room
+
+router = APIRouter()
+
+# 每輪最多發布的 tick 數，發布完後讓出事件循環
+MAX_BATCH = 5000
+IDLE_SLEEP = 0.001
+# 可回放的檔案只能位於此目錄下
+REPLAY_DIR = os.getenv('REPLAY_DIR', 'replays')
+# K線展開的開高低收 tick 間隔 (納秒)
+CANDLE_TICK_SPACING = NANOS_PER_SECOND // 1000
+
+
+class TickTape:
+    """
+    按時間排序的歷史 tick，時間為 epoch 起算的整數納秒，價格為整數 tick
+    """
+
+    def __init__(self, times, symbol_ids, prices, symbols: list):
+        order = np.argsort(times, kind='stable')
+        self.times = np.asarray(times, dtype=np.int64)[order]
+        self.symbol_ids = np.asarray(symbol_ids, dtype=np.int32)[order]
+        self.prices = np.asarray(prices, dtype=np.int64)[order]
+        self.symbols = symbols
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'TickTape':
+        """
+        讀取 timestamp,symbol,price 的 tick 檔，或 timestamp,symbol,open,high,low,close 的K線檔
+        K線按開高低收展開為相隔 1 毫秒的四個 tick，檔中的小數價格換算為整數 tick
+        """
+        symbols = {}
+        times, ids, prices = [], [], []
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            candles = 'close' in (reader.fieldnames or [])
+            for row in reader:
+                t = from_datetime(datetime.fromisoformat(row['timestamp']))
+                symbol_id = symbols.setdefault(row['symbol'], len(symbols))
+                if candles:
+                    for offset, key in enumerate(('open', 'high', 'low', 'close')):
+                        times.append(t + offset * CANDLE_TICK_SPACING)
+                        ids.append(symbol_id)
+                        prices.append(to_ticks(float(row[key])))
+                else:
+                    times.append(t)
+                    ids.append(symbol_id)
+                    prices.append(to_ticks(float(row['price'])))
+        return cls(times, ids, prices, list(symbols))
+
+
+class ReplayDriver:
+    """
+    按模擬時鐘把歷史 tick 推入 PriceFeed，每輪批量發布到期的 tick
+    """
+
+    def __init__(self, tape: TickTape, feed, speed: float = 1.0, max_batch: int = MAX_BATCH):
+        self.tape = tape
+        self.feed = feed
+        self.max_batch = max_batch
+        start = int(tape.times[0]) if len(tape) else 0
+        self.clock = SimulatedClock(start, speed)
+        self.cursor = 0
+        self.published = 0
+        self.finished = asyncio.Event()
+        self._moved = asyncio.Event()
+
+    @property
+    def lag(self) -> int:
+        """
+        落後的模擬納秒數，持續增長表示發布速度跟不上
+        """
+        if self.cursor >= len(self.tape):
+            return 0
+        return max(0, self.clock.now() - int(self.tape.times[self.cursor]))
+
+    def step(self) -> int:
+        """
+        發布所有到期的 tick (每次最多 max_batch 筆)，返回發布數
+        """
+        target = self.clock.now()
+        end = int(np.searchsorted(self.tape.times, target, side='right'))
+        end = min(end, self.cursor + self.max_batch)
+        if end <= self.cursor:
+            return 0
+        symbols = self.tape.symbols
+        ids = self.tape.symbol_ids[self.cursor:end].tolist()
+        prices = self.tape.prices[self.cursor:end].tolist()
+        publish = self.feed.publish
+        for symbol_id, price in zip(ids, prices):
+            publish(symbols[symbol_id], price)
+        count = end - self.cursor
+        self.cursor = end
+        self.published += count
+        return count
+
+    async def run(self, follow: bool = False):
+        """
+        播放到磁帶結尾；follow 為 True 時結束後繼續等待，seek 或 rewind 之後接著發布
+        """
+        self.clock.resume()
+        while True:
+            self.finished.clear()
+            while self.cursor < len(self.tape):
+                if self.step() == 0:
+                    await asyncio.sleep(IDLE_SLEEP)
+                else:
+                    await asyncio.sleep(0)
+            self.finished.set()
+            if not follow:
+                return
+            self._moved.clear()
+            await self._moved.wait()
+
+    def pause(self):
+        self.clock.pause()
+
+    def resume(self):
+        self.clock.resume()
+
+    def set_speed(self, speed: float):
+        self.clock.set_speed(speed)
+
+    def seek(self, sim_time: int):
+        """
+        跳到指定時間，並把每支股票在該時間點的最後價格重新發布
+        """
+        self.cursor = int(np.searchsorted(self.tape.times, sim_time, side='right'))
+        self.clock.seek(sim_time)
+        self._moved.set()
+        if self.cursor == 0:
+            return
+        # 反轉後第一次出現的位置即為最後一筆
+        ids = self.tape.symbol_ids[:self.cursor][::-1]
+        unique, first = np.unique(ids, return_index=True)
+        for symbol_id, index in zip(unique.tolist(), first.tolist()):
+            self.feed.publish(self.tape.symbols[symbol_id], int(self.tape.prices[self.cursor - 1 - index]))
+
+    def rewind(self):
+        self.seek(int(self.tape.times[0]) - 1 if len(self.tape) else 0)
+
+    def status(self) -> dict:
+        return {
+            "sim_time": to_datetime(self.clock.now()),
+            "speed": self.clock.speed,
+            "paused": self.clock.paused,
+            "cursor": self.cursor,
+            "total": len(self.tape),
+            "lag_seconds": to_seconds(self.lag),
+        }
+
+
+replay_driver: Optional[ReplayDriver] = None
+replay_task: Optional[asyncio.Task] = None
+replay_room: Optional[str] = None
+
+
+class ReplayStart(BaseModel):
+    # REPLAY_DIR 下的相對路徑
+    path: str
+    room_id: str
+    speed: float = 1.0
+
+
+class ReplayControl(BaseModel):
+    speed: Optional[float] = None
+    # ISO 時間或 epoch 秒
+    seek: Optional[datetime] = None
+
+
+def resolve_replay_path(path: str, root: str = None) -> str:
+    """
+    回放檔案限定在 REPLAY_DIR 內，絕對路徑、.. 與指向目錄外的符號連結都被拒絕
+    """
+    root = os.path.realpath(root or REPLAY_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.isabs(path) or os.path.commonpath([root, resolved]) != root:
+        raise ValueError("Replay file must be inside the replay directory")
+    return resolved
+
+
+async def run_in_room(driver: ReplayDriver, room: Room):
+    """
+    回放期間房間保持活躍，不會因閒置被卸載而丟失回放的價格
+    播放完畢後任務繼續等待，rewind 或 seek 後從新位置接著回放
+    """
+    def touch(symbol, old_price, new_price):
+        room.last_active = room.clock()
+
+    room.price_feed.add_listener(touch)
+    try:
+        await driver.run(follow=True)
+    finally:
+        room.price_feed.remove_listener(touch)
+
+
+def _driver() -> ReplayDriver:
+    if replay_driver is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No replay loaded")
+    return replay_driver
+
+
+def _status(driver: ReplayDriver) -> dict:
+    return dict(driver.status(), room_id=replay_room)
+
+
+@router.post("/start")
+async def start_replay(data: ReplayStart, current_user: User = Depends(get_operator_user)):
+    """
+    把歷史 tick 回放到指定房間自己的價格源，不影響主市場的價格、條件單、保證金與提醒
+    """
+    global replay_driver, replay_task, replay_room
+    if data.speed <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Speed must be positive")
+    try:
+        path = resolve_replay_path(data.path)
+        # 大檔解析放到執行緒，不阻塞事件循環
+        tape = await asyncio.get_running_loop().run_in_executor(None, TickTape.from_csv, path)
+    except (OSError, KeyError, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    room = await get_room(data.room_id)
+    if replay_task and not replay_task.done():
+        replay_task.cancel()
+    replay_driver = ReplayDriver(tape, room.price_feed, speed=data.speed)
+    replay_room = room.room_id
+    replay_task = asyncio.create_task(run_in_room(replay_driver, room))
+    return _status(replay_driver)
+
+
+@router.post("/pause")
+async def pause_replay(current_user: User = Depends(get_operator_user)):
+    driver = _driver()
+    driver.pause()
+    return _status(driver)
+
+
+@router.post("/resume")
+async def resume_replay(current_user: User = Depends(get_operator_user)):
+    driver = _driver()
+    driver.resume()
+    return _status(driver)
+
+
+@router.post("/control")
+async def control_replay(data: ReplayControl, current_user: User = Depends(get_operator_user)):
+    driver = _driver()
+    try:
+        if data.speed is not None:
+            driver.set_speed(data.speed)
+        if data.seek is not None:
+            driver.seek(from_datetime(data.seek))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _status(driver)
+
+
+@router.post("/rewind")
+async def rewind_replay(current_user: User = Depends(get_operator_user)):
+    driver = _driver()
+    driver.rewind()
+    return _status(driver)
+
+
+@router.get("/status")
+async def replay_status(current_user: User = Depends(get_operator_user)):
+    return _status(_driver())
@@ -0,0 +1,302 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, status
+from auth import get_current_user
+from backtest import TRADING_DAYS, load_history
+from clock import NANOS_PER_SECOND
+from market import ledger
+from models import User
+
+router = APIRouter()
+
+# 滾動窗口的交易日數、VaR 信心水準、年化無風險利率與基準 (空為全市場等權)
+RISK_WINDOW = int(os.getenv('RISK_WINDOW', '252'))
+RISK_CONFIDENCE = float(os.getenv('RISK_CONFIDENCE', '0.95'))
+RISK_FREE_RATE = float(os.getenv('RISK_FREE_RATE', '0.0'))
+RISK_BENCHMARK = os.getenv('RISK_BENCHMARK', '')
+RISK_PROCESSES = int(os.getenv('RISK_PROCESSES', '0'))
+RISK_REFRESH_INTERVAL = float(os.getenv('RISK_REFRESH_INTERVAL', '60'))
+
+METRICS = ('value', 'volatility', 'beta', 'sharpe', 'max_drawdown', 'historical_var', 'parametric_var')
+
+SECONDS_PER_DAY = 86400
+
+
+class ReturnsWindow:
+    """
+    最近 window + 1 個交易日的收盤價矩陣 (行為交易日、列為股票)，缺失的收盤沿用前一日
+    日收益率與協方差矩陣在收盤價變動前只計算一次，version 在每次更新時遞增
+    """
+
+    def __init__(self, window: int = RISK_WINDOW, benchmark: str = RISK_BENCHMARK):
+        self.window = window
+        self.benchmark = benchmark
+        self.columns = {}
+        self.closes = np.full((window + 1, 0), np.nan)
+        self.days = np.full(window + 1, -1, dtype=np.int64)
+        self.version = 0
+        self._derived = None
+
+    def column(self, symbol: str) -> int:
+        index = self.columns.get(symbol)
+        if index is None:
+            index = self.columns[symbol] = self.closes.shape[1]
+            self.closes = np.hstack([self.closes, np.full((self.window + 1, 1), np.nan)])
+            self._changed()
+        return index
+
+    def load(self, history: dict):
+        """
+        由 {symbol: {'timestamp': [...], 'close': array}} 一次建立矩陣
+        """
+        days = sorted({int(ts.timestamp() // SECONDS_PER_DAY) for bars in history.values()
+                       for ts in bars['timestamp']})[-(self.window + 1):]
+        if not days:
+            return
+        self.days[:] = -1
+        self.days[-len(days):] = days
+        self.closes = np.full((self.window + 1, 0), np.nan)
+        self.columns = {}
+        for symbol, bars in history.items():
+            column = self.column(symbol)
+            bar_days = np.array([int(ts.timestamp() // SECONDS_PER_DAY) for ts in bars['timestamp']])
+            rows = np.searchsorted(self.days, bar_days)
+            mask = (rows < len(self.days)) & (self.days[np.minimum(rows, len(self.days) - 1)] == bar_days)
+            self.closes[rows[mask], column] = bars['close'][mask]
+        self._forward_fill()
+        self._changed()
+
+    def _forward_fill(self):
+        valid = np.where(np.isnan(self.closes), -1, np.arange(len(self.closes))[:, None])
+        last = np.maximum.accumulate(valid, axis=0)
+        filled = np.take_along_axis(self.closes, np.maximum(last, 0), axis=0)
+        self.closes = np.where(last >= 0, filled, np.nan)
+
+    def _changed(self):
+        self.version += 1
+        self._derived = None
+
+    def update(self, symbol: str, day: int, close: float):
+        """
+        寫入某日收盤；較新的日子新增一行 (最舊一行移出窗口)，同日重複寫入覆蓋
+        """
+        column = self.column(symbol)
+        if day > self.days[-1]:
+            self.closes = np.roll(self.closes, -1, axis=0)
+            self.closes[-1] = self.closes[-2]
+            self.days = np.roll(self.days, -1)
+            self.days[-1] = day
+            row = len(self.days) - 1
+        else:
+            row = int(np.searchsorted(self.days, day))
+            if row >= len(self.days) or self.days[row] != day:
+                return
+        self.closes[row, column] = close
+        self._changed()
+
+    def last_closes(self) -> np.ndarray:
+        return np.nan_to_num(self.closes[-1])
+
+    def derived(self) -> tuple:
+        """
+        返回 (日收益率 (T, S)，基準收益率 (T,)，協方差 (S, S))，缺失數據的收益率記為 0
+        """
+        if self._derived is None:
+            filled = self.days >= 0
+            closes = self.closes[filled]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns = np.nan_to_num(closes[1:] / closes[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+            if self.benchmark in self.columns:
+                benchmark = returns[:, self.columns[self.benchmark]]
+            else:
+                benchmark = returns.mean(axis=1) if returns.shape[1] else np.zeros(len(returns))
+            count = returns.shape[1]
+            if len(returns) > 1 and count:
+                covariance = np.cov(returns, rowvar=False).reshape(count, count)
+            else:
+                covariance = np.zeros((count, count))
+            self._derived = (returns, benchmark, covariance)
+        return self._derived
+
+
+def risk_metrics(returns: np.ndarray, benchmark: np.ndarray, covariance: np.ndarray, exposures: np.ndarray,
+                 confidence: float = RISK_CONFIDENCE, risk_free: float = RISK_FREE_RATE) -> dict:
+    """
+    對多個組合一次計算風險指標：returns (T, S)，exposures (U, S) 為各組合每支股票的持倉市值
+    收益率以總曝險 (多空市值絕對值之和) 為分母，VaR 以金額表示
+    """
+    gross = np.abs(exposures).sum(axis=1)
+    pnl = returns @ exposures.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        portfolio = np.where(gross > 0, pnl / gross, 0.0)
+    periods = len(returns)
+    mean = portfolio.mean(axis=0) if periods else np.zeros(len(gross))
+    std = portfolio.std(axis=0, ddof=1) if periods > 1 else np.zeros(len(gross))
+    centered = benchmark - benchmark.mean() if periods else benchmark
+    benchmark_var = centered @ centered
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, (mean - risk_free / TRADING_DAYS) / std * np.sqrt(TRADING_DAYS), 0.0)
+        beta = (centered @ (portfolio - mean)) / benchmark_var if benchmark_var > 0 else np.zeros(len(gross))
+    if periods:
+        equity = np.cumprod(1.0 + portfolio, axis=0)
+        peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=0)
+        max_drawdown = (1.0 - equity / peak).max(axis=0)
+        historical_var = np.maximum(-np.quantile(pnl, 1.0 - confidence, axis=0), 0.0)
+    else:
+        max_drawdown = historical_var = np.zeros(len(gross))
+    z = NormalDist().inv_cdf(confidence)
+    variance = np.einsum('us,st,ut->u', exposures, covariance, exposures)
+    expected = exposures @ returns.mean(axis=0) if periods else np.zeros(len(gross))
+    parametric_var = np.maximum(z * np.sqrt(np.maximum(variance, 0.0)) - expected, 0.0)
+    return {
+        "value": exposures.sum(axis=1),
+        "volatility": std * np.sqrt(TRADING_DAYS),
+        "beta": beta,
+        "sharpe": sharpe,
+        "max_drawdown": max_drawdown,
+        "historical_var": historical_var,
+        "parametric_var": parametric_var,
+    }
+
+
+_worker_inputs = None
+
+
+def _init_worker(inputs: tuple):
+    global _worker_inputs
+    _worker_inputs = inputs
+
+
+def _run_chunk(exposures: np.ndarray) -> dict:
+    return risk_metrics(*_worker_inputs, exposures)
+
+
+def batch_metrics(returns: np.ndarray, benchmark: np.ndarray, covariance: np.ndarray,
+                  exposures: np.ndarray, processes: int = 1) -> dict:
+    """
+    按用戶分塊在進程池中計算，收益率與協方差矩陣只在每個進程初始化時傳送一次
+    """
+    if processes == 1 or len(exposures) < processes * 2:
+        return risk_metrics(returns, benchmark, covariance, exposures)
+    chunks = np.array_split(exposures, processes * 4)
+    inputs = (returns, benchmark, covariance)
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(inputs,)) as pool:
+        results = list(pool.map(_run_chunk, chunks))
+    return {name: np.concatenate([result[name] for result in results]) for name in METRICS}
+
+
+class _RiskEntry:
+    __slots__ = ('positions', 'version', 'metrics')
+
+    def __init__(self, positions: dict, version: int, metrics: dict):
+        self.positions = positions
+        self.version = version
+        self.metrics = metrics
+
+
+class RiskService:
+    """
+    按用戶緩存組合風險指標，持倉 (取自 AccountLedger) 變動或有新K線收盤時才失效
+    後台定期把所有失效的用戶合併成一個批次重新計算
+    """
+
+    def __init__(self, ledger, window: ReturnsWindow = None, processes: int = RISK_PROCESSES):
+        self.ledger = ledger
+        self.window = window or ReturnsWindow()
+        self.processes = processes or os.cpu_count() or 1
+        self.cache = {}
+
+    async def load(self, db) -> int:
+        symbols = [row.symbol for row in await db.get_stocks()]
+        if not symbols:
+            return 0
+        self.window.load(await load_history(db, symbols, '1d'))
+        return len(symbols)
+
+    def on_bar(self, bar):
+        self.window.update(bar.symbol, bar.start // (SECONDS_PER_DAY * NANOS_PER_SECOND), bar.close)
+
+    def positions(self, user_id: str) -> Optional[dict]:
+        account = self.ledger.get_account(user_id)
+        if account is None:
+            return None
+        return {symbol: quantity for symbol, quantity in account.positions.items() if quantity}
+
+    def exposures(self, positions_by_user: list) -> np.ndarray:
+        for positions in positions_by_user:
+            for symbol in positions:
+                self.window.column(symbol)
+        prices = self.window.last_closes()
+        exposures = np.zeros((len(positions_by_user), len(prices)))
+        for row, positions in enumerate(positions_by_user):
+            for symbol, quantity in positions.items():
+                column = self.window.columns[symbol]
+                exposures[row, column] = quantity * prices[column]
+        return exposures
+
+    def _valid(self, entry: Optional[_RiskEntry], positions: dict) -> bool:
+        return entry is not None and entry.version == self.window.version and entry.positions == positions
+
+    def get(self, user_id: str) -> Optional[dict]:
+        positions = self.positions(user_id)
+        if positions is None:
+            return None
+        entry = self.cache.get(user_id)
+        if self._valid(entry, positions):
+            return entry.metrics
+        # 單個用戶只取其持有的股票子矩陣計算
+        exposures = self.exposures([positions])
+        returns, benchmark, covariance = self.window.derived()
+        held = np.flatnonzero(exposures[0])
+        result = risk_metrics(returns[:, held], benchmark, covariance[np.ix_(held, held)], exposures[:, held])
+        metrics = {name: float(values[0]) for name, values in result.items()}
+        self.cache[user_id] = _RiskEntry(positions, self.window.version, metrics)
+        return metrics
+
+    def stale_users(self) -> list:
+        return [
+            user_id for user_id in self.ledger.accounts
+            if not self._valid(self.cache.get(user_id), self.positions(user_id))
+        ]
+
+    async def refresh(self, user_ids: list = None) -> int:
+        """
+        以一個批次重算指定 (預設為全部失效) 用戶的指標，返回重算的用戶數
+        輸入在事件循環中取快照，只有矩陣運算交給執行緒與進程池
+        """
+        user_ids = self.stale_users() if user_ids is None else user_ids
+        if not user_ids:
+            return 0
+        positions = [self.positions(user_id) or {} for user_id in user_ids]
+        exposures = self.exposures(positions)
+        version = self.window.version
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, batch_metrics, *self.window.derived(), exposures, self.processes
+        )
+        for row, user_id in enumerate(user_ids):
+            metrics = {name: float(result[name][row]) for name in METRICS}
+            self.cache[user_id] = _RiskEntry(positions[row], version, metrics)
+        return len(user_ids)
+
+    async def run(self, interval: float = RISK_REFRESH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Risk refresh error: {e}")
+
+
+risk_service = RiskService(ledger)
+
+
+@router.get("")
+async def get_risk(current_user: User = Depends(get_current_user)):
+    metrics = risk_service.get(str(current_user.id))
+    if metrics is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Account not found")
+    return metrics
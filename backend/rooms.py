@@ -0,0 +1,434 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from pydantic import BaseModel
+from auth import get_current_user
+from database import Database
+from clock import NANOS_PER_SECOND
+from engine import MatchingEngine
+from fixedpoint import from_ticks, to_ticks
+from idempotency import idempotent
+from ledger import AccountLedger, RiskCheckError
+from market import price_feed
+from models import User
+from orders import OrderCreate, OrderResponse, fill_responses, to_order
+from prices import PriceFeed
+from settlement import aggregate_fills
+from shards import order_from_wire, order_to_wire
+
+router = APIRouter()
+
+# 每個房間的記憶體上限、每秒可用的撮合 CPU 秒數與可累積的上限
+ROOM_MAX_BYTES = int(os.getenv('ROOM_MAX_BYTES', str(16 * 2**20)))
+ROOM_CPU_SHARE = float(os.getenv('ROOM_CPU_SHARE', '0.05'))
+ROOM_CPU_BURST = float(os.getenv('ROOM_CPU_BURST', '0.5'))
+# 同時載入的房間數、閒置多久後卸載為快照、成交寫回數據庫的間隔
+ROOM_MAX_LOADED = int(os.getenv('ROOM_MAX_LOADED', '200'))
+ROOM_IDLE_SECONDS = float(os.getenv('ROOM_IDLE_SECONDS', '600'))
+ROOM_FLUSH_INTERVAL = float(os.getenv('ROOM_FLUSH_INTERVAL', '1'))
+
+# 記憶體估算用的單項大小 (位元組)：掛單含委託、佇列項與凍結記錄
+ORDER_BYTES = 600
+LEVEL_BYTES = 400
+ACCOUNT_BYTES = 1000
+POSITION_BYTES = 150
+
+# 版本 2 起價格與資金為整數 tick、掛單時間為納秒；版本 1 為浮點元與秒
+SNAPSHOT_VERSION = 2
+
+
+def upgrade_snapshot(snapshot: dict) -> dict:
+    """
+    把舊版快照轉換為當前格式：價格與資金乘以 PRICE_SCALE，掛單時間戳由秒轉為納秒
+    """
+    if snapshot.get("version", 1) >= SNAPSHOT_VERSION:
+        return snapshot
+    orders = []
+    for wire in snapshot["orders"]:
+        wire = list(wire)
+        if wire[5] is not None:
+            wire[5] = to_ticks(wire[5])
+        wire[9] = int(round(wire[9] * NANOS_PER_SECOND))
+        orders.append(wire)
+    return {
+        "version": SNAPSHOT_VERSION,
+        "prices": {symbol: to_ticks(price) for symbol, price in snapshot["prices"].items()},
+        "accounts": {
+            user_id: {"cash": to_ticks(account["cash"]), "positions": account["positions"]}
+            for user_id, account in snapshot["accounts"].items()
+        },
+        "orders": orders,
+    }
+
+
+class RoomBudgetError(Exception):
+    """
+    房間的 CPU 或記憶體配額用盡
+    """
+    pass
+
+
+class CpuBudget:
+    """
+    令牌桶：每秒補充 share 秒的撮合時間，最多累積 burst 秒，用盡後拒絕新委託直到補充
+    """
+
+    def __init__(self, share: float = ROOM_CPU_SHARE, burst: float = ROOM_CPU_BURST,
+                 clock: Callable = time.monotonic):
+        self.share = share
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def available(self) -> bool:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.share)
+        self.updated = now
+        return self.tokens > 0
+
+    def charge(self, seconds: float):
+        self.tokens -= seconds
+
+
+class Room:
+    """
+    一場比賽的獨立市場：自己的價格、資金帳戶、委託簿與排行榜，與主市場及其他房間互不影響
+    """
+
+    def __init__(self, room_id: str, name: str, symbols: list, starting_cash: int,
+                 max_bytes: int = ROOM_MAX_BYTES, cpu: CpuBudget = None, clock: Callable = time.monotonic):
+        self.room_id = room_id
+        self.name = name
+        self.symbols = set(symbols)
+        self.starting_cash = starting_cash
+        self.max_bytes = max_bytes
+        self.cpu = cpu or CpuBudget(clock=clock)
+        self.clock = clock
+        self.price_feed = PriceFeed()
+        self.ledger = AccountLedger(self.price_feed)
+        self.engine = MatchingEngine(self.ledger, self.price_feed)
+        self.engine.add_fill_listener(self.on_fills)
+        # 尚未寫回數據庫的成交
+        self.pending_fills = []
+        self.last_active = clock()
+
+    def on_fills(self, fills: list):
+        self.pending_fills.extend(fills)
+
+    def memory_usage(self) -> int:
+        levels = sum(len(book.prices['buy']) + len(book.prices['sell']) for book in self.engine.books.values())
+        positions = sum(len(account.positions) for account in self.ledger.accounts.values())
+        return (len(self.engine.orders) * ORDER_BYTES + levels * LEVEL_BYTES
+                + len(self.ledger.accounts) * ACCOUNT_BYTES + positions * POSITION_BYTES)
+
+    def join(self, user_id: str, cash: int = None):
+        account = self.ledger.get_account(user_id)
+        if account is None:
+            account = self.ledger.load_account(user_id, self.starting_cash if cash is None else cash)
+        return account
+
+    def submit(self, user_id: str, data: OrderCreate) -> tuple:
+        """
+        參數錯誤拋出 ValueError，風控不通過拋出 RiskCheckError，配額用盡拋出 RoomBudgetError
+        """
+        self.last_active = self.clock()
+        if self.ledger.get_account(user_id) is None:
+            raise RiskCheckError("Not a member of this room")
+        if data.symbol not in self.symbols:
+            raise ValueError(f"{data.symbol} is not traded in this room")
+        if not self.cpu.available():
+            raise RoomBudgetError("Room CPU budget exhausted")
+        if data.order_type == 'limit' and self.memory_usage() >= self.max_bytes:
+            raise RoomBudgetError("Room memory budget exhausted")
+        order = to_order(uuid.uuid4().hex, user_id, data)
+        start = time.perf_counter()
+        try:
+            fills = self.engine.submit(order)
+        finally:
+            self.cpu.charge(time.perf_counter() - start)
+        return order, fills
+
+    def cancel(self, user_id: str, order_id: str) -> bool:
+        self.last_active = self.clock()
+        order = self.engine.orders.get(order_id)
+        if order is None or order.user_id != user_id:
+            return False
+        return self.engine.cancel(order_id)
+
+    def leaderboard(self) -> list:
+        rows = []
+        for user_id, account in self.ledger.accounts.items():
+            equity, _ = self.ledger.valuation(account)
+            rows.append({
+                "user_id": user_id,
+                "equity": from_ticks(equity),
+                "return": equity / self.starting_cash - 1.0 if self.starting_cash else 0.0,
+            })
+        rows.sort(key=lambda row: -row["equity"])
+        for rank, row in enumerate(rows, 1):
+            row["rank"] = rank
+        return rows
+
+    def snapshot(self) -> dict:
+        """
+        可 JSON 序列化的完整撮合狀態，掛單按提交時間排列以保留時間優先
+        """
+        orders = sorted(self.engine.orders.values(), key=lambda order: order.timestamp)
+        return {
+            "version": SNAPSHOT_VERSION,
+            "prices": dict(self.price_feed.prices),
+            "accounts": {
+                user_id: {"cash": account.cash, "positions": account.positions}
+                for user_id, account in self.ledger.accounts.items()
+            },
+            "orders": [order_to_wire(order) for order in orders],
+        }
+
+    def restore(self, snapshot: dict):
+        snapshot = upgrade_snapshot(snapshot)
+        self.price_feed.prices.update(snapshot["prices"])
+        for user_id, account in snapshot["accounts"].items():
+            self.ledger.load_account(user_id, account["cash"], account["positions"])
+        for wire in snapshot["orders"]:
+            order = order_from_wire(tuple(wire))
+            # 掛單的凍結在下單時已通過風控，恢復時不再檢查
+            self.ledger.check_order(order.order_id, order.user_id, order.symbol, order.side,
+                                    order.remaining, order.price, forced=True)
+            self.engine.book(order.symbol).rest(order)
+            self.engine.orders[order.order_id] = order
+
+    @classmethod
+    def from_row(cls, row, **kwargs) -> 'Room':
+        """
+        由數據庫的房間記錄建立，有快照時恢復快照，否則以成員餘額與房間持倉重建 (沒有掛單)
+        """
+        room = cls(str(row.id), row.name, list(row.symbols), row.starting_cash, **kwargs)
+        if row.snapshot:
+            room.restore(json.loads(row.snapshot))
+            for member in row.members:
+                if room.ledger.get_account(member.user_id) is None:
+                    room.join(member.user_id, member.balance)
+            return room
+        positions = {}
+        for position in row.positions:
+            positions.setdefault(position.user_id, {})[position.symbol] = position.quantity
+        for member in row.members:
+            room.ledger.load_account(member.user_id, member.balance, positions.get(member.user_id))
+        return room
+
+
+class RoomManager:
+    """
+    按需載入房間：第一次訪問時由快照恢復，最近最少使用或閒置的房間寫回成交與快照後卸載
+    有成交時快照隨成交定期寫入
+    """
+
+    def __init__(self, max_loaded: int = ROOM_MAX_LOADED, idle_seconds: float = ROOM_IDLE_SECONDS,
+                 clock: Callable = time.monotonic):
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self.rooms = OrderedDict()
+        self.loading = {}
+        self.unloading = {}
+
+    async def create(self, db, name: str, symbols: list, starting_cash: int, prices: dict) -> Optional[Room]:
+        row = await db.create_room(name, symbols, starting_cash)
+        if row is None:
+            return None
+        room = Room(str(row.id), name, symbols, starting_cash, clock=self.clock)
+        room.price_feed.prices.update(prices)
+        await db.save_room_snapshot(room.room_id, room.snapshot())
+        self.rooms[room.room_id] = room
+        await self._evict(db)
+        return room
+
+    async def get(self, db, room_id: str) -> Optional[Room]:
+        unloading = self.unloading.get(room_id)
+        if unloading is not None:
+            await unloading
+        room = self.rooms.get(room_id)
+        if room is not None:
+            self.rooms.move_to_end(room_id)
+            return room
+        # 同一房間的並發請求共用一次載入
+        task = self.loading.get(room_id)
+        if task is None:
+            task = self.loading[room_id] = asyncio.ensure_future(self._load(db, room_id))
+            task.add_done_callback(lambda _: self.loading.pop(room_id, None))
+        return await task
+
+    async def _load(self, db, room_id: str) -> Optional[Room]:
+        row = await db.get_room(room_id)
+        if row is None:
+            return None
+        room = Room.from_row(row, clock=self.clock)
+        self.rooms[room_id] = room
+        await self._evict(db)
+        return room
+
+    async def flush(self, db, room: Room) -> int:
+        """
+        成交連同此刻的快照在同一事務寫入，崩潰後恢復的快照不會比成員餘額與持倉舊
+        """
+        if not room.pending_fills:
+            return 0
+        fills, room.pending_fills = room.pending_fills, []
+        if not await db.record_room_fills(room.room_id, *aggregate_fills(fills), snapshot=room.snapshot()):
+            room.pending_fills = fills + room.pending_fills
+            return 0
+        return len(fills)
+
+    async def unload(self, db, room_id: str) -> bool:
+        """
+        先移出已載入列表使其不再接受委託，寫回成交與快照失敗時放回
+        """
+        room = self.rooms.pop(room_id, None)
+        if room is None:
+            return False
+        done = self.unloading[room_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self.flush(db, room)
+            saved = not room.pending_fills and await db.save_room_snapshot(room_id, room.snapshot())
+            if not saved:
+                self.rooms[room_id] = room
+                self.rooms.move_to_end(room_id, last=False)
+            return saved
+        finally:
+            del self.unloading[room_id]
+            done.set_result(None)
+
+    async def _evict(self, db):
+        while len(self.rooms) > self.max_loaded:
+            if not await self.unload(db, next(iter(self.rooms))):
+                break
+
+    async def unload_idle(self, db) -> int:
+        now = self.clock()
+        idle = [room_id for room_id, room in self.rooms.items() if now - room.last_active >= self.idle_seconds]
+        unloaded = 0
+        for room_id in idle:
+            unloaded += await self.unload(db, room_id)
+        return unloaded
+
+    async def unload_all(self, db):
+        for room_id in list(self.rooms):
+            await self.unload(db, room_id)
+
+    async def run(self, db, interval: float = ROOM_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                for room in list(self.rooms.values()):
+                    await self.flush(db, room)
+                await self.unload_idle(db)
+            except Exception as e:
+                print(f"Room maintenance error: {e}")
+
+
+room_manager = RoomManager()
+
+
+class RoomCreate(BaseModel):
+    name: str
+    symbols: list[str]
+    starting_cash: float = 100000.0
+
+
+async def get_room(room_id: str) -> Room:
+    room = await room_manager.get(Database(), room_id)
+    if room is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
+    return room
+
+
+@router.post("")
+async def create_room(data: RoomCreate, current_user: User = Depends(get_current_user)):
+    """
+    建立房間，各股票以主市場現價作為開盤價
+    """
+    prices = {symbol: price_feed.last_price(symbol) for symbol in data.symbols}
+    missing = [symbol for symbol, price in prices.items() if price is None]
+    if missing or not data.symbols:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Unknown symbols: {', '.join(missing)}")
+    try:
+        starting_cash = to_ticks(data.starting_cash)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if starting_cash <= 0:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Starting cash must be positive")
+    room = await room_manager.create(Database(), data.name, data.symbols, starting_cash, prices)
+    if room is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create room")
+    return {"room_id": room.room_id, "name": room.name, "symbols": sorted(room.symbols),
+            "starting_cash": from_ticks(room.starting_cash)}
+
+
+@router.post("/{room_id}/join")
+async def join_room(room_id: str, current_user: User = Depends(get_current_user)):
+    room = await get_room(room_id)
+    user_id = str(current_user.id)
+    member = await Database().add_room_member(room_id, user_id, room.starting_cash)
+    if member is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to join room")
+    account = room.join(user_id, member.balance)
+    return {"room_id": room_id, "cash": from_ticks(account.cash), "positions": account.positions}
+
+
+@router.post("/{room_id}/orders", response_model=OrderResponse)
+async def create_room_order(room_id: str, data: OrderCreate, response: Response,
+                            current_user: User = Depends(get_current_user),
+                            idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    room = await get_room(room_id)
+    user_id = str(current_user.id)
+
+    async def submit() -> dict:
+        try:
+            order, fills = room.submit(user_id, data)
+        except RoomBudgetError as e:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+        except RiskCheckError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        return OrderResponse(
+            order_id=order.order_id,
+            status=order.status,
+            remaining=order.remaining,
+            fills=fill_responses(fills),
+        ).model_dump()
+
+    return await idempotent(user_id, idempotency_key, dict(data.model_dump(), room_id=room_id), response, submit)
+
+
+@router.delete("/{room_id}/orders/{order_id}")
+async def cancel_room_order(room_id: str, order_id: str, current_user: User = Depends(get_current_user)):
+    room = await get_room(room_id)
+    if not room.cancel(str(current_user.id), order_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    return {"message": "Order cancelled"}
+
+
+@router.get("/{room_id}/account")
+async def get_room_account(room_id: str, current_user: User = Depends(get_current_user)):
+    room = await get_room(room_id)
+    account = room.ledger.get_account(str(current_user.id))
+    if account is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not a member of this room")
+    equity, _ = room.ledger.valuation(account)
+    return {"cash": from_ticks(account.cash), "buying_power": from_ticks(account.buying_power),
+            "positions": account.positions, "equity": from_ticks(equity)}
+
+
+@router.get("/{room_id}/leaderboard")
+async def get_leaderboard(room_id: str, current_user: User = Depends(get_current_user)):
+    room = await get_room(room_id)
+    return {"room_id": room_id, "name": room.name, "leaderboard": room.leaderboard()}
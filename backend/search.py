@@ -0,0 +1,313 @@
+import asyncio
+import heapq
+import os
+import re
+from collections import OrderedDict
+
+SEARCH_REFRESH_INTERVAL = float(os.getenv('SEARCH_REFRESH_INTERVAL', '60'))
+
+# 每個字典樹節點緩存的熱門結果數，亦為單次查詢的上限
+TOP_K = 20
+
+# 查詢結果緩存大小，索引變動時整體清空
+QUERY_CACHE_SIZE = int(os.getenv('SEARCH_QUERY_CACHE_SIZE', '10000'))
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+class _Node:
+    __slots__ = ('children', 'symbols', 'ranked')
+
+    def __init__(self):
+        self.children = {}
+        # 子樹內所有鍵對應的股票，以及按熱度排序的完整列表 (懶惰重建)
+        self.symbols = set()
+        self.ranked = None
+
+
+class PrefixTrie:
+    """
+    每個節點保存其子樹的股票集合，前綴查詢只需走到節點即可取得全部匹配
+    """
+
+    def __init__(self):
+        self.root = _Node()
+
+    def insert(self, key: str, symbol: str):
+        node = self.root
+        node.symbols.add(symbol)
+        node.ranked = None
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+            node.symbols.add(symbol)
+            node.ranked = None
+
+    def remove(self, key: str, symbol: str):
+        """
+        從鍵經過的所有節點移除股票，調用方須移除該股票的全部鍵，並刪除空節點
+        """
+        node = self.root
+        node.symbols.discard(symbol)
+        node.ranked = None
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                return
+            child.symbols.discard(symbol)
+            child.ranked = None
+            if not child.symbols:
+                del node.children[char]
+                return
+            node = child
+
+    def invalidate(self, key: str):
+        node = self.root
+        node.ranked = None
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return
+            node.ranked = None
+
+    def find(self, prefix: str):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def fuzzy(self, prefix: str, edits: int = 1) -> list:
+        """
+        容許 edits 次替換、插入或刪除的前綴匹配 (首字元須相同)，返回匹配的節點
+        在每個位置嘗試一次編輯後其餘部分精確走樹，成本約為 O(長度 x 分支數 x 長度)
+        """
+        matches = {}
+        if not prefix:
+            return []
+
+        def search(node, i, edits):
+            end = node
+            for char in prefix[i:]:
+                end = end.children.get(char)
+                if end is None:
+                    break
+            else:
+                matches[id(end)] = end
+            if edits == 0:
+                return
+            while i < len(prefix):
+                expected = prefix[i]
+                # 刪除查詢中的字元，最後一個字元除外，否則會匹配過短的前綴
+                if i < len(prefix) - 1:
+                    search(node, i + 1, edits - 1)
+                for char, child in node.children.items():
+                    if char != expected:
+                        search(child, i + 1, edits - 1)
+                    search(child, i, edits - 1)
+                node = node.children.get(expected)
+                if node is None:
+                    return
+                i += 1
+
+        start = self.root.children.get(prefix[0])
+        if start is not None:
+            search(start, 1, edits)
+        return list(matches.values())
+
+
+class StockEntry:
+    __slots__ = ('symbol', 'name', 'popularity', 'symbol_key', 'tokens')
+
+    def __init__(self, symbol: str, name: str, popularity: int = 0):
+        self.symbol = symbol
+        self.name = name
+        self.popularity = popularity
+        self.symbol_key = symbol.lower()
+        self.tokens = set(tokenize(name))
+
+
+class _Reverse:
+    """
+    讓 nlargest 在熱度相同時按代碼字母升序
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class SearchIndex:
+    """
+    股票代碼與名稱的自動完成索引：代碼與名稱各一棵前綴樹，名稱另有詞元倒排索引
+    排序依次為代碼完全匹配、代碼前綴、名稱前綴，無匹配時退回模糊匹配，同類內按熱度 (成交筆數) 排序
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.by_key = {}
+        self.symbols = PrefixTrie()
+        self.names = PrefixTrie()
+        self.tokens = {}
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _rank_key(self, symbol: str):
+        return (self.entries[symbol].popularity, _Reverse(symbol))
+
+    def _ranked(self, node: _Node) -> list:
+        if node.ranked is None:
+            node.ranked = sorted(node.symbols, key=self._sort_key)
+        return node.ranked
+
+    def _sort_key(self, symbol: str):
+        return (-self.entries[symbol].popularity, symbol)
+
+    def upsert(self, symbol: str, name: str, popularity: int = 0):
+        entry = self.entries.get(symbol)
+        if entry is not None:
+            if entry.name == name:
+                self.set_popularity(symbol, popularity)
+                return
+            self.remove(symbol)
+        self.cache.clear()
+        entry = self.entries[symbol] = StockEntry(symbol, name, popularity)
+        self.by_key[entry.symbol_key] = symbol
+        self.symbols.insert(entry.symbol_key, symbol)
+        for token in entry.tokens:
+            self.names.insert(token, symbol)
+            self.tokens.setdefault(token, set()).add(symbol)
+
+    def remove(self, symbol: str):
+        entry = self.entries.pop(symbol, None)
+        if entry is None:
+            return
+        self.cache.clear()
+        del self.by_key[entry.symbol_key]
+        self.symbols.remove(entry.symbol_key, symbol)
+        for token in entry.tokens:
+            self.names.remove(token, symbol)
+            postings = self.tokens[token]
+            postings.discard(symbol)
+            if not postings:
+                del self.tokens[token]
+
+    def set_popularity(self, symbol: str, popularity: int):
+        entry = self.entries.get(symbol)
+        if entry is None or entry.popularity == popularity:
+            return
+        entry.popularity = popularity
+        self.cache.clear()
+        self.symbols.invalidate(entry.symbol_key)
+        for token in entry.tokens:
+            self.names.invalidate(token)
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> list:
+        limit = min(limit, TOP_K)
+        terms = tokenize(query)
+        if not terms:
+            return []
+        key = (' '.join(terms), limit, fuzzy)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            return cached
+        results = []
+        seen = set()
+
+        def extend(symbols):
+            for symbol in symbols:
+                if symbol not in seen:
+                    seen.add(symbol)
+                    results.append(symbol)
+
+        if len(terms) == 1:
+            term = terms[0]
+            if term in self.by_key:
+                extend([self.by_key[term]])
+            for trie in (self.symbols, self.names):
+                node = trie.find(term)
+                if node is not None:
+                    extend(self._ranked(node)[:TOP_K])
+        else:
+            # 除最後一個詞外必須完全匹配詞元，最後一個詞按前綴匹配
+            sets = sorted((self.tokens.get(term, set()) for term in terms[:-1]), key=len)
+            node = self.names.find(terms[-1])
+            if node is not None and sets[0]:
+                if len(sets[0]) <= TOP_K * 16:
+                    candidates = sets[0].intersection(node.symbols, *sets[1:])
+                    extend(heapq.nlargest(limit, candidates, key=self._rank_key))
+                else:
+                    # 詞元都很常見時按熱度順序掃描前綴節點，湊滿即停
+                    for symbol in self._ranked(node):
+                        if all(symbol in postings for postings in sets):
+                            extend((symbol,))
+                            if len(results) == limit:
+                                break
+
+        # 沒有前綴匹配時才退回模糊匹配，容忍輸入錯誤
+        if fuzzy and not results:
+            term = ''.join(terms)
+            if len(term) >= 3:
+                # 每個匹配節點只需取其熱度前 limit 名，再合併排序
+                candidates = set()
+                for node in self.symbols.fuzzy(term) + self.names.fuzzy(term):
+                    candidates.update(self._ranked(node)[:limit])
+                extend(heapq.nlargest(limit - len(results), candidates, key=self._rank_key))
+        entries = [self.entries[symbol] for symbol in results[:limit]]
+        self.cache[key] = entries
+        if len(self.cache) > QUERY_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return entries
+
+
+class SearchService:
+    """
+    定期與 Stock 表比對，只對新增、改名、刪除或熱度變動的股票增量更新索引
+    """
+
+    def __init__(self):
+        self.index = SearchIndex()
+
+    async def refresh(self, db) -> int:
+        rows = await db.get_stock_search_entries()
+        if rows is None:
+            return 0
+        current = {row.symbol: row for row in rows}
+        changed = 0
+        for symbol in list(self.index.entries):
+            if symbol not in current:
+                self.index.remove(symbol)
+                changed += 1
+        for symbol, row in current.items():
+            entry = self.index.entries.get(symbol)
+            if entry is None or entry.name != row.name or entry.popularity != row.trade_count:
+                self.index.upsert(symbol, row.name, row.trade_count)
+                changed += 1
+        return changed
+
+    async def run(self, db, interval: float = SEARCH_REFRESH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                print(f"Search refresh error: {e}")
+
+
+search_service = SearchService()
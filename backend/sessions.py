@@ -0,0 +1,326 @@
+import asyncio
+import os
+from datetime import datetime, time as dtime
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+import numpy as np
+from clock import now_ns, to_datetime
+from engine import Fill, MatchingEngine, Order, triggered_order
+from ledger import RiskCheckError
+
+PRE_OPEN = 'pre_open'
+OPEN_AUCTION = 'open_auction'
+CONTINUOUS = 'continuous'
+CLOSE_AUCTION = 'close_auction'
+CLOSED = 'closed'
+
+# 收集委託等待集合競價的時段
+COLLECTING = (PRE_OPEN, CLOSE_AUCTION)
+
+SESSION_TIMEZONE = os.getenv('SESSION_TIMEZONE', 'Asia/Taipei')
+SESSION_PRE_OPEN = os.getenv('SESSION_PRE_OPEN', '08:30')
+SESSION_OPEN = os.getenv('SESSION_OPEN', '09:00')
+SESSION_CLOSE_AUCTION = os.getenv('SESSION_CLOSE_AUCTION', '13:25')
+SESSION_CLOSE = os.getenv('SESSION_CLOSE', '13:30')
+# 預設不分時段，全天連續撮合；設為 on 時按時段表開收盤與集合競價
+MARKET_SESSIONS = os.getenv('MARKET_SESSIONS', 'off')
+SESSION_CHECK_INTERVAL = float(os.getenv('SESSION_CHECK_INTERVAL', '1'))
+
+
+class MarketClosedError(Exception):
+    pass
+
+
+class SessionSchedule:
+    """
+    交易日的時段表：盤前收集 -> 開盤集合競價 -> 連續交易 -> 收盤集合競價 -> 休市，週末休市
+    """
+
+    def __init__(self, pre_open: str = SESSION_PRE_OPEN, open: str = SESSION_OPEN,
+                 close_auction: str = SESSION_CLOSE_AUCTION, close: str = SESSION_CLOSE,
+                 timezone: str = SESSION_TIMEZONE, weekdays: tuple = (0, 1, 2, 3, 4)):
+        self.pre_open = dtime.fromisoformat(pre_open)
+        self.open = dtime.fromisoformat(open)
+        self.close_auction = dtime.fromisoformat(close_auction)
+        self.close = dtime.fromisoformat(close)
+        if not self.pre_open <= self.open <= self.close_auction <= self.close:
+            raise ValueError("Session times must be in order")
+        self.timezone = ZoneInfo(timezone)
+        self.weekdays = weekdays
+
+    def now(self) -> datetime:
+        """
+        以市場時鐘判斷時段，回測或模擬時鐘下也能正確開收盤
+        """
+        return to_datetime(now_ns()).astimezone(self.timezone)
+
+    def state_at(self, moment: datetime) -> str:
+        local = moment.astimezone(self.timezone)
+        if local.weekday() not in self.weekdays:
+            return CLOSED
+        current = local.time()
+        if current < self.pre_open or current >= self.close:
+            return CLOSED
+        if current < self.open:
+            return PRE_OPEN
+        if current < self.close_auction:
+            return CONTINUOUS
+        return CLOSE_AUCTION
+
+
+def uncross(orders: list, reference_price: int = None) -> Optional[tuple]:
+    """
+    計算集合競價的成交價：使成交量最大，其次使買賣不平衡最小，再其次最接近參考價
+    以排序後的價位陣列一次累加求出每個價位的買方需求與賣方供給
+    返回 (價格, 成交量)，無法成交時返回 None
+    """
+    buy_prices, buy_quantities, sell_prices, sell_quantities = [], [], [], []
+    market_buy = market_sell = 0
+    for order in orders:
+        if order.side == 'buy':
+            if order.price is None:
+                market_buy += order.remaining
+            else:
+                buy_prices.append(order.price)
+                buy_quantities.append(order.remaining)
+        elif order.price is None:
+            market_sell += order.remaining
+        else:
+            sell_prices.append(order.price)
+            sell_quantities.append(order.remaining)
+
+    prices = np.unique(np.array(buy_prices + sell_prices, dtype=np.int64))
+    if not len(prices):
+        if market_buy and market_sell and reference_price is not None:
+            return reference_price, min(market_buy, market_sell)
+        return None
+    buy_at = np.zeros(len(prices))
+    np.add.at(buy_at, np.searchsorted(prices, buy_prices), buy_quantities)
+    sell_at = np.zeros(len(prices))
+    np.add.at(sell_at, np.searchsorted(prices, sell_prices), sell_quantities)
+    # demand[i]: 願意以 prices[i] 或更高價買入的數量；supply[i]: 願意以 prices[i] 或更低價賣出的數量
+    demand = market_buy + np.cumsum(buy_at[::-1])[::-1]
+    supply = market_sell + np.cumsum(sell_at)
+    executed = np.minimum(demand, supply)
+    volume = executed.max()
+    if volume <= 0:
+        return None
+    candidates = np.flatnonzero(executed == volume)
+    imbalance = np.abs(demand[candidates] - supply[candidates])
+    candidates = candidates[imbalance == imbalance.min()]
+    if reference_price is not None:
+        index = candidates[np.argmin(np.abs(prices[candidates] - reference_price))]
+    else:
+        index = candidates[len(candidates) // 2]
+    return int(prices[index]), int(volume)
+
+
+def allocate(symbol: str, orders: list, price: int, volume: int) -> list:
+    """
+    以單一成交價按價格優先、時間優先分配成交量，市價單最優先
+    """
+    buys = sorted(
+        (o for o in orders if o.side == 'buy' and (o.price is None or o.price >= price)),
+        key=lambda o: (o.price is not None, -(o.price or 0), o.timestamp)
+    )
+    sells = sorted(
+        (o for o in orders if o.side == 'sell' and (o.price is None or o.price <= price)),
+        key=lambda o: (o.price is not None, o.price or 0, o.timestamp)
+    )
+    fills = []
+    b = s = 0
+    while volume > 0 and b < len(buys) and s < len(sells):
+        buy, sell = buys[b], sells[s]
+        quantity = min(volume, buy.remaining, sell.remaining)
+        fills.append(Fill(symbol, price, quantity, buy, sell))
+        buy.remaining -= quantity
+        sell.remaining -= quantity
+        volume -= quantity
+        for order in (buy, sell):
+            order.status = 'filled' if order.remaining == 0 else 'partial'
+        if buy.remaining == 0:
+            b += 1
+        if sell.remaining == 0:
+            s += 1
+    return fills
+
+
+class SessionManager:
+    """
+    按時段表切換市場狀態：收集時段的委託暫存，進入開盤或收盤時對每支股票執行集合競價
+    開盤競價未成交的限價單轉入連續委託簿，收盤競價未成交的委託全部取消
+    """
+
+    def __init__(self, engine: MatchingEngine, schedule: SessionSchedule = None,
+                 clock: Callable = None, enabled: bool = MARKET_SESSIONS == 'on', shard_pool=None):
+        self.engine = engine
+        self.shard_pool = shard_pool
+        self.schedule = schedule or SessionSchedule()
+        self.clock = clock or self.schedule.now
+        self.enabled = enabled
+        self.state = CONTINUOUS if not enabled else self.schedule.state_at(self.clock())
+        self.collected = {}
+        self.queued = {}
+        self.auctions = {}
+        # 開盤競價成交價觸發的條件單，競價結束進入連續交易後再提交
+        self.deferred = []
+
+    def check_open(self):
+        if self.state == CLOSED:
+            raise MarketClosedError("Market is closed")
+
+    def collect(self, order: Order):
+        """
+        收集時段的委託先凍結資金，等待集合競價
+        市價買單與連續撮合相同以凍結價為上限，參加競價時視為該價位的限價單，不會以高於凍結的價格成交
+        """
+        self.check_open()
+        self.engine.collar(order)
+        self._queue(order)
+
+    def _queue(self, order: Order):
+        order.status = 'queued'
+        self.collected.setdefault(order.symbol, {})[order.order_id] = order
+        self.queued[order.order_id] = order
+
+    def submit_triggered(self, conditional):
+        """
+        條件單的觸發回調，與普通委託相同遵守交易時段：連續交易時送往撮合 (有分片時送往分片)，
+        收集時段轉為委託等待集合競價，開盤競價進行中觸發的等競價結束，休市時拒絕
+        """
+        if self.state == CONTINUOUS:
+            if self.shard_pool is not None:
+                self.shard_pool.submit_triggered(conditional)
+            else:
+                self.engine.submit_triggered(conditional)
+        elif self.state == OPEN_AUCTION:
+            self.deferred.append(conditional)
+        elif self.state in COLLECTING:
+            try:
+                self.collect(triggered_order(conditional))
+            except (RiskCheckError, MarketClosedError, ValueError) as e:
+                print(f"Triggered order {conditional.order_id} rejected: {e}")
+        else:
+            print(f"Triggered order {conditional.order_id} rejected: market is closed")
+
+    def find(self, order_id: str) -> Optional[Order]:
+        return self.queued.get(order_id)
+
+    def cancel(self, order_id: str) -> bool:
+        order = self.queued.pop(order_id, None)
+        if order is None:
+            return False
+        del self.collected[order.symbol][order_id]
+        order.status = 'cancelled'
+        if self.engine.ledger:
+            self.engine.ledger.release(order_id)
+        return True
+
+    def run_auction(self, symbol: str) -> list:
+        orders = list(self.collected.pop(symbol, {}).values())
+        for order in orders:
+            del self.queued[order.order_id]
+        reference = self.engine.price_feed.last_price(symbol) if self.engine.price_feed else None
+        result = uncross(orders, reference)
+        if result is not None:
+            price, volume = result
+            fills = allocate(symbol, orders, price, volume)
+            self.engine.apply_fills(fills)
+            self.auctions[symbol] = {"price": price, "volume": volume, "orders": len(orders)}
+        return orders
+
+    def _open(self):
+        self.state = OPEN_AUCTION
+        for symbol in list(self.collected):
+            for order in self.run_auction(symbol):
+                if order.remaining == 0:
+                    continue
+                if order.order_type == 'market':
+                    order.status = 'cancelled'
+                    if self.engine.ledger:
+                        self.engine.ledger.release(order.order_id)
+                else:
+                    self.engine.book(symbol).rest(order)
+                    self.engine.touched_books.add(self.engine.book(symbol))
+                    self.engine.orders[order.order_id] = order
+        self.state = CONTINUOUS
+        deferred, self.deferred = self.deferred, []
+        for conditional in deferred:
+            self.submit_triggered(conditional)
+
+    def _start_close_auction(self):
+        """
+        連續委託簿中的掛單轉入收盤競價，凍結的資金保留到競價結束
+        """
+        for order_id, order in list(self.engine.orders.items()):
+            self.engine.books[order.symbol].cancel(order)
+            self.engine.touched_books.add(self.engine.books[order.symbol])
+            del self.engine.orders[order_id]
+            self._queue(order)
+        self.state = CLOSE_AUCTION
+
+    def _close(self):
+        # 收盤競價的成交價觸發的條件單按休市拒絕，不留到下一個交易日
+        self.state = CLOSED
+        for symbol in list(self.collected):
+            for order in self.run_auction(symbol):
+                if order.remaining:
+                    order.status = 'cancelled'
+                    if self.engine.ledger:
+                        self.engine.ledger.release(order.order_id)
+
+    def tick(self) -> str:
+        """
+        按當前時間推進狀態，跨越多個時段時依序執行
+        """
+        if not self.enabled:
+            return self.state
+        target = self.schedule.state_at(self.clock())
+        if target == self.state:
+            return self.state
+        if target == CLOSED:
+            if self.state in (CONTINUOUS, PRE_OPEN):
+                self._start_close_auction()
+            if self.state == CLOSE_AUCTION:
+                self._close()
+        elif target == PRE_OPEN:
+            self.state = PRE_OPEN
+        elif target == CONTINUOUS:
+            if self.state == PRE_OPEN:
+                self._open()
+            self.state = CONTINUOUS
+        elif target == CLOSE_AUCTION:
+            if self.state == PRE_OPEN:
+                self._open()
+            self._start_close_auction()
+        return self.state
+
+    async def advance(self) -> str:
+        """
+        有撮合分片時的 tick：進入收盤競價前把分片中的掛單取回本引擎，
+        開盤競價後轉入連續交易的掛單送回所屬分片
+        """
+        if self.shard_pool is None or not self.enabled:
+            return self.tick()
+        before = self.state
+        target = self.schedule.state_at(self.clock())
+        if target in (CLOSE_AUCTION, CLOSED) and before in (CONTINUOUS, PRE_OPEN):
+            for order in await self.shard_pool.export_all():
+                self.engine.book(order.symbol).rest(order)
+                self.engine.orders[order.order_id] = order
+        state = self.tick()
+        if state == CONTINUOUS and before != CONTINUOUS:
+            orders = list(self.engine.orders.values())
+            for order in orders:
+                self.engine.books.pop(order.symbol, None)
+                del self.engine.orders[order.order_id]
+            await self.shard_pool.import_orders(orders)
+        return state
+
+    async def run(self, interval: float = SESSION_CHECK_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.advance()
+            except Exception as e:
+                print(f"Session tick error: {e}")
@@ -0,0 +1,141 @@
+import asyncio
+import os
+from typing import Optional
+from clock import NANOS_PER_MICRO
+from journal import Journal
+
+SETTLEMENT_INTERVAL = float(os.getenv('SETTLEMENT_INTERVAL', '0.2'))
+# 同一批成交連續寫入失敗這麼多次 (預設約一分鐘) 後移入死信日誌，不再阻塞之後的成交
+SETTLEMENT_MAX_RETRIES = int(os.getenv('SETTLEMENT_MAX_RETRIES', '300'))
+SETTLEMENT_DEAD_LETTER = os.getenv('SETTLEMENT_DEAD_LETTER', 'settlement.deadletter')
+
+
+def transaction_id(fill, side: str) -> str:
+    """
+    由成交雙方委託號、成交時間 (納秒) 與方向導出的成交記錄編號，記憶體緩存與數據庫中的同一筆記錄編號一致
+    """
+    return f"{fill.buy_order_id}:{fill.sell_order_id}:{fill.timestamp}:{side}"
+
+
+def transaction_timestamp(fill) -> int:
+    # 數據庫 datetime 精度為微秒，納秒時間戳截斷到微秒
+    return fill.timestamp - fill.timestamp % NANOS_PER_MICRO
+
+
+def aggregate_fills(fills: list) -> tuple:
+    """
+    將成交拆成買賣兩邊的 Transaction 行，並按 (用戶, 股票) 彙總持倉與資金淨變動
+    價格與金額均為整數 tick，均價四捨五入到 tick
+    """
+    transactions = []
+    positions = {}
+    cash = {}
+    for fill in fills:
+        for side, user_id in (('buy', fill.buyer_id), ('sell', fill.seller_id)):
+            value = fill.quantity * fill.price
+            transactions.append({
+                "trade_id": transaction_id(fill, side),
+                "timestamp": transaction_timestamp(fill),
+                "type": side,
+                "quantity": fill.quantity,
+                "price": fill.price,
+                "user_id": user_id,
+                "symbol": fill.symbol,
+            })
+            position = positions.get((user_id, fill.symbol))
+            if position is None:
+                position = positions[(user_id, fill.symbol)] = {
+                    "user_id": user_id,
+                    "symbol": fill.symbol,
+                    "quantity": 0,
+                    "buy_quantity": 0,
+                    "buy_value": 0,
+                }
+            if side == 'buy':
+                position["quantity"] += fill.quantity
+                position["buy_quantity"] += fill.quantity
+                position["buy_value"] += value
+                cash[user_id] = cash.get(user_id, 0) - value
+            else:
+                position["quantity"] -= fill.quantity
+                cash[user_id] = cash.get(user_id, 0) + value
+
+    for position in positions.values():
+        buy_quantity = position["buy_quantity"]
+        # 整數除法四捨五入
+        position["average_price"] = (position["buy_value"] + buy_quantity // 2) // buy_quantity if buy_quantity else 0
+    payments = [{"user_id": user_id, "amount": amount} for user_id, amount in cash.items() if amount]
+    return transactions, list(positions.values()), payments
+
+
+class FillSettlement:
+    """
+    緩存撮合成交，定期以單一事務批量寫入 Transaction、Portfolio 與 CashAccount
+    寫入失敗的成交放回緩存重試，連續失敗 max_retries 次後整批寫入死信日誌並丟棄
+    """
+
+    def __init__(self, interval: float = SETTLEMENT_INTERVAL, max_retries: int = SETTLEMENT_MAX_RETRIES,
+                 dead_letter: Optional[Journal] = None):
+        self.interval = interval
+        self.max_retries = max_retries
+        self.dead_letter = dead_letter
+        self.buffer = []
+        # 正在寫入數據庫的一批
+        self.inflight = []
+        self.failures = 0
+        # 定期寫入與公司行動等調用方主動 flush 不交錯，保證返回時之前的成交都已處理
+        self._lock = asyncio.Lock()
+
+    def on_fills(self, fills: list):
+        self.buffer.extend(fills)
+
+    async def flush(self, db) -> int:
+        async with self._lock:
+            return await self._flush(db)
+
+    async def _flush(self, db) -> int:
+        if not self.buffer:
+            return 0
+        fills, self.buffer = self.buffer, []
+        self.inflight = fills
+        try:
+            recorded = await db.record_fills(*aggregate_fills(fills))
+        except Exception as e:
+            print(f"Error settling fills: {e}")
+            recorded = False
+        finally:
+            self.inflight = []
+        if recorded:
+            self.failures = 0
+            return len(fills)
+        self.failures += 1
+        if self.failures < self.max_retries:
+            # 寫入失敗時放回緩存，下一輪重試
+            self.buffer = fills + self.buffer
+            return 0
+        self.failures = 0
+        print(f"Settlement failed {self.max_retries} times, dead-lettering {len(fills)} fills")
+        if self.dead_letter:
+            for fill in fills:
+                self.dead_letter.append({name: getattr(fill, name) for name in type(fill).__slots__})
+            try:
+                self.dead_letter.flush()
+            except OSError as e:
+                print(f"Error writing settlement dead letters: {e}")
+        return 0
+
+    def pending_users(self) -> set:
+        """
+        有成交尚未寫入數據庫的用戶
+        """
+        users = set()
+        for fills in (self.buffer, self.inflight):
+            for fill in fills:
+                users.add(fill.buyer_id)
+                users.add(fill.seller_id)
+        return users
+
+    async def run(self, db):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush(db)
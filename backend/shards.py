@@ -0,0 +1,577 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from bisect import bisect, bisect_left, insort
+from collections import deque
+from typing import Callable, Optional
+from engine import Fill, MatchingEngine, Order, OrderPool, triggered_order
+from prices import PriceFeed
+
+MATCHING_SHARDS = int(os.getenv('MATCHING_SHARDS', '0'))
+SHARD_VNODES = int(os.getenv('SHARD_VNODES', '64'))
+# 等待分片回應的秒數
+SHARD_TIMEOUT = float(os.getenv('SHARD_TIMEOUT', '5'))
+
+
+class ShardUnavailableError(Exception):
+    """
+    撮合分片已退出或沒有及時回應
+    """
+    pass
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    一致性雜湊環，每個分片放置 vnodes 個虛擬節點，增減分片時只有約 1/N 的股票需要遷移
+    """
+
+    def __init__(self, nodes: list = (), vnodes: int = SHARD_VNODES):
+        self.vnodes = vnodes
+        self.nodes = []
+        self.points = []
+        self.owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        self._rebuild()
+
+    def remove(self, node: str):
+        self.nodes.remove(node)
+        self._rebuild()
+
+    def _rebuild(self):
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(self.vnodes))
+        self.points = [point for point, _ in ring]
+        self.owners = [node for _, node in ring]
+
+    def lookup(self, key: str) -> str:
+        if not self.points:
+            raise LookupError("Hash ring is empty")
+        index = bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[index]
+
+    def copy(self) -> 'HashRing':
+        ring = HashRing(vnodes=self.vnodes)
+        ring.nodes = list(self.nodes)
+        ring.points = list(self.points)
+        ring.owners = list(self.owners)
+        return ring
+
+
+# 進程間以元組傳遞委託與成交 (價格為整數 tick)，序列化成本約為直接 pickle 物件的十分之一
+
+def order_to_wire(order: Order) -> tuple:
+    return (order.order_id, order.user_id, order.symbol, order.side, order.quantity,
+            order.price, order.order_type, order.remaining, order.status, order.timestamp)
+
+
+def order_from_wire(wire: tuple, pool: OrderPool = None) -> Order:
+    order = pool.acquire(*wire[:7]) if pool is not None else Order(*wire[:7])
+    order.remaining, order.status, order.timestamp = wire[7:]
+    return order
+
+
+def fill_to_wire(fill: Fill) -> tuple:
+    return (fill.symbol, fill.price, fill.quantity, fill.buy_order_id, fill.sell_order_id,
+            fill.buyer_id, fill.seller_id, fill.timestamp)
+
+
+def fill_from_wire(wire: tuple) -> Fill:
+    fill = Fill.__new__(Fill)
+    (fill.symbol, fill.price, fill.quantity, fill.buy_order_id, fill.sell_order_id,
+     fill.buyer_id, fill.seller_id, fill.timestamp) = wire
+    return fill
+
+
+def depth_changes(engine: MatchingEngine) -> list:
+    """
+    上次回報後各委託簿變動價位的最新總量 [(symbol, side, price, volume)]，隨結果送回 API 進程更新深度鏡像
+    """
+    changes = []
+    for book in engine.touched_books:
+        for side in ('buy', 'sell'):
+            volume = book.volume[side]
+            changes.extend((book.symbol, side, price, volume.get(price, 0)) for price in book.touched[side])
+            book.touched[side].clear()
+    engine.touched_books = set()
+    return changes
+
+
+class DepthBook:
+    """
+    分片委託簿在 API 進程的價位鏡像，只保存各價位的總量
+    與 OrderBook 有相同的 symbol、prices、volume、touched 屬性，DepthFeed 可直接推送與快照
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.prices = {'buy': [], 'sell': []}
+        self.volume = {'buy': {}, 'sell': {}}
+        self.touched = {'buy': set(), 'sell': set()}
+
+    def update(self, side: str, price: int, quantity: int):
+        volume = self.volume[side]
+        prices = self.prices[side]
+        if quantity:
+            if price not in volume:
+                insort(prices, price)
+            volume[price] = quantity
+        elif price in volume:
+            del volume[price]
+            del prices[bisect_left(prices, price)]
+        self.touched[side].add(price)
+
+    def clear(self):
+        for side in ('buy', 'sell'):
+            self.touched[side].update(self.prices[side])
+            self.prices[side].clear()
+            self.volume[side].clear()
+
+
+def handle_command(engine: MatchingEngine, command: tuple):
+    """
+    分片進程內執行單條指令
+    """
+    kind = command[0]
+    if kind == 'submit':
+        # ('submit', 委託, forced)：強制平倉委託在 front 已略過風控，分片內同樣不限價
+        order = order_from_wire(command[1], engine.pool)
+        try:
+            fills = engine.submit(order, forced=len(command) > 2 and command[2])
+            return order.status, order.remaining, [fill_to_wire(fill) for fill in fills]
+        finally:
+            engine.release(order)
+    if kind == 'cancel':
+        return engine.cancel(command[1])
+    if kind == 'export':
+        # 移出一支股票的委託簿，按原提交順序返回掛單以保留時間優先
+        symbol = command[1]
+        book = engine.books.pop(symbol, None)
+        if book is not None:
+            # 委託簿整個移出，所有價位回報為 0
+            for side in ('buy', 'sell'):
+                book.touched[side].update(book.prices[side])
+                book.volume[side].clear()
+            engine.touched_books.add(book)
+        orders = [order for order in engine.orders.values() if order.symbol == symbol]
+        wires = []
+        for order in orders:
+            del engine.orders[order.order_id]
+            wires.append(order_to_wire(order))
+            engine.pool.release(order)
+        return wires
+    if kind == 'import':
+        for wire in command[1]:
+            order = order_from_wire(wire, engine.pool)
+            engine.book(order.symbol).rest(order)
+            engine.orders[order.order_id] = order
+        return len(command[1])
+    if kind == 'split':
+        return engine.apply_split(*command[1:])
+    if kind == 'price':
+        return engine.price_feed.last_price(command[1])
+    raise ValueError(f"Unknown shard command: {kind}")
+
+
+def run_shard(conn):
+    """
+    分片進程主循環：每次接收一批指令，按順序執行後整批返回 (結果, 深度變動)，收到 None 時退出
+    """
+    engine = MatchingEngine(None, PriceFeed())
+    while True:
+        try:
+            batch = conn.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        results = []
+        for command in batch:
+            try:
+                results.append(handle_command(engine, command))
+            except Exception as e:
+                results.append(e)
+        conn.send((results, depth_changes(engine)))
+    conn.close()
+
+
+class _Shard:
+    __slots__ = ('name', 'process', 'conn', 'inflight', 'attached')
+
+    def __init__(self, name: str, process, conn):
+        self.name = name
+        self.process = process
+        self.conn = conn
+        self.inflight = deque()
+        self.attached = False
+
+
+class ShardPool:
+    """
+    按股票一致性雜湊把撮合分散到多個進程，每個分片擁有自己的委託簿與價格狀態
+    API 進程與分片之間以 multiprocessing Pipe 通訊，同一輪事件循環內的請求合併成一批發送
+    API 進程的 front 引擎只負責資金風控與成交結算 (AccountLedger、成交訂閱者、最新價)
+    分片隨結果回報委託簿的價位變動，books / touched_books 為深度鏡像，供 DepthFeed 使用
+    """
+
+    def __init__(self, count: int, front: MatchingEngine = None, vnodes: int = SHARD_VNODES,
+                 context: str = 'spawn', timeout: float = SHARD_TIMEOUT):
+        self.ctx = multiprocessing.get_context(context)
+        self.timeout = timeout
+        self.ring = HashRing([f"shard-{i}" for i in range(count)], vnodes)
+        self.front = front
+        self.shards = {}
+        self.symbols = set()
+        # 仍在分片委託簿中的掛單：order_id -> [user_id, symbol, remaining]
+        self.resting = {}
+        self.books = {}
+        self.touched_books = set()
+        self.pending = {}
+        self._scheduled = False
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._tasks = set()
+
+    def _spawn(self, name: str) -> _Shard:
+        parent, child = self.ctx.Pipe()
+        process = self.ctx.Process(target=run_shard, args=(child,), name=name, daemon=True)
+        process.start()
+        child.close()
+        shard = self.shards[name] = _Shard(name, process, parent)
+        return shard
+
+    def start(self):
+        for name in self.ring.nodes:
+            if name not in self.shards:
+                self._spawn(name)
+
+    def stop(self):
+        for shard in self.shards.values():
+            self._detach(shard)
+            try:
+                shard.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            shard.process.join(timeout=5)
+            shard.conn.close()
+        self.shards = {}
+
+    def shard_for(self, symbol: str) -> str:
+        return self.ring.lookup(symbol)
+
+    def call(self, name: str, commands: list) -> list:
+        """
+        同步發送一批指令並等待結果，只能在沒有異步請求在途時使用
+        """
+        shard = self.shards[name]
+        shard.conn.send(commands)
+        return self._receive(shard)
+
+    def call_many(self, batches: dict) -> dict:
+        """
+        同時向多個分片發送指令批次，再依次收集結果，各分片並行處理
+        """
+        for name, commands in batches.items():
+            self.shards[name].conn.send(commands)
+        return {name: self._receive(self.shards[name]) for name in batches}
+
+    def _receive(self, shard: _Shard) -> list:
+        results, changes = shard.conn.recv()
+        for symbol, side, price, quantity in changes:
+            book = self.books.get(symbol)
+            if book is None:
+                book = self.books[symbol] = DepthBook(symbol)
+            book.update(side, price, quantity)
+            self.touched_books.add(book)
+        return results
+
+    # 異步接口：供 API 進程的事件循環使用
+
+    def _attach(self, shard: _Shard):
+        asyncio.get_running_loop().add_reader(shard.conn.fileno(), self._on_readable, shard)
+        shard.attached = True
+
+    def _detach(self, shard: _Shard):
+        if not shard.attached:
+            return
+        shard.attached = False
+        try:
+            asyncio.get_running_loop().remove_reader(shard.conn.fileno())
+        except (RuntimeError, ValueError, OSError):
+            pass
+
+    def _on_readable(self, shard: _Shard):
+        try:
+            results = self._receive(shard)
+        except (EOFError, OSError):
+            self._fail(shard)
+            return
+        if not shard.inflight:
+            print(f"Unexpected message from matching shard {shard.name}")
+            return
+        futures = shard.inflight.popleft()
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _fail(self, shard: _Shard, futures: list = ()):
+        """
+        分片進程退出：在途請求全部失敗，留在其委託簿中的掛單已丟失，釋放它們的凍結
+        """
+        print(f"Matching shard {shard.name} exited")
+        self._detach(shard)
+        error = ShardUnavailableError(f"Matching shard {shard.name} is unavailable")
+        batches = list(shard.inflight) + [list(futures)]
+        shard.inflight.clear()
+        for batch in batches:
+            for future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        for order_id, entry in list(self.resting.items()):
+            if self.ring.lookup(entry[1]) == shard.name:
+                del self.resting[order_id]
+                self._release(order_id)
+        for symbol, book in self.books.items():
+            if self.ring.lookup(symbol) == shard.name:
+                book.clear()
+                self.touched_books.add(book)
+
+    def _release(self, order_id: str):
+        if self.front and self.front.ledger:
+            self.front.ledger.release(order_id)
+
+    def _flush(self):
+        self._scheduled = False
+        pending, self.pending = self.pending, {}
+        for name, items in pending.items():
+            shard = self.shards[name]
+            futures = [future for _, future in items]
+            try:
+                if not shard.attached:
+                    self._attach(shard)
+                shard.conn.send([command for command, _ in items])
+            except (BrokenPipeError, OSError):
+                self._fail(shard, futures)
+                continue
+            shard.inflight.append(futures)
+
+    def _enqueue(self, symbol: str, command: tuple) -> asyncio.Future:
+        name = self.ring.lookup(symbol)
+        self.symbols.add(symbol)
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(name, []).append((command, future))
+        if not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return future
+
+    async def _wait(self, future: asyncio.Future):
+        # shield 讓超時後遲到的結果仍能寫入 future
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise ShardUnavailableError("Matching shard did not respond in time")
+
+    async def request(self, symbol: str, command: tuple):
+        await self._resumed.wait()
+        return await self._wait(self._enqueue(symbol, command))
+
+    async def submit(self, order: Order, forced: bool = False) -> tuple:
+        """
+        風控後送往分片撮合，返回 (狀態, 剩餘數量, 成交列表)，成交已在 front 結算
+        forced 為強制平倉委託，略過購買力與持倉限制
+        分片出錯時釋放凍結；超時或調用方被取消時委託仍可能在分片執行，結果到達後照常結算
+        """
+        if self.front:
+            self.front.collar(order, forced)
+        future = None
+        try:
+            await self._resumed.wait()
+            future = self._enqueue(order.symbol, ('submit', order_to_wire(order), forced))
+            result = await self._wait(future)
+        except (ShardUnavailableError, asyncio.CancelledError):
+            if future is None or future.done():
+                self._release(order.order_id)
+            else:
+                future.add_done_callback(lambda done: self._settle_late(order, done))
+            raise
+        except Exception:
+            self._release(order.order_id)
+            raise
+        return self._settle(order, *result)
+
+    def _settle(self, order: Order, status: str, remaining: int, wires: list) -> tuple:
+        fills = [fill_from_wire(wire) for wire in wires]
+        order.status, order.remaining = status, remaining
+        for fill in fills:
+            for order_id in (fill.buy_order_id, fill.sell_order_id):
+                entry = self.resting.get(order_id)
+                if entry is not None:
+                    entry[2] -= fill.quantity
+                    if entry[2] <= 0:
+                        del self.resting[order_id]
+        if remaining and status != 'cancelled':
+            self.resting[order.order_id] = [order.user_id, order.symbol, remaining]
+        if self.front:
+            if fills:
+                self.front.apply_fills(fills)
+            if status == 'cancelled':
+                self._release(order.order_id)
+        return status, remaining, fills
+
+    def _settle_late(self, order: Order, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            self._release(order.order_id)
+            return
+        try:
+            self._settle(order, *future.result())
+        except Exception as e:
+            print(f"Late shard result error: {e}")
+
+    def _spawn_task(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def submit_triggered(self, conditional):
+        """
+        觸發的條件單送往所屬分片：價格監聽是同步回調，這裡排程為任務，被拒或失敗只記錄錯誤
+        """
+        self._spawn_task(self._submit_triggered(triggered_order(conditional)))
+
+    async def _submit_triggered(self, order: Order):
+        try:
+            await self.submit(order)
+        except Exception as e:
+            print(f"Triggered order {order.order_id} rejected: {e}")
+
+    def submit_forced(self, order: Order, on_done: Optional[Callable] = None):
+        """
+        強制平倉委託送往所屬分片，與 MatchingEngine.submit_forced 相同的接口，
+        結算完成 (或被拒、分片失敗) 後調用 on_done(order)
+        """
+        self._spawn_task(self._submit_forced(order, on_done))
+
+    async def _submit_forced(self, order: Order, on_done: Optional[Callable]):
+        try:
+            await self.submit(order, forced=True)
+        except Exception as e:
+            print(f"Forced order {order.order_id} rejected: {e}")
+        if on_done:
+            on_done(order)
+
+    async def cancel(self, order_id: str) -> bool:
+        entry = self.resting.get(order_id)
+        if entry is None:
+            return False
+        cancelled = await self.request(entry[1], ('cancel', order_id))
+        self.resting.pop(order_id, None)
+        if cancelled:
+            self._release(order_id)
+        return cancelled
+
+    async def apply_split(self, symbol: str, new_shares: int, old_shares: int) -> list:
+        """
+        在所屬分片按比例調整該股票的掛單，數量變為 0 而撤銷的掛單在 front 釋放凍結
+        """
+        if symbol not in self.symbols:
+            return []
+        removed = await self.request(symbol, ('split', symbol, new_shares, old_shares))
+        for entry in self.resting.values():
+            if entry[1] == symbol:
+                entry[2] = entry[2] * new_shares // old_shares
+        for order_id in removed:
+            self.resting.pop(order_id, None)
+            self._release(order_id)
+        return removed
+
+    async def export_all(self) -> list:
+        """
+        收盤競價前取回所有分片的掛單 (按原提交順序)，凍結的資金保留到競價結束
+        """
+        self._resumed.clear()
+        try:
+            await self.drain()
+            for shard in self.shards.values():
+                self._detach(shard)
+            batches = {}
+            for symbol in self.symbols:
+                batches.setdefault(self.ring.lookup(symbol), []).append(('export', symbol))
+            orders = []
+            for name, results in self.call_many(batches).items():
+                for wires in results:
+                    if isinstance(wires, Exception):
+                        print(f"Shard {name} export error: {wires}")
+                        continue
+                    orders.extend(order_from_wire(wire) for wire in wires)
+            self.resting.clear()
+            return orders
+        finally:
+            self._resumed.set()
+
+    async def import_orders(self, orders: list) -> int:
+        """
+        開盤競價後轉入連續交易的掛單送到所屬分片，保留時間優先
+        """
+        if not orders:
+            return 0
+        self._resumed.clear()
+        try:
+            await self.drain()
+            for shard in self.shards.values():
+                self._detach(shard)
+            batches = {}
+            for order in sorted(orders, key=lambda o: o.timestamp):
+                self.symbols.add(order.symbol)
+                batches.setdefault(self.ring.lookup(order.symbol), []).append(order_to_wire(order))
+                self.resting[order.order_id] = [order.user_id, order.symbol, order.remaining]
+            self.call_many({name: [('import', wires)] for name, wires in batches.items()})
+            return len(orders)
+        finally:
+            self._resumed.set()
+
+    async def drain(self):
+        """
+        等待已排隊與在途的分片請求全部返回
+        """
+        while self.pending or any(shard.inflight for shard in self.shards.values()):
+            await asyncio.sleep(0.001)
+
+    async def add_shard(self, name: Optional[str] = None) -> int:
+        """
+        新增分片並把歸屬改變的股票連同掛單遷移過去，返回遷移的股票數
+        遷移期間暫停新請求，等在途請求完成後同步搬移
+        """
+        name = name or f"shard-{len(self.ring.nodes)}"
+        self._resumed.clear()
+        try:
+            await self.drain()
+            for shard in self.shards.values():
+                self._detach(shard)
+            self._spawn(name)
+            ring = self.ring.copy()
+            ring.add(name)
+            moved = 0
+            for symbol in self.symbols:
+                old, new = self.ring.lookup(symbol), ring.lookup(symbol)
+                if old != new:
+                    orders = self.call(old, [('export', symbol)])[0]
+                    self.call(new, [('import', orders)])
+                    moved += 1
+            self.ring = ring
+            return moved
+        finally:
+            self._resumed.set()
@@ -0,0 +1,89 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from auth import get_current_user
+from indicators import indicator_engine
+from fixedpoint import from_ticks
+from market import correlations, depth, price_feed
+from models import User
+from search import TOP_K, search_service
+
+router = APIRouter()
+
+
+@router.get("/search")
+async def search_stocks(
+    q: str = Query(..., min_length=1, max_length=64),
+    limit: int = Query(10, gt=0, le=TOP_K),
+    current_user: User = Depends(get_current_user)
+):
+    return [
+        {
+            "symbol": entry.symbol,
+            "name": entry.name,
+            "current_price": from_ticks(price_feed.last_price(entry.symbol)),
+        }
+        for entry in search_service.index.search(q, limit)
+    ]
+
+
+@router.get("/correlations")
+async def get_correlations(
+    symbols: Optional[str] = Query(None, description="逗號分隔的股票代碼，空為全部"),
+    kind: str = Query('correlation', pattern='^(correlation|covariance)$'),
+    current_user: User = Depends(get_current_user)
+):
+    requested = [symbol.strip() for symbol in symbols.split(',') if symbol.strip()] if symbols else None
+    estimator = correlations.estimator
+    known, matrix = estimator.correlation(requested) if kind == 'correlation' else estimator.covariance(requested)
+    return {"symbols": known, "updates": estimator.updates, "matrix": matrix.tolist()}
+
+
+@router.get("/{symbol}/indicators")
+async def get_indicator(
+    symbol: str,
+    indicator: str,
+    interval: str = '1d',
+    period: Optional[int] = Query(None, gt=0),
+    fast: Optional[int] = Query(None, gt=0),
+    slow: Optional[int] = Query(None, gt=0),
+    signal: Optional[int] = Query(None, gt=0),
+    k: Optional[float] = Query(None, gt=0),
+    limit: int = Query(500, gt=0, le=10000),
+    current_user: User = Depends(get_current_user)
+):
+    given = {'period': period, 'fast': fast, 'slow': slow, 'signal': signal, 'k': k}
+    params = {name: value for name, value in given.items() if value is not None}
+    try:
+        series = await indicator_engine.get(symbol, interval, indicator, params)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not series.timestamps:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No price history for symbol"
+        )
+    return {
+        "symbol": symbol,
+        "indicator": indicator,
+        "interval": interval,
+        "params": params,
+        **series.tail(limit),
+    }
+
+
+@router.get("/{symbol}/depth")
+async def get_depth(
+    symbol: str,
+    levels: int = Query(50, gt=0, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    深度快照，之後可訂閱 depth:<symbol> 並套用序號大於 seq 的增量
+    """
+    snapshot = depth.snapshot(symbol)
+    return {
+        "symbol": symbol,
+        "seq": snapshot["seq"],
+        "bids": snapshot["bids"][:levels],
+        "asks": snapshot["asks"][:levels],
+    }
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from auth import Auth
+
+router = APIRouter()
+
+QUEUE_SIZE = 1000
+
+
+class Broadcaster:
+    """
+    以主題分組的推送通道，每個訂閱者一個有界隊列
+    訂閱者處理太慢時丟棄最舊的消息，不阻塞發布方
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.topics = {}
+
+    def subscribe(self, topic: str, queue: asyncio.Queue = None) -> asyncio.Queue:
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+        self.topics.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        subscribers = self.topics.get(topic)
+        if subscribers:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.topics[topic]
+
+    def publish(self, topic: str, message: dict) -> int:
+        """
+        發布消息，返回收到消息的訂閱者數
+        """
+        subscribers = self.topics.get(topic)
+        if not subscribers:
+            return 0
+        for queue in subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+        return len(subscribers)
+
+
+broadcaster = Broadcaster()
+
+
+@router.websocket("/ws")
+async def stream(websocket: WebSocket):
+    """
+    客戶端發送 {"action": "subscribe", "topic": "..."} 訂閱主題
+    用戶提醒可帶 token 參數自動訂閱 user:<id>
+    消息中的 ts 為市場時間 (epoch 起算的整數納秒)
+    """
+    await websocket.accept()
+    queue = asyncio.Queue(maxsize=broadcaster.queue_size)
+    topics = set()
+
+    token = websocket.query_params.get('token')
+    if token:
+        try:
+            payload = Auth().verify_token(token)
+            topics.add(f"user:{payload['user_id']}")
+        except ValueError as e:
+            await websocket.close(code=1008, reason=str(e))
+            return
+    for topic in topics:
+        broadcaster.subscribe(topic, queue)
+
+    async def receive():
+        while True:
+            data = json.loads(await websocket.receive_text())
+            topic = data.get('topic')
+            if not topic or topic.startswith('user:'):
+                continue
+            if data.get('action') == 'subscribe':
+                topics.add(topic)
+                broadcaster.subscribe(topic, queue)
+            elif data.get('action') == 'unsubscribe':
+                topics.discard(topic)
+                broadcaster.unsubscribe(topic, queue)
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while not receiver.done():
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        for topic in topics:
+            broadcaster.unsubscribe(topic, queue)
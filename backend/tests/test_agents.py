@@ -0,0 +1,123 @@
+import random
+import httpx
+import pytest
+from ..agents import (EngineGateway, HttpGateway, MarketMaker, MomentumTrader, RandomTrader, assign_tokens,
+                      build_agents, build_engine, run_load)
+from ..ledger import RiskCheckError
+
+class FakeGateway:
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def last_price(self, symbol):
+        return self.prices.get(symbol)
+
+    async def submit(self, user_id, symbol, side, quantity, price=None, order_type='limit'):
+        self.calls.append(('submit', symbol, side, quantity, price, order_type))
+        return f"o{len(self.calls)}"
+
+    async def cancel(self, user_id, order_id):
+        self.calls.append(('cancel', order_id))
+
+@pytest.mark.asyncio
+async def test_agents_generate_load_against_engine():
+    symbols = ["A", "B"]
+    agents = build_agents(50, symbols, rate=20.0, seed=1)
+    gateway = EngineGateway(build_engine(agents, symbols))
+    stats = await run_load(gateway, agents, duration=0.5)
+    assert stats["actions"] > 0
+    assert stats["rejected"] == 0
+    assert stats["p50_ms"] <= stats["p99_ms"]
+    assert gateway.engine.price_feed.last_price("A") is not None
+
+@pytest.mark.asyncio
+async def test_transport_errors_are_counted_without_aborting_the_run():
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers["Authorization"])
+        if len(calls) % 2:
+            raise httpx.ConnectTimeout("saturated", request=request)
+        return httpx.Response(200, json={"order_id": "o1", "status": "filled", "remaining": 0,
+                                         "fills": [{"price": 101.0, "quantity": 1}]})
+
+    agents = [RandomTrader(f"bot{i}", ["A"], 200.0, random.Random(i)) for i in range(4)]
+    tokens = assign_tokens(agents, ["t0", "t1"])
+    gateway = HttpGateway("http://test", tokens, {"A": 100.0}, connections=len(agents),
+                          transport=httpx.MockTransport(handler))
+    try:
+        stats = await run_load(gateway, agents, duration=0.2)
+    finally:
+        await gateway.close()
+    assert stats["transport_errors"] > 0 and stats["actions"] > 0
+    assert stats["transport_errors"] + stats["actions"] == len(calls)
+    # 每個機器人以分配到的用戶身份下單
+    assert set(calls) == {"Bearer t0", "Bearer t1"}
+    assert gateway.last_price("A") == 101.0
+
+@pytest.mark.asyncio
+async def test_http_gateway_rejections_and_cancels():
+    requests = []
+
+    def handler(request):
+        requests.append((request.method, request.url.path, request.headers["Authorization"]))
+        if request.method == "DELETE":
+            return httpx.Response(200, json={"message": "Order cancelled"})
+        return httpx.Response(400, json={"detail": "Insufficient buying power"})
+
+    gateway = HttpGateway("http://test", {"bot0": "t0"}, {}, transport=httpx.MockTransport(handler))
+    try:
+        with pytest.raises(RiskCheckError):
+            await gateway.submit("bot0", "A", "buy", 1, 100.0)
+        await gateway.cancel("bot0", "o1")
+    finally:
+        await gateway.close()
+    assert requests == [("POST", "/api/v1/orders", "Bearer t0"), ("DELETE", "/api/v1/orders/o1", "Bearer t0")]
+
+@pytest.mark.asyncio
+async def test_market_maker_replaces_its_quotes_around_the_mid():
+    gateway = FakeGateway({"A": 100.0})
+    maker = MarketMaker("mm", ["A"], 1.0, random.Random(0), spread=0.002, size=50)
+    await maker.act(gateway)
+    (_, _, bid_side, bid_size, bid, _), (_, _, ask_side, ask_size, ask, _) = gateway.calls
+    assert (bid_side, ask_side, bid_size, ask_size) == ('buy', 'sell', 50, 50)
+    assert 99.7 <= bid < ask <= 100.3 and ask - bid == pytest.approx(0.2, abs=0.011)
+    await maker.act(gateway)
+    # 再次報價前撤銷同一股票的舊報價
+    assert gateway.calls[2:4] == [('cancel', 'o1'), ('cancel', 'o2')]
+    assert maker.quotes["A"] == ['o5', 'o6']
+
+@pytest.mark.asyncio
+async def test_momentum_trader_follows_the_last_move():
+    gateway = FakeGateway({"A": 100.0})
+    trader = MomentumTrader("mo", ["A"], 1.0, random.Random(0), size=7)
+    await trader.act(gateway)
+    await trader.act(gateway)
+    assert gateway.calls == []
+    gateway.prices["A"] = 101.0
+    await trader.act(gateway)
+    gateway.prices["A"] = 99.0
+    await trader.act(gateway)
+    assert gateway.calls == [('submit', 'A', 'buy', 7, None, 'market'), ('submit', 'A', 'sell', 7, None, 'market')]
+
+@pytest.mark.asyncio
+async def test_random_trader_mixes_market_and_nearby_limit_orders():
+    gateway = FakeGateway({"A": 100.0})
+    trader = RandomTrader("rt", ["A"], 1.0, random.Random(3), max_size=20)
+    for _ in range(200):
+        await trader.act(gateway)
+    types = {call[5] for call in gateway.calls}
+    assert types == {'market', 'limit'}
+    assert {call[2] for call in gateway.calls} == {'buy', 'sell'}
+    assert all(1 <= call[3] <= 20 for call in gateway.calls)
+    limits = [call[4] for call in gateway.calls if call[5] == 'limit']
+    assert all(99.5 <= price <= 100.5 for price in limits)
+    assert all(call[4] is None for call in gateway.calls if call[5] == 'market')
+
+def test_build_agents_uses_the_mix_and_distinct_users():
+    agents = build_agents(10, ["A"], 1.0, seed=2)
+    kinds = [type(agent) for agent in agents]
+    assert kinds == [MarketMaker] * 2 + [MomentumTrader] * 3 + [RandomTrader] * 5
+    assert len({agent.user_id for agent in agents}) == 10
+    assert assign_tokens(agents, ["t0", "t1", "t2"])["bot4"] == "t1"
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from ..alerts import AlertIndex, AlertService, PriceAlert
+from ..fixedpoint import to_ticks
+from ..streaming import Broadcaster
+
+def test_crossed_alerts_by_direction():
+    index = AlertIndex()
+    index.add(PriceAlert("a1", "u1", "AAPL", 105.0, "above"))
+    index.add(PriceAlert("a2", "u1", "AAPL", 110.0, "above"))
+    index.add(PriceAlert("b1", "u2", "AAPL", 95.0, "below"))
+
+    assert index.crossed("AAPL", 100.0, 104.0) == []
+    assert [a.alert_id for a in index.crossed("AAPL", 104.0, 108.0)] == ["a1"]
+    assert [a.alert_id for a in index.crossed("AAPL", 108.0, 90.0)] == ["b1"]
+    assert len(index) == 1
+    assert index.for_user("u2") == []
+
+def test_bulk_load_and_remove():
+    index = AlertIndex()
+    index.load([PriceAlert(str(i), "u1", "AAPL", float(100 + i), "above") for i in range(10, 0, -1)])
+    assert index.remove("5")
+    assert not index.remove("5")
+    fired = index.crossed("AAPL", 100.0, 107.0)
+    assert [a.alert_id for a in fired] == ["1", "2", "3", "4", "6", "7"]
+
+@pytest.mark.asyncio
+async def test_service_dispatches_over_channel():
+    class FakeDatabase:
+        def __init__(self):
+            self.marked = []
+
+        async def mark_alerts_triggered(self, alert_ids):
+            self.marked.extend(alert_ids)
+
+    channel = Broadcaster()
+    queue = channel.subscribe("user:u1")
+    service = AlertService(channel)
+    service.index.add(PriceAlert("a1", "u1", "AAPL", 105.0, "above"))
+    db = FakeDatabase()
+    task = asyncio.create_task(service.dispatch(db))
+
+    service.on_price("AAPL", to_ticks(100.0), to_ticks(106.0))
+    message = await asyncio.wait_for(queue.get(), timeout=1.0)
+    assert message["alert_id"] == "a1"
+    assert message["price"] == 106.0
+    await asyncio.sleep(0)
+    task.cancel()
+    assert db.marked == ["a1"]
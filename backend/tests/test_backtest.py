@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from ..backtest import SimulatedPortfolio, expand_grid, moving_average, run_backtest, sweep, validate_costs, validate_params
+
+def make_bars(closes):
+    closes = np.asarray(closes, dtype=np.float64)
+    return {"open": closes.copy(), "high": closes, "low": closes, "close": closes, "volume": np.ones(len(closes))}
+
+def test_moving_average():
+    result = moving_average(np.array([1.0, 2.0, 3.0, 4.0]), 2)
+    assert np.isnan(result[0])
+    assert result[1:].tolist() == [1.5, 2.5, 3.5]
+
+def test_portfolio_semantics():
+    portfolio = SimulatedPortfolio(1000.0)
+    portfolio.apply('buy', 10, 10.0, 0.0)
+    portfolio.apply('buy', 10, 20.0, 0.0)
+    assert portfolio.average_price == 15.0
+    portfolio.apply('sell', 5, 30.0, 0.0)
+    assert portfolio.quantity == 15
+    assert portfolio.average_price == 15.0
+    assert portfolio.realized_pnl == 75.0
+    assert portfolio.cash == 1000.0 - 300.0 + 150.0
+
+def test_momentum_backtest_on_rising_prices():
+    data = make_bars(np.linspace(100, 200, 100))
+    result = run_backtest(data, 'momentum', {'lookback': 5}, commission=0.0, slippage=0.0)
+    assert result.total_return > 0
+    assert result.max_drawdown == 0.0
+    assert result.trades == 1
+    assert result.portfolio.transactions[0].type == 'buy'
+    assert result.portfolio.quantity > 0
+
+def test_flat_signal_keeps_cash():
+    data = make_bars(np.linspace(200, 100, 50))
+    result = run_backtest(data, 'sma_crossover', {'fast': 3, 'slow': 10})
+    assert result.total_return == 0.0
+    assert result.portfolio.transactions == []
+
+def test_sweep_runs_every_combination():
+    grid = {'fast': [3, 5], 'slow': [10, 20]}
+    assert len(expand_grid(grid)) == 4
+    data = {"A": make_bars(np.linspace(100, 200, 60)), "B": make_bars(np.linspace(200, 100, 60))}
+    results = sweep(data, 'sma_crossover', grid, processes=1)
+    assert len(results) == 8
+    assert {r["symbol"] for r in results} == {"A", "B"}
+
+def test_invalid_strategy_params_rejected():
+    validate_params('momentum', {'lookback': 5, 'threshold': 0.01})
+    for strategy, params in (('momentum', {'lookback': 0}), ('momentum', {'lookback': 2.5}),
+                             ('momentum', {'window': 5}), ('sma_crossover', {'fast': 50, 'slow': 10}),
+                             ('mean_reversion', {'width': -1.0}), ('mean_reversion', {'period': True}),
+                             ('momentum', {'threshold': float('nan')})):
+        with pytest.raises(ValueError):
+            validate_params(strategy, params)
+    with pytest.raises(ValueError):
+        run_backtest(make_bars(np.linspace(100, 200, 10)), 'momentum', {'lookback': 0})
+
+def test_invalid_costs_rejected():
+    validate_costs(1000.0, 0.001, 0.0)
+    for cash, commission, slippage in ((0.0, 0.001, 0.0), (-5.0, 0.0, 0.0), (float('inf'), 0.0, 0.0),
+                                       (float('nan'), 0.0, 0.0), (1000.0, -0.1, 0.0), (1000.0, 0.0, 1.5)):
+        with pytest.raises(ValueError):
+            validate_costs(cash, commission, slippage)
+    with pytest.raises(ValueError):
+        run_backtest(make_bars(np.linspace(100, 200, 10)), 'momentum', {'lookback': 2}, initial_cash=0.0)
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+from ..clock import (NANOS_PER_SECOND, ManualClock, RealClock, from_datetime, get_clock, now_ns,
+                     system_clock, to_datetime, use_clock)
+
+
+def test_datetime_round_trip_is_exact_to_the_microsecond():
+    value = datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+    nanos = from_datetime(value)
+    assert nanos == 1704164645678901000
+    assert to_datetime(nanos) == value
+    # 沒有時區的視為 UTC，納秒部分截斷
+    assert from_datetime(value.replace(tzinfo=None)) == nanos
+    assert to_datetime(nanos + 999) == value
+    assert to_datetime(None) is None and from_datetime(None) is None
+
+
+def test_real_clock_is_monotonic_epoch_nanos():
+    clock = RealClock()
+    first = clock.now()
+    assert isinstance(first, int)
+    assert abs(first - datetime.now(timezone.utc).timestamp() * NANOS_PER_SECOND) < NANOS_PER_SECOND
+    assert all(clock.now() >= first for _ in range(1000))
+
+
+def test_market_clock_can_be_swapped():
+    clock = ManualClock(5 * NANOS_PER_SECOND)
+    previous = use_clock(clock)
+    try:
+        assert now_ns() == 5 * NANOS_PER_SECOND
+        clock.advance(NANOS_PER_SECOND)
+        assert now_ns() == 6 * NANOS_PER_SECOND
+    finally:
+        use_clock(previous)
+    assert get_clock() is system_clock
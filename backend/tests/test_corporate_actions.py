@@ -0,0 +1,166 @@
+from datetime import date
+import pytest
+from ..corporate_actions import CorporateAction, CorporateActionProcessor, dividend_payments, split_positions
+from ..engine import MatchingEngine, Order
+from ..fixedpoint import to_ticks
+from ..ledger import AccountLedger, RiskCheckError
+from ..prices import PriceFeed
+from ..settlement import FillSettlement
+from ..triggers import ConditionalOrder, TriggerIndex
+
+def test_split_positions_keeps_cost_basis():
+    average_prices = [to_ticks(100.0), to_ticks(50.0), to_ticks(20.0)]
+    quantities, prices, cash = split_positions([10, 7, -5], average_prices, 3, 2, to_ticks(90.0))
+    assert quantities.tolist() == [15, 10, -7]
+    # 均價與零股現金四捨五入到 tick
+    assert prices.tolist() == [round(price * 2 / 3) for price in average_prices]
+    assert cash.tolist() == [0, to_ticks(0.5 * 60.0), -to_ticks(0.5 * 60.0)]
+
+def test_reverse_split_removes_small_positions():
+    quantities, _, cash = split_positions([25, 3], [to_ticks(10.0)] * 2, 1, 10, to_ticks(10.0))
+    assert quantities.tolist() == [2, 0]
+    assert cash.tolist() == [to_ticks(50.0), to_ticks(30.0)]
+
+def test_dividend_payments():
+    assert dividend_payments([100, -10], to_ticks(0.5)).tolist() == [to_ticks(50.0), to_ticks(-5.0)]
+
+def test_invalid_ratio():
+    with pytest.raises(ValueError):
+        CorporateAction("AAPL", "split", date(2025, 1, 2), new_shares=1, old_shares=2)
+    with pytest.raises(ValueError):
+        CorporateAction("AAPL", "dividend", date(2025, 1, 2), amount=float('inf'))
+
+@pytest.mark.asyncio
+async def test_processor_is_idempotent_and_adjusts_memory():
+    class Row:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class FakeDatabase:
+        def __init__(self):
+            self.actions = {}
+
+        async def get_corporate_action(self, action_key):
+            return self.actions.get(action_key)
+
+        async def get_symbol_positions(self, symbol):
+            return [Row(id="p1", user=Row(id="u1"), quantity=10, average_price=to_ticks(100.0))]
+
+        async def get_stocks(self):
+            return [Row(symbol="AAPL", current_price=to_ticks(100.0))]
+
+        async def apply_corporate_action(self, record, positions, removed, payments, price_factor, batch_size):
+            self.actions[record["action_key"]] = record
+            self.positions = positions
+            return 3
+
+    db = FakeDatabase()
+    ledger = AccountLedger()
+    ledger.load_account("u1", to_ticks(1000.0), {"AAPL": 10})
+    index = TriggerIndex()
+    index.on_price("AAPL", None, to_ticks(100.0))
+    index.add(ConditionalOrder("s1", "u1", "AAPL", "sell", 10, stop_price=to_ticks(90.0)))
+    processor = CorporateActionProcessor(db, ledger, index)
+
+    action = CorporateAction("AAPL", "split", date(2025, 1, 2), new_shares=2, old_shares=1)
+    record = await processor.apply(action)
+    assert record["positions_adjusted"] == 1
+    assert record["orders_adjusted"] == 1
+    assert record["candles_adjusted"] == 3
+    assert db.positions == [{"id": "p1", "quantity": 20, "average_price": to_ticks(50.0)}]
+    assert ledger.get_account("u1").positions["AAPL"] == 20
+    assert index.orders["s1"].stop_price == to_ticks(45.0)
+    assert index.on_price("AAPL", to_ticks(50.0), to_ticks(46.0)) == []
+    assert [o.order_id for o in index.on_price("AAPL", to_ticks(46.0), to_ticks(45.0))] == ["s1"]
+
+    assert await processor.apply(action) is None
+
+@pytest.mark.asyncio
+async def test_split_rescales_resting_orders_in_the_book():
+    class FakeDatabase:
+        async def get_corporate_action(self, action_key):
+            return None
+
+        async def get_symbol_positions(self, symbol):
+            return []
+
+        async def apply_corporate_action(self, record, positions, removed, payments, price_factor, batch_size):
+            return 0
+
+    feed = PriceFeed()
+    feed.publish("AAPL", to_ticks(100.0))
+    ledger = AccountLedger(feed)
+    ledger.load_account("buyer", to_ticks(1000.0), {})
+    ledger.load_account("seller", 0, {"AAPL": 13})
+    engine = MatchingEngine(ledger, feed)
+    engine.submit(Order("b1", "buyer", "AAPL", "buy", 10, to_ticks(100.0)))
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 3, to_ticks(120.0)))
+    processor = CorporateActionProcessor(FakeDatabase(), ledger, price_feed=feed, engine=engine)
+
+    await processor.apply(CorporateAction("AAPL", "split", date(2025, 1, 2), new_shares=2, old_shares=1))
+    book = engine.books["AAPL"]
+    assert book.volume["buy"] == {to_ticks(50.0): 20}
+    assert book.volume["sell"] == {to_ticks(60.0): 6}
+
+    fills = engine.submit(Order("s2", "seller", "AAPL", "sell", 20, to_ticks(50.0)))
+    assert [(f.price, f.quantity) for f in fills] == [(to_ticks(50.0), 20)]
+    buyer = ledger.get_account("buyer")
+    assert buyer.positions["AAPL"] == 20
+    assert buyer.cash == 0 and buyer.reserved_cash == 0
+
+    # 合股後數量變為 0 的掛單撤銷並釋放凍結
+    await processor.apply(CorporateAction("AAPL", "reverse_split", date(2025, 2, 3), new_shares=1, old_shares=10))
+    assert "s1" not in engine.orders and "s1" not in ledger.reservations
+    assert engine.books["AAPL"].volume["sell"] == {}
+    assert ledger.get_account("seller").pending_sell.get("AAPL", 0) == 0
+
+
+@pytest.mark.asyncio
+async def test_split_halts_matching_and_settles_buffered_fills_first():
+    feed = PriceFeed()
+    feed.publish("AAPL", to_ticks(100.0))
+    ledger = AccountLedger(feed)
+    ledger.load_account("buyer", to_ticks(1000.0), {})
+    ledger.load_account("seller", 0, {"AAPL": 10})
+    engine = MatchingEngine(ledger, feed)
+    settlement = FillSettlement()
+    engine.add_fill_listener(settlement.on_fills)
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 5, to_ticks(100.0)))
+    engine.submit(Order("b1", "buyer", "AAPL", "buy", 5, to_ticks(100.0)))
+    seen = []
+
+    class FakeDatabase:
+        def __init__(self):
+            self.recorded = []
+            self.fail = False
+
+        async def record_fills(self, transactions, positions, payments):
+            self.recorded.extend(transactions)
+            return not self.fail
+
+        async def get_corporate_action(self, action_key):
+            return None
+
+        async def get_symbol_positions(self, symbol):
+            # 讀取持倉時成交已寫入，且該股票暫停撮合
+            seen.append(len(self.recorded))
+            with pytest.raises(RiskCheckError):
+                engine.submit(Order("b2", "buyer", "AAPL", "buy", 1, to_ticks(100.0)))
+            return []
+
+        async def apply_corporate_action(self, record, positions, removed, payments, price_factor, batch_size):
+            return 0
+
+    db = FakeDatabase()
+    processor = CorporateActionProcessor(db, ledger, price_feed=feed, engine=engine, settlement=settlement)
+    await processor.apply(CorporateAction("AAPL", "split", date(2025, 1, 2), new_shares=2, old_shares=1))
+    assert seen == [2] and not settlement.buffer
+    assert not engine.halted
+    engine.submit(Order("b3", "buyer", "AAPL", "buy", 1, to_ticks(50.0)))
+
+    # 成交無法寫入時不處理公司行動
+    db.fail = True
+    engine.submit(Order("s3", "seller", "AAPL", "sell", 1, to_ticks(50.0)))
+    with pytest.raises(RuntimeError):
+        await processor.apply(CorporateAction("AAPL", "split", date(2025, 2, 3), new_shares=2, old_shares=1))
+    assert seen == [2] and not engine.halted
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+import numpy as np
+from ..correlation import CorrelationTracker, EWCovariance
+
+
+def reference(returns: np.ndarray, alpha: float) -> np.ndarray:
+    mean = np.zeros(returns.shape[1])
+    cov = np.zeros((returns.shape[1], returns.shape[1]))
+    for r in returns:
+        d = r - mean
+        mean = mean + alpha * d
+        cov = (1 - alpha) * (cov + alpha * np.outer(d, d))
+    return cov
+
+
+def test_rank_one_updates_match_reference_and_grow():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0, 0.01, (200, 5))
+    estimator = EWCovariance(halflife=20, capacity=2)
+    for symbol in "ABCDE":
+        estimator.column(symbol)
+    for r in returns:
+        estimator.update(r)
+    symbols, cov = estimator.covariance()
+    assert symbols == list("ABCDE")
+    np.testing.assert_allclose(cov, reference(returns, estimator.alpha), rtol=1e-10, atol=1e-14)
+
+
+def test_float32_storage_and_subset_snapshot():
+    rng = np.random.default_rng(1)
+    market = rng.normal(0, 0.01, 500)
+    returns = np.column_stack([market + rng.normal(0, 0.002, 500), -market, rng.normal(0, 0.01, 500)])
+    exact = EWCovariance(halflife=100)
+    compact = EWCovariance(halflife=100, dtype='float32')
+    for estimator in (exact, compact):
+        for symbol in ("A", "B", "C"):
+            estimator.column(symbol)
+        for r in returns:
+            estimator.update(r)
+    assert compact.cov.dtype == np.float32
+    symbols, corr = compact.correlation(["B", "A", "missing"])
+    assert symbols == ["B", "A"]
+    assert corr[0, 0] == 1.0
+    assert corr[0, 1] < -0.9
+    np.testing.assert_allclose(corr, exact.correlation(["B", "A"])[1], atol=1e-4)
+
+
+def test_tracker_commits_one_vector_per_period():
+    tracker = CorrelationTracker(EWCovariance(halflife=10))
+    for start, closes in ((0, (10.0, 20.0)), (60, (11.0, 22.0)), (120, (12.1, 22.0))):
+        for symbol, close in zip(("A", "B"), closes):
+            tracker.on_bar(SimpleNamespace(symbol=symbol, start=start, close=close))
+    # 第一期沒有前收盤，第二期在第三期開始時提交
+    assert tracker.estimator.updates == 1
+    assert tracker.commit()
+    assert tracker.estimator.updates == 2
+    assert not tracker.commit()
+    _, cov = tracker.estimator.covariance()
+    assert cov[0, 0] > 0
+    assert cov[1, 1] > 0
@@ -0,0 +1,85 @@
+import random
+from ..depth import DepthFeed
+from ..engine import MatchingEngine, Order
+from ..fixedpoint import to_ticks
+
+
+def make_feed():
+    engine = MatchingEngine()
+    messages = []
+    feed = DepthFeed(engine, lambda topic, message: messages.append((topic, message)))
+    return engine, feed, messages
+
+
+def test_diff_coalesces_changes_per_flush():
+    engine, feed, messages = make_feed()
+    engine.submit(Order("s1", "s", "AAPL", "sell", 10, to_ticks(101.0)))
+    engine.submit(Order("s2", "s", "AAPL", "sell", 5, to_ticks(101.0)))
+    engine.submit(Order("b1", "b", "AAPL", "buy", 7, to_ticks(99.0)))
+    assert feed.flush() == 1
+    topic, message = messages[-1]
+    assert topic == "depth:AAPL"
+    assert message["seq"] == 1
+    assert message["bids"] == [[99.0, 7]]
+    assert message["asks"] == [[101.0, 15]]
+    assert feed.flush() == 0
+
+    engine.submit(Order("b2", "b", "AAPL", "buy", 15, to_ticks(101.0)))
+    engine.cancel("b1")
+    feed.flush()
+    message = messages[-1][1]
+    assert message["seq"] == 2
+    assert message["bids"] == [[99.0, 0]]
+    assert message["asks"] == [[101.0, 0]]
+
+
+def test_snapshot_is_cached_by_sequence():
+    engine, feed, messages = make_feed()
+    engine.submit(Order("s1", "s", "AAPL", "sell", 10, to_ticks(102.0)))
+    engine.submit(Order("s2", "s", "AAPL", "sell", 10, to_ticks(101.0)))
+    engine.submit(Order("b1", "b", "AAPL", "buy", 3, to_ticks(100.0)))
+    snapshot = feed.snapshot("AAPL")
+    assert snapshot["seq"] == 1
+    assert snapshot["bids"] == [[100.0, 3]]
+    assert snapshot["asks"] == [[101.0, 10], [102.0, 10]]
+    # 取快照時已推送變動，flush 不會重複發送
+    assert feed.flush() == 0
+    assert feed.snapshot("AAPL") is snapshot
+    assert feed.snapshot("MSFT")["seq"] == 0
+
+
+def test_client_resyncs_from_snapshot_and_diffs():
+    rng = random.Random(5)
+    engine, feed, messages = make_feed()
+    client = None
+    live = {}
+    for i in range(2000):
+        side = rng.choice(("buy", "sell"))
+        price = round(100 + rng.randint(-10, 10) * 0.5, 2)
+        if rng.random() < 0.2 and engine.orders:
+            engine.cancel(rng.choice(list(engine.orders)))
+        else:
+            engine.submit(Order(str(i), "u", "AAPL", side, rng.randint(1, 50), to_ticks(price)))
+        if i % 7 == 0:
+            feed.flush()
+        if i == 500:
+            # 中途加入的客戶端：先取快照，之後只套用更新的序號
+            snapshot = feed.snapshot("AAPL")
+            client = snapshot["seq"]
+            live = {("bids", p): q for p, q in snapshot["bids"]}
+            live.update({("asks", p): q for p, q in snapshot["asks"]})
+            messages.clear()
+    feed.flush()
+    for _, message in messages:
+        assert message["seq"] == client + 1
+        client = message["seq"]
+        for key in ("bids", "asks"):
+            for price, quantity in message[key]:
+                if quantity:
+                    live[(key, price)] = quantity
+                else:
+                    live.pop((key, price), None)
+    final = feed.snapshot("AAPL")
+    expected = {("bids", p): q for p, q in final["bids"]}
+    expected.update({("asks", p): q for p, q in final["asks"]})
+    assert live == expected
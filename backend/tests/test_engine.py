@@ -0,0 +1,179 @@
+import pytest
+from ..engine import MatchingEngine, Order, OrderPool
+from ..journal import Journal
+from ..ledger import AccountLedger, RiskCheckError
+from ..prices import PriceFeed
+from ..settlement import FillSettlement, aggregate_fills
+from ..triggers import ConditionalOrder, TriggerIndex
+
+def test_price_time_priority():
+    engine = MatchingEngine()
+    engine.submit(Order("a1", "s1", "AAPL", "sell", 10, 101.0))
+    engine.submit(Order("a2", "s2", "AAPL", "sell", 10, 100.0))
+    engine.submit(Order("a3", "s3", "AAPL", "sell", 10, 100.0))
+
+    fills = engine.submit(Order("b1", "b", "AAPL", "buy", 15, 101.0))
+    assert [(f.sell_order_id, f.price, f.quantity) for f in fills] == [("a2", 100.0, 10), ("a3", 100.0, 5)]
+    assert engine.orders["a3"].remaining == 5
+    assert engine.book("AAPL").best("sell") == 100.0
+
+def test_limit_rests_and_cancel():
+    engine = MatchingEngine()
+    order = Order("b1", "b", "AAPL", "buy", 10, 99.0)
+    assert engine.submit(order) == []
+    assert order.status == 'open'
+    assert engine.book("AAPL").best("buy") == 99.0
+    assert engine.cancel("b1")
+    assert engine.book("AAPL").best("buy") is None
+    assert engine.submit(Order("s1", "s", "AAPL", "sell", 10, None, "market")) == []
+
+def test_risk_checks_and_ledger_settlement():
+    ledger = AccountLedger()
+    ledger.load_account("buyer", 1000.0)
+    ledger.load_account("seller", 0.0, {"AAPL": 10})
+    engine = MatchingEngine(ledger, PriceFeed())
+
+    with pytest.raises(RiskCheckError):
+        engine.submit(Order("x", "seller", "AAPL", "sell", 11, 100.0))
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 10, 50.0))
+    engine.submit(Order("b1", "buyer", "AAPL", "buy", 4, 60.0))
+
+    assert ledger.get_account("buyer").cash == 800.0
+    assert ledger.get_account("buyer").positions == {"AAPL": 4}
+    assert ledger.get_account("seller").cash == 200.0
+    assert engine.price_feed.last_price("AAPL") == 50.0
+
+def test_market_buy_stops_at_the_collar_price():
+    ledger = AccountLedger()
+    ledger.load_account("buyer", 10 * 105)
+    ledger.load_account("seller", 0, {"AAPL": 20})
+    engine = MatchingEngine(ledger, PriceFeed())
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 5, 100))
+    engine.submit(Order("s2", "seller", "AAPL", "sell", 10, 120))
+
+    # 凍結價為 100 * 1.05，高於此價的賣單不成交，剩餘數量取消並釋放凍結
+    order = Order("b1", "buyer", "AAPL", "buy", 10, None, "market")
+    fills = engine.submit(order)
+    assert [(f.price, f.quantity) for f in fills] == [(100, 5)]
+    assert order.status == 'cancelled'
+    buyer = ledger.get_account("buyer")
+    assert buyer.cash == 550 and buyer.reserved_cash == 0
+    assert engine.book("AAPL").best("sell") == 120
+
+def test_triggered_stop_enters_book_after_trade():
+    feed = PriceFeed()
+    engine = MatchingEngine(price_feed=feed)
+    triggers = TriggerIndex(on_trigger=engine.submit_triggered)
+    feed.add_listener(triggers.on_price)
+
+    engine.submit(Order("s1", "s", "AAPL", "sell", 5, 100.0))
+    engine.submit(Order("s2", "s", "AAPL", "sell", 5, 101.0))
+    triggers.add(ConditionalOrder("stop1", "t", "AAPL", "buy", 5, stop_price=100.0), reference_price=99.0)
+    fills = engine.submit(Order("b1", "b", "AAPL", "buy", 5, 100.0))
+    assert len(fills) == 1
+    # 成交價觸發止損買單，吃掉下一檔
+    assert engine.book("AAPL").best("sell") is None
+    assert feed.last_price("AAPL") == 101.0
+
+def test_aggregate_fills():
+    engine = MatchingEngine()
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 10, 10.0))
+    engine.submit(Order("s2", "seller", "AAPL", "sell", 10, 20.0))
+    fills = engine.submit(Order("b1", "buyer", "AAPL", "buy", 20, 20.0))
+    transactions, positions, payments = aggregate_fills(fills)
+    assert len(transactions) == 4
+    buyer = next(p for p in positions if p["user_id"] == "buyer")
+    assert buyer["quantity"] == 20
+    assert buyer["average_price"] == 15.0
+    assert {p["user_id"]: p["amount"] for p in payments} == {"buyer": -300.0, "seller": 300.0}
+
+@pytest.mark.asyncio
+async def test_settlement_reports_users_with_unwritten_fills():
+    engine = MatchingEngine()
+    settlement = FillSettlement()
+    engine.add_fill_listener(settlement.on_fills)
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 10, 10.0))
+    engine.submit(Order("b1", "buyer", "AAPL", "buy", 10, 10.0))
+    assert settlement.pending_users() == {"buyer", "seller"}
+
+    class FakeDatabase:
+        async def record_fills(self, transactions, positions, payments):
+            # 寫入過程中仍視為未結算
+            assert settlement.pending_users() == {"buyer", "seller"}
+            return True
+
+    assert await settlement.flush(FakeDatabase()) == 1
+    assert settlement.pending_users() == set()
+
+@pytest.mark.asyncio
+async def test_settlement_dead_letters_a_batch_that_keeps_failing(tmp_path):
+    engine = MatchingEngine()
+    journal = Journal(str(tmp_path / "dead.jsonl"))
+    settlement = FillSettlement(max_retries=3, dead_letter=journal)
+    engine.add_fill_listener(settlement.on_fills)
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 10, 10.0))
+    engine.submit(Order("b1", "buyer", "AAPL", "buy", 10, 10.0))
+
+    class FailingDatabase:
+        async def record_fills(self, transactions, positions, payments):
+            return False
+
+    for _ in range(2):
+        assert await settlement.flush(FailingDatabase()) == 0
+        assert len(settlement.buffer) == 1
+    assert await settlement.flush(FailingDatabase()) == 0
+    assert settlement.buffer == []
+    assert [(r["buy_order_id"], r["quantity"]) for r in journal.read()] == [("b1", 10)]
+
+def test_order_pool_reuses_orders_after_they_leave_the_book():
+    engine = MatchingEngine(pool=OrderPool(size=4))
+    resting = engine.new_order("s1", "s", "AAPL", "sell", 10, 100)
+    engine.submit(resting)
+    engine.release(resting)
+    # 仍在委託簿中的委託不會被歸還
+    assert engine.pool.free == []
+
+    taker = engine.new_order("b1", "b", "AAPL", "buy", 10, 100)
+    assert len(engine.submit(taker)) == 1
+    engine.release(taker)
+    assert len(engine.pool.free) == 2
+    assert engine.pool.created == 2
+
+    reused = engine.new_order("s2", "s", "AAPL", "sell", 5, 101)
+    assert reused is taker
+    assert (reused.order_id, reused.remaining, reused.status) == ("s2", 5, 'new')
+    assert engine.pool.reused == 1
+
+    # 普通構造的委託與重複歸還都被忽略
+    engine.release(Order("x", "x", "AAPL", "buy", 1, 1))
+    engine.pool.release(resting)
+    assert engine.pool.free == [resting]
+
+def test_failing_triggered_order_does_not_fail_the_trade_that_fired_it():
+    feed = PriceFeed()
+    ledger = AccountLedger(feed)
+    engine = MatchingEngine(ledger, feed)
+    triggers = TriggerIndex(on_trigger=engine.submit_triggered)
+    feed.add_listener(triggers.on_price)
+    ledger.load_account("s", 0, {"AAPL": 10})
+    ledger.load_account("b", 10_000)
+    ledger.load_account("t", 10_000)
+
+    stop = ConditionalOrder("stop1", "t", "AAPL", "buy", 5, stop_price=100)
+    triggers.add(stop, reference_price=99)
+    # 模擬觸發時才暴露的錯誤參數
+    stop.quantity = 0
+    engine.submit(Order("s1", "s", "AAPL", "sell", 10, 100))
+    fills = engine.submit(Order("b1", "b", "AAPL", "buy", 10, 100))
+    assert len(fills) == 1
+    assert ledger.get_account("b").positions["AAPL"] == 10
+
+def test_probe_risk_checks_without_reserving():
+    ledger = AccountLedger()
+    ledger.load_account("u", 1000.0)
+    engine = MatchingEngine(ledger, PriceFeed())
+    assert engine.probe_risk(Order("c1", "u", "AAPL", "buy", 10, 100.0)) == 100.0
+    assert not ledger.reservations and ledger.get_account("u").reserved_cash == 0
+    with pytest.raises(RiskCheckError):
+        engine.probe_risk(Order("c2", "u", "AAPL", "buy", 11, 100.0))
+    assert not ledger.reservations
@@ -0,0 +1,112 @@
+import pytest
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+import numpy as np
+from ..equity import EquityService, compute_curves, holdings, merge_chunk
+from ..fixedpoint import to_ticks
+
+UTC = ZoneInfo('UTC')
+
+
+def at(day: int, hour: int = 12) -> datetime:
+    return datetime(2024, 1, day, hour, tzinfo=timezone.utc)
+
+
+def make_inputs():
+    # 用戶 u 初始 1000 現金，1/2 買入 10 股 @10，1/4 賣出 4 股 @12
+    # 資金與現價為 tick，K線為小數
+    accounts = [SimpleNamespace(user_id="u", balance=to_ticks(1000.0 - 100.0 + 48.0))]
+    positions = [SimpleNamespace(user_id="u", symbol="AAPL", quantity=6)]
+    transactions = [
+        SimpleNamespace(user_id="u", symbol="AAPL", type='buy', quantity=10, timestamp=at(2)),
+        SimpleNamespace(user_id="u", symbol="AAPL", type='sell', quantity=4, timestamp=at(4)),
+    ]
+    cash_entries = [
+        SimpleNamespace(user_id="u", amount=to_ticks(-100.0), timestamp=at(2)),
+        SimpleNamespace(user_id="u", amount=to_ticks(48.0), timestamp=at(4)),
+    ]
+    inputs = SimpleNamespace(accounts=accounts, positions=positions,
+                             transactions=transactions, cash_entries=cash_entries)
+    candles = [SimpleNamespace(symbol="AAPL", start_time=at(day, 0), close=close)
+               for day, close in ((1, 9.0), (2, 10.0), (3, 11.0), (5, 13.0))]
+    prices = SimpleNamespace(candles=candles, stocks=[SimpleNamespace(symbol="AAPL", current_price=to_ticks(13.5))])
+    return inputs, prices
+
+
+def test_holdings_rewinds_changes_after_each_day():
+    current = np.array([6.0])
+    result = holdings(current, np.array([0, 0]), np.array([1, 3]), np.array([10.0, -4.0]), 3)
+    # 第 3 日 (序號 3) 的變動在區間之後
+    assert result.tolist() == [[0.0, 10.0, 10.0]]
+
+
+def test_compute_curves_back_derives_daily_state():
+    inputs, prices = make_inputs()
+    user_ids, curves = compute_curves(inputs, prices, date(2024, 1, 1), date(2024, 1, 5), UTC)
+    assert user_ids == ["u"]
+    assert curves["cash"][0].tolist() == [1000.0, 900.0, 900.0, 948.0, 948.0]
+    # 1/4 沒有日K，沿用 1/3 收盤
+    assert curves["positions_value"][0].tolist() == [0.0, 100.0, 110.0, 66.0, 78.0]
+    np.testing.assert_allclose(curves["equity"], curves["cash"] + curves["positions_value"])
+
+
+def test_compute_curves_in_process_pool_matches_inline():
+    inputs, prices = make_inputs()
+    inputs.positions.append(SimpleNamespace(user_id="v", symbol="MSFT", quantity=3))
+    prices.stocks.append(SimpleNamespace(symbol="MSFT", current_price=to_ticks(20.0)))
+    _, inline = compute_curves(inputs, prices, date(2024, 1, 1), date(2024, 1, 5), UTC, processes=1)
+    _, pooled = compute_curves(inputs, prices, date(2024, 1, 1), date(2024, 1, 5), UTC, processes=2)
+    for column in inline:
+        np.testing.assert_allclose(inline[column], pooled[column])
+    # 沒有日K的股票以現價估值
+    assert inline["positions_value"][1].tolist() == [60.0] * 5
+
+
+def test_merge_chunk_overwrites_and_fills_gaps():
+    existing = SimpleNamespace(first_day=2, equity=[1.0, 2.0], cash=[1.0, 2.0], positions_value=[0.0, 0.0])
+    values = {column: np.array([5.0, 6.0]) for column in ('equity', 'cash', 'positions_value')}
+    row = merge_chunk(existing, date(2024, 1, 1), date(2024, 1, 6), values)
+    assert row["first_day"] == 2
+    assert row["equity"] == [1.0, 2.0, 2.0, 5.0, 6.0]
+    assert row["month"] == "2024-01-01"
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.inputs, self.prices = make_inputs()
+        self.curves = {}
+
+    async def get_equity_inputs(self, since, user_id=None):
+        return SimpleNamespace(
+            accounts=self.inputs.accounts, positions=self.inputs.positions,
+            transactions=[t for t in self.inputs.transactions if t.timestamp >= since],
+            cash_entries=[e for e in self.inputs.cash_entries if e.timestamp >= since],
+        )
+
+    async def get_daily_closes(self, since):
+        return self.prices
+
+    async def get_equity_curves(self, start_month, end_month, user_id=None):
+        return [SimpleNamespace(user_id=uid, **row) for (uid, _), row in sorted(self.curves.items())
+                if start_month <= row["month"] <= end_month]
+
+    async def upsert_equity_curves(self, rows):
+        for row in rows:
+            stored = dict(row, month=date.fromisoformat(row["month"]))
+            self.curves[(row["user_id"], stored["month"])] = {k: v for k, v in stored.items() if k != "user_id"}
+        return rows
+
+
+@pytest.mark.asyncio
+async def test_incremental_materialization_and_range_query():
+    db = FakeDatabase()
+    service = EquityService(processes=1, timezone='UTC')
+    assert await service.materialize(db, date(2024, 1, 1), date(2024, 1, 3)) == 1
+    # 增量補算 1/4 至 2/1，跨月產生第二段
+    assert await service.materialize(db, date(2024, 1, 4), date(2024, 2, 1)) == 2
+    curve = await service.curve(db, "u", date(2024, 1, 2), date(2024, 1, 5))
+    assert curve["dates"] == ["2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"]
+    assert curve["equity"] == [1000.0, 1010.0, 1014.0, 1026.0]
+    curve = await service.curve(db, "u", date(2024, 1, 31), date(2024, 2, 10))
+    assert curve["dates"] == ["2024-01-31", "2024-02-01"]
@@ -0,0 +1,98 @@
+import pytest
+import asyncio
+from fastapi import HTTPException, Response
+from ..idempotency import IdempotencyConflictError, IdempotencyStore, fingerprint, idempotent
+from ..clock import NANOS_PER_SECOND, ManualClock
+from ..journal import Journal
+
+
+def counter():
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        return {"order_id": f"o{len(calls)}"}
+    return calls, operation
+
+
+@pytest.mark.asyncio
+async def test_retry_returns_original_result():
+    store = IdempotencyStore(window=60)
+    calls, operation = counter()
+    payload = {"symbol": "AAPL", "side": "buy", "quantity": 1}
+    response = Response()
+    first = await idempotent("u1", "k1", payload, response, operation, store)
+    retry_response = Response()
+    retry = await idempotent("u1", "k1", payload, retry_response, operation, store)
+    assert first == retry == {"order_id": "o1"}
+    assert len(calls) == 1
+    assert retry_response.headers["Idempotent-Replayed"] == "true"
+    # 不同用戶的相同鍵互不影響
+    assert await idempotent("u2", "k1", payload, Response(), operation, store) == {"order_id": "o2"}
+    with pytest.raises(HTTPException) as error:
+        await idempotent("u1", "k1", dict(payload, quantity=2), Response(), operation, store)
+    assert error.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retries_share_one_execution_and_failures_are_not_cached():
+    store = IdempotencyStore(window=60)
+    release = asyncio.Event()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await release.wait()
+        return {"ok": len(calls)}
+
+    tasks = [asyncio.create_task(store.run("u:k", "fp", slow)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks)
+    assert [result for result, _ in results] == [{"ok": 1}] * 3
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+
+    async def failing():
+        raise ValueError("rejected")
+    with pytest.raises(ValueError):
+        await store.run("u:bad", "fp", failing)
+    calls_before = len(calls)
+    assert (await store.run("u:bad", "fp", slow))[0] == {"ok": calls_before + 1}
+    with pytest.raises(IdempotencyConflictError):
+        await store.run("u:bad", "other", slow)
+
+
+@pytest.mark.asyncio
+async def test_window_and_capacity_bound_memory():
+    clock = ManualClock(1000 * NANOS_PER_SECOND)
+    store = IdempotencyStore(window=10, max_keys=100, clock=clock.now)
+    _, operation = counter()
+    for i in range(250):
+        await store.run(f"u:{i}", "fp", operation)
+    assert len(store) == 100
+    assert "u:149" not in store.entries and "u:150" in store.entries
+    clock.advance(11 * NANOS_PER_SECOND)
+    await store.run("u:new", "fp", operation)
+    assert list(store.entries) == ["u:new"]
+
+
+@pytest.mark.asyncio
+async def test_journal_restores_keys_within_window(tmp_path):
+    clock = ManualClock(1000 * NANOS_PER_SECOND)
+    path = str(tmp_path / "idempotency.journal")
+    store = IdempotencyStore(window=10, journal=Journal(path), clock=clock.now)
+    calls, operation = counter()
+    await store.run("u:a", fingerprint({"q": 1}), operation)
+    clock.advance(5 * NANOS_PER_SECOND)
+    await store.run("u:b", fingerprint({"q": 2}), operation)
+    await store.flush()
+    with open(path, 'a') as f:
+        f.write('{"key": "u:torn"')
+
+    clock.advance(6 * NANOS_PER_SECOND)
+    restored = IdempotencyStore(window=10, journal=Journal(path), clock=clock.now)
+    assert restored.load() == 1
+    assert await restored.run("u:b", fingerprint({"q": 2}), operation) == ({"order_id": "o2"}, True)
+    assert len(calls) == 2
+    # 載入時已壓縮掉過期與損壞的行
+    assert restored.journal.lines == 1
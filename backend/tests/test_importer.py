@@ -0,0 +1,67 @@
+import pytest
+from ..fixedpoint import to_ticks
+from ..importer import Checkpoint, PriceImporter, clean_chunk, read_csv_chunks, validate_row
+
+CSV = """symbol,timestamp,open,high,low,close,volume
+aapl,2024-01-02,10,12,9,11,100
+AAPL,2024-01-03,11,13,10,12,200
+AAPL,2024-01-03,11,13,10,12.5,250
+MSFT,2024-01-02,20,19,18,19,100
+MSFT,2024-01-03,20,21,19,20,
+"""
+
+def test_validate_row():
+    row = validate_row({"symbol": "aapl", "timestamp": "2024-01-02", "open": "10", "high": "12",
+                        "low": "9", "close": "11", "volume": "100"}, "1d")
+    assert row["symbol"] == "AAPL"
+    assert row["start_time"] == "2024-01-02T00:00:00+00:00"
+    assert validate_row({"symbol": "AAPL", "timestamp": "bad", "open": "1", "high": "1",
+                         "low": "1", "close": "1"}, "1d") is None
+    assert validate_row({"symbol": "AAPL", "timestamp": "2024-01-02", "open": "1", "high": "inf",
+                         "low": "1", "close": "1"}, "1d") is None
+
+def test_clean_chunk_deduplicates(tmp_path):
+    path = tmp_path / "prices.csv"
+    path.write_text(CSV)
+    chunks = list(read_csv_chunks(str(path), 10))
+    rows, invalid = clean_chunk(chunks[0], "1d")
+    assert invalid == 1
+    assert len(rows) == 3
+    assert [r["close"] for r in rows if r["start_time"].startswith("2024-01-03") and r["symbol"] == "AAPL"] == [12.5]
+
+@pytest.mark.asyncio
+async def test_import_resumes_from_checkpoint(tmp_path):
+    class FakeDatabase:
+        def __init__(self):
+            self.candles = []
+            self.stocks = []
+            self.prices = {}
+
+        async def get_stocks(self):
+            return []
+
+        async def insert_stocks(self, rows):
+            self.stocks.extend(r["symbol"] for r in rows)
+            return []
+
+        async def upsert_candles(self, rows):
+            self.candles.extend(rows)
+            return []
+
+        async def update_stock_prices(self, prices):
+            self.prices.update(prices)
+
+    path = tmp_path / "prices.csv"
+    path.write_text(CSV)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    db = FakeDatabase()
+    stats = await PriceImporter(db, batch_size=2, concurrency=2, checkpoint=Checkpoint(checkpoint_path)).run([str(path)])
+    assert stats["rows_written"] == 4
+    assert sorted(db.stocks) == ["AAPL", "MSFT"]
+    assert db.prices == {symbol: to_ticks(price) for symbol, price in (("AAPL", 12.5), ("MSFT", 20.0))}
+    assert Checkpoint(checkpoint_path).rows_done(str(path)) == 5
+
+    db = FakeDatabase()
+    stats = await PriceImporter(db, batch_size=2, checkpoint=Checkpoint(checkpoint_path)).run([str(path)])
+    assert stats["rows_written"] == 0
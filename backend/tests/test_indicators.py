@@ -0,0 +1,172 @@
+import numpy as np
+import pytest
+from ..candles import Bar, CandleAggregator
+from ..clock import NANOS_PER_SECOND, ManualClock, to_datetime
+from ..fixedpoint import to_ticks
+from ..indicators import INDICATORS, IndicatorEngine, ema, resolve_params
+
+CASES = [
+    ('sma', {'period': 5}),
+    ('ema', {'period': 10}),
+    ('rsi', {'period': 14}),
+    ('macd', {'fast': 5, 'slow': 12, 'signal': 4}),
+    ('bollinger', {'period': 10, 'k': 2.0}),
+    ('vwap', {}),
+]
+
+
+def make_history(n=300, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0, 1, n))
+    high = close + rng.uniform(0, 1, n)
+    low = close - rng.uniform(0, 1, n)
+    return {
+        'timestamp': list(range(n)),
+        'open': close.copy(),
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.integers(0, 1000, n),
+    }
+
+
+def bars(history, start=0):
+    for i in range(start, len(history['close'])):
+        bar = Bar('AAA', '1d', i * 86400 * NANOS_PER_SECOND, float(history['close'][i]), int(history['volume'][i]))
+        bar.high = float(history['high'][i])
+        bar.low = float(history['low'][i])
+        yield bar
+
+
+def slice_history(history, end):
+    return {key: values[:end] for key, values in history.items()}
+
+
+def to_rows(indicator, values):
+    rows = []
+    for value in values:
+        if not isinstance(value, tuple):
+            value = (value,) * len(indicator.outputs)
+        rows.append([np.nan if v is None else v for v in value])
+    return np.array(rows)
+
+
+@pytest.mark.parametrize("name,params", CASES)
+def test_streaming_matches_batch(name, params):
+    history = make_history()
+    indicator = INDICATORS[name]
+    expected = indicator.batch(history, **params)
+    stream = indicator(**params)
+    actual = to_rows(indicator, [stream.update(bar) for bar in bars(history)])
+    for i, column in enumerate(indicator.outputs):
+        np.testing.assert_allclose(actual[:, i], expected[column], rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("name,params", CASES)
+@pytest.mark.parametrize("split", [3, 150])
+def test_prime_continues_batch(name, params, split):
+    history = make_history()
+    indicator = INDICATORS[name]
+    expected = indicator.batch(history, **params)
+    stream = indicator(**params)
+    stream.prime(slice_history(history, split))
+    actual = to_rows(indicator, [stream.update(bar) for bar in bars(history, split)])
+    for i, column in enumerate(indicator.outputs):
+        np.testing.assert_allclose(actual[:, i], expected[column][split:], rtol=1e-9, atol=1e-9)
+
+
+def test_ema_long_series_is_stable():
+    values = np.full(100_000, 42.0)
+    assert np.allclose(ema(values, 3)[2:], 42.0)
+
+
+def test_resolve_params_rejects_unknown():
+    assert resolve_params('sma', {}) == {'period': 20}
+    with pytest.raises(ValueError):
+        resolve_params('sma', {'fast': 3})
+    with pytest.raises(ValueError):
+        resolve_params('nope', {})
+
+
+@pytest.mark.asyncio
+async def test_engine_caches_and_streams():
+    history = make_history(50)
+    loads = []
+
+    async def loader(symbol, interval):
+        loads.append(symbol)
+        return history
+
+    engine = IndicatorEngine(loader, cache_size=2)
+    series = await engine.get('AAA', '1d', 'sma', {'period': 5})
+    await engine.get('AAA', '1d', 'sma', {'period': 5})
+    assert loads == ['AAA']
+
+    bar = Bar('AAA', '1d', 86400 * NANOS_PER_SECOND, 200.0)
+    engine.on_bar(bar)
+    assert len(series.timestamps) == 51
+    expected = (history['close'][-4:].sum() + 200.0) / 5
+    assert series.columns['value'][-1] == pytest.approx(expected)
+
+    await engine.get('BBB', '1d', 'ema', {})
+    await engine.get('CCC', '1d', 'ema', {})
+    assert len(engine.cache) == 2
+    assert ('AAA', '1d') not in engine.by_source
+    engine.on_bar(bar)
+    assert len(series.timestamps) == 51
+
+
+@pytest.mark.asyncio
+async def test_engine_rolls_minute_bars_into_longer_intervals():
+    history = make_history(50)
+
+    async def loader(symbol, interval):
+        return history
+
+    engine = IndicatorEngine(loader, max_points=20)
+    daily = await engine.get('AAA', '1d', 'sma', {'period': 5})
+    assert len(daily.timestamps) == 20
+    minute = NANOS_PER_SECOND * 60
+    day = 86400 * NANOS_PER_SECOND
+    for i, close in enumerate((10.0, 12.0, 11.0)):
+        bar = Bar('AAA', '1m', 100 * day + i * minute, close, 5)
+        engine.on_bar(bar)
+    # 當天的K線要等下一天的第一根分鐘K線才收盤
+    assert len(daily.timestamps) == 20
+    engine.on_bar(Bar('AAA', '1m', 101 * day, 13.0, 1))
+    assert len(daily.timestamps) == 21
+    assert daily.timestamps[-1] == to_datetime(100 * day)
+    expected = (history['close'][-4:].sum() + 11.0) / 5
+    assert daily.columns['value'][-1] == pytest.approx(expected)
+    rolled = engine.rolling[('AAA', '1d')]
+    assert (rolled.start, rolled.open, rolled.volume) == (101 * day, 13.0, 1)
+
+    # 序列長度有上限
+    for i in range(2, 30):
+        engine.on_bar(Bar('AAA', '1m', (100 + i) * day, 13.0, 1))
+    assert len(daily.timestamps) <= 40
+
+    # 比收到的K線更短的週期無法合成，從緩存移除
+    await engine.get('AAA', '1m', 'sma', {})
+    engine.on_bar(Bar('AAA', '5m', 200 * day, 13.0, 1))
+    assert ('AAA', '1m') not in engine.by_source and len(engine.cache) == 1
+
+
+def test_aggregator_closes_bars_on_boundary():
+    clock = ManualClock(120 * NANOS_PER_SECOND)
+    aggregator = CandleAggregator('1m', clock=clock.now)
+    closed = []
+    aggregator.add_listener(closed.append)
+    # 價格訂閱收到 tick，K線以小數保存
+    aggregator.on_price('AAA', None, to_ticks(10.0))
+    aggregator.update('AAA', 12.0, 5)
+    aggregator.on_price('AAA', to_ticks(12.0), to_ticks(9.0))
+    clock.set(185 * NANOS_PER_SECOND)
+    aggregator.on_price('AAA', to_ticks(9.0), to_ticks(11.0))
+    assert len(closed) == 1
+    bar = closed[0]
+    assert (bar.start, bar.open, bar.high, bar.low, bar.close, bar.volume) == (120 * NANOS_PER_SECOND, 10.0, 12.0, 9.0, 9.0, 5)
+    clock.set(300 * NANOS_PER_SECOND)
+    assert aggregator.close_due() == 1
+    assert closed[-1].start == 180 * NANOS_PER_SECOND
+    assert len(aggregator.closed) == 2
@@ -0,0 +1,120 @@
+import pytest
+from ..fixedpoint import from_ticks, to_ticks
+from ..ledger import AccountLedger, RiskCheckError
+
+def make_ledger():
+    ledger = AccountLedger()
+    ledger.load_account("u1", 10000.0, {"AAPL": 10}, max_position=100)
+    return ledger
+
+def test_buy_reserves_buying_power():
+    ledger = make_ledger()
+    ledger.check_order("o1", "u1", "AAPL", "buy", 50, 100.0)
+    account = ledger.get_account("u1")
+    assert account.buying_power == 5000.0
+
+    with pytest.raises(RiskCheckError):
+        ledger.check_order("o2", "u1", "AAPL", "buy", 51, 100.0)
+
+def test_release_on_cancel():
+    ledger = make_ledger()
+    ledger.check_order("o1", "u1", "AAPL", "buy", 50, 100.0)
+    assert ledger.release("o1")
+    assert ledger.get_account("u1").buying_power == 10000.0
+    assert not ledger.release("o1")
+
+def test_position_limit():
+    ledger = make_ledger()
+    ledger.check_order("o1", "u1", "AAPL", "buy", 60, 10.0)
+    with pytest.raises(RiskCheckError):
+        ledger.check_order("o2", "u1", "AAPL", "buy", 31, 10.0)
+
+def test_short_restriction():
+    ledger = make_ledger()
+    ledger.check_order("o1", "u1", "AAPL", "sell", 6, 100.0)
+    with pytest.raises(RiskCheckError):
+        ledger.check_order("o2", "u1", "AAPL", "sell", 5, 100.0)
+
+def test_partial_fill_updates_cash_and_position():
+    ledger = make_ledger()
+    ledger.check_order("o1", "u1", "AAPL", "buy", 10, 100.0)
+    ledger.apply_fill("o1", 4, 99.0)
+    account = ledger.get_account("u1")
+    assert account.cash == 10000.0 - 396.0
+    assert account.positions["AAPL"] == 14
+    assert account.reserved_cash == 600.0
+
+    ledger.apply_fill("o1", 6, 100.0)
+    assert "o1" not in ledger.reservations
+    assert account.reserved_cash == 0.0
+
+def test_fixed_point_cash_does_not_drift():
+    assert to_ticks(0.1 + 0.2) == to_ticks(0.3)
+    assert from_ticks(to_ticks(12.34)) == 12.34
+    ledger = AccountLedger()
+    ledger.load_account("buyer", to_ticks(1.0))
+    ledger.load_account("seller", 0, {"AAPL": 10})
+    for i in range(10):
+        ledger.check_order(f"b{i}", "buyer", "AAPL", "buy", 1, to_ticks(0.1))
+        ledger.check_order(f"s{i}", "seller", "AAPL", "sell", 1, to_ticks(0.1))
+        ledger.apply_fill(f"b{i}", 1, to_ticks(0.1))
+        ledger.apply_fill(f"s{i}", 1, to_ticks(0.1))
+    # 浮點運算下 10 x 0.1 不等於 1.0，整數 tick 精確守恆
+    assert ledger.get_account("buyer").cash == 0
+    assert ledger.get_account("buyer").reserved_cash == 0
+    assert ledger.get_account("seller").cash == to_ticks(1.0)
+
+def test_to_ticks_rejects_non_finite():
+    for value in (float('inf'), float('-inf'), float('nan'), 1e309):
+        with pytest.raises(ValueError):
+            to_ticks(value)
+
+@pytest.mark.asyncio
+async def test_reconcile_keeps_reservations():
+    class Row:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class FakeDatabase:
+        async def get_cash_accounts(self):
+            return [Row(user=Row(id="u1"), balance=8000.0, max_position=100, allow_short=False,
+                        margin_ratio=None, maintenance_ratio=None)]
+
+        async def get_positions(self):
+            return [Row(user=Row(id="u1"), stock=Row(symbol="AAPL"), quantity=12)]
+
+    ledger = make_ledger()
+    ledger.check_order("o1", "u1", "AAPL", "buy", 10, 100.0)
+    assert await ledger.reconcile(FakeDatabase()) == 1
+    account = ledger.get_account("u1")
+    assert account.cash == 8000.0
+    assert account.positions == {"AAPL": 12}
+    assert account.buying_power == 7000.0
+
+@pytest.mark.asyncio
+async def test_reconcile_skips_unsettled_users_and_evicts_deleted_accounts():
+    class Row:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class FakeDatabase:
+        async def get_cash_accounts(self):
+            # 數據庫還沒有 u1 的成交，u2 已被刪除
+            return [Row(user=Row(id="u1"), balance=10000.0, max_position=100, allow_short=False,
+                        margin_ratio=None, maintenance_ratio=None)]
+
+        async def get_positions(self):
+            return [Row(user=Row(id="u1"), stock=Row(symbol="AAPL"), quantity=10)]
+
+    ledger = make_ledger()
+    ledger.load_account("u2", 500.0)
+    ledger.check_order("o1", "u1", "AAPL", "buy", 5, 100.0)
+    ledger.apply_fill("o1", 5, 100.0)
+    assert await ledger.reconcile(FakeDatabase(), pending=lambda: {"u1"}) == 1
+    assert ledger.get_account("u1").cash == 9500.0
+    assert ledger.get_account("u1").positions == {"AAPL": 15}
+    assert ledger.get_account("u2") is None
+
+    # 成交寫入後的下一輪才以數據庫為準
+    assert await ledger.reconcile(FakeDatabase(), pending=set) == 1
+    assert ledger.get_account("u1").cash == 10000.0
@@ -0,0 +1,106 @@
+import pytest
+import numpy as np
+from ..engine import MatchingEngine, Order
+from ..ledger import AccountLedger, RiskCheckError
+from ..margin import MarginEngine, breach_prices
+from ..prices import PriceFeed
+
+
+def make_market():
+    feed = PriceFeed()
+    ledger = AccountLedger(feed)
+    engine = MatchingEngine(ledger, feed)
+    margin = MarginEngine(ledger, engine, feed)
+    feed.add_listener(margin.on_price)
+    engine.add_fill_listener(margin.on_fills)
+    return feed, ledger, engine, margin
+
+
+def test_margin_account_can_borrow_and_short():
+    feed, ledger, engine, _ = make_market()
+    feed.prices.update({"AAPL": 100.0, "MSFT": 50.0})
+    ledger.load_account("m", 5000.0, margin_ratio=0.5)
+    # 5000 權益可支撐 10000 曝險
+    ledger.check_order("o1", "m", "AAPL", "buy", 60, 100.0)
+    ledger.check_order("o2", "m", "MSFT", "sell", 80, 50.0)
+    with pytest.raises(RiskCheckError):
+        ledger.check_order("o3", "m", "MSFT", "sell", 1, 50.0)
+    assert ledger.get_account("m").reserved_cash == pytest.approx(5000.0)
+    ledger.apply_fill("o1", 60, 100.0)
+    account = ledger.get_account("m")
+    assert account.cash == -1000.0
+    assert account.reserved_cash == pytest.approx(2000.0)
+    # 平倉不需要保證金
+    ledger.check_order("o4", "m", "AAPL", "sell", 60, 100.0)
+
+
+def test_breach_prices_are_conservative():
+    rng = np.random.default_rng(7)
+    ledger = AccountLedger()
+    for _ in range(200):
+        prices = dict(zip("ABCD", rng.uniform(10, 200, 4)))
+        positions = {s: int(q) for s, q in zip("ABCD", rng.integers(-100, 100, 4)) if q}
+        account = ledger.load_account("u", float(rng.uniform(0, 20000)), positions,
+                                      margin_ratio=0.5, maintenance_ratio=0.3)
+        equity, gross = ledger.valuation(account, prices)
+        excess = equity - 0.3 * gross
+        if excess < 0 or not gross:
+            continue
+        thresholds = breach_prices(account, prices, excess, gross)
+        # 任意價格移動只要不越過各自的觸發價，帳戶都不會跌破維持保證金
+        moved = {}
+        for symbol, (side, level) in thresholds.items():
+            fraction = rng.uniform(0, 1)
+            moved[symbol] = prices[symbol] + (level - prices[symbol]) * fraction
+        equity, gross = ledger.valuation(account, moved)
+        assert equity - 0.3 * gross >= -1e-6
+
+
+def test_tick_only_evaluates_crossed_accounts_and_liquidates():
+    feed, ledger, engine, margin = make_market()
+    feed.publish("AAPL", 100.0)
+    ledger.load_account("m", -5000.0, {"AAPL": 100}, margin_ratio=0.5, maintenance_ratio=0.25)
+    ledger.load_account("safe", 9000.0, {"AAPL": 10}, margin_ratio=0.5, maintenance_ratio=0.25)
+    ledger.load_account("bidder", 10 ** 6)
+    assert margin.load() == 2
+    assert margin.thresholds["m"]["AAPL"] == ('long', pytest.approx(100 - 2500 / 75))
+
+    evaluated = []
+    index = margin.index
+    margin.index = lambda user_id: evaluated.append(user_id) or index(user_id)
+    feed.publish("AAPL", 70.0)
+    assert evaluated == []
+
+    engine.submit(Order("bid", "bidder", "AAPL", "buy", 100, 65.0))
+    feed.publish("AAPL", 66.0)
+    # 只有越過觸發價的帳戶被重新計算，權益 1600 需回到 50% 初始保證金，平倉 52 股
+    assert evaluated[0] == "m"
+    assert "safe" not in evaluated
+    account = ledger.get_account("m")
+    assert account.positions == {"AAPL": 48}
+    assert account.cash == pytest.approx(-5000.0 + 52 * 65.0)
+    assert not margin.liquidating
+    assert "m" in margin.thresholds
+
+
+def test_short_squeeze_liquidates_through_engine():
+    feed, ledger, engine, margin = make_market()
+    feed.publish("AAPL", 50.0)
+    ledger.load_account("lender", 0.0, {"AAPL": 1000})
+    ledger.load_account("buyer", 10 ** 6)
+    ledger.load_account("m", 2500.0, margin_ratio=0.5, maintenance_ratio=0.3)
+    engine.submit(Order("bid", "buyer", "AAPL", "buy", 100, 50.0))
+    engine.submit(Order("short", "m", "AAPL", "sell", 100, None, 'market'))
+    assert ledger.get_account("m").positions == {"AAPL": -100}
+    # 超額 1000，每漲一元損失 100 x 1.3
+    assert margin.thresholds["m"]["AAPL"] == ('short', pytest.approx(50 + 1000 / 130))
+
+    engine.submit(Order("ask", "lender", "AAPL", "sell", 1000, 60.0))
+    feed.publish("AAPL", 57.5)
+    assert ledger.get_account("m").positions == {"AAPL": -100}
+    feed.publish("AAPL", 62.0)
+    # 權益 7500 - 6200 = 1300 < 30% x 6200，強制買回經撮合成交於賣一價 60
+    account = ledger.get_account("m")
+    assert account.positions.get("AAPL", 0) > -100
+    assert account.cash < 7500.0
+    assert engine.book("AAPL").volume['sell'][60.0] < 1000
@@ -0,0 +1,62 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from ..ledger import AccountLedger
+from ..montecarlo import ProjectionService, cholesky, project, simulate_paths
+from ..risk import ReturnsWindow, RiskService
+
+
+def make_history(days: int = 40) -> dict:
+    rng = np.random.default_rng(3)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    timestamps = [start + timedelta(days=i) for i in range(days)]
+    return {
+        symbol: {"timestamp": timestamps, "close": 100.0 * np.cumprod(1 + rng.normal(0, 0.01, days))}
+        for symbol in ("AAA", "BBB")
+    }
+
+
+def test_cholesky_handles_singular_covariance():
+    a = np.array([0.01, 0.02])
+    covariance = np.outer(a, a)
+    factor = cholesky(covariance)
+    np.testing.assert_allclose(factor @ factor.T, covariance, atol=1e-9)
+
+
+def test_simulated_returns_have_target_correlation():
+    covariance = np.array([[0.0004, 0.0003], [0.0003, 0.0004]])
+    factor = cholesky(covariance)
+    # 單日模擬的市值即 exp(對數收益率)，以兩支股票各自的路徑檢查相關性
+    first = simulate_paths(np.array([1.0, 0.0]), np.zeros(2), factor, 1, 20000, 0, chunk_bytes=4096)
+    second = simulate_paths(np.array([0.0, 1.0]), np.zeros(2), factor, 1, 20000, 0, chunk_bytes=4096)
+    corr = np.corrcoef(np.log(first[:, 0]), np.log(second[:, 0]))[0, 1]
+    assert corr == pytest.approx(0.75, abs=0.02)
+
+
+def test_projection_is_identical_with_process_pool():
+    exposures = np.array([1000.0, 500.0])
+    mean = np.array([0.001, 0.0])
+    covariance = np.array([[0.0004, 0.0001], [0.0001, 0.0009]])
+    inline = project(exposures, mean, covariance, 10, 3000, seed=7, processes=1, job_paths=1000)
+    pooled = project(exposures, mean, covariance, 10, 3000, seed=7, processes=2, job_paths=1000)
+    assert inline == pooled
+    assert inline["percentiles"]["50"][0] == 1500.0
+    fan = [inline["percentiles"][p][-1] for p in ("5", "25", "50", "75", "95")]
+    assert fan == sorted(fan)
+
+
+@pytest.mark.asyncio
+async def test_projection_cached_until_positions_change():
+    ledger = AccountLedger()
+    ledger.load_account("u", 0.0, {"AAA": 10, "BBB": 5})
+    window = ReturnsWindow(window=30)
+    window.load(make_history())
+    service = ProjectionService(RiskService(ledger, window, processes=1), processes=1)
+    first = await service.get("u", 5, 500)
+    assert await service.get("u", 5, 500) is first
+    assert await service.get("u", 5, 1000) is not first
+    ledger.get_account("u").positions["AAA"] = 0
+    changed = await service.get("u", 5, 500)
+    assert changed is not first
+    assert changed["value"] < first["value"]
+    assert await service.get("missing", 5, 500) is None
@@ -0,0 +1,135 @@
+import asyncio
+import pytest
+import math
+from types import SimpleNamespace
+import numpy as np
+from ..fixedpoint import to_ticks
+from ..ledger import AccountLedger, RiskCheckError
+from ..options import (OptionChain, OptionsService, binomial_american, black_scholes, contract_symbol,
+                       norm_cdf, strike_ladder)
+
+NOW = 1_700_000_000.0
+
+
+def test_norm_cdf_accuracy():
+    x = np.linspace(-5, 5, 101)
+    exact = np.array([0.5 * (1 + math.erf(v / math.sqrt(2))) for v in x])
+    np.testing.assert_allclose(norm_cdf(x), exact, atol=2e-7)
+
+
+def test_black_scholes_parity_and_greeks():
+    strikes = np.array([90.0, 100.0, 110.0])
+    years = np.full(3, 0.5)
+    call = black_scholes(100.0, strikes, years, 0.25, 0.03, np.ones(3, dtype=bool))
+    put = black_scholes(100.0, strikes, years, 0.25, 0.03, np.zeros(3, dtype=bool))
+    np.testing.assert_allclose(call["price"] - put["price"], 100.0 - strikes * math.exp(-0.03 * 0.5), atol=1e-5)
+    assert call["price"][1] == pytest.approx(7.7603, abs=1e-3)
+    # delta 與 gamma 對照有限差分
+    bump = 0.01
+    up = black_scholes(100.0 + bump, strikes, years, 0.25, 0.03, np.ones(3, dtype=bool))["price"]
+    down = black_scholes(100.0 - bump, strikes, years, 0.25, 0.03, np.ones(3, dtype=bool))["price"]
+    np.testing.assert_allclose(call["delta"], (up - down) / (2 * bump), atol=1e-4)
+    np.testing.assert_allclose(call["gamma"], (up - 2 * call["price"] + down) / bump ** 2, rtol=1e-2)
+    expired = black_scholes(100.0, strikes, np.zeros(3), 0.25, 0.03, np.zeros(3, dtype=bool))
+    assert expired["price"].tolist() == [0.0, 0.0, 10.0]
+
+
+def test_binomial_american_put_has_early_exercise_premium():
+    strikes = np.array([100.0, 100.0])
+    years = np.array([1.0, 1.0])
+    is_call = np.array([True, False])
+    american = binomial_american(100.0, strikes, years, 0.2, 0.05, is_call, steps=400)
+    european = black_scholes(100.0, strikes, years, 0.2, 0.05, is_call)["price"]
+    assert american[0] == pytest.approx(european[0], abs=0.02)
+    assert american[1] > european[1] + 0.1
+
+
+def test_chain_generation_and_reprice():
+    assert contract_symbol("AAPL", __import__('datetime').date(2024, 6, 21), True, 150) == "AAPL240621C00150000"
+    assert strike_ladder(100.0, count=2, step=0.05) == [90.0, 95.0, 100.0, 105.0, 110.0]
+    chain = OptionChain("AAPL", volatility=0.3, style='american')
+    chain.generate(100.0, __import__('datetime').date(2023, 11, 14), expiry_days=[30])
+    assert len(chain) == len(strike_ladder(100.0)) * 2
+    chain.reprice(100.0, NOW)
+    before = chain.marks["price"].copy()
+    chain.reprice(105.0, NOW)
+    assert (chain.marks["price"][chain.is_call] > before[chain.is_call]).all()
+    assert (chain.marks["price"][~chain.is_call] < before[~chain.is_call]).all()
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.trades = []
+
+    async def record_option_trade(self, user_id, contract, quantity, price, amount):
+        self.trades.append((user_id, contract["symbol"], quantity, price, amount))
+        return True
+
+
+@pytest.mark.asyncio
+async def test_trade_portfolio_and_expiry():
+    clock = SimpleNamespace(now=NOW)
+    ledger = AccountLedger()
+    ledger.load_account("u", to_ticks(5000.0))
+    service = OptionsService(ledger, clock=lambda: clock.now)
+    chain = service.ensure_chain("AAPL", 100.0)
+    symbol = next(s for s in chain.symbols if s.endswith("C00100000"))
+    db = FakeDatabase()
+
+    fill = await service.trade(db, "u", symbol, 'buy', 2)
+    assert fill["amount"] == pytest.approx(-fill["price"] * 200, abs=1e-4)
+    assert ledger.get_account("u").cash == to_ticks(5000.0 + fill["amount"])
+    assert db.trades[-1][4] == to_ticks(fill["amount"])
+    with pytest.raises(RiskCheckError):
+        await service.trade(db, "u", symbol, 'sell', 3)
+    with pytest.raises(RiskCheckError):
+        await service.trade(db, "u", symbol, 'buy', 1000)
+
+    service.on_price("AAPL", to_ticks(100.0), to_ticks(110.0))
+    portfolio = service.portfolio("u")
+    assert portfolio["positions"][0]["unrealized_pnl"] > 0
+    assert portfolio["totals"]["delta"] == pytest.approx(portfolio["positions"][0]["delta"])
+
+    # 到期後按內在價值 (110 - 100) 現金結算
+    clock.now = NOW + 8 * 86400
+    assert await service.expire(db) == 1
+    assert db.trades[-1][2:4] == (-2, 10.0)
+    assert service.portfolio("u")["positions"] == []
+    assert symbol not in service.contracts
+
+
+@pytest.mark.asyncio
+async def test_concurrent_buys_cannot_overspend_and_failed_writes_refund():
+    class SlowDatabase(FakeDatabase):
+        def __init__(self, ok=True):
+            super().__init__()
+            self.ok = ok
+
+        async def record_option_trade(self, user_id, contract, quantity, price, amount):
+            await asyncio.sleep(0)
+            return self.ok and await super().record_option_trade(user_id, contract, quantity, price, amount)
+
+    ledger = AccountLedger()
+    service = OptionsService(ledger, clock=lambda: NOW)
+    chain = service.ensure_chain("AAPL", 100.0)
+    symbol = next(s for s in chain.symbols if s.endswith("C00100000"))
+    cost = to_ticks(float(chain.marks["price"][chain.index[symbol]]) * 100)
+    ledger.load_account("u", cost + cost // 2)
+
+    results = await asyncio.gather(*(service.trade(SlowDatabase(), "u", symbol, 'buy', 1) for _ in range(2)),
+                                   return_exceptions=True)
+    assert sum(isinstance(result, RiskCheckError) for result in results) == 1
+    assert ledger.get_account("u").cash == cost // 2
+
+    with pytest.raises(RuntimeError):
+        await service.trade(SlowDatabase(ok=False), "u", symbol, 'sell', 1)
+    assert service.positions["u"][symbol][0] == 1
+    ledger.adjust_cash("u", cost)
+    with pytest.raises(RuntimeError):
+        await service.trade(SlowDatabase(ok=False), "u", symbol, 'buy', 1)
+    assert ledger.get_account("u").cash == cost + cost // 2
+
+    # 模型價格為 0 時不能買入
+    chain.marks["price"][chain.index[symbol]] = 0.0
+    with pytest.raises(ValueError):
+        await service.trade(SlowDatabase(), "u", symbol, 'buy', 1)
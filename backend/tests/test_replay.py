@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from ..auth import OPERATORS, get_operator_user
+from ..clock import NANOS_PER_SECOND, SimulatedClock
+from ..models import User
+from ..fixedpoint import to_ticks
+from ..prices import PriceFeed
+from ..replay import ReplayDriver, TickTape, resolve_replay_path
+
+
+def make_tape():
+    # 兩支股票，每秒一個 tick
+    times = [t * NANOS_PER_SECOND for t in range(10)]
+    ids = [t % 2 for t in range(10)]
+    prices = [to_ticks(100.0 + t) for t in range(10)]
+    return TickTape(times, ids, prices, ['AAA', 'BBB'])
+
+
+def test_clock_pause_and_speed():
+    clock = SimulatedClock(1000 * NANOS_PER_SECOND, speed=100.0)
+    assert clock.now() == 1000 * NANOS_PER_SECOND
+    clock.set_speed(10.0)
+    assert clock.speed == 10.0
+    clock.seek(2000 * NANOS_PER_SECOND)
+    assert clock.now() == 2000 * NANOS_PER_SECOND
+    clock.resume()
+    assert clock.now() >= 2000 * NANOS_PER_SECOND
+    with pytest.raises(ValueError):
+        clock.set_speed(0)
+
+
+def test_step_publishes_due_ticks():
+    feed = PriceFeed()
+    seen = []
+    feed.add_listener(lambda symbol, old, new: seen.append((symbol, new)))
+    driver = ReplayDriver(make_tape(), feed)
+    driver.clock.seek(3500 * NANOS_PER_SECOND // 1000)
+    assert driver.step() == 4
+    assert seen == [(symbol, to_ticks(price)) for symbol, price in
+                    (('AAA', 100.0), ('BBB', 101.0), ('AAA', 102.0), ('BBB', 103.0))]
+    assert driver.step() == 0
+
+
+def test_step_respects_max_batch():
+    driver = ReplayDriver(make_tape(), PriceFeed(), max_batch=3)
+    driver.clock.seek(100 * NANOS_PER_SECOND)
+    assert driver.step() == 3
+    assert driver.cursor == 3
+    assert driver.lag > 0
+
+
+def test_seek_restores_last_prices():
+    feed = PriceFeed()
+    driver = ReplayDriver(make_tape(), feed)
+    driver.seek(6 * NANOS_PER_SECOND)
+    assert driver.cursor == 7
+    assert feed.prices == {'AAA': to_ticks(106.0), 'BBB': to_ticks(105.0)}
+    driver.rewind()
+    assert driver.cursor == 0
+    driver.clock.seek(NANOS_PER_SECOND)
+    driver.step()
+    assert feed.prices == {'AAA': to_ticks(100.0), 'BBB': to_ticks(101.0)}
+
+
+def test_from_csv_expands_candles(tmp_path):
+    path = tmp_path / "candles.csv"
+    path.write_text(
+        "timestamp,symbol,open,high,low,close\n"
+        "2024-01-02T09:31:00,AAA,11,12,9,10\n"
+        "2024-01-02T09:30:00,AAA,10,13,8,11\n"
+    )
+    tape = TickTape.from_csv(str(path))
+    assert len(tape) == 8
+    assert tape.prices.tolist() == [to_ticks(p) for p in (10, 13, 8, 11, 11, 12, 9, 10)]
+
+
+@pytest.mark.asyncio
+async def test_run_replays_whole_tape():
+    feed = PriceFeed()
+    driver = ReplayDriver(make_tape(), feed, speed=1000.0)
+    await asyncio.wait_for(driver.run(), timeout=5)
+    assert driver.published == 10
+    assert driver.finished.is_set()
+    assert feed.prices == {'AAA': to_ticks(108.0), 'BBB': to_ticks(109.0)}
+
+
+@pytest.mark.asyncio
+async def test_rewind_after_finishing_replays_again():
+    feed = PriceFeed()
+    driver = ReplayDriver(make_tape(), feed, speed=1000.0)
+    task = asyncio.create_task(driver.run(follow=True))
+    try:
+        await asyncio.wait_for(driver.finished.wait(), timeout=5)
+        assert driver.published == 10 and not task.done()
+        driver.rewind()
+        assert driver.cursor == 0
+        for _ in range(5000):
+            if driver.published == 20:
+                break
+            await asyncio.sleep(0.001)
+        assert driver.published == 20 and driver.cursor == 10
+    finally:
+        task.cancel()
+
+
+def test_speed_must_be_positive():
+    for speed in (0, -1.0):
+        with pytest.raises(ValueError):
+            SimulatedClock(0, speed)
+        with pytest.raises(ValueError):
+            ReplayDriver(make_tape(), PriceFeed(), speed=speed)
+
+
+def test_replay_path_confined_to_replay_dir(tmp_path):
+    (tmp_path / "ticks.csv").write_text("timestamp,symbol,price\n")
+    assert resolve_replay_path("ticks.csv", str(tmp_path)) == str((tmp_path / "ticks.csv").resolve())
+    for path in ("../secret.csv", "/etc/passwd", "sub/../../x.csv"):
+        with pytest.raises(ValueError):
+            resolve_replay_path(path, str(tmp_path))
+
+
+@pytest.mark.asyncio
+async def test_replay_routes_require_operator():
+    OPERATORS.add("ops@example.com")
+    try:
+        with pytest.raises(HTTPException) as excinfo:
+            await get_operator_user(User("u1", "user", "user@example.com"))
+        assert excinfo.value.status_code == 403
+        operator = User("u2", "ops", "ops@example.com")
+        assert await get_operator_user(operator) is operator
+    finally:
+        OPERATORS.discard("ops@example.com")
@@ -0,0 +1,92 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import numpy as np
+from ..clock import NANOS_PER_SECOND
+from ..ledger import AccountLedger
+from ..risk import ReturnsWindow, RiskService, batch_metrics, risk_metrics
+
+
+def make_history(days: int = 60, seed: int = 1) -> dict:
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    timestamps = [start + timedelta(days=i) for i in range(days)]
+    market = rng.normal(0.0005, 0.01, days)
+    history = {}
+    for symbol, beta in (("AAA", 1.0), ("BBB", 2.0), ("CCC", 0.5)):
+        returns = beta * market + rng.normal(0, 0.002, days)
+        history[symbol] = {"timestamp": timestamps, "close": 100.0 * np.cumprod(1 + returns)}
+    return history
+
+
+def test_single_asset_metrics():
+    returns = np.array([[0.01], [-0.02], [0.03], [0.0]])
+    result = risk_metrics(returns, returns[:, 0], np.cov(returns, rowvar=False).reshape(1, 1),
+                          np.array([[1000.0]]))
+    assert result["volatility"][0] == pytest.approx(returns.std(ddof=1) * np.sqrt(252))
+    assert result["beta"][0] == pytest.approx(1.0)
+    # 1.01 -> 0.9898 的回撤
+    assert result["max_drawdown"][0] == pytest.approx(0.02)
+    assert result["historical_var"][0] > 0
+
+
+def test_window_update_and_beta():
+    window = ReturnsWindow(window=30, benchmark="AAA")
+    window.load(make_history())
+    version = window.version
+    returns, benchmark, covariance = window.derived()
+    assert returns.shape == (30, 3)
+    assert covariance.shape == (3, 3)
+    exposures = np.eye(3) * 1000.0
+    betas = risk_metrics(returns, benchmark, covariance, exposures)["beta"]
+    assert betas[0] == pytest.approx(1.0)
+    assert betas[1] == pytest.approx(2.0, abs=0.3)
+
+    last_day = int(window.days[-1])
+    window.update("AAA", last_day + 1, 200.0)
+    assert window.version > version
+    assert window.days[-1] == last_day + 1
+    # 新的一天其他股票沿用前一日收盤
+    assert window.closes[-1, 1] == window.closes[-2, 1]
+    assert window.derived()[0][-1, 1] == 0.0
+
+
+def test_batch_in_process_pool_matches_inline():
+    window = ReturnsWindow(window=30)
+    window.load(make_history())
+    exposures = np.random.default_rng(2).normal(0, 1000, (16, 3))
+    inline = batch_metrics(*window.derived(), exposures, processes=1)
+    pooled = batch_metrics(*window.derived(), exposures, processes=2)
+    for name in inline:
+        np.testing.assert_allclose(inline[name], pooled[name])
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidated_by_positions_and_bars():
+    ledger = AccountLedger()
+    ledger.load_account("u", 10000.0, {"AAA": 10, "BBB": 5})
+    ledger.load_account("v", 10000.0, {"CCC": 3})
+    window = ReturnsWindow(window=30)
+    window.load(make_history())
+    service = RiskService(ledger, window, processes=1)
+
+    metrics = service.get("u")
+    assert service.get("u") is metrics
+    assert service.stale_users() == ["v"]
+    assert await service.refresh() == 1
+    assert service.stale_users() == []
+
+    # 單個用戶的子矩陣計算與批次一致
+    batch = service.cache["u"].metrics
+    await service.refresh(["u"])
+    for name, value in batch.items():
+        assert service.cache["u"].metrics[name] == pytest.approx(value)
+
+    ledger.get_account("u").positions["AAA"] = 20
+    assert service.stale_users() == ["u"]
+    assert service.get("u")["value"] > metrics["value"]
+
+    start = int(window.days[-1] + 1) * 86400 * NANOS_PER_SECOND
+    service.on_bar(SimpleNamespace(symbol="CCC", start=start, close=50.0))
+    assert sorted(service.stale_users()) == ["u", "v"]
+    assert service.get("missing") is None
@@ -0,0 +1,153 @@
+import pytest
+import json
+from types import SimpleNamespace
+from ..fixedpoint import to_ticks
+from ..orders import OrderCreate
+from ..ledger import RiskCheckError
+from ..rooms import CpuBudget, Room, RoomBudgetError, RoomManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def limit(symbol, side, quantity, price):
+    return OrderCreate(symbol=symbol, side=side, quantity=quantity, price=price)
+
+
+def test_rooms_are_isolated():
+    first = Room("r1", "A", ["AAPL"], to_ticks(10000.0))
+    second = Room("r2", "B", ["AAPL"], to_ticks(10000.0))
+    for room in (first, second):
+        room.price_feed.prices["AAPL"] = to_ticks(100.0)
+        room.join("u1")
+        room.join("u2")
+    first.submit("u1", limit("AAPL", "buy", 10, 105.0))
+    first.ledger.get_account("u2").positions["AAPL"] = 10
+    _, fills = first.submit("u2", OrderCreate(symbol="AAPL", side="sell", quantity=10, order_type='market'))
+    assert [(f.price, f.quantity) for f in fills] == [(to_ticks(105.0), 10)]
+    assert first.price_feed.last_price("AAPL") == to_ticks(105.0)
+    assert second.price_feed.last_price("AAPL") == to_ticks(100.0)
+    assert second.ledger.get_account("u1").cash == to_ticks(10000.0)
+    assert first.leaderboard()[0]["user_id"] == "u2"
+    with pytest.raises(RiskCheckError):
+        second.submit("outsider", limit("AAPL", "buy", 1, 100.0))
+    with pytest.raises(ValueError):
+        second.submit("u1", limit("MSFT", "buy", 1, 100.0))
+
+
+def test_cpu_and_memory_budgets():
+    clock = FakeClock()
+    budget = CpuBudget(share=0.1, burst=0.01, clock=clock)
+    assert budget.available()
+    budget.charge(0.02)
+    assert not budget.available()
+    clock.now = 0.2
+    assert budget.available()
+
+    room = Room("r1", "A", ["AAPL"], to_ticks(1e6), max_bytes=5000, cpu=CpuBudget(share=0.0, burst=10.0))
+    room.join("u1")
+    with pytest.raises(RoomBudgetError):
+        for i in range(10):
+            room.submit("u1", limit("AAPL", "buy", 1, 100.0 - i))
+    assert room.memory_usage() >= 5000
+    room.cpu.charge(100.0)
+    with pytest.raises(RoomBudgetError):
+        room.submit("u1", OrderCreate(symbol="AAPL", side="buy", quantity=1, order_type='market'))
+
+
+def test_float_snapshots_are_upgraded_to_ticks_on_restore():
+    legacy = {
+        "version": 1,
+        "prices": {"AAPL": 100.5},
+        "accounts": {"u1": {"cash": 9000.25, "positions": {"AAPL": 3}}},
+        "orders": [["o1", "u1", "AAPL", "buy", 10, 99.5, "limit", 10, "open", 1700000000.5]],
+    }
+    room = Room("r1", "A", ["AAPL"], to_ticks(10000.0))
+    room.restore(json.loads(json.dumps(legacy)))
+    assert room.price_feed.last_price("AAPL") == to_ticks(100.5)
+    assert room.ledger.get_account("u1").cash == to_ticks(9000.25)
+    order = room.engine.orders["o1"]
+    assert order.price == to_ticks(99.5) and order.timestamp == 1700000000500000000
+    assert room.snapshot()["version"] == 2
+    assert room.snapshot()["orders"][0][5] == to_ticks(99.5)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rooms = {}
+        self.fills = []
+
+    async def create_room(self, name, symbols, starting_cash):
+        room_id = f"room{len(self.rooms)}"
+        self.rooms[room_id] = SimpleNamespace(id=room_id, name=name, symbols=symbols, starting_cash=starting_cash,
+                                              snapshot=None, members=[], positions=[])
+        return self.rooms[room_id]
+
+    async def get_room(self, room_id):
+        return self.rooms.get(room_id)
+
+    async def save_room_snapshot(self, room_id, snapshot):
+        self.rooms[room_id].snapshot = json.dumps(snapshot)
+        return True
+
+    async def record_room_fills(self, room_id, transactions, positions, payments, snapshot=None):
+        self.fills.append((room_id, transactions))
+        if snapshot is not None:
+            self.rooms[room_id].snapshot = json.dumps(snapshot)
+        return True
+
+
+@pytest.mark.asyncio
+async def test_rooms_unload_to_snapshot_and_reload_lazily():
+    db = FakeDatabase()
+    clock = FakeClock()
+    manager = RoomManager(max_loaded=1, idle_seconds=60, clock=clock)
+    first = await manager.create(db, "A", ["AAPL"], to_ticks(1000.0), {"AAPL": to_ticks(10.0)})
+    first.join("u1")
+    first.join("u2", 0)
+    first.ledger.get_account("u2").positions["AAPL"] = 5
+    first.submit("u1", limit("AAPL", "buy", 20, 9.0))
+    first.submit("u2", limit("AAPL", "sell", 5, 9.0))
+
+    # 超過載入上限時最久未用的房間寫回成交並卸載
+    second = await manager.create(db, "B", ["AAPL"], to_ticks(1000.0), {"AAPL": to_ticks(10.0)})
+    assert list(manager.rooms) == [second.room_id]
+    assert db.fills[0][0] == first.room_id and len(db.fills[0][1]) == 2
+
+    restored = await manager.get(db, first.room_id)
+    assert restored is not first
+    assert restored.ledger.get_account("u1").positions == {"AAPL": 5}
+    assert restored.ledger.get_account("u1").reserved_cash == 15 * to_ticks(9.0)
+    assert restored.engine.book("AAPL").best("buy") == to_ticks(9.0)
+    assert restored.price_feed.last_price("AAPL") == to_ticks(9.0)
+    assert restored.ledger.get_account("u2").positions == {}
+    with pytest.raises(RiskCheckError):
+        restored.submit("u2", OrderCreate(symbol="AAPL", side="sell", quantity=1, order_type='market'))
+
+    clock.now = 120.0
+    assert await manager.unload_idle(db) == 1
+    assert not manager.rooms
+    assert await manager.get(db, "missing") is None
+
+
+@pytest.mark.asyncio
+async def test_periodic_flush_saves_snapshot_with_the_fills():
+    db = FakeDatabase()
+    manager = RoomManager(clock=FakeClock())
+    room = await manager.create(db, "A", ["AAPL"], to_ticks(1000.0), {"AAPL": to_ticks(10.0)})
+    room.join("u1")
+    room.join("u2", 0)
+    room.ledger.get_account("u2").positions["AAPL"] = 5
+    room.submit("u1", limit("AAPL", "buy", 5, 9.0))
+    room.submit("u2", limit("AAPL", "sell", 5, 9.0))
+    assert await manager.flush(db, room) == 1
+
+    # 沒有卸載就崩潰：重新載入的快照包含已寫入的成交
+    restored = Room.from_row(db.rooms[room.room_id])
+    assert restored.ledger.get_account("u1").positions == {"AAPL": 5}
+    assert restored.ledger.get_account("u1").cash == to_ticks(1000.0 - 45.0)
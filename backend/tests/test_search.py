@@ -0,0 +1,104 @@
+import random
+import pytest
+from ..search import SearchIndex, SearchService
+
+
+def build():
+    index = SearchIndex()
+    index.upsert('AAPL', 'Apple Inc', 500)
+    index.upsert('APP', 'AppLovin Corp', 50)
+    index.upsert('AMZN', 'Amazon.com Inc', 400)
+    index.upsert('BAC', 'Bank of America Corp', 300)
+    index.upsert('BK', 'Bank of New York Mellon', 100)
+    index.upsert('2330', '台積電', 900)
+    return index
+
+
+def symbols(entries):
+    return [entry.symbol for entry in entries]
+
+
+def test_exact_symbol_ranks_first():
+    index = build()
+    assert symbols(index.search('app'))[:2] == ['APP', 'AAPL']
+
+
+def test_prefix_ranked_by_popularity():
+    index = build()
+    assert symbols(index.search('a', fuzzy=False)) == ['AAPL', 'AMZN', 'APP', 'BAC']
+    assert symbols(index.search('ban')) == ['BAC', 'BK']
+
+
+def test_multi_word_query():
+    index = build()
+    assert symbols(index.search('bank of n')) == ['BK']
+    assert symbols(index.search('bank of')) == ['BAC', 'BK']
+
+
+def test_fuzzy_matches_typos():
+    index = build()
+    assert symbols(index.search('amazn')) == ['AMZN']
+    assert symbols(index.search('amazn', fuzzy=False)) == []
+
+
+def test_unicode_names():
+    index = build()
+    assert symbols(index.search('台積')) == ['2330']
+    assert symbols(index.search('233')) == ['2330']
+
+
+def test_incremental_update_and_remove():
+    index = build()
+    index.set_popularity('APP', 1000)
+    assert symbols(index.search('a', fuzzy=False))[0] == 'APP'
+    index.upsert('APP', 'Renamed Holdings', 1000)
+    assert 'APP' not in symbols(index.search('applovin'))
+    assert symbols(index.search('renamed')) == ['APP']
+    index.remove('BAC')
+    assert symbols(index.search('bank of')) == ['BK']
+    assert 'america' not in index.tokens
+    index.remove('BK')
+    assert index.names.find('bank') is None
+
+
+def test_matches_brute_force_prefix():
+    rng = random.Random(3)
+    index = SearchIndex()
+    names = {}
+    for i in range(300):
+        symbol = ''.join(rng.choice('ABCDE') for _ in range(rng.randint(1, 4))) + str(i)
+        names[symbol] = rng.randint(0, 50)
+        index.upsert(symbol, f"Co {symbol}", names[symbol])
+    for symbol in list(names)[::3]:
+        index.remove(symbol)
+        del names[symbol]
+    for prefix in ('a', 'ab', 'c', 'dd', 'e1'):
+        expected = sorted((s for s in names if s.lower().startswith(prefix)), key=lambda s: (-names[s], s))
+        assert symbols(index.search(prefix, limit=20, fuzzy=False))[:len(expected[:20])] == expected[:20]
+
+
+class Row:
+    def __init__(self, symbol, name, trade_count):
+        self.symbol = symbol
+        self.name = name
+        self.trade_count = trade_count
+
+
+class FakeDb:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def get_stock_search_entries(self):
+        return self.rows
+
+
+@pytest.mark.asyncio
+async def test_service_refresh_applies_diff():
+    service = SearchService()
+    db = FakeDb([Row('AAPL', 'Apple Inc', 1), Row('MSFT', 'Microsoft', 2)])
+    assert await service.refresh(db) == 2
+    assert await service.refresh(db) == 0
+    db.rows = [Row('AAPL', 'Apple Inc', 5), Row('NVDA', 'Nvidia', 0)]
+    assert await service.refresh(db) == 3
+    assert set(service.index.entries) == {'AAPL', 'NVDA'}
+    assert service.index.entries['AAPL'].popularity == 5
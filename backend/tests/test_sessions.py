@@ -0,0 +1,245 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import pytest
+from ..clock import ManualClock, from_datetime, use_clock
+from ..engine import MatchingEngine, Order
+from ..fixedpoint import to_ticks
+from ..ledger import AccountLedger
+from ..prices import PriceFeed
+from ..triggers import ConditionalOrder
+from ..sessions import (CLOSE_AUCTION, CLOSED, CONTINUOUS, OPEN_AUCTION, PRE_OPEN, MarketClosedError,
+                        SessionManager, SessionSchedule, allocate, uncross)
+
+TZ = ZoneInfo('Asia/Taipei')
+
+
+def at(hour, minute, day=6):
+    # 2025-01-06 為星期一
+    return datetime(2025, 1, day, hour, minute, tzinfo=TZ)
+
+
+def test_schedule_states():
+    schedule = SessionSchedule('08:30', '09:00', '13:25', '13:30', 'Asia/Taipei')
+    assert schedule.state_at(at(8, 0)) == CLOSED
+    assert schedule.state_at(at(8, 45)) == PRE_OPEN
+    assert schedule.state_at(at(10, 0)) == CONTINUOUS
+    assert schedule.state_at(at(13, 27)) == CLOSE_AUCTION
+    assert schedule.state_at(at(13, 30)) == CLOSED
+    assert schedule.state_at(at(10, 0, day=11)) == CLOSED
+
+
+def test_schedule_follows_the_market_clock():
+    schedule = SessionSchedule('08:30', '09:00', '13:25', '13:30', 'Asia/Taipei')
+    clock = ManualClock(from_datetime(at(8, 45)))
+    previous = use_clock(clock)
+    try:
+        sessions = SessionManager(MatchingEngine(), schedule, enabled=True)
+        assert sessions.state == PRE_OPEN
+        clock.set(from_datetime(at(10, 0)))
+        assert schedule.now() == at(10, 0)
+        assert sessions.tick() == CONTINUOUS
+    finally:
+        use_clock(previous)
+
+
+def test_uncross_maximizes_volume():
+    orders = [
+        Order("b1", "u", "X", "buy", 100, to_ticks(10.2)),
+        Order("b2", "u", "X", "buy", 100, to_ticks(10.0)),
+        Order("b3", "u", "X", "buy", 50, None, "market"),
+        Order("s1", "u", "X", "sell", 120, to_ticks(9.9)),
+        Order("s2", "u", "X", "sell", 100, to_ticks(10.1)),
+        Order("s3", "u", "X", "sell", 100, to_ticks(10.3)),
+    ]
+    # 10.0: 需求 250 供給 120；10.1: 需求 150 供給 220；10.2: 需求 150 供給 220
+    price, volume = uncross(orders, reference_price=to_ticks(10.16))
+    assert volume == 150
+    assert price == to_ticks(10.2)
+    assert uncross(orders, reference_price=to_ticks(10.0))[0] == to_ticks(10.1)
+
+
+def test_uncross_brute_force():
+    import random
+    rng = random.Random(7)
+    for _ in range(200):
+        orders = [
+            Order(str(i), "u", "X", rng.choice(("buy", "sell")), rng.randint(1, 100),
+                  to_ticks(round(rng.uniform(9, 11), 1)))
+            for i in range(rng.randint(1, 30))
+        ]
+        result = uncross(orders)
+        best = 0
+        for p in {o.price for o in orders}:
+            demand = sum(o.remaining for o in orders if o.side == 'buy' and o.price >= p)
+            supply = sum(o.remaining for o in orders if o.side == 'sell' and o.price <= p)
+            best = max(best, min(demand, supply))
+        assert (result[1] if result else 0) == best
+
+
+def test_no_cross():
+    orders = [Order("b", "u", "X", "buy", 10, to_ticks(9.0)), Order("s", "u", "X", "sell", 10, to_ticks(10.0))]
+    assert uncross(orders) is None
+
+
+def test_allocate_price_time_priority():
+    orders = [
+        Order("b1", "u", "X", "buy", 30, to_ticks(10.0)),
+        Order("b2", "u", "X", "buy", 30, to_ticks(10.5)),
+        Order("s1", "u", "X", "sell", 40, to_ticks(9.5)),
+    ]
+    fills = allocate("X", orders, to_ticks(10.0), 40)
+    price = to_ticks(10.0)
+    assert [(f.buy_order_id, f.quantity, f.price) for f in fills] == [("b2", 30, price), ("b1", 10, price)]
+    assert orders[0].remaining == 20
+
+
+def test_session_day_cycle():
+    now = [at(8, 40)]
+    ledger = AccountLedger()
+    ledger.load_account("buyer", to_ticks(10_000.0))
+    ledger.load_account("seller", 0, {"X": 100})
+    engine = MatchingEngine(ledger, PriceFeed())
+    engine.price_feed.prices["X"] = to_ticks(10.0)
+    fills = []
+    engine.add_fill_listener(fills.extend)
+    schedule = SessionSchedule('08:30', '09:00', '13:25', '13:30', 'Asia/Taipei')
+    sessions = SessionManager(engine, schedule, clock=lambda: now[0], enabled=True)
+    assert sessions.state == PRE_OPEN
+
+    sessions.collect(Order("b1", "buyer", "X", "buy", 60, to_ticks(11.0)))
+    sessions.collect(Order("b2", "buyer", "X", "buy", 30, to_ticks(9.0)))
+    sessions.collect(Order("s1", "seller", "X", "sell", 50, to_ticks(10.0)))
+    assert ledger.get_account("buyer").reserved_cash == 60 * to_ticks(11.0) + 30 * to_ticks(9.0)
+    assert sessions.cancel("b2")
+    assert ledger.get_account("buyer").reserved_cash == 60 * to_ticks(11.0)
+
+    now[0] = at(9, 0)
+    assert sessions.tick() == CONTINUOUS
+    assert [(f.price, f.quantity) for f in fills] == [(to_ticks(10.0), 50)]
+    assert engine.price_feed.last_price("X") == to_ticks(10.0)
+    # 未成交的限價買單轉入連續委託簿
+    assert engine.orders["b1"].remaining == 10
+    assert engine.book("X").best("buy") == to_ticks(11.0)
+
+    now[0] = at(13, 26)
+    assert sessions.tick() == CLOSE_AUCTION
+    assert "b1" in sessions.queued and not engine.orders
+    assert engine.book("X").best("buy") is None
+    sessions.collect(Order("s2", "seller", "X", "sell", 20, to_ticks(10.5)))
+
+    now[0] = at(13, 30)
+    assert sessions.tick() == CLOSED
+    # 10.5 與 11.0 成交量相同，取最接近參考價 10.0 者
+    assert [(f.price, f.quantity) for f in fills[1:]] == [(to_ticks(10.5), 10)]
+    assert ledger.get_account("buyer").reserved_cash == 0
+    assert ledger.get_account("seller").available_quantity("X") == 40
+    with pytest.raises(MarketClosedError):
+        sessions.collect(Order("b3", "buyer", "X", "buy", 1, to_ticks(10.0)))
+
+
+def test_auction_market_buys_stop_at_the_collar():
+    now = [at(8, 40)]
+    ledger = AccountLedger()
+    ledger.load_account("buyer", to_ticks(1_000.0))
+    ledger.load_account("seller", 0, {"X": 100})
+    engine = MatchingEngine(ledger, PriceFeed())
+    engine.price_feed.prices["X"] = to_ticks(10.0)
+    fills = []
+    engine.add_fill_listener(fills.extend)
+    schedule = SessionSchedule('08:30', '09:00', '13:25', '13:30', 'Asia/Taipei')
+    sessions = SessionManager(engine, schedule, clock=lambda: now[0], enabled=True)
+    # 凍結 100 股 x 10.5，賣方要價 12 不應成交
+    sessions.collect(Order("b1", "buyer", "X", "buy", 95, None, 'market'))
+    sessions.collect(Order("s1", "seller", "X", "sell", 50, to_ticks(12.0)))
+    sessions.collect(Order("s2", "seller", "X", "sell", 10, to_ticks(10.2)))
+    now[0] = at(9, 0)
+    assert sessions.tick() == CONTINUOUS
+    assert [(f.price, f.quantity) for f in fills] == [(to_ticks(10.2), 10)]
+    buyer = ledger.get_account("buyer")
+    assert buyer.cash == to_ticks(1_000.0) - 10 * to_ticks(10.2)
+    # 未成交的市價單取消，不轉入委託簿
+    assert "b1" not in engine.orders and buyer.reserved_cash == 0
+    assert engine.book("X").best("buy") is None
+
+
+def test_triggered_orders_follow_the_session_state():
+    now = [at(8, 40)]
+    ledger = AccountLedger()
+    ledger.load_account("buyer", to_ticks(1_000.0))
+    ledger.load_account("seller", 0, {"X": 100})
+    engine = MatchingEngine(ledger, PriceFeed())
+    engine.price_feed.prices["X"] = to_ticks(10.0)
+    schedule = SessionSchedule('08:30', '09:00', '13:25', '13:30', 'Asia/Taipei')
+    sessions = SessionManager(engine, schedule, clock=lambda: now[0], enabled=True)
+
+    def stop(order_id, side="buy"):
+        return ConditionalOrder(order_id, "buyer" if side == "buy" else "seller", "X", side, 5, 'stop_limit',
+                                stop_price=to_ticks(10.0), limit_price=to_ticks(10.0))
+
+    # 盤前觸發的轉為委託等待開盤競價
+    sessions.submit_triggered(stop("t1"))
+    assert sessions.queued["t1"].price == to_ticks(10.0)
+    sessions.state = OPEN_AUCTION
+    sessions.submit_triggered(stop("t2"))
+    assert sessions.deferred and "t2" not in engine.orders
+    sessions.state = PRE_OPEN
+    now[0] = at(9, 0)
+    assert sessions.tick() == CONTINUOUS
+    # 開盤競價時觸發的在進入連續交易後提交
+    assert not sessions.deferred
+    assert engine.orders["t1"].remaining == 5 and engine.orders["t2"].remaining == 5
+    sessions.submit_triggered(stop("t3", "sell"))
+    assert ledger.get_account("buyer").positions == {"X": 5}
+
+    now[0] = at(13, 30)
+    assert sessions.tick() == CLOSED
+    sessions.submit_triggered(stop("t4"))
+    assert "t4" not in engine.orders and "t4" not in sessions.queued and "t4" not in ledger.reservations
+
+
+def test_disabled_sessions_stay_continuous():
+    sessions = SessionManager(MatchingEngine(), clock=lambda: at(3, 0), enabled=False)
+    assert sessions.tick() == CONTINUOUS
+
+
+@pytest.mark.asyncio
+async def test_sharded_sessions_move_resting_orders_through_the_auctions():
+    class FakePool:
+        def __init__(self):
+            self.resting = [Order("s1", "seller", "X", "sell", 10, to_ticks(10.0))]
+
+        async def export_all(self):
+            orders, self.resting = self.resting, []
+            return orders
+
+        async def import_orders(self, orders):
+            self.resting.extend(orders)
+            return len(orders)
+
+    now = [at(9, 0)]
+    ledger = AccountLedger()
+    ledger.load_account("buyer", to_ticks(10_000.0))
+    ledger.load_account("seller", 0, {"X": 100})
+    engine = MatchingEngine(ledger, PriceFeed())
+    ledger.check_order("s1", "seller", "X", "sell", 10, to_ticks(10.0))
+    pool = FakePool()
+    schedule = SessionSchedule('08:30', '09:00', '13:25', '13:30', 'Asia/Taipei')
+    sessions = SessionManager(engine, schedule, clock=lambda: now[0], enabled=True, shard_pool=pool)
+    assert sessions.state == CONTINUOUS
+
+    now[0] = at(13, 26)
+    assert await sessions.advance() == CLOSE_AUCTION
+    assert "s1" in sessions.queued and not pool.resting
+    sessions.collect(Order("b1", "buyer", "X", "buy", 4, to_ticks(10.0)))
+    now[0] = at(13, 30)
+    assert await sessions.advance() == CLOSED
+    assert ledger.get_account("seller").positions["X"] == 96
+    assert ledger.get_account("seller").pending_sell == {}
+
+    # 次日開盤競價後未成交的限價單送回分片
+    now[0] = at(8, 40, day=7)
+    assert await sessions.advance() == PRE_OPEN
+    sessions.collect(Order("s3", "seller", "X", "sell", 5, to_ticks(12.0)))
+    now[0] = at(9, 0, day=7)
+    assert await sessions.advance() == CONTINUOUS
+    assert [o.order_id for o in pool.resting] == ["s3"] and not engine.orders
@@ -0,0 +1,177 @@
+import asyncio
+import multiprocessing
+import pytest
+from ..depth import DepthFeed
+from ..engine import MatchingEngine, Order
+from ..fixedpoint import to_ticks
+from ..ledger import AccountLedger
+from ..margin import MarginEngine
+from ..prices import PriceFeed
+from ..shards import HashRing, ShardPool, ShardUnavailableError, _Shard, handle_command, order_to_wire
+from ..triggers import ConditionalOrder
+
+
+def test_ring_is_balanced_and_moves_few_keys():
+    symbols = [f"SYM{i}" for i in range(5000)]
+    ring = HashRing(["a", "b", "c", "d"], vnodes=128)
+    owners = {symbol: ring.lookup(symbol) for symbol in symbols}
+    counts = {node: list(owners.values()).count(node) for node in ring.nodes}
+    assert min(counts.values()) > 5000 / 4 * 0.75
+
+    grown = ring.copy()
+    grown.add("e")
+    moved = [s for s in symbols if grown.lookup(s) != owners[s]]
+    # 只有移到新節點的股票需要遷移，約 1/5
+    assert all(grown.lookup(s) == "e" for s in moved)
+    assert 0.1 < len(moved) / len(symbols) < 0.3
+
+
+def test_export_import_keeps_time_priority():
+    source = MatchingEngine()
+    target = MatchingEngine()
+    for order_id, price in (("s1", 101.0), ("s2", 100.0), ("s3", 100.0)):
+        handle_command(source, ('submit', order_to_wire(Order(order_id, "u", "X", "sell", 10, price))))
+    orders = handle_command(source, ('export', "X"))
+    assert not source.orders and "X" not in source.books
+    handle_command(target, ('import', orders))
+    status, remaining, fills = handle_command(target, ('submit', order_to_wire(Order("b", "v", "X", "buy", 15, 101.0))))
+    # 成交元組: (symbol, price, quantity, buy_order_id, sell_order_id, ...)
+    assert [(f[4], f[2]) for f in fills] == [("s2", 10), ("s3", 5)]
+
+
+@pytest.mark.asyncio
+async def test_pool_matches_settles_and_rebalances():
+    ledger = AccountLedger()
+    ledger.load_account("buyer", 100_000.0)
+    ledger.load_account("seller", 0.0, {f"S{i}": 100 for i in range(20)})
+    front = MatchingEngine(ledger, PriceFeed())
+    fills_seen = []
+    front.add_fill_listener(fills_seen.extend)
+    pool = ShardPool(2, front, vnodes=16)
+    pool.start()
+    try:
+        symbols = [f"S{i}" for i in range(20)]
+        await asyncio.gather(*(pool.submit(Order(f"s-{s}", "seller", s, "sell", 10, 10.0)) for s in symbols))
+        assert len(pool.resting) == 20
+        assert ledger.get_account("seller").available_quantity("S0") == 90
+
+        moved = await pool.add_shard()
+        assert 0 < moved < 20
+        assert len(pool.shards) == 3
+
+        results = await asyncio.gather(*(pool.submit(Order(f"b-{s}", "buyer", s, "buy", 4, 10.0)) for s in symbols))
+        assert all(status == 'filled' for status, _, _ in results)
+        assert len(fills_seen) == 20
+        assert front.price_feed.last_price("S7") == 10.0
+        assert ledger.get_account("buyer").cash == pytest.approx(100_000.0 - 20 * 40.0)
+        assert pool.resting["s-S3"][2] == 6
+
+        assert await pool.cancel("s-S3")
+        assert not await pool.cancel("s-S3")
+        assert ledger.get_account("seller").available_quantity("S3") == 96
+    finally:
+        pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_pool_routes_triggers_and_auctions_and_fails_on_shard_exit():
+    ledger = AccountLedger()
+    ledger.load_account("buyer", 100_000.0)
+    ledger.load_account("seller", 0.0, {"X": 100})
+    front = MatchingEngine(ledger, PriceFeed())
+    front.price_feed.prices["X"] = 10.0
+    pool = ShardPool(2, front, vnodes=16)
+    pool.start()
+    try:
+        await pool.submit(Order("s1", "seller", "X", "sell", 10, 10.0))
+        # 觸發的止損單在所屬分片撮合，不進入 front 的委託簿
+        pool.submit_triggered(ConditionalOrder("t1", "buyer", "X", "buy", 4, 'stop', stop_price=10.0))
+        await asyncio.gather(*pool._tasks)
+        assert pool.resting["s1"][2] == 6
+        assert not front.orders and ledger.get_account("buyer").positions == {"X": 4}
+
+        # 收盤競價取回分片中的掛單，開盤後送回
+        orders = await pool.export_all()
+        assert [(o.order_id, o.remaining) for o in orders] == [("s1", 6)] and not pool.resting
+        assert await pool.import_orders(orders) == 1
+        assert pool.resting["s1"][2] == 6
+
+        shard = pool.shards[pool.shard_for("X")]
+        shard.process.kill()
+        shard.process.join()
+        with pytest.raises(ShardUnavailableError):
+            await pool.submit(Order("b2", "buyer", "X", "buy", 1, 10.0))
+        # 在途請求失敗，分片中丟失的掛單與這筆委託的凍結都已釋放
+        assert not pool.resting and not ledger.reservations
+        assert ledger.get_account("seller").available_quantity("X") == 96
+    finally:
+        pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_pool_liquidates_margin_accounts_in_the_shards():
+    feed = PriceFeed()
+    ledger = AccountLedger(feed)
+    front = MatchingEngine(ledger, feed)
+    pool = ShardPool(2, front, vnodes=16)
+    margin = MarginEngine(ledger, front, feed, shard_pool=pool)
+    feed.add_listener(margin.on_price)
+    front.add_fill_listener(margin.on_fills)
+    feed.publish("X", 100.0)
+    ledger.load_account("m", -5000.0, {"X": 100}, margin_ratio=0.5, maintenance_ratio=0.25)
+    ledger.load_account("bidder", 10 ** 6)
+    margin.load()
+    pool.start()
+    try:
+        await pool.submit(Order("bid", "bidder", "X", "buy", 100, 65.0))
+        feed.publish("X", 66.0)
+        assert margin.liquidating == {"m": 1}
+        await asyncio.gather(*pool._tasks)
+        # 平倉的市價賣單在分片中與買單成交，結算後重建索引
+        assert ledger.get_account("m").positions == {"X": 48}
+        assert ledger.get_account("m").cash == pytest.approx(-5000.0 + 52 * 65.0)
+        assert pool.resting["bid"][2] == 48
+        assert not margin.liquidating and "m" in margin.thresholds
+    finally:
+        pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_pool_mirrors_shard_depth_for_the_depth_feed():
+    ledger = AccountLedger()
+    ledger.load_account("buyer", to_ticks(100_000.0))
+    ledger.load_account("seller", 0, {"X": 100})
+    pool = ShardPool(2, MatchingEngine(ledger, PriceFeed()), vnodes=16)
+    messages = []
+    feed = DepthFeed(pool, lambda topic, message: messages.append(message))
+    pool.start()
+    try:
+        await pool.submit(Order("s1", "seller", "X", "sell", 10, to_ticks(10.0)))
+        await pool.submit(Order("s2", "seller", "X", "sell", 5, to_ticks(11.0)))
+        await pool.submit(Order("b1", "buyer", "X", "buy", 4, to_ticks(10.0)))
+        assert feed.flush() == 1
+        assert messages[-1]["asks"] == [[10.0, 6], [11.0, 5]]
+        assert feed.snapshot("X")["asks"] == [[10.0, 6], [11.0, 5]]
+
+        await pool.cancel("s2")
+        feed.flush()
+        assert messages[-1]["asks"] == [[11.0, 0]]
+        # 取回掛單後分片委託簿為空，鏡像也清空
+        await pool.export_all()
+        feed.flush()
+        assert messages[-1]["asks"] == [[10.0, 0]]
+        assert feed.snapshot("X")["asks"] == []
+    finally:
+        pool.stop()
+
+
+def test_unsolicited_shard_message_is_ignored():
+    pool = ShardPool(1)
+    parent, child = multiprocessing.Pipe()
+    shard = _Shard("shard-0", None, parent)
+    child.send(([("late", 0, [])], [("X", "sell", 10, 3)]))
+    # 超時後遲到的結果沒有對應的在途批次
+    pool._on_readable(shard)
+    assert pool.books["X"].volume['sell'] == {10: 3}
+    parent.close()
+    child.close()
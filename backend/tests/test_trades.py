@@ -0,0 +1,102 @@
+import pytest
+from types import SimpleNamespace
+from ..clock import NANOS_PER_SECOND, from_datetime, to_datetime
+from ..engine import MatchingEngine, Order
+from ..trades import (InvalidCursorError, TradeCache, TradeHistory, TradeRecord,
+                      decode_cursor, encode_cursor)
+
+
+class FakeDatabase:
+    """
+    以記憶體列表模擬 get_user_trades 的鍵集分頁
+    """
+
+    def __init__(self, records: dict):
+        self.records = records
+        self.calls = 0
+
+    async def get_user_trades(self, user_id, before_timestamp=None, before_id=None, limit=50):
+        self.calls += 1
+        rows = sorted(self.records.get(user_id, []), key=lambda r: r.key, reverse=True)
+        if before_timestamp is not None:
+            rows = [r for r in rows if r.key < (from_datetime(before_timestamp), before_id)]
+        return [
+            SimpleNamespace(trade_id=r.trade_id, type=r.type, symbol=r.symbol, quantity=r.quantity,
+                            price=r.price, timestamp=to_datetime(r.timestamp))
+            for r in rows[:limit]
+        ]
+
+
+def history(user_id: str, count: int) -> list:
+    return [TradeRecord(f"t{i:04d}", 'buy', "AAPL", 1, 10.0, (1000 + i) * NANOS_PER_SECOND) for i in range(count)]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor((1700000000123456000, "a:b:buy"))) == (1700000000123456000, "a:b:buy")
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("not-a-cursor")
+
+
+def test_fills_update_cache_for_both_sides():
+    engine = MatchingEngine()
+    cache = TradeCache(size=3)
+    engine.add_fill_listener(cache.on_fills)
+    engine.submit(Order("s1", "seller", "AAPL", "sell", 10, 10.0))
+    fill, = engine.submit(Order("b1", "buyer", "AAPL", "buy", 4, 10.0))
+    cache.seed("buyer", [], complete=True)
+    page = cache.page("buyer", None, 10)
+    # 編號包含成交時間，同一對委託多次成交也不會重複
+    assert [(r.trade_id, r.type, r.quantity) for r in page] == [(f"b1:s1:{fill.timestamp}:buy", 'buy', 4)]
+    assert cache.users["seller"].records[0].type == 'sell'
+
+
+def test_ring_buffer_evicts_oldest_and_loses_completeness():
+    cache = TradeCache(size=3)
+    cache.seed("u", history("u", 2), complete=True)
+    fills = [SimpleNamespace(symbol="AAPL", price=10.0, quantity=1, buy_order_id=f"b{i}",
+                             sell_order_id="s", buyer_id="u", seller_id="v", timestamp=(2000 + i) * NANOS_PER_SECOND)
+             for i in range(2)]
+    cache.on_fills(fills)
+    records = cache.users["u"].records
+    assert len(records) == 3
+    assert records[0].trade_id == "t0001"
+    assert not cache.users["u"].complete
+    # 超出緩存範圍的頁需回到數據庫
+    assert cache.page("u", records[0].key, 2) is None
+
+
+@pytest.mark.asyncio
+async def test_first_page_served_from_cache():
+    db = FakeDatabase({"u": history("u", 10)})
+    trades = TradeHistory(TradeCache(size=6))
+    first = await trades.page(db, "u", limit=3)
+    assert [t["id"] for t in first["trades"]] == ["t0009", "t0008", "t0007"]
+    assert db.calls == 1
+    again = await trades.page(db, "u", limit=3)
+    assert again == first
+    assert db.calls == 1
+
+    second = await trades.page(db, "u", first["next_cursor"], limit=3)
+    assert [t["id"] for t in second["trades"]] == ["t0006", "t0005", "t0004"]
+    assert db.calls == 1
+    # 第三頁超出緩存的六筆，改走數據庫游標查詢
+    third = await trades.page(db, "u", second["next_cursor"], limit=3)
+    assert [t["id"] for t in third["trades"]] == ["t0003", "t0002", "t0001"]
+    assert db.calls == 2
+    last = await trades.page(db, "u", third["next_cursor"], limit=3)
+    assert [t["id"] for t in last["trades"]] == ["t0000"]
+    assert last["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_unsettled_fills_merge_with_loaded_history():
+    db = FakeDatabase({"u": history("u", 2)})
+    trades = TradeHistory(TradeCache(size=10))
+    engine = MatchingEngine()
+    engine.add_fill_listener(trades.cache.on_fills)
+    engine.submit(Order("s1", "v", "AAPL", "sell", 1, 10.0))
+    fill, = engine.submit(Order("b1", "u", "AAPL", "buy", 1, 10.0))
+    page = await trades.page(db, "u", limit=10)
+    assert [t["id"] for t in page["trades"]] == [f"b1:s1:{fill.timestamp}:buy", "t0001", "t0000"]
+    assert page["next_cursor"] is None
+    assert db.calls == 1
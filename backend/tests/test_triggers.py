@@ -0,0 +1,106 @@
+import random
+import pytest
+from ..triggers import ConditionalOrder, TriggerIndex
+
+def test_stop_orders_fire_on_cross():
+    index = TriggerIndex()
+    index.on_price("AAPL", None, 100.0)
+    index.add(ConditionalOrder("s1", "u1", "AAPL", "sell", 10, stop_price=95.0))
+    index.add(ConditionalOrder("b1", "u1", "AAPL", "buy", 10, stop_price=105.0))
+    index.add(ConditionalOrder("l1", "u1", "AAPL", "buy", 10, "stop_limit", stop_price=110.0, limit_price=111.0))
+
+    assert index.on_price("AAPL", 100.0, 97.0) == []
+    assert [o.order_id for o in index.on_price("AAPL", 97.0, 94.0)] == ["s1"]
+    fired = index.on_price("AAPL", 94.0, 112.0)
+    assert sorted(o.order_id for o in fired) == ["b1", "l1"]
+    assert index.pending() == 0
+
+def test_stop_already_crossed_fires_immediately():
+    triggered = []
+    index = TriggerIndex(on_trigger=triggered.append)
+    index.on_price("AAPL", None, 100.0)
+    assert index.add(ConditionalOrder("s1", "u1", "AAPL", "sell", 10, stop_price=101.0))
+    assert triggered[0].triggered_price == 100.0
+
+def test_cancelled_order_does_not_fire():
+    index = TriggerIndex()
+    index.on_price("AAPL", None, 100.0)
+    index.add(ConditionalOrder("s1", "u1", "AAPL", "sell", 10, stop_price=95.0))
+    assert index.cancel("s1")
+    assert index.on_price("AAPL", 100.0, 90.0) == []
+
+def test_trailing_stop_follows_high():
+    index = TriggerIndex()
+    index.on_price("AAPL", None, 100.0)
+    index.add(ConditionalOrder("t1", "u1", "AAPL", "sell", 10, "trailing_stop", trail=5.0))
+    assert index.on_price("AAPL", 100.0, 96.0) == []
+    assert index.on_price("AAPL", 96.0, 110.0) == []
+    fired = index.on_price("AAPL", 110.0, 104.0)
+    assert [o.order_id for o in fired] == ["t1"]
+    assert fired[0].stop_price == 105.0
+
+def test_matches_brute_force_on_random_walk():
+    rng = random.Random(7)
+    index = TriggerIndex()
+    price = 100.0
+    index.on_price("X", None, price)
+    reference = {}
+    for step in range(2000):
+        if step % 3 == 0:
+            order_id = f"o{step}"
+            side = rng.choice(["buy", "sell"])
+            if rng.random() < 0.5:
+                order = ConditionalOrder(order_id, "u", "X", side, 1, "trailing_stop", trail=rng.randint(1, 10))
+                reference[order_id] = [side, "trail", order.trail, price]
+            else:
+                stop = price + rng.randint(1, 10) * (1 if side == "buy" else -1)
+                order = ConditionalOrder(order_id, "u", "X", side, 1, stop_price=stop)
+                reference[order_id] = [side, "stop", stop, None]
+            index.add(order)
+
+        price = max(1.0, price + rng.randint(-3, 3))
+        expected = set()
+        for order_id, (side, kind, value, extreme) in list(reference.items()):
+            if kind == "trail":
+                extreme = max(extreme, price) if side == "sell" else min(extreme, price)
+                reference[order_id][3] = extreme
+                stop = extreme - value if side == "sell" else extreme + value
+            else:
+                stop = value
+            if (side == "sell" and price <= stop) or (side == "buy" and price >= stop):
+                expected.add(order_id)
+                del reference[order_id]
+        fired = {o.order_id for o in index.on_price("X", None, price)}
+        assert fired == expected
+
+def test_invalid_conditional_orders_rejected():
+    for kwargs in (dict(side="hold", quantity=1, stop_price=95.0),
+                   dict(side="sell", quantity=0, stop_price=95.0),
+                   dict(side="sell", quantity=-5, stop_price=95.0),
+                   dict(side="sell", quantity=1, order_type="trailing_stop", trail=-1.0),
+                   dict(side="buy", quantity=1, order_type="stop_limit", stop_price=95.0, limit_price=0)):
+        with pytest.raises(ValueError):
+            ConditionalOrder("x", "u1", "AAPL", **kwargs)
+
+def test_cancelled_orders_are_compacted_out_of_the_heaps():
+    rng = random.Random(3)
+    index = TriggerIndex(compact_fraction=0.5, compact_min=8)
+    index.on_price("X", None, 100.0)
+    live = set()
+    for i in range(400):
+        side = rng.choice(["buy", "sell"])
+        if rng.random() < 0.5:
+            order = ConditionalOrder(f"o{i}", "u", "X", side, 1, "trailing_stop", trail=rng.randint(1, 10))
+        else:
+            order = ConditionalOrder(f"o{i}", "u", "X", side, 1, stop_price=100.0 + rng.randint(1, 10) * (1 if side == "buy" else -1))
+        index.add(order)
+        live.add(order.order_id)
+        if rng.random() < 0.8:
+            victim = rng.choice(sorted(live))
+            index.cancel(victim)
+            live.discard(victim)
+    book = index.books["X"]
+    # 堆中的已撤銷項不超過存活數，且沒有漏掉存活的委託
+    assert len(book) <= 2 * len(live) + 8
+    fired = {o.order_id for o in index.on_price("X", None, 1.0)} | {o.order_id for o in index.on_price("X", None, 1000.0)}
+    assert fired == live
@@ -0,0 +1,205 @@
+import base64
+import json
+import os
+from collections import OrderedDict, deque
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from auth import get_current_user
+from database import Database
+from models import User
+from clock import from_datetime, to_datetime
+from fixedpoint import from_ticks
+from settlement import transaction_id, transaction_timestamp
+
+router = APIRouter()
+
+# 每個活躍用戶在記憶體中保留的最近成交筆數，以及最多緩存的用戶數
+TRADE_CACHE_SIZE = int(os.getenv('TRADE_CACHE_SIZE', '200'))
+TRADE_CACHE_USERS = int(os.getenv('TRADE_CACHE_USERS', '10000'))
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class TradeRecord:
+    """
+    價格為整數 tick，時間戳為微秒精度的整數納秒，與數據庫中的記錄一致
+    """
+    __slots__ = ('trade_id', 'type', 'symbol', 'quantity', 'price', 'timestamp')
+
+    def __init__(self, trade_id: str, type: str, symbol: str, quantity: int, price: int, timestamp: int):
+        self.trade_id = trade_id
+        self.type = type
+        self.symbol = symbol
+        self.quantity = quantity
+        self.price = price
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_fill(cls, fill, side: str) -> 'TradeRecord':
+        return cls(transaction_id(fill, side), side, fill.symbol, fill.quantity, fill.price,
+                   transaction_timestamp(fill))
+
+    @classmethod
+    def from_row(cls, row) -> 'TradeRecord':
+        return cls(row.trade_id, row.type, row.symbol, row.quantity, row.price,
+                   from_datetime(row.timestamp))
+
+    @property
+    def key(self) -> tuple:
+        return (self.timestamp, self.trade_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.trade_id,
+            "type": self.type,
+            "symbol": self.symbol,
+            "quantity": self.quantity,
+            "price": from_ticks(self.price),
+            "timestamp": to_datetime(self.timestamp).isoformat(),
+        }
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, trade_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(timestamp), str(trade_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+
+class _UserTrades:
+    __slots__ = ('records', 'loaded', 'complete')
+
+    def __init__(self, size: int):
+        # 由舊到新排列，超出容量時從舊的一端淘汰
+        self.records = deque(maxlen=size)
+        # loaded: 已從數據庫載入最近記錄；complete: 緩存即為全部歷史
+        self.loaded = False
+        self.complete = False
+
+
+class TradeCache:
+    """
+    每個活躍用戶最近 size 筆成交的環形緩存，由撮合成交即時追加
+    首次查詢時從數據庫載入並與尚未結算的成交合併，之後第一頁不再查詢數據庫
+    用戶數超過上限時淘汰最久未使用的用戶
+    """
+
+    def __init__(self, size: int = TRADE_CACHE_SIZE, max_users: int = TRADE_CACHE_USERS):
+        self.size = size
+        self.max_users = max_users
+        self.users = OrderedDict()
+
+    def _entry(self, user_id: str) -> _UserTrades:
+        entry = self.users.get(user_id)
+        if entry is None:
+            entry = self.users[user_id] = _UserTrades(self.size)
+            if len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        else:
+            self.users.move_to_end(user_id)
+        return entry
+
+    def on_fills(self, fills: list):
+        for fill in fills:
+            for side, user_id in (('buy', fill.buyer_id), ('sell', fill.seller_id)):
+                entry = self._entry(user_id)
+                if len(entry.records) == self.size:
+                    entry.complete = False
+                entry.records.append(TradeRecord.from_fill(fill, side))
+
+    def is_loaded(self, user_id: str) -> bool:
+        entry = self.users.get(user_id)
+        return entry is not None and entry.loaded
+
+    def seed(self, user_id: str, records: list, complete: bool):
+        """
+        合併數據庫中的最近記錄 (complete 表示數據庫已無更早記錄) 與緩存中的成交，按編號去重
+        """
+        entry = self._entry(user_id)
+        merged = {record.trade_id: record for record in records}
+        for record in entry.records:
+            merged[record.trade_id] = record
+        ordered = sorted(merged.values(), key=lambda record: record.key)
+        entry.records.clear()
+        entry.records.extend(ordered)
+        entry.loaded = True
+        entry.complete = complete and len(ordered) <= self.size
+
+    def page(self, user_id: str, before: Optional[tuple], limit: int) -> Optional[list]:
+        """
+        由新到舊返回早於 before 的 limit 筆記錄，緩存不足以回答時返回 None
+        """
+        entry = self.users.get(user_id)
+        if entry is None or not entry.loaded:
+            return None
+        self.users.move_to_end(user_id)
+        result = []
+        for record in reversed(entry.records):
+            if before is not None and record.key >= before:
+                continue
+            result.append(record)
+            if len(result) == limit:
+                return result
+        return result if entry.complete else None
+
+
+class TradeHistory:
+    """
+    用戶成交記錄的游標分頁，游標為上一頁最後一筆的 (timestamp, trade_id)
+    """
+
+    def __init__(self, cache: TradeCache = None):
+        self.cache = cache or TradeCache()
+
+    async def load(self, db, user_id: str) -> bool:
+        rows = await db.get_user_trades(user_id, limit=self.cache.size)
+        if rows is None:
+            return False
+        self.cache.seed(user_id, [TradeRecord.from_row(row) for row in rows], len(rows) < self.cache.size)
+        return True
+
+    async def page(self, db, user_id: str, cursor: str = None, limit: int = 50) -> Optional[dict]:
+        before = decode_cursor(cursor) if cursor else None
+        if before is None and not self.cache.is_loaded(user_id):
+            await self.load(db, user_id)
+        records = self.cache.page(user_id, before, limit)
+        if records is None:
+            timestamp, trade_id = before or (None, None)
+            rows = await db.get_user_trades(user_id, to_datetime(timestamp), trade_id, limit)
+            if rows is None:
+                return None
+            records = [TradeRecord.from_row(row) for row in rows]
+        return {
+            "trades": [record.to_dict() for record in records],
+            "next_cursor": encode_cursor(records[-1].key) if len(records) == limit else None,
+        }
+
+
+trade_history = TradeHistory()
+
+
+@router.get("")
+async def get_trades(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, gt=0, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        page = await trade_history.page(Database(), str(current_user.id), cursor, limit)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Trade history unavailable"
+        )
+    return page
@@ -0,0 +1,335 @@
+import heapq
+import itertools
+from typing import Callable, Optional
+from engine import SIDES
+
+ORDER_TYPES = ('stop', 'stop_limit', 'trailing_stop')
+
+# 一支股票的已撤銷條件單超過堆中項目的此比例 (且至少 TRIGGER_COMPACT_MIN 筆) 時重建堆，清除懶惰刪除的項
+TRIGGER_COMPACT_FRACTION = 0.5
+TRIGGER_COMPACT_MIN = 64
+
+
+class ConditionalOrder:
+    __slots__ = ('order_id', 'user_id', 'symbol', 'side', 'quantity', 'order_type',
+                 'stop_price', 'limit_price', 'trail', 'active', 'triggered_price')
+
+    def __init__(self, order_id: str, user_id: str, symbol: str, side: str, quantity: int,
+                 order_type: str = 'stop', stop_price: float = None, limit_price: float = None,
+                 trail: float = None):
+        # 觸發時才轉為普通委託，參數必須在掛入索引前完整檢查
+        if side not in SIDES:
+            raise ValueError(f"Unknown side: {side}")
+        if order_type not in ORDER_TYPES:
+            raise ValueError(f"Unknown order type: {order_type}")
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        if order_type == 'trailing_stop' and (trail is None or trail <= 0):
+            raise ValueError("Trailing stop requires a positive trail amount")
+        if order_type != 'trailing_stop' and stop_price is None:
+            raise ValueError("Stop order requires a stop price")
+        if order_type == 'stop_limit' and (limit_price is None or limit_price <= 0):
+            raise ValueError("Stop-limit order requires a positive limit price")
+        self.order_id = order_id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.order_type = order_type
+        self.stop_price = stop_price
+        self.limit_price = limit_price
+        self.trail = trail
+        self.active = True
+        self.triggered_price = None
+
+
+# 以下兩個結構都在「轉換後的價格」x 上運作：賣單 x = price，買單 x = -price
+# 如此買賣兩邊都統一為「x 跌到觸發價以下時觸發」
+
+
+class _StopBook:
+    """
+    固定觸發價：以觸發價為鍵的最大堆
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+    def add(self, key: float, order: ConditionalOrder):
+        heapq.heappush(self.heap, (-key, next(self.counter), order))
+
+    def fire(self, x: float, fired: list):
+        heap = self.heap
+        while heap and -heap[0][0] >= x:
+            order = heapq.heappop(heap)[2]
+            if order.active:
+                fired.append(order)
+
+    def scale(self, factor: float):
+        # 正數縮放後取整到 tick 不改變大小順序 (只可能產生相等)，堆結構保持有效
+        self.heap = [(round(key * factor), seq, order) for key, seq, order in self.heap]
+
+    def compact(self) -> int:
+        before = len(self.heap)
+        self.heap = [item for item in self.heap if item[2].active]
+        heapq.heapify(self.heap)
+        return before - len(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class _TrailingBook:
+    """
+    追蹤止損：觸發價為 H - trail，H 為下單後 x 的最高點
+    同一時刻達到相同高點的委託共用一個分組，新高時才懶惰地合併分組，
+    每個分組內以 trail 建最小堆，分組頂端觸發價再放入全局最大堆
+    """
+
+    def __init__(self, sign: int):
+        self.sign = sign
+        self.groups = {}
+        self.by_anchor = {}
+        self.anchors = []
+        self.tops = []
+        self.counter = itertools.count()
+        self.size = 0
+
+    def _push_top(self, gid: int):
+        anchor, heap, version = self.groups[gid]
+        heapq.heappush(self.tops, (heap[0][0] - anchor, gid, version))
+
+    def _new_group(self, anchor: float, heap: list) -> int:
+        gid = next(self.counter)
+        self.groups[gid] = [anchor, heap, 0]
+        self.by_anchor[anchor] = gid
+        heapq.heappush(self.anchors, (anchor, gid))
+        self._push_top(gid)
+        return gid
+
+    def _drop_group(self, gid: int):
+        anchor = self.groups.pop(gid)[0]
+        if self.by_anchor.get(anchor) == gid:
+            del self.by_anchor[anchor]
+
+    def add(self, x: float, order: ConditionalOrder):
+        item = (order.trail, next(self.counter), order)
+        self.size += 1
+        gid = self.by_anchor.get(x)
+        if gid is None:
+            self._new_group(x, [item])
+            return
+        group = self.groups[gid]
+        heapq.heappush(group[1], item)
+        if group[1][0] is item:
+            group[2] += 1
+            self._push_top(gid)
+
+    def _merge_below(self, x: float):
+        merged = []
+        anchors = self.anchors
+        while anchors and anchors[0][0] < x:
+            gid = heapq.heappop(anchors)[1]
+            if gid in self.groups:
+                merged.append(self.groups[gid][1])
+                self._drop_group(gid)
+        if not merged:
+            return
+        existing = self.by_anchor.get(x)
+        if existing is not None:
+            merged.append(self.groups[existing][1])
+            self._drop_group(existing)
+        # 小堆併入大堆
+        merged.sort(key=len, reverse=True)
+        base = merged[0]
+        for heap in merged[1:]:
+            for item in heap:
+                heapq.heappush(base, item)
+        self._new_group(x, base)
+
+    def fire(self, x: float, fired: list):
+        self._merge_below(x)
+        tops = self.tops
+        while tops and -tops[0][0] >= x:
+            _, gid, version = heapq.heappop(tops)
+            group = self.groups.get(gid)
+            if group is None or group[2] != version:
+                continue
+            heap = group[1]
+            order = heapq.heappop(heap)[2]
+            self.size -= 1
+            if order.active:
+                order.stop_price = self.sign * (group[0] - order.trail)
+                fired.append(order)
+            if heap:
+                group[2] += 1
+                self._push_top(gid)
+            else:
+                self._drop_group(gid)
+
+    def scale(self, factor: float):
+        for group in self.groups.values():
+            group[0] = round(group[0] * factor)
+            group[1][:] = [(round(trail * factor), seq, order) for trail, seq, order in group[1]]
+        self.by_anchor = {group[0]: gid for gid, group in self.groups.items()}
+        self.anchors = [(round(anchor * factor), gid) for anchor, gid in self.anchors]
+        # 取整後觸發價由分組重新計算，與委託的 trail 保持一致
+        self.tops = [(heap[0][0] - anchor, gid, version) for gid, (anchor, heap, version) in self.groups.items()]
+        heapq.heapify(self.tops)
+
+    def compact(self) -> int:
+        """
+        丟棄已撤銷的委託並重建分組頂端的全局堆，返回移除數
+        """
+        removed = 0
+        for gid in list(self.groups):
+            group = self.groups[gid]
+            heap = [item for item in group[1] if item[2].active]
+            removed += len(group[1]) - len(heap)
+            if heap:
+                heapq.heapify(heap)
+                group[1] = heap
+            else:
+                self._drop_group(gid)
+        self.size -= removed
+        self.anchors = [(anchor, gid) for anchor, gid in self.anchors if gid in self.groups]
+        heapq.heapify(self.anchors)
+        self.tops = [(heap[0][0] - anchor, gid, version) for gid, (anchor, heap, version) in self.groups.items()]
+        heapq.heapify(self.tops)
+        return removed
+
+    def __len__(self):
+        return self.size
+
+
+class _SymbolTriggers:
+    def __init__(self):
+        self.stops = {'buy': _StopBook(), 'sell': _StopBook()}
+        self.trailing = {'buy': _TrailingBook(-1), 'sell': _TrailingBook(1)}
+        # 撤銷後仍留在堆中的項目數 (觸發時順帶丟棄的不扣減，只會讓重建提早)
+        self.cancelled = 0
+
+    def __len__(self):
+        return sum(len(book) for books in (self.stops, self.trailing) for book in books.values())
+
+    def compact(self) -> int:
+        self.cancelled = 0
+        return sum(book.compact() for books in (self.stops, self.trailing) for book in books.values())
+
+
+class TriggerIndex:
+    """
+    按股票分組的條件單觸發索引，每次價格更新只處理被穿越的委託 O(log n + k)
+    撤單為懶惰刪除，已撤銷的項目累積到一定比例時重建該股票的堆，記憶體不會無限增長
+    """
+
+    def __init__(self, on_trigger: Optional[Callable] = None,
+                 compact_fraction: float = TRIGGER_COMPACT_FRACTION, compact_min: int = TRIGGER_COMPACT_MIN):
+        self.books = {}
+        self.orders = {}
+        self.last_prices = {}
+        self.on_trigger = on_trigger
+        self.compact_fraction = compact_fraction
+        self.compact_min = compact_min
+
+    def _book(self, symbol: str) -> _SymbolTriggers:
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = _SymbolTriggers()
+        return book
+
+    def add(self, order: ConditionalOrder, reference_price: float = None) -> bool:
+        """
+        加入條件單，若觸發價已被穿越則立即觸發並返回 True
+        """
+        if order.order_id in self.orders:
+            raise ValueError("Duplicate order id")
+        price = self.last_prices.get(order.symbol, reference_price)
+        sign = 1 if order.side == 'sell' else -1
+        book = self._book(order.symbol)
+
+        if order.order_type == 'trailing_stop':
+            if price is None:
+                raise ValueError("Trailing stop requires a reference price")
+            order.stop_price = price - sign * order.trail
+            book.trailing[order.side].add(sign * price, order)
+        else:
+            if price is not None and sign * price <= sign * order.stop_price:
+                self._trigger([order], price)
+                return True
+            book.stops[order.side].add(sign * order.stop_price, order)
+        self.orders[order.order_id] = order
+        return False
+
+    def cancel(self, order_id: str) -> bool:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return False
+        # 懶惰刪除，堆頂遇到時丟棄
+        order.active = False
+        book = self.books.get(order.symbol)
+        if book is not None:
+            book.cancelled += 1
+            if book.cancelled >= self.compact_min and book.cancelled > len(book) * self.compact_fraction:
+                book.compact()
+        return True
+
+    def on_price(self, symbol: str, old_price: Optional[float], price: float) -> list:
+        """
+        價格更新時觸發被穿越的條件單，可直接作為 PriceFeed 的訂閱者
+        """
+        self.last_prices[symbol] = price
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+        fired = []
+        book.stops['sell'].fire(price, fired)
+        book.stops['buy'].fire(-price, fired)
+        book.trailing['sell'].fire(price, fired)
+        book.trailing['buy'].fire(-price, fired)
+        if fired:
+            self._trigger(fired, price)
+        return fired
+
+    def _trigger(self, fired: list, price: float):
+        for order in fired:
+            order.active = False
+            order.triggered_price = price
+            self.orders.pop(order.order_id, None)
+        if self.on_trigger:
+            for order in fired:
+                self.on_trigger(order)
+
+    def apply_split(self, symbol: str, new_shares: int, old_shares: int) -> int:
+        """
+        拆股或合股時按比例調整該股票所有掛單，價格取整到 tick，返回調整的委託數
+        """
+        factor = old_shares / new_shares
+        book = self.books.get(symbol)
+        if symbol in self.last_prices:
+            self.last_prices[symbol] = round(self.last_prices[symbol] * factor)
+        if book is None:
+            return 0
+        for side in ('buy', 'sell'):
+            book.stops[side].scale(factor)
+            book.trailing[side].scale(factor)
+
+        adjusted = 0
+        for order in [o for o in self.orders.values() if o.symbol == symbol]:
+            order.quantity = order.quantity * new_shares // old_shares
+            if order.stop_price is not None:
+                order.stop_price = round(order.stop_price * factor)
+            if order.limit_price is not None:
+                order.limit_price = round(order.limit_price * factor)
+            if order.trail is not None:
+                order.trail = round(order.trail * factor)
+            if order.quantity == 0:
+                self.cancel(order.order_id)
+            adjusted += 1
+        return adjusted
+
+    def pending(self, symbol: str = None) -> int:
+        if symbol is None:
+            return len(self.orders)
+        return sum(1 for order in self.orders.values() if order.symbol == symbol)